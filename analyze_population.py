@@ -3,19 +3,57 @@ Main script for isochrone population analysis.
 Generates multiple driving time isochrones (15, 30, 45 minutes) for health facilities 
 and calculates population within each isochrone area.
 """
-import ee
-import openrouteservice
-import pandas as pd
-import folium
+from __future__ import annotations
+
+import argparse
+import threading
 import time
-from typing import Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
 from config import get_config
-from logger import get_logger
+from facility_result import FacilityResult
+from isochrone_reuse import IsochroneReuse
+from lazy_import import lazy_import
+from logger import get_logger, log_context
+from map_renderer import LeafletMap
+from static_map import save_static_map
 from auth_gee import initialize_gee
+from metrics import finish_run, get_metrics
+from offline_isochrones import OfflineIsochroneError
+from ors_pool import ORSBackendPool, create_ors_client
+from population_backends import PopulationBackend, get_population_backend
+from population_cache import log_population_cache_report
+from profiling import add_profile_arguments, run_profiled
+from progress import ProgressReporter
+
+# Heavy dependencies are imported on first use (see lazy_import.py)
+ee = lazy_import('ee')
+openrouteservice = lazy_import('openrouteservice')
+pd = lazy_import('pandas')
+folium = lazy_import('folium')
 
 logger = get_logger(__name__)
+metrics = get_metrics()
+
+# ORS routing profile of every isochrone request
+ORS_PROFILE = 'driving-car'
+
+# Population year mosaicked from the GEE dataset, and the finest scale regions are reduced at
+GEE_POPULATION_YEAR = 2020
+GEE_MIN_SCALE = 250
+
+# Image each GEE dataset resolved to (see population_image_source)
+_population_image_sources: Dict[str, str] = {}
+_population_image_lock = threading.Lock()
+
+# Darker isochrone border color per range in minutes
+BORDER_COLORS = {
+    15: "#1565C0",  # Dark blue
+    30: "#6A1B9A",  # Dark purple
+    45: "#C62828"   # Dark red
+}
 
 
 class IsochroneAnalysisError(Exception):
@@ -115,25 +153,19 @@ def filter_by_level(df: pd.DataFrame, level_col: str, target_levels: list) -> pd
     return df[df[level_col].apply(is_target_level)].copy()
 
 
-def load_and_filter_data(filepath: str, target_levels: list = None) -> pd.DataFrame:
+def load_facilities(filepath: str) -> pd.DataFrame:
     """
-    Load facilities data from Excel file and filter by level.
+    Load all facilities from the Excel file, whatever their level.
     
     Args:
         filepath: Path to Excel file
-        target_levels: List of target levels to filter (default from config)
     
     Returns:
-        Filtered DataFrame
+        DataFrame with whitespace-stripped column names
     
     Raises:
         FileNotFoundError: If file doesn't exist
-        ValueError: If required columns are missing
     """
-    config = get_config()
-    if target_levels is None:
-        target_levels = config.target_levels
-    
     logger.info(f"Loading data from {filepath}...")
     
     if not Path(filepath).exists():
@@ -149,6 +181,29 @@ def load_and_filter_data(filepath: str, target_levels: list = None) -> pd.DataFr
     
     # Normalize column names (strip whitespace)
     df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def load_and_filter_data(filepath: str, target_levels: list = None) -> pd.DataFrame:
+    """
+    Load facilities data from Excel file and filter by level.
+    
+    Args:
+        filepath: Path to Excel file
+        target_levels: List of target levels to filter (default from config)
+    
+    Returns:
+        Filtered DataFrame
+    
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        ValueError: If required columns are missing
+    """
+    config = get_config()
+    if target_levels is None:
+        target_levels = config.target_levels
+    
+    df = load_facilities(filepath)
     
     # Find level column - prefer 'keph_level_name' over 'keph_level' (UUID)
     level_col = None
@@ -172,6 +227,62 @@ def load_and_filter_data(filepath: str, target_levels: list = None) -> pd.DataFr
     return filtered_df
 
 
+def correct_swapped_coordinates(lat_raw: Any, lon_raw: Any) -> Tuple[Any, Any, bool]:
+    """
+    Convert raw coordinate values to numbers and undo swapped lat/lon columns.
+    
+    Args:
+        lat_raw: Raw latitude value from the facility file
+        lon_raw: Raw longitude value from the facility file
+    
+    Returns:
+        Tuple of (lat, lon, swapped); values that cannot be parsed are returned as NaN
+    """
+    # Convert to numeric, handling string values and NaN
+    try:
+        lat_raw = pd.to_numeric(lat_raw, errors='coerce')
+        lon_raw = pd.to_numeric(lon_raw, errors='coerce')
+    except (ValueError, TypeError):
+        pass  # Will be caught by validate_coordinates
+    
+    # Check if coordinates are swapped (Kenya lat: -4.5 to 5.5, lon: 33.9 to 41.9)
+    # If lat is > 10 or lon is < -5, they're likely swapped
+    if (lat_raw is not None and lon_raw is not None and 
+        not pd.isna(lat_raw) and not pd.isna(lon_raw)):
+        if (lat_raw > 10 or lon_raw < -5):
+            return lon_raw, lat_raw, True
+    return lat_raw, lon_raw, False
+
+
+def extract_facility_locations(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Extract validated facility names and coordinates from a facilities DataFrame.
+    Rows with missing or invalid coordinates are dropped.
+    
+    Args:
+        df: Facilities DataFrame (as returned by load_and_filter_data)
+    
+    Returns:
+        DataFrame with columns 'name', 'lat', 'lon', indexed like the input
+    """
+    lat_col = find_column_by_pattern(df, ['lat'], 'Latitude')
+    lon_col = find_column_by_pattern(df, ['lon', 'long'], 'Longitude')
+    name_col = find_column_by_pattern(df, ['name'], 'Facility Name')
+    
+    records = {}
+    for index, row in df.iterrows():
+        lat, lon, _ = correct_swapped_coordinates(row.get(lat_col), row.get(lon_col))
+        try:
+            lat, lon = validate_coordinates(lat, lon)
+        except InvalidCoordinateError:
+            logger.debug(f"Skipping facility at index {index}: invalid coordinates ({lat}, {lon})")
+            continue
+        name = row.get(name_col, f"Facility at ({lat}, {lon})")
+        records[index] = {'name': name, 'lat': lat, 'lon': lon}
+    
+    return pd.DataFrame.from_dict(records, orient='index', columns=['name', 'lat', 'lon'])
+
+
 def get_isochrone_with_retry(
     client: openrouteservice.Client,
     lat: float,
@@ -193,9 +304,10 @@ def get_isochrone_with_retry(
         retry_delay: Initial retry delay in seconds (default from config)
     
     Returns:
-        Isochrone GeoJSON response with multiple features, or None if failed
+        Isochrone GeoJSON response with multiple features, or None if failed (offline
+        engine errors are not retried)
     """
-    config = get_config()
+    config = get_config().snapshot()
     if ranges_sec is None:
         ranges_sec = config.range_seconds
     # Handle backward compatibility - if single value, convert to list
@@ -210,29 +322,94 @@ def get_isochrone_with_retry(
     for attempt in range(max_retries):
         try:
             logger.debug(f"Requesting isochrones for ({lat}, {lon}), ranges: {ranges_sec}, attempt {attempt + 1}/{max_retries}")
-            iso = client.isochrones(
-                locations=[[lon, lat]],
-                profile='driving-car',
-                range=ranges_sec,  # Pass list directly - ORS supports multiple ranges
-                attributes=['total_pop']
-            )
+            metrics.incr('ors_requests')
+            with metrics.timer('ors_request'):
+                iso = client.isochrones(
+                    locations=[[lon, lat]],
+                    profile=ORS_PROFILE,
+                    range=ranges_sec,  # Pass list directly - ORS supports multiple ranges
+                    attributes=['total_pop']
+                )
             logger.debug(f"Successfully generated {len(iso.get('features', []))} isochrones for ({lat}, {lon})")
             return iso
+        except OfflineIsochroneError as e:
+            # The offline engine fails the same way every time (no road nearby, unsupported profile)
+            metrics.incr('ors_failures')
+            logger.error(f"Failed to generate isochrones for ({lat}, {lon}): {e}")
+            return None
         except Exception as e:
+            metrics.incr('ors_errors')
             if attempt < max_retries - 1:
                 wait_time = retry_delay * (2 ** attempt)  # Exponential backoff
                 logger.warning(
                     f"Error generating isochrones for ({lat}, {lon}), attempt {attempt + 1}/{max_retries}: {e}. "
                     f"Retrying in {wait_time:.1f}s..."
                 )
-                time.sleep(wait_time)
+                metrics.incr('ors_retries')
+                with metrics.timer('retry_backoff'):
+                    time.sleep(wait_time)
             else:
+                metrics.incr('ors_failures')
                 logger.error(f"Failed to generate isochrones for ({lat}, {lon}) after {max_retries} attempts: {e}")
                 return None
     
     return None
 
 
+def population_image_source(dataset_name: str) -> str:
+    """
+    Identify the image get_population_image() uses for a dataset.
+
+    Resolved once per dataset and process, so the persistent population cache
+    never files values from a fallback image under the population year.
+
+    Args:
+        dataset_name: GEE ImageCollection name
+
+    Returns:
+        The population year (e.g. '2020') if the dataset has images for it, otherwise
+        'latest:<system:index>' of the most recent image
+    """
+    with _population_image_lock:
+        source = _population_image_sources.get(dataset_name)
+    if source is None:
+        dataset_collection = ee.ImageCollection(dataset_name)
+        dataset_year = dataset_collection.filterDate(f'{GEE_POPULATION_YEAR}-01-01',
+                                                     f'{GEE_POPULATION_YEAR + 1}-01-01')
+        if dataset_year.size().getInfo() > 0:
+            source = str(GEE_POPULATION_YEAR)
+        else:
+            latest = dataset_collection.sort('system:time_start', False).first()
+            source = f"latest:{latest.get('system:index').getInfo()}"
+            logger.warning(f"{dataset_name} has no {GEE_POPULATION_YEAR} images; "
+                           f"using the most recent ({source})")
+        with _population_image_lock:
+            _population_image_sources[dataset_name] = source
+    return source
+
+
+def get_population_image(dataset_name: str) -> "ee.Image":
+    """
+    Build the GEE population image for a dataset.
+    
+    Args:
+        dataset_name: GEE ImageCollection name
+    
+    Returns:
+        ee.Image with a 'population' band
+    """
+    # WorldPop/GP/100m/pop is an ImageCollection with multiple years/tiles
+    # Filter for the population year and mosaic tiles together
+    dataset_collection = ee.ImageCollection(dataset_name)
+    
+    # Mosaic the year's images if available, otherwise use most recent
+    if population_image_source(dataset_name) == str(GEE_POPULATION_YEAR):
+        dataset_year = dataset_collection.filterDate(f'{GEE_POPULATION_YEAR}-01-01',
+                                                     f'{GEE_POPULATION_YEAR + 1}-01-01')
+        return dataset_year.mosaic()
+    return dataset_collection.sort('system:time_start', False).first()
+
+
 def calculate_population_gee(geometry: Dict[str, Any], dataset_name: str = None, scale: int = None, max_pixels: int = None) -> Optional[float]:
     """
     Calculate population within geometry using Google Earth Engine.
@@ -246,7 +423,7 @@ def calculate_population_gee(geometry: Dict[str, Any], dataset_name: str = None,
     Returns:
         Population count or None if calculation fails
     """
-    config = get_config()
+    config = get_config().snapshot()
     if dataset_name is None:
         dataset_name = config.gee_dataset
     if scale is None:
@@ -254,33 +431,25 @@ def calculate_population_gee(geometry: Dict[str, Any], dataset_name: str = None,
     if max_pixels is None:
         max_pixels = config.gee_max_pixels
     
+    metrics.incr('gee_requests')
     try:
         logger.debug(f"Calculating population for geometry using dataset {dataset_name}")
-        # WorldPop/GP/100m/pop is an ImageCollection with multiple years/tiles
-        # Filter for 2020 data and mosaic tiles together
-        dataset_collection = ee.ImageCollection(dataset_name)
-        dataset_2020 = dataset_collection.filterDate('2020-01-01', '2021-01-01')
-        
-        # Mosaic 2020 images if available, otherwise use most recent
-        collection_size = dataset_2020.size().getInfo()
-        if collection_size > 0:
-            dataset = dataset_2020.mosaic()
-        else:
-            dataset = dataset_collection.sort('system:time_start', False).first()
-        
-        gee_geom = ee.Geometry(geometry)
-        
-        # Use a slightly coarser scale (250m) to ensure reliable data retrieval
-        scale_to_use = max(scale, 250)
-        
-        stats = dataset.reduceRegion(
-            reducer=ee.Reducer.sum(),
-            geometry=gee_geom,
-            scale=scale_to_use,
-            maxPixels=max_pixels
-        )
-        
-        population = stats.get('population').getInfo()
+        with metrics.timer('gee_population'):
+            dataset = get_population_image(dataset_name)
+            
+            gee_geom = ee.Geometry(geometry)
+            
+            # Use a slightly coarser scale (250m) to ensure reliable data retrieval
+            scale_to_use = max(scale, GEE_MIN_SCALE)
+            
+            stats = dataset.reduceRegion(
+                reducer=ee.Reducer.sum(),
+                geometry=gee_geom,
+                scale=scale_to_use,
+                maxPixels=max_pixels
+            )
+            
+            population = stats.get('population').getInfo()
         
         if population is None:
             logger.warning("GEE returned None for population calculation")
@@ -289,18 +458,73 @@ def calculate_population_gee(geometry: Dict[str, Any], dataset_name: str = None,
         logger.debug(f"Population calculated: {population:,.0f}")
         return float(population)
     except Exception as e:
+        metrics.incr('gee_errors')
         logger.error(f"GEE population calculation error: {e}", exc_info=True)
         return None
 
 
+def calculate_populations_gee(
+    geometries: List[Dict[str, Any]],
+    dataset_name: str = None,
+    scale: int = None
+) -> List[Optional[float]]:
+    """
+    Calculate population within several geometries in one Google Earth Engine request.
+    
+    Args:
+        geometries: GeoJSON geometry dictionaries
+        dataset_name: GEE dataset name (default from config)
+        scale: Scale in meters (default from config)
+    
+    Returns:
+        Population count per geometry (None where GEE returned no value); all None if the request fails
+    """
+    config = get_config().snapshot()
+    if dataset_name is None:
+        dataset_name = config.gee_dataset
+    if scale is None:
+        scale = config.gee_scale
+    if not geometries:
+        return []
+    
+    metrics.incr('gee_requests')
+    try:
+        logger.debug(f"Calculating population for {len(geometries)} geometries using dataset {dataset_name}")
+        with metrics.timer('gee_population'):
+            dataset = get_population_image(dataset_name).select('population')
+            collection = ee.FeatureCollection([
+                ee.Feature(ee.Geometry(geometry), {'index': i}) for i, geometry in enumerate(geometries)
+            ])
+            stats = dataset.reduceRegions(
+                collection=collection,
+                reducer=ee.Reducer.sum(),
+                scale=max(scale, GEE_MIN_SCALE)  # Same coarser scale as calculate_population_gee
+            ).getInfo()
+        
+        populations: List[Optional[float]] = [None] * len(geometries)
+        for feature in stats.get('features', []):
+            properties = feature.get('properties', {})
+            value = properties.get('sum')
+            if value is not None:
+                populations[int(properties['index'])] = float(value)
+        return populations
+    except Exception as e:
+        metrics.incr('gee_errors')
+        logger.error(f"GEE batch population calculation error: {e}", exc_info=True)
+        return [None] * len(geometries)
+
+
 def process_facility(
     row: pd.Series,
     df: pd.DataFrame,
     ors_client: openrouteservice.Client,
     config,
     facility_num: int = None,
-    total: int = None
-) -> Optional[Dict[str, Any]]:
+    total: int = None,
+    progress: Optional[ProgressReporter] = None,
+    population_backend: Optional[PopulationBackend] = None,
+    isochrone_reuse: Optional[IsochroneReuse] = None
+) -> Optional[FacilityResult]:
     """
     Process a single facility: generate multiple isochrones and calculate population for each.
     
@@ -308,10 +532,15 @@ def process_facility(
         row: Facility row from DataFrame
         df: Full DataFrame (for column detection)
         ors_client: OpenRouteService client
-        config: Configuration object
+        config: Configuration snapshot (Config.snapshot())
+        facility_num: Position of this facility in the run (for log messages)
+        total: Number of facilities in the run (for log messages)
+        progress: Progress reporter notified of each facility and range result
+        population_backend: Population backend (default from config population.backend)
+        isochrone_reuse: Approximate mode: reuse isochrones of nearby facilities (see isochrone_reuse.py)
     
     Returns:
-        Dictionary with facility data and results, or None if processing failed
+        FacilityResult with isochrones and populations by range, or None if processing failed
     """
     # Find coordinate and name columns
     lat_col = find_column_by_pattern(df, ['lat'], 'Latitude')
@@ -326,196 +555,186 @@ def process_facility(
         logger.error(f"Missing required column: {e}")
         return None
     
-    # Convert to numeric, handling string values and NaN
-    try:
-        lat_raw = pd.to_numeric(lat_raw, errors='coerce')
-        lon_raw = pd.to_numeric(lon_raw, errors='coerce')
-    except (ValueError, TypeError):
-        pass  # Will be caught by validate_coordinates
-    
-    # Check if coordinates are swapped (Kenya lat: -4.5 to 5.5, lon: 33.9 to 41.9)
-    # If lat is > 10 or lon is < -5, they're likely swapped
-    if (lat_raw is not None and lon_raw is not None and 
-        not pd.isna(lat_raw) and not pd.isna(lon_raw)):
-        if (lat_raw > 10 or lon_raw < -5):
-            # Coordinates are swapped, swap them back
-            lat, lon = lon_raw, lat_raw
+    with log_context(facility=name):
+        lat, lon, swapped = correct_swapped_coordinates(lat_raw, lon_raw)
+        if swapped:
             logger.debug(f"Swapped coordinates for {name}: ({lat_raw}, {lon_raw}) -> ({lat}, {lon})")
-        else:
-            lat, lon = lat_raw, lon_raw
-    else:
-        lat, lon = lat_raw, lon_raw
     
-    # Show progress info if provided
-    progress_info = ""
-    if facility_num is not None and total is not None:
-        progress_pct = (facility_num / total) * 100
-        progress_info = f" [{facility_num}/{total} - {progress_pct:.1f}%]"
+        progress_info = ""
+        if facility_num is not None and total is not None:
+            progress_info = f" [{facility_num}/{total}]"
     
-    logger.info(f"Processing {name} ({lat}, {lon})...")
-    print(f"  Facility: {name}{progress_info}")
-    print(f"  Location: ({lat:.6f}, {lon:.6f})")
+        logger.info(f"Processing {name} ({lat}, {lon}){progress_info}...")
+        if progress is not None:
+            progress.start_item(name)
     
-    # Validate coordinates
-    try:
-        lat, lon = validate_coordinates(lat, lon)
-    except InvalidCoordinateError as e:
-        logger.error(f"Invalid coordinates for {name}: {e}")
-        return None
+        # Validate coordinates
+        try:
+            lat, lon = validate_coordinates(lat, lon)
+        except InvalidCoordinateError as e:
+            logger.error(f"Invalid coordinates for {name}: {e}")
+            return None
     
-    # Get ranges from config (ensure it's a list)
-    ranges_sec = config.range_seconds
-    if isinstance(ranges_sec, int):
-        ranges_sec = [ranges_sec]
+        ranges_sec = config.range_seconds
     
-    # Generate each isochrone separately (ORS v8.1.0 only supports 1 isochrone per request)
-    isochrones_by_range = {}
-    populations_by_range = {}
-    all_features = []
+        # Generate each isochrone separately (ORS v8.1.0 only supports 1 isochrone per request)
+        features_by_range = {}
+        sources = {}
+        # Reused isochrones checked against ORS: range -> reused feature
+        validations = {}
     
-    for range_sec in ranges_sec:
-        range_min = range_sec // 60
-        logger.debug(f"Requesting {range_min}-minute isochrone for {name}...")
-        print(f"    Generating {range_min}-minute isochrone...", end=" ", flush=True)
+        for range_sec in ranges_sec:
+            range_min = range_sec // 60
+            
+            if isochrone_reuse is not None:
+                match = isochrone_reuse.lookup(lat, lon, range_sec, ORS_PROFILE)
+                if match is not None and not match.validate:
+                    logger.debug(f"Reusing {range_min}-minute isochrone of {match.source_name} "
+                                 f"({match.distance_m:.0f} m away) for {name}")
+                    features_by_range[range_sec] = match.feature
+                    sources[range_sec] = match.provenance
+                    continue
+                if match is not None:
+                    validations[range_sec] = match.feature
+            
+            logger.debug(f"Requesting {range_min}-minute isochrone for {name}...")
         
-        # Request single isochrone
-        iso_json = get_isochrone_with_retry(ors_client, lat, lon, [range_sec])
+            # Request single isochrone
+            iso_json = get_isochrone_with_retry(
+                ors_client, lat, lon, [range_sec],
+                max_retries=config.ors_retry_attempts, retry_delay=config.ors_retry_delay
+            )
         
-        if not iso_json or 'features' not in iso_json or len(iso_json['features']) == 0:
-            logger.warning(f"Failed to generate isochrone for {name} at {range_min} minutes")
-            print("[FAILED]")
-            continue
+            if not iso_json or 'features' not in iso_json or len(iso_json['features']) == 0:
+                logger.warning(f"Failed to generate isochrone for {name} at {range_min} minutes")
+                validations.pop(range_sec, None)
+                if progress is not None:
+                    progress.range_done(False)
+                continue
         
-        feature = iso_json['features'][0]
-        geom = feature.get('geometry')
+            feature = iso_json['features'][0]
         
-        if not geom:
-            logger.warning(f"No geometry in isochrone response for {name} at {range_min} minutes")
-            print("[NO GEOMETRY]")
-            continue
+            if not feature.get('geometry'):
+                logger.warning(f"No geometry in isochrone response for {name} at {range_min} minutes")
+                validations.pop(range_sec, None)
+                if progress is not None:
+                    progress.range_done(False)
+                continue
         
-        print("[OK]", end=" ", flush=True)
+            features_by_range[range_sec] = feature
+            if isochrone_reuse is not None:
+                sources[range_sec] = 'ors'
+                isochrone_reuse.add(name, lat, lon, range_sec, feature, ORS_PROFILE)
         
-        # Calculate population for this isochrone
-        print("Calculating population...", end=" ", flush=True)
-        pop = calculate_population_gee(geom)
-        if pop is None:
-            logger.warning(f"Failed to calculate population for {name} at {range_min} minutes, setting to -1")
-            pop = -1
-            print("[FAILED]")
-        else:
-            print(f"[OK] Population: {pop:,.0f}")
+            # Small delay between requests
+            with metrics.timer('sleep'):
+                time.sleep(config.sleep_between_requests)
+    
+        # Calculate population for all isochrones (and reused ones being validated) in one backend call
+        if population_backend is None:
+            population_backend = get_population_backend(config)
+        features = list(features_by_range.values()) + list(validations.values())
+        all_pops = population_backend.populations(features) if features else []
+        pops = all_pops[:len(features_by_range)]
         
-        logger.info(f"  {range_min}-min isochrone: Population: {pop:,.0f}")
+        exact = dict(zip(features_by_range, pops))
+        for (range_sec, approx_pop) in zip(validations, all_pops[len(features_by_range):]):
+            if approx_pop is not None and exact[range_sec] is not None:
+                isochrone_reuse.record_validation(approx_pop, exact[range_sec])
+    
+        result = FacilityResult(name, lat, lon, source_row=row)
+        for (range_sec, feature), pop in zip(features_by_range.items(), pops):
+            range_min = range_sec // 60
+            if pop is None:
+                logger.warning(f"Failed to calculate population for {name} at {range_min} minutes, setting to -1")
+                pop = -1
+            if progress is not None:
+                progress.range_done(pop >= 0)
         
-        # Store isochrone and population by time range
-        isochrones_by_range[range_min] = {
-            'geometry': geom,
-            'feature': feature,
-            'range_seconds': range_sec
-        }
-        populations_by_range[range_min] = pop
-        all_features.append(feature)
+            logger.info(f"  {range_min}-min isochrone: Population: {pop:,.0f}")
         
-        # Small delay between requests
-        time.sleep(config.sleep_between_requests)
-    
-    if not isochrones_by_range:
-        logger.warning(f"Failed to generate any isochrones for {name}")
-        return None
-    
-    # Create combined GeoJSON for storage
-    combined_geojson = {
-        "type": "FeatureCollection",
-        "features": all_features
-    }
-    
-    # Prepare result
-    result = row.to_dict()
-    result['lat'] = lat
-    result['lon'] = lon
-    result['name'] = name
-    result['isochrones'] = isochrones_by_range  # Changed from single 'isochrone'
-    result['populations'] = populations_by_range
-    
-    # For backward compatibility and map rendering, also store the full GeoJSON
-    result['isochrone_geojson'] = combined_geojson
+            # Store the isochrone once (packed) with its population
+            result.add_range(range_sec, feature, pop, sources.get(range_sec))
     
-    # Also keep backward-compatible single isochrone field (use largest range)
-    if all_features:
-        result['isochrone'] = {
-            "type": "FeatureCollection",
-            "features": [all_features[-1]]  # Largest range
-        }
-        result['population_1hr'] = populations_by_range.get(max(populations_by_range.keys()) if populations_by_range else 0, -1)
+        if not result.ranges:
+            logger.warning(f"Failed to generate any isochrones for {name}")
+            return None
     
-    return result
+        return result
 
 
-def create_map(results: list, config) -> folium.Map:
+def build_map(results: list, config) -> LeafletMap:
     """
-    Create Folium map with facilities and multiple colored isochrones.
+    Build the map with facilities and multiple colored isochrones.
     
     Args:
-        results: List of result dictionaries
+        results: List of FacilityResult objects (or legacy single-isochrone dictionaries)
         config: Configuration object
     
     Returns:
-        Folium Map object
+        LeafletMap (render() or save() writes the HTML directly; to_folium() gives a folium.Map)
     """
-    m = folium.Map(
-        location=[config.map_center_lat, config.map_center_lon],
-        zoom_start=config.map_zoom_start
-    )
+    clustered = config.map_facility_layer == 'clustered' or (
+        config.map_facility_layer == 'auto' and len(results) >= config.map_cluster_threshold)
+    m = LeafletMap(center=(config.map_center_lat, config.map_center_lon), zoom=config.map_zoom_start,
+                   prefer_canvas=clustered)
     
     # Get color mapping from config
     color_map = config.map_isochrone_colors
     
-    # Define darker border colors for each time range
-    border_color_map = {
-        15: "#1565C0",  # Dark blue
-        30: "#6A1B9A",  # Dark purple
-        45: "#C62828"   # Dark red
-    }
+    # Clustered mode: facilities go into one data array instead of one marker each
+    point_ranges = sorted({r for result in results if isinstance(result, FacilityResult) for r in result.ranges})
+    points = []
+    
+    county_column = None
+    if config.map_sidecars and config.map_sidecar_split == 'county':
+        county_column = find_county_column(results)
+        if county_column is None:
+            logger.warning("map.sidecar_split is 'county' but the facilities have no county column; "
+                           "all isochrones go into 'Unknown county'")
     
     for result in results:
-        # Check for new format (multiple isochrones) or old format (single isochrone)
-        if 'isochrones' in result:
+        # Check for new format (multiple isochrones) or old format (single isochrone dict)
+        if isinstance(result, FacilityResult):
             # New format: multiple isochrones
-            name = result.get('name', 'Unknown')
-            lat = result.get('lat')
-            lon = result.get('lon')
-            populations = result.get('populations', {})
+            name = result.name
+            lat = result.lat
+            lon = result.lon
+            populations = result.populations
             
             # Add isochrones in reverse order (largest to smallest) so smaller ones appear on top
-            for range_min in sorted(result['isochrones'].keys(), reverse=True):
-                iso_data = result['isochrones'][range_min]
+            for range_min in sorted(result.ranges.keys(), reverse=True):
                 pop = populations.get(range_min, 0)
                 color = color_map.get(range_min, config.map_isochrone_color)  # Default color if not specified
-                border_color = border_color_map.get(range_min, color)  # Use darker border color
-                
-                # Create a GeoJSON feature collection for this single isochrone
-                single_feature_geojson = {
-                    "type": "FeatureCollection",
-                    "features": [iso_data['feature']]
-                }
-                
-                folium.GeoJson(
-                    single_feature_geojson,
-                    style_function=lambda x, fill_c=color, border_c=border_color: {
-                        'fillColor': fill_c,
-                        'color': border_c,
+                border_color = BORDER_COLORS.get(range_min, color)  # Use darker border color
+                group, bounds = None, None
+                if config.map_sidecars:
+                    # Layer groups become the sidecar files, loaded when toggled on and in view
+                    group = sidecar_group(result, range_min, config.map_sidecar_split, county_column)
+                    degrees = result.ranges[range_min].packed.degrees()
+                    west, south = degrees.min(axis=0)
+                    east, north = degrees.max(axis=0)
+                    bounds = (south, west, north, east)
+                m.add_geojson(
+                    {"type": "FeatureCollection", "features": [result.feature(range_min)]},
+                    style={
+                        'fillColor': color,
+                        'color': border_color,
                         'weight': 2,
                         'fillOpacity': config.map_isochrone_opacity
                     },
-                    tooltip=f"{name} - {range_min} min: {pop:,.0f} people"
-                ).add_to(m)
+                    tooltip=f"{name} - {range_min} min: {pop:,.0f} people",
+                    group=group,
+                    bounds=bounds
+                )
             
             # Add facility marker (smaller circle marker)
-            if lat is not None and lon is not None:
+            if lat is not None and lon is not None and clustered:
+                points.append((lat, lon, name, *[populations.get(r) for r in point_ranges]))
+            elif lat is not None and lon is not None:
                 pop_text = ", ".join([f"{k}min: {v:,.0f}" for k, v in sorted(populations.items())])
-                folium.CircleMarker(
-                    [lat, lon],
+                m.add_circle_marker(
+                    lat, lon,
                     radius=5,  # Smaller marker size
                     popup=f"<b>{name}</b><br>Population:<br>{pop_text}",
                     color='red',
@@ -523,7 +742,7 @@ def create_map(results: list, config) -> folium.Map:
                     fillColor='red',
                     fillOpacity=0.8,
                     weight=2
-                ).add_to(m)
+                )
         
         elif 'isochrone' in result:
             # Old format: single isochrone (backward compatibility)
@@ -533,21 +752,21 @@ def create_map(results: list, config) -> folium.Map:
             lon = result.get('lon')
             
             # Add isochrone
-            folium.GeoJson(
+            m.add_geojson(
                 result['isochrone'],
-                style_function=lambda x: {
+                style={
                     'fillColor': config.map_isochrone_color,
                     'color': config.map_isochrone_color,
                     'weight': 1,
                     'fillOpacity': config.map_isochrone_opacity
                 },
                 tooltip=f"{name}: {pop:,.0f}"
-            ).add_to(m)
+            )
             
             # Add marker (smaller circle marker)
             if lat is not None and lon is not None:
-                folium.CircleMarker(
-                    [lat, lon],
+                m.add_circle_marker(
+                    lat, lon,
                     radius=5,  # Smaller marker size
                     popup=f"{name}<br>Population: {pop:,.0f}",
                     color='red',
@@ -555,42 +774,95 @@ def create_map(results: list, config) -> folium.Map:
                     fillColor='red',
                     fillOpacity=0.8,
                     weight=2
-                ).add_to(m)
+                )
+    
+    if points:
+        m.add_points(
+            points,
+            columns=[f"{r}min" for r in point_ranges],
+            title="Population:",
+            cluster=True,
+            radius=5,
+            color='red',
+            fill=True,
+            fillColor='red',
+            fillOpacity=0.8,
+            weight=2
+        )
     
     # Add legend with totals if using multiple isochrones
     if color_map:
         # Calculate combined totals across all facilities
-        total_15min = 0
-        total_30min = 0
-        total_45min = 0
-        
+        totals_map = {15: 0, 30: 0, 45: 0}
         for result in results:
-            if 'populations' in result:
-                populations = result.get('populations', {})
-                if 15 in populations and populations[15] >= 0:
-                    total_15min += populations[15]
-                if 30 in populations and populations[30] >= 0:
-                    total_30min += populations[30]
-                if 45 in populations and populations[45] >= 0:
-                    total_45min += populations[45]
-        
-        totals_map = {
-            15: total_15min,
-            30: total_30min,
-            45: total_45min
-        }
-        
-        color_items = sorted(color_map.items())
-        legend_items = "\n".join([
-            f'<p style="margin:5px 0"><span style="color:{color}">●</span> {range_min} minutes<br><small style="margin-left:20px;">Total: {totals_map.get(range_min, 0):,.0f} people</small></p>'
-            for range_min, color in color_items
-        ])
-        
-        # Add grand total
-        grand_total = total_45min
-        legend_items += f'<hr style="margin:10px 0;"><p style="margin:5px 0;"><b>Grand Total (45-min):</b><br><small style="margin-left:20px;">{grand_total:,.0f} people</small></p>'
-        
-        legend_html = f'''
+            if isinstance(result, FacilityResult):
+                for range_min, pop in result.populations.items():
+                    if range_min in totals_map and pop >= 0:
+                        totals_map[range_min] += pop
+        m.add_html(legend_html(color_map, totals_map, grand_total=totals_map[45]))
+    
+    return m
+
+
+def find_county_column(results: list) -> Optional[str]:
+    """
+    Find the county column of the facility rows behind the results (e.g. 'County' or 'county_name').
+    
+    Args:
+        results: List of FacilityResult objects
+    
+    Returns:
+        Column name, or None if the rows have no county column
+    """
+    for result in results:
+        if isinstance(result, FacilityResult) and result.source_row is not None:
+            columns = result.source_row.index if hasattr(result.source_row, 'index') else list(result.source_row)
+            return find_column_by_pattern(pd.DataFrame(columns=list(columns)), ['county'], None)
+    return None
+
+
+def sidecar_group(result: FacilityResult, range_min: int, split: str, county_column: Optional[str] = 'County') -> str:
+    """
+    Layer group (and sidecar file) of one isochrone.
+    
+    Args:
+        result: Facility result the isochrone belongs to
+        range_min: Isochrone range in minutes
+        split: 'range' (one group per time range) or 'county' (one group per facility county)
+        county_column: Column of the facility row holding its county (see find_county_column)
+    
+    Returns:
+        Group name shown in the layer control
+    """
+    if split == 'county':
+        county = (result.source_row.get(county_column)
+                  if result.source_row is not None and county_column is not None else None)
+        return str(county) if county is not None and not pd.isna(county) else 'Unknown county'
+    return f"{range_min} min isochrones"
+
+
+def legend_html(color_map: Dict[int, str], totals_map: Dict[int, float], grand_total: float) -> str:
+    """
+    Fixed-position legend panel with the combined population of each time range.
+    
+    Args:
+        color_map: Isochrone color per range in minutes
+        totals_map: Combined population per range in minutes
+        grand_total: Population shown as the 45-min grand total
+    
+    Returns:
+        HTML snippet
+    """
+    color_items = sorted(color_map.items())
+    legend_items = "\n".join([
+        f'<p style="margin:5px 0"><span style="color:{color}">●</span> {range_min} minutes<br><small style="margin-left:20px;">Total: {totals_map.get(range_min, 0):,.0f} people</small></p>'
+        for range_min, color in color_items
+    ])
+    
+    # Add grand total
+    legend_items += f'<hr style="margin:10px 0;"><p style="margin:5px 0;"><b>Grand Total (45-min):</b><br><small style="margin-left:20px;">{grand_total:,.0f} people</small></p>'
+    
+    return f'''
         <div style="position: fixed; 
                     bottom: 50px; right: 50px; width: 250px; height: auto; 
                     background-color: white; z-index:9999; 
@@ -600,25 +872,126 @@ def create_map(results: list, config) -> folium.Map:
         {legend_items}
         </div>
         '''
-        m.get_root().html.add_child(folium.Element(legend_html))
+
+
+def create_map(results: list, config) -> folium.Map:
+    """
+    Create the Folium map with facilities and multiple colored isochrones.
     
-    return m
+    Same content as build_map(), rendered through folium; used when
+    map.renderer is 'folium'.
+    
+    Args:
+        results: List of FacilityResult objects (or legacy single-isochrone dictionaries)
+        config: Configuration object
+    
+    Returns:
+        Folium Map object
+    """
+    return build_map(results, config).to_folium()
+
+
+def save_map(m: LeafletMap, path: str, config):
+    """
+    Write a map with the configured renderer ('template' writes it directly, 'folium' via folium).
+    
+    With map.sidecars (template renderer only), grouped GeoJSON layers are written to
+    sidecar files next to the page and loaded on demand.
+    """
+    if config.map_renderer == 'folium':
+        m.to_folium().save(path)
+    else:
+        m.save(path, sidecars=config.map_sidecars, compress=config.map_sidecar_gzip)
+
+
+def write_results_csv(results: list, output_path: str) -> pd.DataFrame:
+    """
+    Write facility results to CSV, one row per facility with a population column per range.
+    
+    Args:
+        results: List of FacilityResult objects from process_facility
+        output_path: CSV file path
+    
+    Returns:
+        The DataFrame that was written
+    """
+    # One flat row per facility (source columns plus population columns, no geometry)
+    csv_data = [result.to_row() for result in results]
+    
+    result_df = pd.DataFrame(csv_data)
+    with metrics.timer('csv_write'):
+        result_df.to_csv(output_path, index=False)
+    logger.info(f"Saved results to {output_path}")
+    return result_df
+
+
+def process_facilities(
+    df: pd.DataFrame,
+    ors_client: openrouteservice.Client,
+    config,
+    workers: int = 1,
+    progress: Optional[ProgressReporter] = None,
+    population_backend: Optional[PopulationBackend] = None,
+    isochrone_reuse: Optional[IsochroneReuse] = None
+) -> List[FacilityResult]:
+    """
+    Run process_facility() for every facility on a bounded pool of worker threads.
+
+    Each worker sleeps config.sleep_between_requests after its own requests and
+    facilities, so the request rate per worker is unchanged.
+
+    Args:
+        df: Facilities to process
+        ors_client: OpenRouteService client or ORSBackendPool (shared by the workers)
+        config: Configuration snapshot (Config.snapshot())
+        workers: Facilities processed at once
+        progress: Progress reporter notified of each facility and range result
+        population_backend: Population backend (default from config population.backend)
+        isochrone_reuse: Approximate mode: reuse isochrones of nearby facilities
+
+    Returns:
+        FacilityResults of the facilities that succeeded, in input order
+    """
+    total = len(df)
+
+    def run(facility_num: int, row: pd.Series) -> Optional[FacilityResult]:
+        result = process_facility(row, df, ors_client, config, facility_num=facility_num, total=total,
+                                  progress=progress, population_backend=population_backend,
+                                  isochrone_reuse=isochrone_reuse)
+        if progress is not None:
+            progress.item_done(result is not None)
+        # Sleep between requests to be nice to the server
+        with metrics.timer('sleep'):
+            time.sleep(config.sleep_between_requests)
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='facility')
+    try:
+        futures = [executor.submit(run, idx, row) for idx, (_, row) in enumerate(df.iterrows(), 1)]
+        return [result for result in (future.result() for future in futures) if result]
+    finally:
+        # Interrupted runs drop the facilities not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def main():
     """Main execution function."""
-    config = get_config()
+    config = get_config().snapshot()
     logger.info("Starting isochrone population analysis")
     
     try:
-        # 1. Initialize GEE
-        logger.info("Initializing Google Earth Engine...")
-        initialize_gee()
+        # 1. Initialize the population backend (GEE only when it is used)
+        if config.population_backend == 'gee':
+            logger.info("Initializing Google Earth Engine...")
+            with metrics.timer('gee_init'):
+                initialize_gee()
+        population_backend = get_population_backend(config)
         
         # 2. Load and filter data
         logger.info("Loading facility data...")
         try:
-            df = load_and_filter_data(config.input_file, config.target_levels)
+            with metrics.timer('load_data'):
+                df = load_and_filter_data(config.input_file, config.target_levels)
         except (FileNotFoundError, ValueError) as e:
             logger.error(f"Data loading error: {e}", exc_info=True)
             return
@@ -632,89 +1005,86 @@ def main():
         df = df.sample(frac=0.3, random_state=42)
         logger.info(f"Randomly sampled 30% of facilities: {len(df)} out of {original_count} facilities")
         
-        # 3. Initialize ORS client
-        logger.info(f"Connecting to ORS at {config.ors_base_url}...")
+        # 3. Initialize ORS client (the offline engine needs no server)
+        if config.ors_engine == 'offline':
+            logger.info(f"Using the offline isochrone engine on {config.road_graph_file}")
+        elif len(config.ors_base_urls) > 1:
+            # Several backends: the pool's check_all() below decides whether any of them can serve
+            logger.info(f"Connecting to {len(config.ors_base_urls)} ORS backends...")
+        else:
+            logger.info(f"Connecting to ORS at {config.ors_base_url}...")
         
-        # Pre-flight connection check
-        try:
-            import requests
-            health_response = requests.get(config.ors_health_url, timeout=5)
-            if health_response.status_code != 200:
-                logger.warning(f"ORS health check returned status {health_response.status_code}")
-                logger.warning("Continuing anyway, but connection may fail...")
-        except requests.exceptions.ConnectionError:
-            logger.error("Cannot connect to ORS server!")
-            logger.error("")
-            logger.error("Troubleshooting:")
-            logger.error("  1. Get current GCP instance IP: python get_gcp_ors_ip.py")
-            logger.error("  2. Update config: python get_gcp_ors_ip.py --update-config")
-            logger.error("  3. Check instance status: python check_ors.py")
-            logger.error("")
-            raise ConnectionError(
-                f"Cannot connect to ORS server at {config.ors_base_url}. "
-                f"Please verify the server is running and the IP address is correct. "
-                f"Run 'python get_gcp_ors_ip.py' to get the current GCP instance IP."
-            )
-        except Exception as e:
-            logger.warning(f"Pre-flight check failed: {e}, continuing anyway...")
+            # Pre-flight connection check
+            try:
+                import requests
+                health_response = requests.get(config.ors_health_url, timeout=5)
+                if health_response.status_code != 200:
+                    logger.warning(f"ORS health check returned status {health_response.status_code}")
+                    logger.warning("Continuing anyway, but connection may fail...")
+            except requests.exceptions.ConnectionError:
+                logger.error("Cannot connect to ORS server!")
+                logger.error("")
+                logger.error("Troubleshooting:")
+                logger.error("  1. Get current GCP instance IP: python get_gcp_ors_ip.py")
+                logger.error("  2. Update config: python get_gcp_ors_ip.py --update-config")
+                logger.error("  3. Check instance status: python check_ors.py")
+                logger.error("  4. Or run without the server: set ors.engine to offline (see road_graph.py)")
+                logger.error("")
+                raise ConnectionError(
+                    f"Cannot connect to ORS server at {config.ors_base_url}. "
+                    f"Please verify the server is running and the IP address is correct. "
+                    f"Run 'python get_gcp_ors_ip.py' to get the current GCP instance IP."
+                )
+            except Exception as e:
+                logger.warning(f"Pre-flight check failed: {e}, continuing anyway...")
         
-        ors_client = openrouteservice.Client(
-            key=config.ors_api_key,
-            base_url=config.ors_base_url
-        )
+        ors_client = create_ors_client(config)
+        if isinstance(ors_client, ORSBackendPool):
+            logger.info("Checking ORS backends...")
+            if ors_client.check_all() == 0:
+                raise ConnectionError(
+                    f"None of the configured ORS backends are ready: {', '.join(config.ors_base_urls)}"
+                )
         
         # 4. Process facilities
-        results = []
         total = len(df)
         logger.info(f"Processing {total} facilities...")
-        print(f"\n{'='*70}")
-        print(f"Processing {total} facilities...")
-        print(f"{'='*70}\n")
         
-        for idx, (index, row) in enumerate(df.iterrows(), 1):
-            # Calculate progress
-            progress_pct = (idx / total) * 100
-            print(f"[{idx}/{total}] ({progress_pct:.1f}%) Processing facility {idx}...")
-            
-            result = process_facility(row, df, ors_client, config, facility_num=idx, total=total)
-            
-            if result:
-                results.append(result)
-                print(f"  [SUCCESS] Successfully processed: {result.get('name', 'Unknown')}\n")
-            else:
-                print(f"  [FAILED] Failed to process facility {idx}\n")
-            
-            # Sleep between requests to be nice to the server
-            time.sleep(config.sleep_between_requests)
+        isochrone_reuse = None
+        if config.isochrone_reuse_enabled:
+            isochrone_reuse = IsochroneReuse(config.isochrone_reuse_radius_m, config.isochrone_reuse_validate_every)
+            logger.info(f"Approximate mode: reusing isochrones of facilities within {config.isochrone_reuse_radius_m:.0f} m")
+        
+        # One facility in flight per ORS backend, so each added container adds throughput
+        workers = 1 if config.ors_engine == 'offline' else len(config.ors_base_urls)
+        if workers > 1:
+            logger.info(f"Processing facilities on {workers} workers, one per ORS backend")
+        with ProgressReporter(total) as progress:
+            results = process_facilities(df, ors_client, config, workers=workers, progress=progress,
+                                         population_backend=population_backend, isochrone_reuse=isochrone_reuse)
         
-        print(f"\n{'='*70}")
-        print(f"Processing complete: {len(results)} out of {total} facilities successfully processed")
-        print(f"{'='*70}\n")
         logger.info(f"Successfully processed {len(results)} out of {total} facilities")
+        if isochrone_reuse is not None:
+            logger.info(isochrone_reuse.report())
+        if isinstance(ors_client, ORSBackendPool):
+            for stats in ors_client.stats():
+                logger.info(f"ORS backend stats: {stats}")
         
         # 5. Save results
         if results:
-            # Prepare DataFrame for CSV (exclude isochrone data)
-            csv_data = []
-            for result in results:
-                csv_row = {k: v for k, v in result.items() 
-                          if k not in ['isochrones', 'isochrone', 'isochrone_geojson']}
-                
-                # Add population columns for each time range
-                populations = result.get('populations', {})
-                for range_min in sorted(populations.keys()):
-                    csv_row[f'population_{range_min}min'] = populations[range_min]
-                
-                csv_data.append(csv_row)
-            
-            result_df = pd.DataFrame(csv_data)
-            result_df.to_csv(config.output_csv, index=False)
-            logger.info(f"Saved results to {config.output_csv}")
+            write_results_csv(results, config.output_csv)
             
             # Create and save map
-            m = create_map(results, config)
-            m.save(config.output_map)
+            with metrics.timer('map_build'):
+                m = build_map(results, config)
+            with metrics.timer('map_save'):
+                save_map(m, config.output_map, config)
             logger.info(f"Saved map to {config.output_map}")
+            if config.output_image:
+                try:
+                    save_static_map(results, config.output_image, config, border_colors=BORDER_COLORS)
+                except ValueError as e:
+                    logger.error(f"Static map not written: {e}")
         else:
             logger.warning("No results to save")
     
@@ -723,7 +1093,17 @@ def main():
     except Exception as e:
         logger.error(f"Unexpected error in main: {e}", exc_info=True)
         raise
+    finally:
+        log_population_cache_report()
+        finish_run('analyze_population', config)
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description='Isochrone population analysis for health facilities')
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, parse_args(), 'analyze_population')
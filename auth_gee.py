@@ -1,7 +1,9 @@
 """Google Earth Engine authentication utility."""
-import ee
+from lazy_import import lazy_import
 from logger import get_logger
 
+ee = lazy_import('ee')
+
 logger = get_logger(__name__)
 
 
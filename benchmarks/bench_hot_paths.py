@@ -0,0 +1,323 @@
+"""
+Benchmark suite for the analysis hot paths.
+
+Times load_and_filter_data, process_facility (with stubbed ORS and
+population backends), map building and rendering (create_map) and the
+results CSV writing from main() on synthetic facility tables of 100 to
+50,000 rows, records throughput and peak memory to a JSON baseline, and
+fails when a change regresses beyond a threshold.
+
+Usage (from the project root):
+    python -m benchmarks.bench_hot_paths --save-baseline   # record a baseline
+    python -m benchmarks.bench_hot_paths                   # compare against it
+    python -m benchmarks.bench_hot_paths --quick           # small sizes only
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import analyze_population  # noqa: E402
+from config import get_config  # noqa: E402
+from ors_standin import synthetic_isochrone_feature  # noqa: E402
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+QUICK_SIZES = [100, 1000]
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+
+# Kenya bounding box for synthetic facilities
+KENYA_LAT = (-4.5, 4.5)
+KENYA_LON = (34.0, 41.5)
+LEVELS = ['Level 2', 'Level 3', 'Level 4', 'Level 5', 'Level 6']
+
+
+def make_facility_table(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Build a synthetic facility table shaped like the KMHFR export.
+    About 1% of rows have swapped lat/lon columns, as in the real file.
+    """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(*KENYA_LAT, rows)
+    lon = rng.uniform(*KENYA_LON, rows)
+    swapped = rng.random(rows) < 0.01
+    lat[swapped], lon[swapped] = lon[swapped], lat[swapped].copy()
+    return pd.DataFrame({
+        'code': np.arange(10000, 10000 + rows),
+        'Facility Name': [f"Synthetic Facility {i}" for i in range(rows)],
+        'Latitude': lat,
+        'Longitude': lon,
+        'keph_level_name': rng.choice(LEVELS, rows),
+        'County': rng.choice(['Nairobi', 'Kakamega', 'Wajir', 'Meru', 'Kisumu', 'Mombasa'], rows),
+        'Owner': rng.choice(['Ministry of Health', 'Private Practice', 'Faith Based'], rows),
+        'Beds': rng.integers(0, 400, rows),
+    })
+
+
+class StubORSClient:
+    """
+    In-process ORS client returning synthetic isochrones with realistic vertex counts.
+    Response bodies are memoized as JSON text and parsed on every call, like the
+    real client, so timed runs measure the pipeline rather than polygon generation.
+    """
+
+    def __init__(self):
+        self._responses: Dict[tuple, str] = {}
+
+    def isochrones(self, locations, profile='driving-car', range=None, attributes=None, **kwargs):
+        lon, lat = locations[0]
+        key = (lon, lat, tuple(range))
+        if key not in self._responses:
+            self._responses[key] = json.dumps({
+                "type": "FeatureCollection",
+                "features": [synthetic_isochrone_feature(lon, lat, r) for r in range],
+            })
+        return json.loads(self._responses[key])
+
+
+class StubPopulationBackend:
+    """Population backend returning a constant, so timings exclude population lookups."""
+
+    name = 'stub'
+
+    def population(self, feature) -> float:
+        return 12345.0
+
+    def populations(self, features) -> List[float]:
+        return [12345.0] * len(features)
+
+
+def measure(fn: Callable[[], Any], items: int, repeat: int = 3, measure_memory: bool = True) -> Dict[str, float]:
+    """
+    Time fn (best of ``repeat`` runs) and, separately, its peak traced memory.
+
+    Returns:
+        Dictionary with seconds, throughput (items/s), peak_mb and items
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = None
+    if measure_memory:
+        # Traced separately: tracemalloc slows execution and would skew timings
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = peak / (1024 * 1024)
+
+    return {
+        'items': items,
+        'seconds': best,
+        'throughput': items / best if best > 0 else float('inf'),
+        'peak_mb': peak_mb,
+    }
+
+
+def run_benchmarks(
+    sizes: List[int],
+    process_sample: int = 200,
+    map_sample: int = 300,
+    repeat: int = 3,
+    measure_memory: bool = True,
+    work_dir: Optional[Path] = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Run every hot-path benchmark for each table size.
+
+    Args:
+        sizes: Facility table sizes (rows)
+        process_sample: Facilities per size passed through process_facility
+        map_sample: Facility results per size rendered by create_map
+        repeat: Timing repetitions (best is kept)
+        measure_memory: Also record peak memory with tracemalloc
+        work_dir: Directory for generated inputs/outputs (default: temporary)
+
+    Returns:
+        Mapping of benchmark name ("stage[rows]") to measurements
+    """
+    # Per-facility progress output and INFO logging would swamp the report;
+    # send stdout to /dev/null (still paying for the writes) and drop INFO records
+    logging.disable(logging.INFO)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return _run(sizes, process_sample, map_sample, repeat, measure_memory, work_dir)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _run(sizes, process_sample, map_sample, repeat, measure_memory, work_dir):
+    """Body of run_benchmarks(), executed with progress output silenced."""
+    # Real configuration with request pacing disabled
+    config = get_config().snapshot()._replace(sleep_between_requests=0.0)
+    client = StubORSClient()
+    backend = StubPopulationBackend()
+    results: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(work_dir or tmp)
+        for rows in sizes:
+            table = make_facility_table(rows)
+            excel_path = work_dir / f"facilities_{rows}.xlsx"
+            table.to_excel(excel_path, index=False)
+
+            name = f"load_and_filter_data[{rows}]"
+            results[name] = measure(
+                lambda: analyze_population.load_and_filter_data(str(excel_path), ['4', '5', '6']),
+                rows, repeat, measure_memory
+            )
+            _report(name, results[name])
+
+            df = analyze_population.load_and_filter_data(str(excel_path), ['4', '5', '6'])
+            sample = df.head(process_sample)
+
+            def process_all():
+                return [analyze_population.process_facility(row, df, client, config,
+                                                            population_backend=backend)
+                        for _, row in sample.iterrows()]
+
+            # Warm-up run fills the stub's response cache
+            facility_results = [r for r in process_all() if r]
+
+            name = f"process_facility[{rows}]"
+            results[name] = measure(process_all, len(sample), repeat, measure_memory)
+            _report(name, results[name])
+
+            map_results = facility_results[:map_sample]
+            name = f"create_map[{rows}]"
+            results[name] = measure(
+                lambda: analyze_population.build_map(map_results, config).render(),
+                len(map_results), max(1, repeat - 1), measure_memory
+            )
+            _report(name, results[name])
+
+            # The CSV holds one row per processed facility; reuse sampled results to reach full size
+            csv_results = (facility_results * (rows // max(len(facility_results), 1) + 1))[:rows]
+            csv_path = work_dir / f"results_{rows}.csv"
+            name = f"write_results_csv[{rows}]"
+            results[name] = measure(
+                lambda: analyze_population.write_results_csv(csv_results, str(csv_path)),
+                len(csv_results), repeat, measure_memory
+            )
+            _report(name, results[name])
+
+    return results
+
+
+def _report(name: str, m: Dict[str, float]):
+    """Print one benchmark line to the real stdout."""
+    peak = f"{m['peak_mb']:8.1f} MB" if m.get('peak_mb') is not None else "       - MB"
+    print(f"  {name:<32} {m['seconds']:9.3f}s {m['throughput']:12.1f}/s  peak {peak}",
+          file=sys.__stdout__, flush=True)
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """
+    Compare results against a baseline.
+
+    Returns:
+        Human-readable descriptions of every regression beyond threshold
+        (slower time or higher peak memory); empty if none
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous['seconds'] > 0 and current['seconds'] > previous['seconds'] * (1 + threshold):
+            regressions.append(
+                f"{name}: time {previous['seconds']:.3f}s -> {current['seconds']:.3f}s "
+                f"(+{(current['seconds'] / previous['seconds'] - 1) * 100:.0f}%)"
+            )
+        prev_mem, cur_mem = previous.get('peak_mb'), current.get('peak_mb')
+        if prev_mem and cur_mem is not None and cur_mem > prev_mem * (1 + threshold):
+            regressions.append(
+                f"{name}: peak memory {prev_mem:.1f}MB -> {cur_mem:.1f}MB "
+                f"(+{(cur_mem / prev_mem - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    """Main function for command-line usage. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description='Benchmark the analysis hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help=f'Facility table sizes (default: {DEFAULT_SIZES})')
+    parser.add_argument('--quick', action='store_true', help=f'Only run sizes {QUICK_SIZES}')
+    parser.add_argument('--process-sample', type=int, default=200,
+                        help='Facilities per size run through process_facility (default: 200)')
+    parser.add_argument('--map-sample', type=int, default=300,
+                        help='Facility results per size rendered by create_map (default: 300)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions, best kept (default: 3)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip peak memory measurement')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Allowed regression as a fraction (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--output', help='Also write this run\'s results to a JSON file')
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    print(f"Running hot-path benchmarks for sizes {sizes}...")
+    results = run_benchmarks(sizes, args.process_sample, args.map_sample, args.repeat, not args.no_memory)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': sizes,
+        },
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text()).get('results', {})
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nOK: no regressions beyond {args.threshold * 100:.0f}% against {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
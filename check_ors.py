@@ -1,9 +1,28 @@
-"""OpenRouteService health check and connectivity test utility."""
-import requests
+"""
+OpenRouteService health check, connectivity test and load test utility.
+
+Usage:
+    python check_ors.py                  # health check + one test isochrone
+    python check_ors.py --health-only    # wait until /v2/health reports ready
+    python check_ors.py --load-test      # ramp concurrent isochrone requests, report throughput and latency
+    python check_ors.py --load-test --concurrency 1,4,16,32 --requests 100 --ranges 900,1800
+"""
+import argparse
+import csv
+import random
+import threading
 import time
-import openrouteservice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
 from config import get_config
+from lazy_import import lazy_import
 from logger import get_logger
+from metrics import percentile
+from ors_pool import health_url_for
+
+requests = lazy_import('requests')
+openrouteservice = lazy_import('openrouteservice')
 
 logger = get_logger(__name__)
 
@@ -132,7 +151,15 @@ def test_ors_comprehensive():
     # Test 1: Health Check
     logger.info("Test 1: Health Check")
     logger.info("-" * 60)
-    health_ok = check_ors_health(max_attempts=1)  # Just check once, don't wait
+    base_urls = config.ors_base_urls
+    if len(base_urls) > 1:
+        # Multiple backends: check each one, pass if any is ready
+        logger.info(f"Checking {len(base_urls)} ORS backends...")
+        health_ok = False
+        for url in base_urls:
+            health_ok = check_ors_health(health_url_for(url), max_attempts=1) or health_ok
+    else:
+        health_ok = check_ors_health(max_attempts=1)  # Just check once, don't wait
     
     if not health_ok:
         logger.warning("Health check failed - ORS may still be initializing")
@@ -183,11 +210,241 @@ def test_ors_comprehensive():
         return False
 
 
+class LoadLevel(NamedTuple):
+    """Results of one concurrency level of a load test (latencies of successful requests, in seconds)."""
+    concurrency: int
+    requests: int
+    errors: int
+    seconds: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+    @property
+    def throughput(self) -> float:
+        """Successful requests per second."""
+        return (self.requests - self.errors) / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+def sample_locations(facilities, n: int, seed: int = 0) -> List[List[float]]:
+    """
+    Pick random facility coordinates to request isochrones for.
+
+    Args:
+        facilities: DataFrame with 'lat' and 'lon' columns (extract_facility_locations output)
+        n: Number of locations (all facilities if there are fewer)
+        seed: Random seed, so repeated runs request the same places
+
+    Returns:
+        [lon, lat] pairs, as ORS expects them
+    """
+    rows = list(zip(facilities['lon'], facilities['lat']))
+    picked = random.Random(seed).sample(rows, min(n, len(rows)))
+    return [[float(lon), float(lat)] for lon, lat in picked]
+
+
+def run_load_level(
+    client_factory: Callable[[], object],
+    locations: Sequence[List[float]],
+    ranges: Sequence[int],
+    concurrency: int,
+    num_requests: int,
+    profile: str = 'driving-car'
+) -> LoadLevel:
+    """
+    Send num_requests isochrone requests from `concurrency` threads, each with its own client.
+
+    Like process_facility, every request asks for a single range (ORS v8.1.0 allows
+    one isochrone per request). Requests cycle through the (location, range) pairs,
+    so every level requests the same isochrones. A request fails when it raises or
+    returns no features.
+
+    Args:
+        client_factory: Returns a new ORS client (called once per worker thread)
+        locations: [lon, lat] pairs
+        ranges: Isochrone ranges in seconds, one per request
+        concurrency: Number of requests in flight at once
+        num_requests: Requests sent at this level
+        profile: ORS routing profile
+
+    Returns:
+        LoadLevel
+    """
+    pairs = [(location, range_sec) for location in locations for range_sec in ranges]
+    local = threading.local()
+    latencies: List[float] = []
+    errors = []
+    lock = threading.Lock()
+
+    def request(i: int):
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        start = time.perf_counter()
+        try:
+            location, range_sec = pairs[i % len(pairs)]
+            result = local.client.isochrones(locations=[location], profile=profile, range=[range_sec])
+            ok = bool(result and result.get('features'))
+        except Exception as e:
+            logger.debug(f"Load test request {i} failed: {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            (latencies if ok else errors).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, range(num_requests)))
+    seconds = time.perf_counter() - start
+    return LoadLevel(concurrency, num_requests, len(errors), seconds, percentile(latencies, 0.5),
+                     percentile(latencies, 0.9), percentile(latencies, 0.99), max(latencies, default=0.0))
+
+
+def run_load_test(
+    client_factory: Callable[[], object],
+    locations: Sequence[List[float]],
+    ranges: Sequence[int],
+    levels: Sequence[int],
+    requests_per_level: int,
+    max_error_rate: float = 0.5,
+    profile: str = 'driving-car'
+) -> List[LoadLevel]:
+    """
+    Ramp through increasing concurrency levels, stopping once the server is saturated with errors.
+
+    Args:
+        client_factory: Returns a new ORS client
+        locations: [lon, lat] pairs
+        ranges: Isochrone ranges in seconds, one per request
+        levels: Concurrency levels, run in increasing order
+        requests_per_level: Requests sent at each level (at least one per worker)
+        max_error_rate: Stop the ramp after a level with a higher error rate
+        profile: ORS routing profile
+
+    Returns:
+        LoadLevel per level run
+    """
+    results = []
+    for concurrency in sorted(levels):
+        level = run_load_level(client_factory, locations, ranges, concurrency,
+                               max(requests_per_level, concurrency), profile)
+        logger.info(f"Concurrency {concurrency:3d}: {level.throughput:6.2f} req/s, p50 {level.p50:.2f}s, "
+                    f"p90 {level.p90:.2f}s, p99 {level.p99:.2f}s, errors {level.error_rate:.0%}")
+        results.append(level)
+        if level.error_rate > max_error_rate:
+            logger.warning(f"Stopping the ramp: {level.error_rate:.0%} of requests failed at "
+                           f"concurrency {concurrency}")
+            break
+    return results
+
+
+def saturation_point(results: List[LoadLevel], gain: float = 1.1) -> Optional[LoadLevel]:
+    """
+    Lowest concurrency level after which more workers stop paying off.
+
+    That is the first level whose throughput the next level does not raise by at least `gain`
+    (10% by default), or the highest level when throughput kept rising. Levels with errors
+    are not recommended.
+
+    Returns:
+        The level, or None if every level had errors
+    """
+    clean = [r for r in results if r.errors == 0]
+    for level, following in zip(clean, clean[1:]):
+        if following.throughput < level.throughput * gain:
+            return level
+    return clean[-1] if clean else None
+
+
+def format_load_report(results: List[LoadLevel]) -> str:
+    """Table of the load test levels and the recommended concurrency."""
+    lines = [f"{'workers':>7} {'requests':>8} {'req/s':>7} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'max s':>7} "
+             f"{'errors':>7}"]
+    for r in results:
+        lines.append(f"{r.concurrency:7d} {r.requests:8d} {r.throughput:7.2f} {r.p50:7.2f} {r.p90:7.2f} "
+                     f"{r.p99:7.2f} {r.max:7.2f} {r.error_rate:7.1%}")
+    best = saturation_point(results)
+    if best is None:
+        lines.append("Every level had errors; check the server before sizing workers")
+    elif best is results[-1] and len(results) > 1:
+        lines.append(f"Throughput still rising at {best.concurrency} concurrent requests "
+                     f"({best.throughput:.2f} req/s); try higher levels")
+    else:
+        lines.append(f"Throughput stops scaling at {best.concurrency} concurrent requests "
+                     f"({best.throughput:.2f} req/s, p90 {best.p90:.2f}s)")
+    return "\n".join(lines)
+
+
+def write_load_report(results: List[LoadLevel], path: str):
+    """Write the load test levels as CSV."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['concurrency', 'requests', 'errors', 'error_rate', 'seconds', 'throughput',
+                         'p50_s', 'p90_s', 'p99_s', 'max_s'])
+        for r in results:
+            writer.writerow([r.concurrency, r.requests, r.errors, round(r.error_rate, 4), round(r.seconds, 3),
+                             round(r.throughput, 3), round(r.p50, 3), round(r.p90, 3), round(r.p99, 3),
+                             round(r.max, 3)])
+
+
+def load_test_main(args) -> bool:
+    """Run the --load-test mode against the configured (or --url) ORS server."""
+    from analyze_population import extract_facility_locations, load_and_filter_data
+    config = get_config().snapshot()
+    base_url = args.url or config.ors_base_url
+    ranges = [int(r) for r in args.ranges.split(',')] if args.ranges else list(config.range_seconds)
+    levels = [int(c) for c in args.concurrency.split(',')] if args.concurrency else list(config.ors_load_test_levels)
+
+    try:
+        facilities = extract_facility_locations(load_and_filter_data(config.input_file, config.target_levels))
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Could not load sample facilities: {e}")
+        return False
+    locations = sample_locations(facilities, args.samples)
+    if not locations:
+        logger.error(f"No facilities with valid coordinates in {config.input_file}")
+        return False
+
+    logger.info(f"Load testing {base_url}: {len(locations)} facility locations, ranges {ranges} s, "
+                f"concurrency {levels}, {args.requests} requests per level")
+
+    def client_factory():
+        # Failed and rate-limited requests are reported, not retried
+        return openrouteservice.Client(key=config.ors_api_key, base_url=base_url, timeout=config.ors_timeout,
+                                       retry_over_query_limit=False)
+
+    results = run_load_test(client_factory, locations, ranges, levels, args.requests)
+    logger.info("\n" + format_load_report(results))
+    if args.output:
+        write_load_report(results, args.output)
+        logger.info(f"Saved load test results to {args.output}")
+    return saturation_point(results) is not None
+
+
 if __name__ == "__main__":
     import sys
     
-    # Check if user wants just health check or full test
-    if len(sys.argv) > 1 and sys.argv[1] == "--health-only":
+    parser = argparse.ArgumentParser(description='OpenRouteService health, connectivity and load tests')
+    parser.add_argument('--health-only', action='store_true', help='Only wait until /v2/health reports ready')
+    parser.add_argument('--load-test', action='store_true',
+                        help='Ramp concurrent isochrone requests and report throughput and latency per level')
+    parser.add_argument('--concurrency', help='Load test: comma-separated concurrency levels '
+                                              '(default: ors.load_test_levels)')
+    parser.add_argument('--requests', type=int, default=get_config().ors_load_test_requests,
+                        help='Load test: requests per concurrency level (default: ors.load_test_requests)')
+    parser.add_argument('--ranges', help='Load test: comma-separated isochrone ranges in seconds, one per request '
+                                         '(default: analysis.range_seconds)')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='Load test: facility locations sampled from the input file (default: 100)')
+    parser.add_argument('--url', help='Load test: ORS base URL (default: ors.base_url)')
+    parser.add_argument('--output', help='Load test: write the results to this CSV file')
+    args = parser.parse_args()
+    
+    if args.health_only:
         try:
             check_ors_health()
         except KeyboardInterrupt:
@@ -195,6 +452,13 @@ if __name__ == "__main__":
         except Exception as e:
             logger.error(f"Health check failed: {e}", exc_info=True)
             sys.exit(1)
+    elif args.load_test:
+        try:
+            success = load_test_main(args)
+        except KeyboardInterrupt:
+            logger.info("Load test interrupted by user")
+            success = False
+        sys.exit(0 if success else 1)
     else:
         # Run comprehensive test
         success = test_ors_comprehensive()
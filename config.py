@@ -5,7 +5,7 @@ Loads configuration from config.yaml with environment variable overrides.
 import os
 import yaml
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, NamedTuple, Optional, Tuple
 
 # Get project root directory
 PROJECT_ROOT = Path(__file__).parent.absolute()
@@ -85,6 +85,97 @@ def _apply_env_overrides(config: Dict[str, Any], prefix: str = "") -> Dict[str,
     return result
 
 
+class ConfigSnapshot(NamedTuple):
+    """
+    Immutable, resolved view of the configuration for hot loops.
+    
+    Field names match the Config properties, so a snapshot can be passed
+    wherever a config object is read by attribute. Attribute access is a plain
+    tuple lookup (no dotted-path walk), and the snapshot pickles as a tuple of
+    primitives for process-pool workers. Lists are converted to tuples;
+    map_isochrone_colors stays a dict and must not be modified.
+    """
+    ors_base_url: str
+    ors_base_urls: Tuple[str, ...]
+    ors_failure_threshold: int
+    ors_readmit_interval: float
+    ors_engine: str
+    ors_health_url: str
+    ors_api_key: str
+    ors_timeout: int
+    ors_load_test_levels: tuple
+    ors_load_test_requests: int
+    ors_retry_attempts: int
+    ors_retry_delay: float
+    input_file: str
+    output_csv: str
+    output_map: str
+    population_grid_file: str
+    matrix_output_raster: str
+    matrix_output_table: str
+    matrix_output_catchments: str
+    coverage_state_file: str
+    osm_pbf_file: str
+    road_graph_file: str
+    offline_cell_m: float
+    offline_max_snap_m: float
+    range_seconds: Tuple[int, ...]
+    target_levels: Tuple[str, ...]
+    sleep_between_requests: float
+    isochrone_reuse_enabled: bool
+    isochrone_reuse_radius_m: float
+    isochrone_reuse_validate_every: int
+    siting_candidate_levels: Tuple[str, ...]
+    siting_k: int
+    siting_range_seconds: int
+    siting_isochrones_file: str
+    siting_output_table: str
+    siting_output_layer: str
+    siting_output_map: str
+    matrix_k_nearest: int
+    matrix_maximum_routes: int
+    matrix_prefilter_km: float
+    matrix_max_minutes: int
+    matrix_grid_scale: int
+    matrix_min_cell_population: float
+    matrix_engine: str
+    matrix_offroad_kmh: float
+    matrix_max_offroad_m: float
+    gee_dataset: str
+    gee_scale: int
+    gee_max_pixels: int
+    population_backend: str
+    population_raster_file: str
+    population_h3_index_file: str
+    population_h3_resolution: int
+    population_cache_file: str
+    log_level: str
+    log_file: str
+    log_console_level: str
+    log_file_level: str
+    log_format: str
+    log_date_format: str
+    log_json_file: Optional[str]
+    progress_refresh_interval: float
+    progress_log_interval: float
+    metrics_enabled: bool
+    metrics_output_dir: str
+    map_center_lat: float
+    map_center_lon: float
+    map_zoom_start: int
+    map_isochrone_color: str
+    map_isochrone_colors: Dict[int, str]
+    map_isochrone_opacity: float
+    map_renderer: str
+    map_sidecars: bool
+    map_sidecar_split: str
+    map_sidecar_gzip: bool
+    map_facility_layer: str
+    map_cluster_threshold: int
+    map_image_resolution: float
+    map_image_point_radius: int
+
+
 class Config:
     """Configuration class that loads from YAML and environment variables."""
     
@@ -93,15 +184,39 @@ class Config:
         self._config = _load_yaml_config(config_path)
         self._config = _apply_env_overrides(self._config)
         self._resolve_paths()
+        self._snapshot: Optional[ConfigSnapshot] = None
+    
+    def snapshot(self) -> ConfigSnapshot:
+        """
+        Get an immutable snapshot of all settings, built once and cached.
+        
+        Returns:
+            ConfigSnapshot with every property resolved
+        """
+        if self._snapshot is None:
+            values = {name: getattr(self, name) for name in ConfigSnapshot._fields}
+            values['ors_base_urls'] = tuple(values['ors_base_urls'])
+            values['range_seconds'] = tuple(int(r) for r in values['range_seconds'])
+            values['target_levels'] = tuple(str(level) for level in values['target_levels'])
+            values['siting_candidate_levels'] = tuple(str(level) for level in values['siting_candidate_levels'])
+            values['ors_load_test_levels'] = tuple(int(level) for level in values['ors_load_test_levels'])
+            self._snapshot = ConfigSnapshot(**values)
+        return self._snapshot
     
     def _resolve_paths(self):
         """Resolve all file paths in the configuration."""
         if 'files' in self._config:
-            for key in ['input_file', 'output_csv', 'output_map']:
-                if key in self._config['files']:
+            for key in ['input_file', 'output_csv', 'output_map', 'population_grid',
+                        'matrix_raster', 'matrix_table', 'catchment_table', 'coverage_state',
+                        'osm_pbf', 'road_graph', 'siting_isochrones', 'siting_table', 'siting_layer',
+                        'siting_map', 'output_image']:
+                if self._config['files'].get(key):
                     resolved_path = _resolve_path(self._config['files'][key])
                     # Create output directories if they don't exist
-                    if key in ['output_csv', 'output_map']:
+                    if key in ['output_csv', 'output_map', 'population_grid',
+                               'matrix_raster', 'matrix_table', 'catchment_table', 'coverage_state',
+                               'road_graph', 'siting_isochrones', 'siting_table', 'siting_layer',
+                               'siting_map', 'output_image']:
                         resolved_path.parent.mkdir(parents=True, exist_ok=True)
                     self._config['files'][key] = str(resolved_path)
         
@@ -110,6 +225,16 @@ class Config:
             # Create logs directory if it doesn't exist
             log_file.parent.mkdir(parents=True, exist_ok=True)
             self._config['logging']['file'] = str(log_file)
+        
+        for key in ['raster_file', 'h3_index_file', 'cache_file']:
+            if self._config.get('population', {}).get(key):
+                self._config['population'][key] = str(_resolve_path(self._config['population'][key]))
+        
+        if self._config.get('logging', {}).get('json_file'):
+            self._config['logging']['json_file'] = str(_resolve_path(self._config['logging']['json_file']))
+        
+        if self._config.get('metrics', {}).get('output_dir'):
+            self._config['metrics']['output_dir'] = str(_resolve_path(self._config['metrics']['output_dir']))
     
     def get(self, key_path: str, default: Any = None) -> Any:
         """
@@ -131,6 +256,32 @@ class Config:
         """Get ORS base URL."""
         return self.get('ors.base_url', 'http://localhost:8080/ors')
     
+    @property
+    def ors_base_urls(self) -> list:
+        """
+        Get list of ORS backend base URLs.
+        Falls back to the single ors.base_url when ors.base_urls is empty.
+        """
+        urls = self.get('ors.base_urls') or []
+        if isinstance(urls, str):
+            urls = [u.strip() for u in urls.split(',') if u.strip()]
+        return list(urls) if urls else [self.ors_base_url]
+    
+    @property
+    def ors_failure_threshold(self) -> int:
+        """Get consecutive failures before an ORS backend is taken out of rotation."""
+        return self.get('ors.failure_threshold', 3)
+    
+    @property
+    def ors_readmit_interval(self) -> float:
+        """Get seconds between health checks of an out-of-rotation ORS backend."""
+        return self.get('ors.readmit_interval', 30.0)
+    
+    @property
+    def ors_engine(self) -> str:
+        """Get isochrone engine: server (ORS HTTP API) or offline (local road graph)."""
+        return self.get('ors.engine', 'server')
+    
     @property
     def ors_health_url(self) -> str:
         """Get ORS health check URL."""
@@ -146,6 +297,16 @@ class Config:
         """Get ORS request timeout in seconds."""
         return self.get('ors.timeout', 30)
     
+    @property
+    def ors_load_test_levels(self) -> list:
+        """Get concurrency levels ramped through by check_ors.py --load-test."""
+        return self.get('ors.load_test_levels', [1, 2, 4, 8, 16])
+    
+    @property
+    def ors_load_test_requests(self) -> int:
+        """Get isochrone requests sent at each load test concurrency level."""
+        return int(self.get('ors.load_test_requests', 50))
+    
     @property
     def ors_retry_attempts(self) -> int:
         """Get number of retry attempts for ORS requests."""
@@ -171,6 +332,56 @@ class Config:
         """Get output map HTML file path."""
         return self.get('files.output_map', 'isochrone_map.html')
     
+    @property
+    def output_image(self) -> str:
+        """Get static map image path (.png or .tif GeoTIFF); empty to skip it."""
+        return self.get('files.output_image', '')
+    
+    @property
+    def population_grid_file(self) -> str:
+        """Get local population grid (.npz) path; fetched from GEE and saved here if missing."""
+        return self.get('files.population_grid', '')
+    
+    @property
+    def matrix_output_raster(self) -> str:
+        """Get travel-time raster output path for the matrix analysis mode."""
+        return self.get('files.matrix_raster', 'json/travel_time_raster.npz')
+    
+    @property
+    def matrix_output_table(self) -> str:
+        """Get population-by-minute table output path for the matrix analysis mode."""
+        return self.get('files.matrix_table', 'json/population_by_minute.csv')
+    
+    @property
+    def matrix_output_catchments(self) -> str:
+        """Get per-facility catchment table output path for the matrix analysis mode."""
+        return self.get('files.catchment_table', 'json/catchments.csv')
+    
+    @property
+    def coverage_state_file(self) -> str:
+        """Get stored coverage state path for what-if scenarios (scenarios.py)."""
+        return self.get('files.coverage_state', 'json/coverage_state.npz')
+    
+    @property
+    def osm_pbf_file(self) -> str:
+        """Get OSM extract (.osm.pbf) path the offline road graph is built from."""
+        return self.get('files.osm_pbf', 'files/kenya-latest.osm.pbf')
+    
+    @property
+    def road_graph_file(self) -> str:
+        """Get road graph (.npz) path used by the offline isochrone engine."""
+        return self.get('files.road_graph', 'json/road_graph.npz')
+    
+    @property
+    def offline_cell_m(self) -> float:
+        """Get grid cell size in meters of offline isochrone polygons."""
+        return float(self.get('offline.cell_m', 200))
+    
+    @property
+    def offline_max_snap_m(self) -> float:
+        """Get largest distance in meters from a facility to the road network for offline isochrones."""
+        return float(self.get('offline.max_snap_m', 500))
+    
     @property
     def range_seconds(self):
         """Get isochrone range(s) in seconds. Returns list if multiple ranges, int if single."""
@@ -190,6 +401,101 @@ class Config:
         """Get sleep time between requests in seconds."""
         return self.get('analysis.sleep_between_requests', 0.5)
     
+    @property
+    def isochrone_reuse_enabled(self) -> bool:
+        """Get whether nearby facilities reuse each other's isochrones (approximate mode)."""
+        return bool(self.get('isochrone_reuse.enabled', False))
+    
+    @property
+    def isochrone_reuse_radius_m(self) -> float:
+        """Get largest facility distance in meters at which an isochrone is reused."""
+        return float(self.get('isochrone_reuse.radius_m', 300))
+    
+    @property
+    def isochrone_reuse_validate_every(self) -> int:
+        """Get how often a reused isochrone is checked against ORS (every Nth reuse, 0 never)."""
+        return int(self.get('isochrone_reuse.validate_every', 10))
+    
+    @property
+    def siting_candidate_levels(self) -> list:
+        """Get facility levels eligible as candidate sites (e.g. for upgrade)."""
+        return self.get('siting.candidate_levels', ['3', '4'])
+    
+    @property
+    def siting_k(self) -> int:
+        """Get number of candidate sites to select."""
+        return int(self.get('siting.k', 10))
+    
+    @property
+    def siting_range_seconds(self) -> int:
+        """Get travel time range in seconds that defines a covered person."""
+        return int(self.get('siting.range_seconds', 3600))
+    
+    @property
+    def siting_isochrones_file(self) -> str:
+        """Get GeoJSON file caching the isochrones of existing and candidate facilities."""
+        return self.get('files.siting_isochrones', 'json/siting_isochrones.geojson')
+    
+    @property
+    def siting_output_table(self) -> str:
+        """Get ranked site table output path."""
+        return self.get('files.siting_table', 'json/siting_ranked.csv')
+    
+    @property
+    def siting_output_layer(self) -> str:
+        """Get GeoJSON map layer output path of the selected sites."""
+        return self.get('files.siting_layer', 'json/siting_selected.geojson')
+    
+    @property
+    def siting_output_map(self) -> str:
+        """Get HTML map output path of the selected sites."""
+        return self.get('files.siting_map', 'maps/siting_map.html')
+    
+    @property
+    def matrix_k_nearest(self) -> int:
+        """Get number of straight-line nearest facilities routed to per grid cell."""
+        return self.get('matrix.k_nearest', 3)
+    
+    @property
+    def matrix_maximum_routes(self) -> int:
+        """Get ORS matrix limit on sources x destinations per request (server's maximum_routes)."""
+        return self.get('matrix.maximum_routes', 2500)
+    
+    @property
+    def matrix_prefilter_km(self) -> float:
+        """Get straight-line distance beyond which facilities are not considered for a cell."""
+        return self.get('matrix.prefilter_km', 60.0)
+    
+    @property
+    def matrix_max_minutes(self) -> int:
+        """Get last minute tabulated in the population-by-minute table."""
+        return self.get('matrix.max_minutes', 60)
+    
+    @property
+    def matrix_grid_scale(self) -> int:
+        """Get population grid cell size in meters for the matrix analysis mode."""
+        return self.get('matrix.grid_scale', 1000)
+    
+    @property
+    def matrix_min_cell_population(self) -> float:
+        """Get minimum population for a grid cell to be routed."""
+        return self.get('matrix.min_cell_population', 1.0)
+    
+    @property
+    def matrix_engine(self) -> str:
+        """Get matrix mode engine: ors (matrix requests) or graph (one multi-source search on the road graph)."""
+        return self.get('matrix.engine', 'ors')
+    
+    @property
+    def matrix_offroad_kmh(self) -> float:
+        """Get off-road speed between population cells or facilities and the road network (graph engine)."""
+        return float(self.get('matrix.offroad_kmh', 5))
+    
+    @property
+    def matrix_max_offroad_m(self) -> float:
+        """Get largest off-road distance from a population cell to the road network (graph engine)."""
+        return float(self.get('matrix.max_offroad_m', 2000))
+    
     @property
     def gee_dataset(self) -> str:
         """Get GEE dataset name."""
@@ -205,6 +511,31 @@ class Config:
         """Get GEE max pixels."""
         return self.get('gee.max_pixels', 1000000000)
     
+    @property
+    def population_backend(self) -> str:
+        """Get population backend name (gee, raster, grid or ors)."""
+        return self.get('population.backend', 'gee')
+    
+    @property
+    def population_raster_file(self) -> str:
+        """Get local population raster (GeoTIFF or .npz) path for the raster backend."""
+        return self.get('population.raster_file', '')
+    
+    @property
+    def population_h3_index_file(self) -> str:
+        """Get H3 population index (.npz) path for the h3 backend."""
+        return self.get('population.h3_index_file', 'json/population_h3.npz')
+    
+    @property
+    def population_h3_resolution(self) -> int:
+        """Get H3 resolution used when building the population index."""
+        return int(self.get('population.h3_resolution', 8))
+    
+    @property
+    def population_cache_file(self) -> str:
+        """Get persistent population cache (SQLite) path; empty disables the cache."""
+        return self.get('population.cache_file', 'json/population_cache.sqlite')
+    
     @property
     def log_level(self) -> str:
         """Get logging level."""
@@ -235,6 +566,31 @@ class Config:
         """Get log date format string."""
         return self.get('logging.date_format', '%Y-%m-%d %H:%M:%S')
     
+    @property
+    def log_json_file(self) -> Optional[str]:
+        """Get JSON-lines log file path (None if disabled)."""
+        return self.get('logging.json_file') or None
+    
+    @property
+    def progress_refresh_interval(self) -> float:
+        """Get minimum seconds between progress status line redraws."""
+        return float(self.get('progress.refresh_interval', 0.5))
+    
+    @property
+    def progress_log_interval(self) -> float:
+        """Get seconds between progress log lines when stdout is not a terminal."""
+        return float(self.get('progress.log_interval', 30))
+    
+    @property
+    def metrics_enabled(self) -> bool:
+        """Get whether run metrics are written at the end of a run."""
+        return bool(self.get('metrics.enabled', True))
+    
+    @property
+    def metrics_output_dir(self) -> str:
+        """Get directory for run metrics files."""
+        return self.get('metrics.output_dir', 'logs')
+    
     @property
     def map_center_lat(self) -> float:
         """Get map center latitude."""
@@ -273,6 +629,46 @@ class Config:
     def map_isochrone_opacity(self) -> float:
         """Get isochrone opacity for map."""
         return self.get('map.isochrone_opacity', 0.3)
+    
+    @property
+    def map_renderer(self) -> str:
+        """Get HTML map renderer: template (direct Leaflet HTML) or folium."""
+        return self.get('map.renderer', 'template')
+    
+    @property
+    def map_sidecars(self) -> bool:
+        """Get whether isochrone layers are written to sidecar files loaded on demand (template renderer)."""
+        return bool(self.get('map.sidecars', False))
+    
+    @property
+    def map_sidecar_split(self) -> str:
+        """Get how isochrone layers are split into sidecar files: range or county."""
+        return self.get('map.sidecar_split', 'range')
+    
+    @property
+    def map_sidecar_gzip(self) -> bool:
+        """Get whether sidecar files are gzip-compressed."""
+        return bool(self.get('map.sidecar_gzip', False))
+    
+    @property
+    def map_facility_layer(self) -> str:
+        """Get how facilities are drawn: markers (one circle marker each), clustered (canvas + clustering) or auto."""
+        return self.get('map.facility_layer', 'auto')
+    
+    @property
+    def map_cluster_threshold(self) -> int:
+        """Get number of facilities from which facility_layer 'auto' switches to the clustered layer."""
+        return int(self.get('map.cluster_threshold', 1000))
+    
+    @property
+    def map_image_resolution(self) -> float:
+        """Get static map image resolution in degrees per pixel."""
+        return float(self.get('map.image_resolution', 0.005))
+    
+    @property
+    def map_image_point_radius(self) -> int:
+        """Get radius of facility points on the static map, in pixels."""
+        return int(self.get('map.image_point_radius', 2))
 
 
 # Global configuration instance
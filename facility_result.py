@@ -0,0 +1,145 @@
+"""
+Compact per-facility analysis results.
+
+A facility's isochrones are stored once each, as packed coordinate arrays
+(see packed_geometry.py), next to their population and ORS feature
+properties. The GeoJSON views needed by the map (single features, the
+combined FeatureCollection, the largest-range "isochrone") are rebuilt on
+demand instead of being kept alongside the geometry. The facility's Excel row is referenced, not copied.
+"""
+from typing import Any, Dict, Optional
+
+from packed_geometry import PackedGeometry
+
+
+class IsochroneRange:
+    """One isochrone of a facility: its packed geometry, population, ORS properties and provenance."""
+
+    __slots__ = ('range_seconds', 'population', 'packed', 'properties', 'source')
+
+    def __init__(self, range_seconds: int, population: float, packed: PackedGeometry, properties: Optional[dict] = None,
+                 source: Optional[str] = None):
+        self.range_seconds = range_seconds
+        self.population = population
+        self.packed = packed
+        self.properties = properties or {}
+        # Where the isochrone came from ('ors' or 'reused:<facility> (<distance> m)'; None when not tracked)
+        self.source = source
+
+    @property
+    def geometry(self) -> Dict[str, Any]:
+        """GeoJSON geometry, built from the packed coordinates on each access."""
+        return self.packed.to_geojson()
+
+    @property
+    def wkb(self) -> bytes:
+        """Little-endian WKB, built from the packed coordinates on each access."""
+        return self.packed.to_wkb()
+
+    @property
+    def feature(self) -> Dict[str, Any]:
+        """GeoJSON Feature, built from the packed coordinates on each access."""
+        return {"type": "Feature", "properties": self.properties, "geometry": self.geometry}
+
+
+class FacilityResult:
+    """
+    Isochrones and populations of one facility.
+
+    Usage:
+        result = FacilityResult(name, lat, lon, source_row=row)
+        result.add_range(range_sec, feature, pop)
+        result.populations          # {15: 1234.0, 30: ...}
+        result.feature(15)          # GeoJSON Feature built on demand
+        result.to_row()             # flat dict for the results CSV
+    """
+
+    __slots__ = ('name', 'lat', 'lon', 'source_row', 'ranges')
+
+    def __init__(self, name: str, lat: float, lon: float, source_row=None):
+        """
+        Args:
+            name: Facility name
+            lat: Latitude (validated, after any swap correction)
+            lon: Longitude (validated, after any swap correction)
+            source_row: Facility row (pandas Series or mapping) from the input table, kept by reference
+        """
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.source_row = source_row
+        self.ranges: Dict[int, IsochroneRange] = {}
+
+    def add_range(self, range_seconds: int, feature: Dict[str, Any], population: float, source: Optional[str] = None):
+        """
+        Store one isochrone; the feature's coordinate lists are packed and not retained.
+
+        Args:
+            range_seconds: Travel time of the isochrone in seconds
+            feature: GeoJSON Feature returned by ORS
+            population: Population inside the isochrone (-1 if the calculation failed)
+            source: Provenance written to the isochrone_source_<N>min column (see isochrone_reuse.py)
+        """
+        self.ranges[range_seconds // 60] = IsochroneRange(
+            range_seconds, population, PackedGeometry.from_geojson(feature['geometry']), feature.get('properties'),
+            source
+        )
+
+    @property
+    def populations(self) -> Dict[int, float]:
+        """Population per range in minutes."""
+        return {range_min: iso.population for range_min, iso in self.ranges.items()}
+
+    @property
+    def population_1hr(self) -> float:
+        """Population of the largest range (-1 if there are no ranges)."""
+        if not self.ranges:
+            return -1
+        return self.ranges[max(self.ranges)].population
+
+    def feature(self, range_min: int) -> Dict[str, Any]:
+        """GeoJSON Feature for one range in minutes."""
+        return self.ranges[range_min].feature
+
+    @property
+    def isochrone_geojson(self) -> Dict[str, Any]:
+        """FeatureCollection of every range, in the order they were added."""
+        return {"type": "FeatureCollection", "features": [iso.feature for iso in self.ranges.values()]}
+
+    @property
+    def isochrone(self) -> Dict[str, Any]:
+        """FeatureCollection holding only the largest range."""
+        features = [self.feature(max(self.ranges))] if self.ranges else []
+        return {"type": "FeatureCollection", "features": features}
+
+    @property
+    def geometry_bytes(self) -> int:
+        """Total size of the stored coordinate and offset arrays."""
+        return sum(iso.packed.nbytes for iso in self.ranges.values())
+
+    def to_row(self) -> Dict[str, Any]:
+        """
+        Flatten to one results CSV row: the source row's columns, then lat, lon,
+        name, populations, population_1hr and a population_<N>min column per range,
+        plus an isochrone_source_<N>min column for ranges with a recorded provenance.
+        """
+        row: Dict[str, Any] = {}
+        if self.source_row is not None:
+            row.update(self.source_row.to_dict() if hasattr(self.source_row, 'to_dict') else self.source_row)
+        row['lat'] = self.lat
+        row['lon'] = self.lon
+        row['name'] = self.name
+        populations = self.populations
+        row['populations'] = populations
+        row['population_1hr'] = self.population_1hr
+        for range_min in sorted(populations):
+            row[f'population_{range_min}min'] = populations[range_min]
+        for range_min in sorted(self.ranges):
+            if self.ranges[range_min].source is not None:
+                row[f'isochrone_source_{range_min}min'] = self.ranges[range_min].source
+        return row
+
+    def __repr__(self) -> str:
+        ranges = ", ".join(f"{m}min" for m in sorted(self.ranges))
+        return f"FacilityResult({self.name!r}, lat={self.lat}, lon={self.lon}, ranges=[{ranges}])"
+
@@ -2,15 +2,78 @@
 Generate an isochrone map for a single location.
 Quick utility script to create isochrone maps for specific facilities.
 """
-import openrouteservice
-import folium
+import argparse
 from config import get_config
 from logger import get_logger
-from analyze_population import get_isochrone_with_retry, validate_coordinates
+from analyze_population import get_isochrone_with_retry, save_map, validate_coordinates
+from map_renderer import LeafletMap
+from ors_pool import create_ors_client
+from profiling import add_profile_arguments, run_profiled
 
 logger = get_logger(__name__)
 
 
+def single_isochrone_map(
+    iso_json: dict,
+    lat: float,
+    lon: float,
+    facility_name: str,
+    range_seconds: int,
+    config
+) -> LeafletMap:
+    """
+    Build the map of one facility's isochrone, with its marker and a title panel.
+    
+    Args:
+        iso_json: ORS isochrone response (FeatureCollection)
+        lat: Facility latitude
+        lon: Facility longitude
+        facility_name: Name of the facility
+        range_seconds: Isochrone range in seconds
+        config: Configuration object
+    
+    Returns:
+        LeafletMap
+    """
+    m = LeafletMap(
+        center=(lat, lon),
+        zoom=11  # Closer zoom for single facility
+    )
+    
+    # Add isochrone
+    m.add_geojson(
+        iso_json,
+        style={
+            'fillColor': config.map_isochrone_color,
+            'color': config.map_isochrone_color,
+            'weight': 2,
+            'fillOpacity': config.map_isochrone_opacity
+        },
+        tooltip=f"{facility_name} - {range_seconds/60:.0f} minute driving area"
+    )
+    
+    # Add facility marker
+    m.add_marker(
+        lat, lon,
+        popup=f"<b>{facility_name}</b><br>Coordinates: {lat}, {lon}",
+        tooltip=facility_name,
+        color='red', icon='hospital-o', prefix='fa'
+    )
+    
+    # Add title
+    m.add_html(f'''
+    <div style="position: fixed; 
+                top: 10px; left: 50px; width: 400px; height: 90px; 
+                background-color: white; z-index:9999; 
+                border:2px solid grey; padding: 10px;
+                font-size:14px">
+    <h4 style="margin-top:0">{facility_name}</h4>
+    <p style="margin-bottom:0"><b>{range_seconds/60:.0f}-minute</b> driving isochrone</p>
+    </div>
+    ''')
+    return m
+
+
 def generate_isochrone_map(
     lat: float,
     lon: float,
@@ -42,10 +105,7 @@ def generate_isochrone_map(
     
     # Initialize ORS client
     logger.info(f"Connecting to ORS at {config.ors_base_url}...")
-    ors_client = openrouteservice.Client(
-        key=config.ors_api_key,
-        base_url=config.ors_base_url
-    )
+    ors_client = create_ors_client(config)
     
     # Generate isochrone
     logger.info("Requesting isochrone from ORS...")
@@ -53,7 +113,7 @@ def generate_isochrone_map(
         ors_client,
         lat,
         lon,
-        range_sec=range_seconds,
+        ranges_sec=[range_seconds],
         max_retries=config.ors_retry_attempts
     )
     
@@ -65,43 +125,7 @@ def generate_isochrone_map(
     
     # Create map
     logger.info("Creating map...")
-    m = folium.Map(
-        location=[lat, lon],
-        zoom_start=11  # Closer zoom for single facility
-    )
-    
-    # Add isochrone
-    folium.GeoJson(
-        iso_json,
-        style_function=lambda x: {
-            'fillColor': config.map_isochrone_color,
-            'color': config.map_isochrone_color,
-            'weight': 2,
-            'fillOpacity': config.map_isochrone_opacity
-        },
-        tooltip=f"{facility_name} - {range_seconds/60:.0f} minute driving area"
-    ).add_to(m)
-    
-    # Add facility marker
-    folium.Marker(
-        [lat, lon],
-        popup=f"<b>{facility_name}</b><br>Coordinates: {lat}, {lon}",
-        tooltip=facility_name,
-        icon=folium.Icon(color='red', icon='hospital-o', prefix='fa')
-    ).add_to(m)
-    
-    # Add title
-    title_html = f'''
-    <div style="position: fixed; 
-                top: 10px; left: 50px; width: 400px; height: 90px; 
-                background-color: white; z-index:9999; 
-                border:2px solid grey; padding: 10px;
-                font-size:14px">
-    <h4 style="margin-top:0">{facility_name}</h4>
-    <p style="margin-bottom:0"><b>{range_seconds/60:.0f}-minute</b> driving isochrone</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(title_html))
+    m = single_isochrone_map(iso_json, lat, lon, facility_name, range_seconds, config)
     
     # Create maps directory if it doesn't exist
     from pathlib import Path
@@ -121,7 +145,7 @@ def generate_isochrone_map(
         else:
             output_file = Path(output_file)
     
-    m.save(str(output_file))
+    save_map(m, str(output_file), config)
     logger.info(f"Map saved to: {output_file}")
     
     return str(output_file)
@@ -172,37 +196,7 @@ def main():
             
             # Create map
             logger.info("Creating map...")
-            m = folium.Map(location=[lat, lon], zoom_start=11)
-            
-            folium.GeoJson(
-                iso_json,
-                style_function=lambda x: {
-                    'fillColor': config.map_isochrone_color,
-                    'color': config.map_isochrone_color,
-                    'weight': 2,
-                    'fillOpacity': config.map_isochrone_opacity
-                },
-                tooltip=f"{facility_name} - {range_seconds/60:.0f} minute driving area"
-            ).add_to(m)
-            
-            folium.Marker(
-                [lat, lon],
-                popup=f"<b>{facility_name}</b><br>Coordinates: {lat}, {lon}",
-                tooltip=facility_name,
-                icon=folium.Icon(color='red', icon='hospital-o', prefix='fa')
-            ).add_to(m)
-            
-            title_html = f'''
-            <div style="position: fixed; 
-                        top: 10px; left: 50px; width: 400px; height: 90px; 
-                        background-color: white; z-index:9999; 
-                        border:2px solid grey; padding: 10px;
-                        font-size:14px">
-            <h4 style="margin-top:0">{facility_name}</h4>
-            <p style="margin-bottom:0"><b>{range_seconds/60:.0f}-minute</b> driving isochrone</p>
-            </div>
-            '''
-            m.get_root().html.add_child(folium.Element(title_html))
+            m = single_isochrone_map(iso_json, lat, lon, facility_name, range_seconds, config)
             
             # Create maps directory if it doesn't exist
             from pathlib import Path
@@ -211,7 +205,7 @@ def main():
             
             safe_name = facility_name.replace(' ', '_').replace('/', '_')
             output_file = maps_dir / f"isochrone_{safe_name}.html"
-            m.save(str(output_file))
+            save_map(m, str(output_file), config)
             
             print(f"\n✓ Success! Isochrone map generated: {output_file}")
             print(f"Open {output_file} in your browser to view the map.")
@@ -251,6 +245,13 @@ def main():
         sys.exit(1)
 
 
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description='Generate an isochrone map for a single location')
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
+    run_profiled(main, parse_args(), 'generate_single_isochrone')
 
@@ -0,0 +1,267 @@
+"""
+H3 hexagon population index for fast isochrone totals.
+
+The population raster is aggregated once into H3 cells at a configurable
+resolution and stored as a sorted array of cell ids with their counts
+(16 bytes per populated hexagon). An isochrone's population is then computed
+by polyfilling the polygon: hexagons the boundary does not cross are summed
+wholesale with a vectorized searchsorted lookup, and only hexagons on the
+boundary are refined against a window of the raster the index was built
+from. National runs become CPU-bound instead of waiting on Earth Engine.
+
+Requires the optional ``h3`` package (version 4 or later).
+
+Usage:
+    python h3_index.py                        # build from files.population_grid
+    python h3_index.py --source raster -r 9   # build from population.raster_file at resolution 9
+"""
+import argparse
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from config import get_config
+from logger import get_logger
+from packed_geometry import PackedGeometry
+from population_grid import PopulationGrid, load_raster_grid
+from rasterize import geometry_bounds, grid_window, polygon_edges, polygon_mask
+
+logger = get_logger(__name__)
+
+KM_PER_DEGREE = 111.32
+
+
+def _import_h3():
+    """Import the optional h3 package, with an actionable error if it is missing or too old."""
+    try:
+        import h3
+    except ImportError as e:
+        raise ImportError("The H3 population index requires the h3 package (pip install 'h3>=4')") from e
+    if not hasattr(h3, 'LatLngPoly'):
+        raise ImportError(f"The H3 population index requires h3>=4 (found {getattr(h3, '__version__', '?')})")
+    from h3.api import basic_int
+    return h3, basic_int
+
+
+def _lookup(sorted_ids: np.ndarray, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (positions, found) of cells in a sorted id array."""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(cells), dtype=np.int64), np.zeros(len(cells), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, cells), len(sorted_ids) - 1)
+    return positions, sorted_ids[positions] == cells
+
+
+class H3PopulationIndex:
+    """
+    Population per H3 cell, refined at isochrone boundaries against the source raster.
+
+    ``cell_ids`` is sorted and ``counts[i]`` is the population of ``cell_ids[i]``.
+    ``raster`` is the grid or raster file the index was built from; it is
+    loaded on the first boundary refinement unless a grid is passed in.
+    """
+
+    __slots__ = ('resolution', 'cell_ids', 'counts', 'raster', '_grid')
+
+    def __init__(self, resolution: int, cell_ids, counts, raster: str = '', grid: PopulationGrid = None):
+        self.resolution = int(resolution)
+        self.cell_ids = np.asarray(cell_ids, dtype=np.uint64)
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.raster = str(raster or '')
+        self._grid = grid
+
+    @property
+    def total(self) -> float:
+        return float(self.counts.sum())
+
+    @property
+    def grid(self) -> PopulationGrid:
+        """Source raster used for boundary refinement."""
+        if self._grid is None:
+            if not self.raster or not Path(self.raster).exists():
+                raise FileNotFoundError(f"Source raster of the H3 population index not found: {self.raster!r}; "
+                                        f"rebuild the index with 'python h3_index.py'")
+            self._grid = load_raster_grid(self.raster)
+        return self._grid
+
+    def sum_cells(self, cells) -> float:
+        """Total population of the given hexagons (unknown cells count as zero)."""
+        cells = np.asarray(cells, dtype=np.uint64)
+        positions, found = _lookup(self.cell_ids, cells)
+        return float(self.counts[positions[found]].sum())
+
+    def refine_cells(self, cells, packed: PackedGeometry) -> float:
+        """
+        Population of the raster cells in the given hexagons whose centers are inside the polygon.
+
+        Only the raster window under the polygon is read. Its cells inside the
+        polygon and near the hexagons are assigned to hexagons exactly as
+        build_h3_index() did.
+        """
+        _, h3_int = _import_h3()
+        cells = np.unique(np.asarray(cells, dtype=np.uint64))
+        grid = self.grid
+        row0, row1, col0, col1 = grid_window(grid, geometry_bounds(packed))
+        if len(cells) == 0 or row1 == row0 or col1 == col0:
+            return 0.0
+        west, north = grid.west + col0 * grid.xres, grid.north - row0 * grid.yres
+        shape = (row1 - row0, col1 - col0)
+        values = np.nan_to_num(grid.values[row0:row1, col0:col1], nan=0.0)
+
+        # Raster cells under the hexagons, widened by one cell so no cell on a hexagon edge is missed
+        hexagons = PackedGeometry.from_geojson({'type': 'MultiPolygon', 'coordinates': [
+            [[[lon, lat] for lat, lon in h3_int.cell_to_boundary(int(cell))]] for cell in cells.tolist()
+        ]})
+        near = polygon_mask(hexagons, west, north, grid.xres, grid.yres, shape)
+        near[1:] |= near[:-1].copy()
+        near[:-1] |= near[1:].copy()
+        near[:, 1:] |= near[:, :-1].copy()
+        near[:, :-1] |= near[:, 1:].copy()
+
+        rows, cols = np.nonzero(near & (values > 0) & polygon_mask(packed, west, north, grid.xres, grid.yres, shape))
+        lat, lon = grid.cell_centers(rows + row0, cols + col0)
+        hexagon = np.fromiter(
+            (h3_int.latlng_to_cell(a, b, self.resolution) for a, b in zip(lat.tolist(), lon.tolist())),
+            dtype=np.uint64, count=len(rows)
+        )
+        return float(values[rows, cols][np.isin(hexagon, cells)].sum())
+
+    def population(self, packed: PackedGeometry) -> float:
+        """
+        Population inside a polygon: interior hexagons summed wholesale, boundary hexagons refined.
+
+        Args:
+            packed: Isochrone polygon
+
+        Returns:
+            Population count
+        """
+        boundary = boundary_cells(packed, self.resolution)
+        interior = np.setdiff1d(np.asarray(polygon_cells(packed, self.resolution), dtype=np.uint64), boundary)
+        return self.sum_cells(interior) + self.refine_cells(boundary, packed)
+
+    def save(self, path: str):
+        """Save the index to a compressed .npz file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path, resolution=self.resolution, cell_ids=self.cell_ids, counts=self.counts, raster=self.raster
+        )
+        logger.info(f"Saved H3 population index ({len(self.cell_ids):,} cells, res {self.resolution}) to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "H3PopulationIndex":
+        """Load an index written by save()."""
+        if not Path(path).exists():
+            raise FileNotFoundError(f"H3 population index not found: {path}")
+        with np.load(path) as data:
+            return cls(int(data['resolution']), data['cell_ids'], data['counts'], str(data['raster']))
+
+
+def polygon_cells(packed: PackedGeometry, resolution: int) -> List[int]:
+    """
+    Return the H3 cells whose centers are inside a (multi)polygon.
+
+    Args:
+        packed: Polygon or MultiPolygon
+        resolution: H3 resolution
+
+    Returns:
+        List of integer H3 cell ids
+    """
+    h3, h3_int = _import_h3()
+    coords = packed.degrees()
+    rings = packed.ring_offsets
+    polygons = []
+    for p in range(len(packed.polygon_offsets) - 1):
+        loops = [
+            [(lat, lon) for lon, lat in coords[rings[r]:rings[r + 1]].tolist()]
+            for r in range(packed.polygon_offsets[p], packed.polygon_offsets[p + 1])
+        ]
+        if loops and len(loops[0]) >= 3:
+            polygons.append(h3.LatLngPoly(loops[0], *loops[1:]))
+    if not polygons:
+        return []
+    shape = polygons[0] if len(polygons) == 1 else h3.LatLngMultiPoly(*polygons)
+    return list(h3_int.h3shape_to_cells(shape, resolution))
+
+
+def boundary_cells(packed: PackedGeometry, resolution: int) -> np.ndarray:
+    """
+    Return the H3 cells crossed by the polygon's edges.
+
+    Edges are sampled at a quarter of the hexagon edge length, so every
+    hexagon the boundary passes through is found. Hexagons not returned are
+    entirely inside or entirely outside the polygon.
+
+    Args:
+        packed: Polygon or MultiPolygon
+        resolution: H3 resolution
+
+    Returns:
+        Sorted unique uint64 cell ids
+    """
+    _, h3_int = _import_h3()
+    x0, y0, x1, y1 = polygon_edges(packed)
+    if len(x0) == 0:
+        return np.empty(0, dtype=np.uint64)
+    spacing = h3_int.average_hexagon_edge_length(resolution, unit='km') / 4 / KM_PER_DEGREE
+    steps = np.maximum(np.ceil(np.hypot(x1 - x0, y1 - y0) / spacing), 1).astype(np.int64)
+    # Fraction along each edge of every sample point, edges laid end to end
+    edge = np.repeat(np.arange(len(x0)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[edge]
+    lon = x0[edge] + t * (x1 - x0)[edge]
+    lat = y0[edge] + t * (y1 - y0)[edge]
+    cells = {h3_int.latlng_to_cell(a, b, resolution) for a, b in zip(lat.tolist(), lon.tolist())}
+    return np.unique(np.fromiter(cells, dtype=np.uint64, count=len(cells)))
+
+
+def build_h3_index(grid: PopulationGrid, resolution: int, raster: str = '') -> H3PopulationIndex:
+    """
+    Aggregate a population grid into H3 cells.
+
+    Args:
+        grid: Population grid (raster cell centers are assigned to hexagons)
+        resolution: H3 resolution (8: ~0.7 km2, 9: ~0.1 km2 per hexagon)
+        raster: File the grid was loaded from, saved with the index for boundary refinement
+
+    Returns:
+        H3PopulationIndex
+    """
+    _, h3_int = _import_h3()
+    rows, cols = grid.populated_cells(0.0)
+    lat, lon = grid.cell_centers(rows, cols)
+    pop = grid.values[rows, cols]
+    logger.info(f"Assigning {len(pop):,} populated raster cells to H3 resolution {resolution}...")
+
+    point_cells = np.fromiter(
+        (h3_int.latlng_to_cell(a, b, resolution) for a, b in zip(lat.tolist(), lon.tolist())),
+        dtype=np.uint64, count=len(pop)
+    )
+    cell_ids, inverse = np.unique(point_cells, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=pop.astype(np.float64), minlength=len(cell_ids))
+    return H3PopulationIndex(resolution, cell_ids, counts, raster, grid)
+
+
+def main(argv: list = None):
+    """Build the H3 population index from the configured raster or grid."""
+    config = get_config()
+    parser = argparse.ArgumentParser(description='Build the H3 population index used by the h3 population backend')
+    parser.add_argument('--source', choices=['grid', 'raster'], default='grid',
+                        help='Build from files.population_grid (grid) or population.raster_file (raster)')
+    parser.add_argument('-r', '--resolution', type=int, default=config.population_h3_resolution,
+                        help=f'H3 resolution (default: {config.population_h3_resolution})')
+    parser.add_argument('-o', '--output', default=config.population_h3_index_file,
+                        help=f'Output .npz path (default: {config.population_h3_index_file})')
+    args = parser.parse_args(argv)
+
+    source = config.population_grid_file if args.source == 'grid' else config.population_raster_file
+    if not source or not Path(source).exists():
+        parser.error(f"{args.source} source file not found: {source!r}")
+    index = build_h3_index(load_raster_grid(source), args.resolution, str(Path(source).resolve()))
+    index.save(args.output)
+    print(f"H3 index: {len(index.cell_ids):,} cells at resolution {index.resolution}, "
+          f"total population {index.total:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
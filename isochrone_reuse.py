@@ -0,0 +1,180 @@
+"""
+Approximate isochrone reuse for nearby facilities.
+
+Facilities in dense towns often sit a few hundred metres apart, and their
+isochrones are nearly identical. In approximate mode, an isochrone request
+within ``isochrone_reuse.radius_m`` of a facility already requested from ORS
+(same profile and range) reuses that facility's polygon instead of calling
+ORS. Reused ranges record their source facility and distance in the results.
+
+To keep the error measured, every ``isochrone_reuse.validate_every``-th
+reuse still calls ORS: the exact isochrone is used for the result and the
+population difference between the reused and the exact polygon is recorded
+and reported at the end of the run.
+
+Usage:
+    reuse = IsochroneReuse(radius_m=300, validate_every=10)
+    match = reuse.lookup(lat, lon, range_sec)       # ReuseMatch or None
+    reuse.add(name, lat, lon, range_sec, feature)   # after each ORS isochrone
+    reuse.record_validation(approx_pop, exact_pop)
+    reuse.report()
+"""
+import math
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from logger import get_logger
+from metrics import get_metrics
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in metres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class ReuseMatch(NamedTuple):
+    """A cached isochrone close enough to be reused."""
+
+    feature: Dict[str, Any]
+    source_name: str
+    distance_m: float
+    validate: bool  # Also request ORS and compare populations
+
+    @property
+    def provenance(self) -> str:
+        """Value of the results' isochrone_source column for a reused isochrone."""
+        return f"reused:{self.source_name} ({self.distance_m:.0f} m)"
+
+
+class IsochroneReuse:
+    """
+    Isochrones requested from ORS this run, bucketed on a lat/lon grid of
+    about ``radius_m`` for neighbour lookups. Safe to share between threads.
+    """
+
+    def __init__(self, radius_m: float, validate_every: int = 0):
+        """
+        Args:
+            radius_m: Largest facility distance at which an isochrone is reused
+            validate_every: Request ORS anyway for every Nth reuse and record the population delta (0: never)
+        """
+        if radius_m <= 0:
+            raise ValueError(f"isochrone_reuse.radius_m must be positive, got {radius_m}")
+        self.radius_m = float(radius_m)
+        self.validate_every = int(validate_every)
+        self._cell_deg = self.radius_m / METERS_PER_DEGREE_LAT
+        self._entries: Dict[Tuple[str, int, int, int], List[Tuple[float, float, str, Dict[str, Any]]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+        self.validations: List[Tuple[float, float]] = []
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self._cell_deg), math.floor(lon / self._cell_deg)
+
+    def add(self, name: str, lat: float, lon: float, range_sec: int, feature: Dict[str, Any],
+            profile: str = 'driving-car'):
+        """
+        Remember an isochrone requested from ORS (reused isochrones are never added, so errors don't chain).
+
+        Args:
+            name: Facility name, recorded as the provenance of reuses
+            lat: Facility latitude
+            lon: Facility longitude
+            range_sec: Isochrone range in seconds
+            feature: GeoJSON Feature returned by ORS
+            profile: ORS routing profile
+        """
+        row, col = self._cell(lat, lon)
+        with self._lock:
+            self._entries[(profile, range_sec, row, col)].append((lat, lon, name, feature))
+
+    def lookup(self, lat: float, lon: float, range_sec: int, profile: str = 'driving-car') -> Optional[ReuseMatch]:
+        """
+        Find the nearest cached isochrone of the same profile and range within the radius.
+
+        Args:
+            lat: Facility latitude
+            lon: Facility longitude
+            range_sec: Isochrone range in seconds
+            profile: ORS routing profile
+
+        Returns:
+            ReuseMatch, or None if ORS must be called
+        """
+        row, col = self._cell(lat, lon)
+        # A degree of longitude shrinks with latitude, so more columns fall within the radius
+        col_span = math.ceil(1 / max(math.cos(math.radians(abs(lat) + self._cell_deg)), 1e-6))
+        with self._lock:
+            self.requests += 1
+            best = None
+            for r in (row - 1, row, row + 1):
+                for c in range(col - col_span, col + col_span + 1):
+                    for entry in self._entries.get((profile, range_sec, r, c), ()):
+                        distance = haversine_m(lat, lon, entry[0], entry[1])
+                        if distance <= self.radius_m and (best is None or distance < best[0]):
+                            best = (distance, entry)
+            if best is None:
+                return None
+            self.reused += 1
+            validate = self.validate_every > 0 and self.reused % self.validate_every == 0
+        metrics.incr('isochrone_reuse_hits')
+        distance, (_, _, name, feature) = best
+        return ReuseMatch(feature, name, distance, validate)
+
+    def record_validation(self, approx_population: float, exact_population: float):
+        """Record the populations of a reused isochrone and of the exact ORS isochrone it was checked against."""
+        with self._lock:
+            self.validations.append((float(approx_population), float(exact_population)))
+        metrics.incr('isochrone_reuse_validations')
+
+    def validation_summary(self) -> Dict[str, float]:
+        """
+        Population error of reused isochrones observed in validations.
+
+        Returns:
+            Dictionary with count, mean/median/p95/max absolute relative error (fractions of the exact
+            population) and mean signed error; empty if there were no validations
+        """
+        with self._lock:
+            pairs = np.array(self.validations, dtype=np.float64).reshape(-1, 2)
+        valid = pairs[pairs[:, 1] > 0]
+        if len(valid) == 0:
+            return {}
+        relative = (valid[:, 0] - valid[:, 1]) / valid[:, 1]
+        absolute = np.abs(relative)
+        return {
+            'count': int(len(valid)),
+            'mean_abs_error': float(absolute.mean()),
+            'median_abs_error': float(np.median(absolute)),
+            'p95_abs_error': float(np.quantile(absolute, 0.95)),
+            'max_abs_error': float(absolute.max()),
+            'mean_error': float(relative.mean()),
+        }
+
+    def report(self) -> str:
+        """Reuse rate and the validated population error, for the end-of-run log."""
+        with self._lock:
+            requests, reused = self.requests, self.reused
+        # Validated reuses still called ORS
+        saved = reused - (reused // self.validate_every if self.validate_every > 0 else 0)
+        rate = saved / requests if requests else 0.0
+        text = (f"Isochrone reuse (radius {self.radius_m:.0f} m): {reused} of {requests} isochrones reused, "
+                f"{saved} ORS requests saved ({rate:.0%})")
+        summary = self.validation_summary()
+        if summary:
+            text += (f"; population delta over {summary['count']} validations: "
+                     f"mean {summary['mean_abs_error']:.1%}, p95 {summary['p95_abs_error']:.1%}, "
+                     f"max {summary['max_abs_error']:.1%} (mean signed {summary['mean_error']:+.1%})")
+        return text
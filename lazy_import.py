@@ -0,0 +1,69 @@
+"""
+Deferred imports for heavy dependencies.
+
+``ee``, ``openrouteservice``, ``pandas`` and ``folium`` each take hundreds of
+milliseconds to import. Modules bind them with ``lazy_import()`` so the real
+import happens on first attribute access, and utilities such as
+``check_ors.py`` that never touch them start quickly.
+
+Usage:
+    from lazy_import import lazy_import
+    pd = lazy_import('pandas')      # nothing imported yet
+    pd.DataFrame(...)               # pandas imported here
+
+Modules using this should add ``from __future__ import annotations`` so type
+hints such as ``pd.DataFrame`` are not evaluated at import time.
+"""
+import importlib
+import sys
+import threading
+import types
+
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_target']
+        if module is None:
+            with _import_lock:
+                module = self.__dict__['_lazy_target']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_target'] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.__dict__['_lazy_target'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return the module if it is already imported, otherwise a proxy that imports it on first use.
+
+    Args:
+        name: Fully qualified module name
+
+    Returns:
+        The module, or a LazyModule standing in for it
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -1,66 +1,239 @@
 """
 Logging configuration module.
 Sets up structured logging with console and file handlers.
+
+All module loggers share one QueueHandler. Records are put on an in-memory
+queue by the calling thread and formatted and written by a single background
+listener thread, so log I/O never blocks ORS or GEE work. Optionally, records
+are also written as JSON lines with the facility and stage fields set through
+``log_context()``.
 """
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Optional
 from config import get_config
 
+# Fields attached to every record logged in the current context (facility, stage, ...)
+_log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
 
-def setup_logger(name: str = None) -> logging.Logger:
+CONTEXT_FIELDS = ('facility', 'stage')
+
+_queue: Optional[queue.Queue] = None
+_queue_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields: Any):
     """
-    Set up and return a logger with console and file handlers.
-    
-    Args:
-        name: Logger name (typically __name__). If None, uses root logger.
-    
-    Returns:
-        Configured logger instance.
+    Attach fields (e.g. facility, stage) to every record logged inside the block.
+    Nested contexts add to, and override, the enclosing fields.
     """
-    config = get_config()
-    
-    # Get logger
-    logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, config.log_level.upper(), logging.INFO))
-    
-    # Avoid adding handlers multiple times
-    if logger.handlers:
-        return logger
-    
-    # Create formatters
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that stamps the caller's log context on the record and leaves
+    formatting to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Context variables belong to the calling thread; capture them before queueing
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        # Merge args now so later mutation of argument objects can't change the message;
+        # timestamps, layout and tracebacks are formatted by the listener
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """
+    StreamHandler that keeps a progress status line at the bottom of a terminal.
+    Records are written above the status line, which is redrawn after each one.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self.status = ''
+
+    def _clear_status(self):
+        if self.status:
+            self.stream.write('\r\x1b[K')
+
+    def set_status(self, line: str):
+        """Replace the status line ('' removes it)."""
+        self.acquire()
+        try:
+            self._clear_status()
+            self.status = line
+            if line:
+                self.stream.write(line)
+            self.stream.flush()
+        finally:
+            self.release()
+
+    def emit(self, record: logging.LogRecord):
+        if not self.status:
+            super().emit(record)
+            return
+        # Called with the handler lock held, so set_status() can't interleave
+        self._clear_status()
+        super().emit(record)
+        self.stream.write(self.status)
+        self.stream.flush()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def _build_handlers(config) -> list:
+    """Create the console, file and optional JSON-lines handlers run by the listener."""
     formatter = logging.Formatter(
         fmt=config.log_format,
         datefmt=config.log_date_format
     )
-    
+
     # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = ConsoleHandler(sys.stdout)
     console_handler.setLevel(getattr(logging, config.log_console_level.upper(), logging.INFO))
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
+
     # File handler
     log_file_path = Path(config.log_file)
     log_file_path.parent.mkdir(parents=True, exist_ok=True)
-    
+
     file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
     file_handler.setLevel(getattr(logging, config.log_file_level.upper(), logging.DEBUG))
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+    handlers = [console_handler, file_handler]
+
+    # Optional JSON-lines handler
+    if config.log_json_file:
+        json_path = Path(config.log_json_file)
+        json_path.parent.mkdir(parents=True, exist_ok=True)
+        json_handler = logging.FileHandler(json_path, encoding='utf-8')
+        json_handler.setLevel(getattr(logging, config.log_file_level.upper(), logging.DEBUG))
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    return handlers
+
+
+def get_queue_handler() -> logging.Handler:
+    """
+    Get the shared queue handler, starting the background listener on first use.
+
+    Returns:
+        The QueueHandler attached to every module logger.
+    """
+    global _queue, _queue_handler, _listener
+    if _queue_handler is None:
+        config = get_config()
+        _queue = queue.Queue()
+        _queue_handler = ContextQueueHandler(_queue)
+        _listener = logging.handlers.QueueListener(
+            _queue, *_build_handlers(config), respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return _queue_handler
+
+
+def get_listener_handlers() -> tuple:
+    """Return the handlers (console, file, JSON lines) run by the listener thread."""
+    get_queue_handler()
+    return _listener.handlers
+
+
+def get_console_handler() -> ConsoleHandler:
+    """Return the console handler run by the listener thread."""
+    return next(h for h in get_listener_handlers() if isinstance(h, ConsoleHandler))
+
+
+def flush_logging():
+    """Block until every queued record has been written."""
+    if _queue is not None and _listener is not None and _listener._thread is not None:
+        _queue.join()
+        for handler in _listener.handlers:
+            handler.flush()
+
+
+def shutdown_logging():
+    """Stop the listener thread after writing queued records, and close its handlers."""
+    global _queue, _queue_handler, _listener
+    if _listener is not None:
+        if _listener._thread is not None:
+            _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _queue = _queue_handler = _listener = None
+
+
+def setup_logger(name: str = None) -> logging.Logger:
+    """
+    Set up and return a logger attached to the shared queue handler.
+
+    Args:
+        name: Logger name (typically __name__). If None, uses root logger.
+
+    Returns:
+        Configured logger instance.
+    """
+    config = get_config()
+
+    # Get logger
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, config.log_level.upper(), logging.INFO))
+
+    # Avoid adding handlers multiple times
+    if logger.handlers:
+        return logger
+
+    logger.addHandler(get_queue_handler())
     return logger
 
 
 def get_logger(name: str = None) -> logging.Logger:
     """
     Get a logger instance. Convenience function that calls setup_logger.
-    
+
     Args:
         name: Logger name (typically __name__).
-    
+
     Returns:
         Configured logger instance.
     """
     return setup_logger(name)
-
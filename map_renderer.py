@@ -0,0 +1,458 @@
+"""
+Lightweight Leaflet map renderer.
+
+Writes the same maps folium produces (Leaflet 1.9.3, OpenStreetMap tiles,
+GeoJSON layers with sticky tooltips, Font Awesome markers, fixed HTML panels)
+without building a folium object graph: each layer is serialized to a compact
+GeoJSON string once, when it is added, and the page is a single precompiled
+template filled with those strings. There are no per-layer element ids or
+Jinja passes, so maps of hundreds of facilities render in a fraction of the
+time and memory.
+
+``LeafletMap.to_folium()`` builds the equivalent folium.Map for callers that
+need one (e.g. to add folium plugins).
+
+``save(path, sidecars=True)`` keeps only the page shell inline and writes the
+GeoJSON layers of each layer group to a sidecar file next to it (optionally
+gzip-compressed). The page fetches a group's file when the group is switched
+on in the layer control and its bounds are in view, so the map draws
+immediately however many polygons it holds. Sidecar files are fetched over
+HTTP; browsers block fetch() from file:// pages, so serve the output folder
+(e.g. ``python -m http.server``).
+
+``add_points()`` draws many points (e.g. every facility in the country) from
+one data array: circles on a canvas instead of one DOM element each,
+optionally clustered with Leaflet.markercluster, with popup HTML generated
+from the array only when a point is clicked.
+
+Usage:
+    m = LeafletMap(center=(lat, lon), zoom=7)
+    m.add_geojson(feature, style={'fillColor': '#ff0000', 'weight': 2}, tooltip="15 min")
+    m.add_marker(lat, lon, popup="<b>Hospital</b>", tooltip="Hospital")
+    m.add_points([(lat, lon, "Clinic", 1234.0)], columns=["15min"], cluster=True)
+    m.add_html(legend_html)
+    m.save("maps/map.html")
+    m.save("maps/map.html", sidecars=True, compress=True)   # maps/map_layers/*.json.gz
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import re
+from pathlib import Path
+from string import Template
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from lazy_import import lazy_import
+
+folium = lazy_import('folium')
+folium_plugins = lazy_import('folium.plugins')
+
+TILES_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+TILES_ATTRIBUTION = ('&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> '
+                     'contributors')
+
+# Same Leaflet, awesome-markers and Font Awesome versions folium loads
+_SCRIPTS = [
+    "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js",
+    "https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.js",
+]
+_STYLESHEETS = [
+    "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css",
+    "https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.2.0/css/all.min.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.css",
+]
+# Leaflet.markercluster, loaded only by maps with clustered point layers (same version as folium.plugins)
+_CLUSTER_SCRIPTS = [
+    "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/leaflet.markercluster.js",
+]
+_CLUSTER_STYLESHEETS = [
+    "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css",
+]
+
+# Popup of a point built from its data row; the same code runs in the page and in folium's cluster callback
+_POINT_POPUP_JS = """function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, function (c) { return "&#" + c.charCodeAt(0) + ";"; });
+}
+function pointPopup(p, row) {
+    var lines = p.columns.map(function (column, i) {
+        var value = row[i + 3];
+        if (value === null) { value = "-"; }
+        else if (typeof value === "number") { value = value.toLocaleString("en-US", {maximumFractionDigits: 0}); }
+        return escapeHtml(column) + ": " + escapeHtml(value);
+    });
+    return "<b>" + escapeHtml(row[2]) + "</b><br>" + (p.title ? p.title + "<br>" : "") + lines.join(p.separator);
+}"""
+
+_PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="content-type" content="text/html; charset=UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no" />
+$head
+<style>
+html, body { width: 100%; height: 100%; margin: 0; padding: 0; }
+#map { position: absolute; top: 0; bottom: 0; right: 0; left: 0; }
+.leaflet-container { font-size: 1rem; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+$html
+<script>
+var map = L.map("map", {center: $center, zoom: $zoom, zoomControl: true, preferCanvas: $prefer_canvas});
+L.tileLayer($tiles_url, {minZoom: 0, maxZoom: 19, attribution: $tiles_attribution}).addTo(map);
+var groupNames = $groups;
+var groups = groupNames.map(function (name) { return L.layerGroup().addTo(map); });
+function target(group) { return group === null ? map : groups[group]; }
+function decorate(layer, popup, tooltip) {
+    if (popup !== null) { layer.bindPopup(popup, {maxWidth: "100%"}); }
+    if (tooltip !== null) { layer.bindTooltip(tooltip, {sticky: true}); }
+    return layer;
+}
+function addGeojson(d, pane) {
+    var style = d[1];
+    decorate(L.geoJson(d[0], {style: function () { return style; }, pane: pane}), null, d[2]).addTo(target(d[3]));
+}
+// [geojson, style, tooltip, group]
+var geojsonLayers = [
+$geojson
+];
+geojsonLayers.forEach(function (d) { addGeojson(d); });
+// [lat, lon, popup, tooltip, icon options, group]
+var markers = [
+$markers
+];
+markers.forEach(function (d) {
+    var icon = L.AwesomeMarkers.icon(d[4]);
+    decorate(L.marker([d[0], d[1]], {icon: icon}), d[2], d[3]).addTo(target(d[5]));
+});
+// [lat, lon, popup, tooltip, path options, group]
+var circleMarkers = [
+$circle_markers
+];
+circleMarkers.forEach(function (d) {
+    decorate(L.circleMarker([d[0], d[1]], d[4]), d[2], d[3]).addTo(target(d[5]));
+});
+$point_popup
+// {rows: [[lat, lon, name, value...]], columns, title, separator, style, cluster, group}
+var pointLayers = [
+$point_layers
+];
+var pointRenderer = L.canvas({padding: 0.5});
+pointLayers.forEach(function (p) {
+    var style = Object.assign({renderer: pointRenderer}, p.style);
+    var points = p.rows.map(function (row, i) { return L.circleMarker([row[0], row[1]], Object.assign({row: i}, style)); });
+    var layer;
+    if (p.cluster) {
+        layer = L.markerClusterGroup({chunkedLoading: true, showCoverageOnHover: false});
+        layer.addLayers(points);
+    } else {
+        layer = L.featureGroup(points);
+    }
+    layer.bindPopup(function (point) { return pointPopup(p, p.rows[point.options.row]); }, {maxWidth: "100%"});
+    layer.addTo(target(p.group));
+});
+if (groupNames.length) {
+    var overlays = {};
+    groupNames.forEach(function (name, i) { overlays[name] = groups[i]; });
+    L.control.layers(null, overlays).addTo(map);
+}
+// [url, group, [south, west, north, east] or null]: files of GeoJSON layers loaded on demand,
+// each in its own pane below the markers, stacked in the order the groups were added
+var sidecars = $sidecars;
+sidecars.forEach(function (s, i) {
+    map.createPane("sidecar" + i).style.zIndex = Math.min(201 + i, 399);
+});
+function fetchLayers(url) {
+    return fetch(url).then(function (response) {
+        if (!response.ok) { throw new Error(url + ": HTTP " + response.status); }
+        if (/\\.gz$$/.test(url)) {
+            return new Response(response.body.pipeThrough(new DecompressionStream("gzip"))).json();
+        }
+        return response.json();
+    });
+}
+function loadSidecars() {
+    var view = map.getBounds();
+    sidecars.forEach(function (s, i) {
+        if (s.loading || !map.hasLayer(groups[s[1]])) { return; }
+        if (s[2] !== null && !view.intersects(L.latLngBounds([s[2][0], s[2][1]], [s[2][2], s[2][3]]))) { return; }
+        s.loading = true;
+        fetchLayers(s[0]).then(function (rows) {
+            rows.forEach(function (d) { addGeojson(d, "sidecar" + i); });
+        }).catch(function (error) {
+            s.loading = false;
+            console.error("Could not load " + s[0], error);
+        });
+    });
+}
+if (sidecars.length) {
+    map.on("moveend overlayadd", loadSidecars);
+    loadSidecars();
+}
+</script>
+</body>
+</html>
+""")
+
+
+def _slug(name: str) -> str:
+    """File-name-safe form of a layer group name."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_').lower() or 'layer'
+
+
+def _union_bounds(bounds: List[Optional[list]]) -> Optional[list]:
+    """[south, west, north, east] covering all bounds, or None if any is unknown."""
+    if not bounds or any(b is None for b in bounds):
+        return None
+    return [min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds)]
+
+
+def _js(value: Any) -> str:
+    """Serialize a value as a JavaScript literal that is safe inside a <script> element."""
+    return json.dumps(value, separators=(',', ':')).replace('</', '<\\/')
+
+
+class LeafletMap:
+    """
+    A Leaflet map assembled from pre-serialized layers.
+
+    Layers are drawn in the order they are added (GeoJSON layers first, then
+    markers, then circle markers), like the equivalent folium map. GeoJSON
+    layers of a group written to a sidecar file are drawn below all markers.
+    """
+
+    __slots__ = ('center', 'zoom', 'prefer_canvas', '_geojson', '_geojson_groups', '_geojson_bounds', '_markers',
+                 '_circle_markers', '_points', '_html', '_groups')
+
+    def __init__(self, center: Sequence[float], zoom: int, prefer_canvas: bool = False):
+        """
+        Args:
+            center: (lat, lon) of the initial view
+            zoom: Initial zoom level
+            prefer_canvas: Draw vector layers (GeoJSON, circle markers) on a canvas instead of as SVG elements
+        """
+        self.center = [float(center[0]), float(center[1])]
+        self.zoom = int(zoom)
+        self.prefer_canvas = prefer_canvas
+        self._geojson: List[str] = []
+        self._geojson_groups: List[Optional[int]] = []
+        self._geojson_bounds: List[Optional[list]] = []
+        self._markers: List[str] = []
+        self._circle_markers: List[str] = []
+        self._points: List[Dict[str, Any]] = []
+        self._html: List[str] = []
+        self._groups: List[str] = []
+
+    def _group(self, name: Optional[str]) -> Optional[int]:
+        if name is None:
+            return None
+        if name not in self._groups:
+            self._groups.append(name)
+        return self._groups.index(name)
+
+    def add_geojson(
+        self,
+        data: Union[Dict[str, Any], str],
+        style: Dict[str, Any],
+        tooltip: Optional[str] = None,
+        group: Optional[str] = None,
+        bounds: Optional[Sequence[float]] = None
+    ):
+        """
+        Add a GeoJSON layer.
+
+        Args:
+            data: GeoJSON geometry, Feature or FeatureCollection (dict, or an already serialized string)
+            style: Leaflet path options applied to every feature
+            tooltip: Sticky tooltip HTML
+            group: Name of a toggleable layer group (default: drawn directly on the map)
+            bounds: (south, west, north, east) of the layer; lets a sidecar file wait until it is in view
+        """
+        geojson = data.replace('</', '<\\/') if isinstance(data, str) else _js(data)
+        index = self._group(group)
+        self._geojson.append(f"[{geojson},{_js(style)},{_js(tooltip)},{_js(index)}]")
+        self._geojson_groups.append(index)
+        self._geojson_bounds.append(None if bounds is None else [float(b) for b in bounds])
+
+    def add_marker(
+        self,
+        lat: float,
+        lon: float,
+        popup: Optional[str] = None,
+        tooltip: Optional[str] = None,
+        color: str = 'red',
+        icon: str = 'hospital-o',
+        prefix: str = 'fa',
+        group: Optional[str] = None
+    ):
+        """Add a pin marker with a Font Awesome icon (folium.Marker with folium.Icon)."""
+        options = {'markerColor': color, 'iconColor': 'white', 'icon': icon, 'prefix': prefix,
+                   'extraClasses': 'fa-rotate-0'}
+        self._markers.append(f"[{float(lat)},{float(lon)},{_js(popup)},{_js(tooltip)},{_js(options)},"
+                             f"{_js(self._group(group))}]")
+
+    def add_circle_marker(
+        self,
+        lat: float,
+        lon: float,
+        radius: float = 5,
+        popup: Optional[str] = None,
+        tooltip: Optional[str] = None,
+        group: Optional[str] = None,
+        **path_options
+    ):
+        """Add a circle marker; path_options are Leaflet path options (color, fillColor, weight...)."""
+        options = {'radius': radius, **path_options}
+        self._circle_markers.append(f"[{float(lat)},{float(lon)},{_js(popup)},{_js(tooltip)},{_js(options)},"
+                                    f"{_js(self._group(group))}]")
+
+    def add_points(
+        self,
+        rows: Sequence[Sequence[Any]],
+        columns: Sequence[str] = (),
+        title: Optional[str] = None,
+        separator: str = ', ',
+        cluster: bool = False,
+        group: Optional[str] = None,
+        radius: float = 5,
+        **path_options
+    ):
+        """
+        Add a layer of points drawn on a canvas, with popups built from the data when clicked.
+
+        Args:
+            rows: (lat, lon, name, value, ...) per point; values are shown under columns
+            columns: Labels of the values after the name
+            title: HTML line between the bold name and the values (e.g. "Population:")
+            separator: HTML between the "label: value" entries
+            cluster: Group nearby points into clusters (Leaflet.markercluster)
+            group: Name of a toggleable layer group (default: drawn directly on the map)
+            radius: Circle radius in pixels
+            **path_options: Leaflet path options (color, fillColor, weight...)
+        """
+        self._points.append({
+            'rows': [[float(row[0]), float(row[1]), *row[2:]] for row in rows],
+            'columns': list(columns),
+            'title': title,
+            'separator': separator,
+            'style': {'radius': radius, **path_options},
+            'cluster': cluster,
+            'group': self._group(group),
+        })
+
+    def add_html(self, html: str):
+        """Add a raw HTML element to the page body, e.g. a fixed-position legend or title panel."""
+        self._html.append(html)
+
+    def render(self) -> str:
+        """Return the complete HTML page."""
+        return self._render(self._geojson, [])
+
+    def _render(self, geojson: List[str], sidecars: List[list]) -> str:
+        scripts, stylesheets = list(_SCRIPTS), list(_STYLESHEETS)
+        if any(p['cluster'] for p in self._points):
+            scripts += _CLUSTER_SCRIPTS
+            stylesheets += _CLUSTER_STYLESHEETS
+        head = "\n".join([f'<script src="{src}"></script>' for src in scripts]
+                         + [f'<link rel="stylesheet" href="{href}"/>' for href in stylesheets])
+        return _PAGE.substitute(
+            head=head,
+            html="\n".join(self._html),
+            center=_js(self.center),
+            zoom=self.zoom,
+            prefer_canvas=_js(self.prefer_canvas),
+            tiles_url=_js(TILES_URL),
+            tiles_attribution=_js(TILES_ATTRIBUTION),
+            groups=_js(self._groups),
+            geojson=",\n".join(geojson),
+            markers=",\n".join(self._markers),
+            circle_markers=",\n".join(self._circle_markers),
+            point_popup=_POINT_POPUP_JS,
+            point_layers=",\n".join(_js(p) for p in self._points),
+            sidecars=_js(sidecars),
+        )
+
+    def save(self, path: str, sidecars: bool = False, compress: bool = False) -> List[str]:
+        """
+        Write the HTML page to a file.
+
+        Args:
+            path: Output HTML file
+            sidecars: Write the GeoJSON layers of each layer group to <stem>_layers/ next to the page,
+                      loaded on demand, instead of inlining them (ungrouped layers stay inline)
+            compress: gzip the sidecar files (.json.gz)
+
+        Returns:
+            Paths of the sidecar files written
+        """
+        path = Path(path)
+        inline = self._geojson
+        written, entries = [], []
+        if sidecars and any(g is not None for g in self._geojson_groups):
+            inline = []
+            by_group: Dict[int, List[int]] = {}
+            for i, group in enumerate(self._geojson_groups):
+                if group is None:
+                    inline.append(self._geojson[i])
+                else:
+                    by_group.setdefault(group, []).append(i)
+            layer_dir = path.parent / f"{path.stem}_layers"
+            layer_dir.mkdir(parents=True, exist_ok=True)
+            # Drop files of groups from an earlier save
+            for stale in layer_dir.glob('[0-9][0-9][0-9]_*.json*'):
+                stale.unlink()
+            for index, rows in sorted(by_group.items()):
+                name = self._groups[index]
+                file_name = f"{index:03d}_{_slug(name)}.json" + ('.gz' if compress else '')
+                data = ("[\n" + ",\n".join(self._geojson[i] for i in rows) + "\n]").encode('utf-8')
+                file_path = layer_dir / file_name
+                file_path.write_bytes(gzip.compress(data, mtime=0) if compress else data)
+                written.append(str(file_path))
+                entries.append([f"{layer_dir.name}/{file_name}", index,
+                                _union_bounds([self._geojson_bounds[i] for i in rows])])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self._render(inline, entries))
+        return written
+
+    def to_folium(self) -> folium.Map:
+        """Build the equivalent folium.Map."""
+        m = folium.Map(location=self.center, zoom_start=self.zoom, prefer_canvas=self.prefer_canvas)
+        groups = [folium.FeatureGroup(name=name) for name in self._groups]
+
+        def target(group):
+            return m if group is None else groups[group]
+
+        # Rows are JSON arrays ('<\/' is a JSON escape of '</')
+        for row in self._geojson:
+            data, style, tooltip, group = json.loads(row)
+            folium.GeoJson(data, style_function=lambda x, s=style: s, tooltip=tooltip).add_to(target(group))
+        for row in self._markers:
+            lat, lon, popup, tooltip, options, group = json.loads(row)
+            folium.Marker([lat, lon], popup=popup, tooltip=tooltip,
+                          icon=folium.Icon(color=options['markerColor'], icon=options['icon'],
+                                           prefix=options['prefix'])).add_to(target(group))
+        for row in self._circle_markers:
+            lat, lon, popup, tooltip, options, group = json.loads(row)
+            folium.CircleMarker([lat, lon], popup=popup, tooltip=tooltip, **options).add_to(target(group))
+        for p in self._points:
+            # The cluster callback gets each data row and builds its circle with the page's popup code
+            # folium assigns it as 'var callback = <expression>;', so the helpers live inside one function expression
+            callback = (f"(function () {{\n{_POINT_POPUP_JS}\n"
+                        f"var layer = {_js({k: v for k, v in p.items() if k != 'rows'})};\n"
+                        f"return function (row) {{\n"
+                        f"    return L.circleMarker([row[0], row[1]], layer.style).bindPopup(pointPopup(layer, row));\n"
+                        f"}};\n}})()")
+            # An unclustered layer is a cluster group that stops clustering from zoom level 0
+            options = {} if p['cluster'] else {'disableClusteringAtZoom': 0}
+            folium_plugins.FastMarkerCluster(p['rows'], callback=callback, **options).add_to(target(p['group']))
+        for html in self._html:
+            m.get_root().html.add_child(folium.Element(html))
+        for group in groups:
+            group.add_to(m)
+        if groups:
+            folium.LayerControl().add_to(m)
+        return m
@@ -0,0 +1,435 @@
+"""
+Matrix-based travel-time surface from population grid cells to facilities.
+
+Instead of requesting fixed-threshold isochrones per facility, this mode uses
+the ORS matrix endpoint to compute the driving time from every populated grid
+cell centroid to its nearest few facilities. The result is a
+travel-time-to-nearest-facility raster and a population-by-minute table that
+answers "how many people live within N minutes" for any N.
+
+With ``matrix.engine: graph`` the travel times come from a single
+multi-source search over the offline road graph (travel_time_field.py)
+instead of matrix requests, so national runs need no ORS server.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import get_config
+from lazy_import import lazy_import
+from logger import get_logger
+from metrics import finish_run, get_metrics
+from analyze_population import load_and_filter_data, extract_facility_locations
+from ors_pool import create_ors_client
+from population_grid import PopulationGrid, bounds_around, load_population_grid
+
+pd = lazy_import('pandas')
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km; arguments broadcast like numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def nearest_candidates(
+    cell_lat: np.ndarray,
+    cell_lon: np.ndarray,
+    fac_lat: np.ndarray,
+    fac_lon: np.ndarray,
+    k: int,
+    max_km: float,
+    chunk_size: int = 20000
+) -> np.ndarray:
+    """
+    Straight-line prefilter: the k nearest facilities within max_km of each cell.
+
+    Returns:
+        (n_cells, k) int array of facility indices, -1 where fewer than k
+        facilities lie within max_km
+    """
+    n_cells = len(cell_lat)
+    k = min(k, len(fac_lat))
+    result = np.full((n_cells, k), -1, dtype=np.int64)
+    for start in range(0, n_cells, chunk_size):
+        stop = min(start + chunk_size, n_cells)
+        dist = haversine_km(cell_lat[start:stop, None], cell_lon[start:stop, None], fac_lat[None, :], fac_lon[None, :])
+        if k < dist.shape[1]:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape).copy()
+        nearest = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(nearest, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        idx[nearest > max_km] = -1
+        result[start:stop] = idx
+    return result
+
+
+def plan_matrix_batches(candidates: np.ndarray, maximum_routes: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Group cells into matrix requests of at most maximum_routes (sources x destinations).
+
+    Cells are ordered by their nearest facility so neighbouring cells, which
+    share candidate facilities, land in the same request.
+
+    Args:
+        candidates: (n_cells, k) facility indices from nearest_candidates()
+        maximum_routes: Server limit on sources * destinations per request
+
+    Returns:
+        List of (cell_indices, facility_indices) arrays, one per request
+    """
+    reachable = np.nonzero(candidates[:, 0] >= 0)[0]
+    order = reachable[np.argsort(candidates[reachable, 0], kind='stable')]
+
+    batches = []
+    cells: List[int] = []
+    facilities: set = set()
+    for cell in order:
+        cell_facilities = {int(f) for f in candidates[cell] if f >= 0}
+        merged = facilities | cell_facilities
+        if cells and (len(cells) + 1) * len(merged) > maximum_routes:
+            batches.append((np.array(cells), np.array(sorted(facilities))))
+            cells, merged = [], cell_facilities
+        cells.append(int(cell))
+        facilities = merged
+    if cells:
+        batches.append((np.array(cells), np.array(sorted(facilities))))
+    return batches
+
+
+def get_matrix_with_retry(
+    client,
+    locations: List[List[float]],
+    n_sources: int,
+    max_retries: int = None,
+    retry_delay: float = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Request a duration matrix with retry logic.
+
+    Args:
+        client: OpenRouteService client (or ORSBackendPool)
+        locations: [lon, lat] pairs; the first n_sources are sources, the rest destinations
+        n_sources: Number of source locations
+        max_retries: Maximum retry attempts (default from config)
+        retry_delay: Initial retry delay in seconds (default from config)
+
+    Returns:
+        ORS matrix response, or None if all attempts failed
+    """
+    config = get_config().snapshot()
+    if max_retries is None:
+        max_retries = config.ors_retry_attempts
+    if retry_delay is None:
+        retry_delay = config.ors_retry_delay
+
+    for attempt in range(max_retries):
+        try:
+            metrics.incr('ors_matrix_requests')
+            with metrics.timer('ors_matrix_request'):
+                return client.distance_matrix(
+                    locations=locations,
+                    profile='driving-car',
+                    sources=list(range(n_sources)),
+                    destinations=list(range(n_sources, len(locations))),
+                    metrics=['duration']
+                )
+        except Exception as e:
+            metrics.incr('ors_errors')
+            if attempt < max_retries - 1:
+                wait_time = retry_delay * (2 ** attempt)  # Exponential backoff
+                logger.warning(
+                    f"Error requesting matrix ({n_sources}x{len(locations) - n_sources}), "
+                    f"attempt {attempt + 1}/{max_retries}: {e}. Retrying in {wait_time:.1f}s..."
+                )
+                metrics.incr('ors_retries')
+                with metrics.timer('retry_backoff'):
+                    time.sleep(wait_time)
+            else:
+                metrics.incr('ors_failures')
+                logger.error(f"Failed to request matrix after {max_retries} attempts: {e}")
+                return None
+    return None
+
+
+def compute_travel_times(
+    client,
+    cell_lat: np.ndarray,
+    cell_lon: np.ndarray,
+    fac_lat: np.ndarray,
+    fac_lon: np.ndarray,
+    k: int,
+    max_km: float,
+    maximum_routes: int,
+    sleep_between_requests: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute driving time from each cell to its nearest facility.
+
+    Returns:
+        Tuple of (seconds, facility_index) arrays; unreachable cells have
+        seconds = inf and facility_index = -1
+    """
+    candidates = nearest_candidates(cell_lat, cell_lon, fac_lat, fac_lon, k, max_km)
+    batches = plan_matrix_batches(candidates, maximum_routes)
+    n_prefiltered = int((candidates[:, 0] < 0).sum())
+    logger.info(
+        f"{len(cell_lat)} cells, {n_prefiltered} beyond {max_km:.0f} km of any facility; "
+        f"{len(batches)} matrix requests (maximum_routes={maximum_routes})"
+    )
+
+    seconds = np.full(len(cell_lat), np.inf)
+    nearest = np.full(len(cell_lat), -1, dtype=np.int64)
+    for batch_num, (cells, facilities) in enumerate(batches, 1):
+        locations = (
+            np.column_stack([cell_lon[cells], cell_lat[cells]]).tolist()
+            + np.column_stack([fac_lon[facilities], fac_lat[facilities]]).tolist()
+        )
+        response = get_matrix_with_retry(client, locations, len(cells))
+        if not response or 'durations' not in response:
+            logger.warning(f"Matrix request {batch_num}/{len(batches)} failed; {len(cells)} cells left unreachable")
+            continue
+
+        durations = np.array(response['durations'], dtype=np.float64)  # None -> nan
+        durations[np.isnan(durations)] = np.inf
+        best = np.argmin(durations, axis=1)
+        seconds[cells] = durations[np.arange(len(cells)), best]
+        nearest[cells] = np.where(np.isfinite(seconds[cells]), facilities[best], -1)
+        logger.debug(f"Matrix request {batch_num}/{len(batches)}: {len(cells)}x{len(facilities)}")
+
+        if sleep_between_requests:
+            with metrics.timer('sleep'):
+                time.sleep(sleep_between_requests)
+
+    return seconds, nearest
+
+
+def population_by_minute(minutes: np.ndarray, population: np.ndarray, max_minutes: int) -> pd.DataFrame:
+    """
+    Tabulate population by travel time to the nearest facility.
+
+    Args:
+        minutes: Travel time in minutes per cell (inf/nan if unreachable)
+        population: Population per cell
+        max_minutes: Last minute to tabulate
+
+    Returns:
+        DataFrame with columns minute, population (reaching a facility in
+        (minute-1, minute]), cumulative_population and cumulative_pct
+    """
+    population = np.asarray(population, dtype=np.float64)
+    finite = np.isfinite(minutes)
+    bins = np.ceil(np.asarray(minutes)[finite]).astype(np.int64)
+    in_range = bins <= max_minutes
+    counts = np.bincount(np.maximum(bins[in_range], 0), weights=population[finite][in_range],
+                         minlength=max_minutes + 1)[:max_minutes + 1]
+    # Minute 0 means the cell centroid snapped onto the facility; fold it into minute 1
+    counts[1] += counts[0]
+    counts = counts[1:]
+    cumulative = np.cumsum(counts)
+    total = float(population.sum())
+    return pd.DataFrame({
+        'minute': np.arange(1, max_minutes + 1),
+        'population': counts,
+        'cumulative_population': cumulative,
+        'cumulative_pct': cumulative / total * 100 if total > 0 else np.zeros_like(cumulative),
+    })
+
+
+def population_within(table: pd.DataFrame, threshold_min: int) -> float:
+    """Population within threshold_min minutes of a facility, from a population_by_minute() table."""
+    rows = table[table['minute'] <= threshold_min]
+    return float(rows['cumulative_population'].iloc[-1]) if len(rows) else 0.0
+
+
+def catchment_table(
+    facilities: pd.DataFrame,
+    nearest: np.ndarray,
+    minutes: np.ndarray,
+    population: np.ndarray,
+    ranges_min: List[int]
+) -> pd.DataFrame:
+    """
+    Tabulate, per facility, the population of its catchment within each range.
+
+    A cell belongs to the catchment of its nearest facility, so every person is
+    counted once across facilities (unlike overlapping per-facility isochrones).
+
+    Args:
+        facilities: DataFrame with 'name', 'lat', 'lon' columns
+        nearest: Nearest facility index per cell (-1 if unreachable)
+        minutes: Travel time in minutes per cell
+        population: Population per cell
+        ranges_min: Ranges in minutes
+
+    Returns:
+        DataFrame with name, lat, lon and population_{m}min columns, one row per facility
+    """
+    table = facilities[['name', 'lat', 'lon']].reset_index(drop=True).copy()
+    population = np.asarray(population, dtype=np.float64)
+    reached = nearest >= 0
+    for range_min in ranges_min:
+        within = reached & (minutes <= range_min)
+        table[f'population_{range_min}min'] = np.bincount(nearest[within], weights=population[within],
+                                                          minlength=len(table))[:len(table)]
+    return table
+
+
+def save_travel_time_raster(path: str, grid: PopulationGrid, rows, cols, minutes, nearest):
+    """
+    Save the travel-time-to-nearest-facility raster as .npz.
+    Arrays share the grid's transform; unpopulated/unreachable cells are NaN (-1 for facility).
+    """
+    raster = np.full(grid.shape, np.nan, dtype=np.float32)
+    facility = np.full(grid.shape, -1, dtype=np.int32)
+    raster[rows, cols] = np.where(np.isfinite(minutes), minutes, np.nan)
+    facility[rows, cols] = nearest
+    with metrics.timer('raster_write'):
+        np.savez_compressed(
+            path,
+            minutes=raster,
+            facility=facility,
+            transform=np.array([grid.west, grid.north, grid.xres, grid.yres], dtype=np.float64)
+        )
+    logger.info(f"Saved travel time raster {grid.shape} to {path}")
+
+
+def run_matrix_analysis(facilities: pd.DataFrame, grid: PopulationGrid, client, config,
+                        graph=None) -> Dict[str, Any]:
+    """
+    Compute the travel-time surface and population-by-minute table.
+
+    Args:
+        facilities: DataFrame with 'name', 'lat', 'lon' columns
+        grid: Population grid
+        client: ORS client or pool (unused by the graph engine)
+        config: Configuration object
+        graph: RoadGraph for the graph engine (default: loaded from config.road_graph_file)
+
+    Returns:
+        Dictionary with 'table', 'minutes', 'nearest', 'population', 'rows', 'cols'
+    """
+    rows, cols = grid.populated_cells(config.matrix_min_cell_population)
+    cell_lat, cell_lon = grid.cell_centers(rows, cols)
+    population = grid.values[rows, cols]
+    fac_lat = facilities['lat'].to_numpy(dtype=np.float64)
+    fac_lon = facilities['lon'].to_numpy(dtype=np.float64)
+
+    if config.matrix_engine == 'graph':
+        from road_graph import RoadGraph
+        from travel_time_field import compute_travel_times_graph
+        if graph is None:
+            with metrics.timer('road_graph_load'):
+                graph = RoadGraph.load(config.road_graph_file)
+        seconds, nearest = compute_travel_times_graph(
+            graph, grid, rows, cols, fac_lat, fac_lon,
+            max_seconds=config.matrix_max_minutes * 60,
+            max_snap_m=config.matrix_max_offroad_m,
+            offroad_kmh=config.matrix_offroad_kmh
+        )
+    else:
+        seconds, nearest = compute_travel_times(
+            client, cell_lat, cell_lon, fac_lat, fac_lon,
+            k=config.matrix_k_nearest,
+            max_km=config.matrix_prefilter_km,
+            maximum_routes=config.matrix_maximum_routes,
+            sleep_between_requests=config.sleep_between_requests
+        )
+    minutes = seconds / 60.0
+    table = population_by_minute(minutes, population, config.matrix_max_minutes)
+    return {'table': table, 'minutes': minutes, 'nearest': nearest, 'population': population,
+            'rows': rows, 'cols': cols}
+
+
+def load_matrix_inputs(config) -> Optional[Tuple[pd.DataFrame, PopulationGrid]]:
+    """
+    Load the filtered facilities and the population grid around them.
+
+    The grid is fetched from GEE (and cached in config.population_grid_file)
+    on first use.
+
+    Args:
+        config: Configuration object
+
+    Returns:
+        Tuple of (facilities with 'name', 'lat', 'lon' columns, grid), or None
+        if no facilities could be loaded (the error is logged)
+    """
+    try:
+        df = load_and_filter_data(config.input_file, config.target_levels)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Data loading error: {e}", exc_info=True)
+        return None
+
+    facilities = extract_facility_locations(df).reset_index(drop=True)
+    if len(facilities) == 0:
+        logger.error("No facilities with valid coordinates after filtering")
+        return None
+
+    return facilities, load_grid_around(facilities['lat'], facilities['lon'], config)
+
+
+def load_grid_around(lats, lons, config) -> PopulationGrid:
+    """
+    Load the population grid around the given points (buffered by config.matrix_prefilter_km),
+    fetching it from GEE if config.population_grid_file doesn't exist yet or was cached for
+    another extent or matrix.grid_scale.
+    """
+    bounds = bounds_around(lats, lons, config.matrix_prefilter_km)
+    with metrics.timer('population_grid'):
+        return load_population_grid(config.population_grid_file, bounds=bounds, scale=config.matrix_grid_scale)
+
+
+def main():
+    """Main execution function for the matrix analysis mode."""
+    config = get_config().snapshot()
+    logger.info("Starting matrix travel-time analysis")
+
+    inputs = load_matrix_inputs(config)
+    if inputs is None:
+        return
+    facilities, grid = inputs
+
+    client = create_ors_client(config) if config.matrix_engine != 'graph' else None
+    try:
+        result = run_matrix_analysis(facilities, grid, client, config)
+    except FileNotFoundError as e:
+        logger.error(f"{e}")
+        return
+    table = result['table']
+    catchments = catchment_table(facilities, result['nearest'], result['minutes'], result['population'],
+                                 [range_sec // 60 for range_sec in config.range_seconds])
+
+    with metrics.timer('csv_write'):
+        table.to_csv(config.matrix_output_table, index=False)
+        catchments.to_csv(config.matrix_output_catchments, index=False)
+    logger.info(f"Saved population-by-minute table to {config.matrix_output_table}")
+    logger.info(f"Saved per-facility catchment table to {config.matrix_output_catchments}")
+    save_travel_time_raster(config.matrix_output_raster, grid, result['rows'], result['cols'],
+                            result['minutes'], result['nearest'])
+
+    print(f"\n{'='*70}")
+    print("POPULATION BY TRAVEL TIME TO NEAREST FACILITY")
+    print(f"{'='*70}")
+    for range_sec in config.range_seconds:
+        range_min = range_sec // 60
+        print(f"  Within {range_min:>3} min: {population_within(table, range_min):,.0f} people")
+    print(f"  Grid total:      {grid.total:,.0f} people")
+    print(f"{'='*70}\n")
+    finish_run('matrix_analysis', config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Run metrics: per-stage latency histograms and event counters.
+
+Stages (ORS requests, GEE calls, sleeps, map rendering, file writes, ...) are
+timed with ``metrics.timer('stage')``. At the end of a run ``finish_run()``
+writes a JSON and a Prometheus text-format metrics file and prints a short
+bottleneck summary.
+"""
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import get_config
+from logger import get_logger, log_context
+
+logger = get_logger(__name__)
+
+PROMETHEUS_PREFIX = "isochrone_analysis"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Latency samples kept per stage; beyond this a uniform reservoir sample is kept
+MAX_SAMPLES = 50000
+
+
+class StageStats:
+    """Latency observations for one stage."""
+
+    __slots__ = ('count', 'total', 'max', 'samples', '_random')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+        self._random = random.Random(0)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling keeps quantiles unbiased with bounded memory
+            slot = self._random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = seconds
+
+    def quantile(self, q: float) -> float:
+        return percentile(self.samples, q)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the q-quantile (0..1) of values using linear interpolation; 0.0 if empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+class MetricsRegistry:
+    """Thread-safe collection of stage latencies and event counters for one run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+
+    def reset(self):
+        """Clear all observations and restart the run clock."""
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.started = time.perf_counter()
+            self.started_at = datetime.now()
+
+    def observe(self, stage: str, seconds: float):
+        """Record one latency observation for a stage."""
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(seconds)
+
+    def incr(self, counter: str, amount: int = 1):
+        """Increment an event counter."""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as one observation of ``stage``; records logged inside carry the stage."""
+        start = time.perf_counter()
+        try:
+            with log_context(stage=stage):
+                yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @property
+    def wall_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> Dict:
+        """Return a JSON-serializable summary of the run."""
+        with self._lock:
+            stages = {
+                name: {
+                    'count': s.count,
+                    'total_seconds': s.total,
+                    'mean_seconds': s.total / s.count if s.count else 0.0,
+                    'max_seconds': s.max,
+                    **{f"p{int(q * 100)}_seconds": s.quantile(q) for q in QUANTILES},
+                }
+                for name, s in self.stages.items()
+            }
+            counters = dict(self.counters)
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_seconds': self.wall_seconds,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def to_prometheus(self, run_name: str = None) -> str:
+        """Render metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        run_label = f'run="{run_name}",' if run_name else ''
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Latency of pipeline stages in seconds.",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary",
+        ]
+        for stage, s in sorted(summary['stages'].items()):
+            labels = f'{run_label}stage="{stage}"'
+            for q in QUANTILES:
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},quantile="{q}"}} {s[f"p{int(q * 100)}_seconds"]:.6f}'
+                )
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{{labels}}} {s["total_seconds"]:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{{labels}}} {s["count"]}')
+
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_events_total Count of pipeline events (retries, errors, ...).")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_events_total counter")
+        for event, count in sorted(summary['counters'].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_events_total{{{run_label}event="{event}"}} {count}')
+
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_run_seconds Wall-clock duration of the run.")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}_run_seconds{{{run_label.rstrip(',')}}} {summary['wall_seconds']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def bottleneck_summary(self, top: int = 6) -> str:
+        """Return a short console table of where the run's time went."""
+        summary = self.summary()
+        wall = summary['wall_seconds']
+        stages = sorted(summary['stages'].items(), key=lambda kv: kv[1]['total_seconds'], reverse=True)
+
+        lines = [
+            f"Run time {wall:.1f}s - top stages by total time:",
+            f"  {'stage':<18} {'count':>7} {'total':>9} {'share':>6} {'p50':>8} {'p95':>8} {'p99':>8}",
+        ]
+        for stage, s in stages[:top]:
+            share = s['total_seconds'] / wall * 100 if wall > 0 else 0.0
+            lines.append(
+                f"  {stage:<18} {s['count']:>7} {s['total_seconds']:>8.1f}s {share:>5.1f}% "
+                f"{s['p50_seconds']:>7.2f}s {s['p95_seconds']:>7.2f}s {s['p99_seconds']:>7.2f}s"
+            )
+        if summary['counters']:
+            counters = ", ".join(f"{k}={v}" for k, v in sorted(summary['counters'].items()))
+            lines.append(f"  events: {counters}")
+        if stages and wall > 0:
+            name, slowest = stages[0]
+            lines.append(f"  Bottleneck: {name} ({slowest['total_seconds'] / wall * 100:.0f}% of run time)")
+        return "\n".join(lines)
+
+    def write(self, output_dir: str, run_name: str) -> Dict[str, str]:
+        """
+        Write metrics_<run_name>.json and metrics_<run_name>.prom to output_dir.
+
+        Returns:
+            Dictionary with 'json' and 'prometheus' file paths
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        json_path = out / f"metrics_{run_name}.json"
+        prom_path = out / f"metrics_{run_name}.prom"
+
+        payload = dict(self.summary(), run=run_name)
+        json_path.write_text(json.dumps(payload, indent=2))
+        prom_path.write_text(self.to_prometheus(run_name))
+        return {'json': str(json_path), 'prometheus': str(prom_path)}
+
+
+# Global metrics registry for the current run
+_metrics_instance: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get or create the global metrics registry."""
+    global _metrics_instance
+    if _metrics_instance is None:
+        _metrics_instance = MetricsRegistry()
+    return _metrics_instance
+
+
+def finish_run(run_name: str, config=None) -> Optional[Dict[str, str]]:
+    """
+    Write the run's metrics files and print the bottleneck summary.
+
+    Args:
+        run_name: Name used in file names and the Prometheus 'run' label
+        config: Configuration object (default: global config)
+
+    Returns:
+        Paths of the written files, or None if metrics are disabled
+    """
+    if config is None:
+        config = get_config()
+    if not config.metrics_enabled:
+        return None
+
+    metrics = get_metrics()
+    paths = metrics.write(config.metrics_output_dir, run_name)
+    print(f"\n{metrics.bottleneck_summary()}")
+    logger.info(f"Saved run metrics to {paths['json']} and {paths['prometheus']}")
+    return paths
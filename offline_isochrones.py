@@ -0,0 +1,310 @@
+"""
+Offline isochrone engine on a local road graph.
+
+Stands in for the ORS server when it is down or unreachable: the facility is
+snapped to the nearest road node, a Dijkstra search bounded at the largest
+range runs over the road graph built by road_graph.py, and each range's
+reachable roads (including the reachable part of edges leaving the last
+nodes) are rasterized onto a grid of ``offline.cell_m`` metre cells, grown
+by one cell and traced into concave polygons with holes.
+
+``OfflineIsochroneClient.isochrones()`` takes the same arguments and
+returns the same GeoJSON FeatureCollection as ``openrouteservice.Client``,
+so ``get_isochrone_with_retry`` and everything after it work unchanged.
+Select it with ``ors.engine: offline``.
+"""
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import get_config
+from logger import get_logger
+from metrics import get_metrics
+from packed_geometry import PackedGeometry
+from rasterize import points_in_polygon
+from road_graph import RoadGraph
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Unit steps of the boundary tracer, counter-clockwise: east, north, west, south
+_STEPS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+class OfflineIsochroneError(ValueError):
+    """Raised when an isochrone can't be computed (e.g. no road near the location)."""
+    pass
+
+
+def reachable_points(
+    graph: RoadGraph,
+    nodes: np.ndarray,
+    times: np.ndarray,
+    range_sec: float,
+    spacing_deg: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample the road network reachable within a range.
+
+    Reached nodes are included, and every edge leaving them is sampled up to
+    the point the remaining time allows, every ``spacing_deg`` degrees.
+
+    Args:
+        graph: Road graph
+        nodes: Nodes reached by the search
+        times: Travel time to each node
+        range_sec: Isochrone range in seconds
+        spacing_deg: Distance between samples along edges
+
+    Returns:
+        (lon, lat) arrays of sample points
+    """
+    within = times <= range_sec
+    nodes, times = nodes[within], times[within]
+    starts = graph.indptr[nodes]
+    counts = graph.indptr[nodes + 1] - starts
+    # Every outgoing edge of the reached nodes
+    tail = np.repeat(nodes, counts)
+    edge = np.arange(counts.sum()) + np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    head = graph.indices[edge]
+    fraction = np.clip((range_sec - np.repeat(times, counts)) / np.maximum(graph.seconds[edge], 1e-6), 0.0, 1.0)
+
+    x0, y0 = graph.lon[tail], graph.lat[tail]
+    dx, dy = (graph.lon[head] - x0) * fraction, (graph.lat[head] - y0) * fraction
+    steps = np.maximum(np.ceil(np.hypot(dx, dy) / spacing_deg), 1).astype(np.int64)
+    which = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps) + 1) / steps[which]
+    lon = np.concatenate((graph.lon[nodes], x0[which] + t * dx[which]))
+    lat = np.concatenate((graph.lat[nodes], y0[which] + t * dy[which]))
+    return lon, lat
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    """Grow a boolean mask by one cell in the eight directions."""
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    rows = grown.copy()
+    grown[:, 1:] |= rows[:, :-1]
+    grown[:, :-1] |= rows[:, 1:]
+    return grown
+
+
+def trace_mask(mask: np.ndarray) -> List[List[Tuple[int, int]]]:
+    """
+    Trace the outlines of the True cells of a mask.
+
+    Cell (r, c) covers x in [c, c + 1] and y in [r, r + 1] (row 0 at the
+    bottom). Outer rings come out counter-clockwise and holes clockwise;
+    cells touching only at a corner belong to separate rings.
+
+    Args:
+        mask: Boolean array
+
+    Returns:
+        Closed rings of (x, y) grid vertices, with collinear vertices removed
+    """
+    padded = np.pad(mask, 1)
+    inside = padded[1:-1, 1:-1]
+    edges: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    # Directed cell sides with the inside on the left: (start x, start y, direction)
+    for direction, (neighbour, dx0, dy0) in enumerate((
+        (padded[:-2, 1:-1], 0, 0),   # east along the bottom side, cell below outside
+        (padded[1:-1, 2:], 1, 0),    # north along the right side
+        (padded[2:, 1:-1], 1, 1),    # west along the top side
+        (padded[1:-1, :-2], 0, 1),   # south along the left side
+    )):
+        rows, cols = np.nonzero(inside & ~neighbour)
+        for x, y in zip((cols + dx0).tolist(), (rows + dy0).tolist()):
+            edges[(x, y)].append(direction)
+
+    rings = []
+    while edges:
+        start = next(iter(edges))
+        x, y = start
+        previous = None
+        vertices, directions = [], []
+        while True:
+            outgoing = edges[(x, y)]
+            left = None if previous is None else (previous + 1) % 4
+            # At pinch points (two outgoing sides) turning left keeps diagonal neighbours apart
+            direction = left if left in outgoing else outgoing[0]
+            outgoing.remove(direction)
+            if not outgoing:
+                del edges[(x, y)]
+            vertices.append((x, y))
+            directions.append(direction)
+            previous = direction
+            x, y = x + _STEPS[direction][0], y + _STEPS[direction][1]
+            if (x, y) == start:
+                break
+        # Keep only corners: vertices where the direction changes
+        rings.append([vertex for i, vertex in enumerate(vertices) if directions[i] != directions[i - 1]])
+    return rings
+
+
+def _ring_area2(ring: np.ndarray) -> float:
+    """Twice the signed area of a ring (positive when counter-clockwise)."""
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def mask_to_geometry(mask: np.ndarray, west: float, south: float, cell_lon: float, cell_lat: float) -> Optional[Dict[str, Any]]:
+    """
+    Convert a grid mask to a GeoJSON Polygon or MultiPolygon.
+
+    Args:
+        mask: Boolean array, row 0 at the south
+        west: Longitude of the grid's western edge
+        south: Latitude of the grid's southern edge
+        cell_lon: Cell width in degrees
+        cell_lat: Cell height in degrees
+
+    Returns:
+        GeoJSON geometry with holes assigned to their outer ring, or None if the mask is empty
+    """
+    exteriors, holes = [], []
+    for ring in trace_mask(mask):
+        grid = np.array(ring, dtype=np.float64)
+        (exteriors if _ring_area2(grid) > 0 else holes).append(grid)
+    if not exteriors:
+        return None
+
+    polygons = [[exterior] for exterior in exteriors]
+    if len(exteriors) == 1:
+        polygons[0].extend(holes)
+    else:
+        packed = [PackedGeometry.from_geojson({"type": "Polygon", "coordinates": [e.tolist()]}) for e in exteriors]
+        for hole in holes:
+            # The empty cell to the right of the hole's first side is inside the hole
+            step = np.sign(hole[1] - hole[0])
+            x, y = hole[0] + 0.5 * step + 0.5 * np.array([step[1], -step[0]])
+            for polygon, shape in zip(polygons, packed):
+                if points_in_polygon(shape, np.array([x]), np.array([y]))[0]:
+                    polygon.append(hole)
+                    break
+
+    def to_lonlat(ring: np.ndarray) -> List[List[float]]:
+        coords = np.column_stack((west + ring[:, 0] * cell_lon, south + ring[:, 1] * cell_lat))
+        coords = np.round(coords, 6).tolist()
+        return coords + coords[:1]
+
+    polygons = [[to_lonlat(ring) for ring in polygon] for polygon in polygons]
+    if len(polygons) == 1:
+        return {"type": "Polygon", "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+def isochrone_polygons(
+    graph: RoadGraph,
+    lat: float,
+    lon: float,
+    ranges_sec: Sequence[float],
+    cell_m: float = 200.0,
+    max_snap_m: float = 500.0
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Compute isochrone polygons for several ranges from one Dijkstra search.
+
+    Args:
+        graph: Road graph
+        lat: Start latitude
+        lon: Start longitude
+        ranges_sec: Ranges in seconds
+        cell_m: Grid cell size of the polygons in meters
+        max_snap_m: Largest distance from the start to the nearest road node
+
+    Returns:
+        GeoJSON geometry per range (None where nothing is reachable)
+
+    Raises:
+        OfflineIsochroneError: If no road node is within max_snap_m
+    """
+    node, snap_m = graph.nearest_node(lat, lon)
+    if snap_m > max_snap_m:
+        raise OfflineIsochroneError(
+            f"No road within {max_snap_m:.0f} m of ({lat}, {lon}) (nearest node {snap_m:.0f} m away)"
+        )
+    with metrics.timer('offline_dijkstra'):
+        nodes, times = graph.shortest_times([node], max(ranges_sec))
+
+    cell_lat = cell_m / METERS_PER_DEGREE_LAT
+    cell_lon = cell_lat / max(math.cos(math.radians(lat)), 0.01)
+    geometries = []
+    with metrics.timer('offline_polygons'):
+        for range_sec in ranges_sec:
+            xs, ys = reachable_points(graph, nodes, times, range_sec, min(cell_lat, cell_lon) / 2)
+            # Grid aligned to whole cells, with a one-cell margin for the dilation
+            west = (math.floor(xs.min() / cell_lon) - 1) * cell_lon
+            south = (math.floor(ys.min() / cell_lat) - 1) * cell_lat
+            cols = np.floor((xs - west) / cell_lon).astype(np.int64)
+            rows = np.floor((ys - south) / cell_lat).astype(np.int64)
+            mask = np.zeros((rows.max() + 2, cols.max() + 2), dtype=bool)
+            mask[rows, cols] = True
+            geometries.append(mask_to_geometry(_dilate(mask), west, south, cell_lon, cell_lat))
+    return geometries
+
+
+class OfflineIsochroneClient:
+    """
+    Drop-in replacement for ``openrouteservice.Client`` that computes isochrones
+    on a local road graph (only ``isochrones()`` is supported).
+    """
+
+    def __init__(self, graph: RoadGraph = None, graph_path: str = None, cell_m: float = None,
+                 max_snap_m: float = None):
+        """
+        Args:
+            graph: Loaded road graph (instead of graph_path)
+            graph_path: .npz written by ``python road_graph.py`` (default from config files.road_graph)
+            cell_m: Polygon grid cell size in meters (default from config offline.cell_m)
+            max_snap_m: Largest snapping distance to the road network (default from config offline.max_snap_m)
+        """
+        config = get_config().snapshot()
+        self.graph_path = graph_path or config.road_graph_file
+        self.cell_m = cell_m or config.offline_cell_m
+        self.max_snap_m = max_snap_m or config.offline_max_snap_m
+        self._graph = graph
+        if graph is None:
+            # Fail at startup, not on the first facility
+            with metrics.timer('road_graph_load'):
+                self._graph = RoadGraph.load(self.graph_path)
+            logger.info(f"Offline isochrone engine: {self._graph!r} from {self.graph_path}")
+
+    @property
+    def graph(self) -> RoadGraph:
+        return self._graph
+
+    def isochrones(self, locations, profile: str = 'driving-car', range=None, attributes=None, **kwargs) -> Dict[str, Any]:
+        """
+        Compute isochrones like ``openrouteservice.Client.isochrones``.
+
+        Args:
+            locations: [[lon, lat], ...] start points
+            profile: Routing profile (only driving-car is modelled)
+            range: Ranges in seconds
+            attributes: Ignored (total_pop is not available offline)
+
+        Returns:
+            GeoJSON FeatureCollection with one feature per location and range, ordered like ORS
+        """
+        if profile != 'driving-car':
+            raise OfflineIsochroneError(f"The offline engine only models driving-car, not {profile}")
+        ranges = sorted(range or [])
+        features = []
+        for group_index, (lon, lat) in enumerate(locations):
+            geometries = isochrone_polygons(self._graph, lat, lon, ranges, self.cell_m, self.max_snap_m)
+            for range_sec, geometry in zip(ranges, geometries):
+                if geometry is None:
+                    continue
+                features.append({
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": {"group_index": group_index, "value": float(range_sec), "center": [lon, lat]},
+                })
+        metrics.incr('offline_isochrones', len(features))
+        return {"type": "FeatureCollection", "features": features, "metadata": {"engine": "offline"}}
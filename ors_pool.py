@@ -0,0 +1,317 @@
+"""
+Health-weighted load balancing across multiple OpenRouteService backends.
+
+The pool exposes the same request methods as ``openrouteservice.Client``
+(``isochrones``, ``distance_matrix``, ...), so it can be passed anywhere a
+client is expected, e.g. ``get_isochrone_with_retry``.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from config import get_config
+from lazy_import import lazy_import
+from logger import get_logger
+
+openrouteservice = lazy_import('openrouteservice')
+requests = lazy_import('requests')
+
+logger = get_logger(__name__)
+
+# Client methods that are routed through the pool
+ROUTED_METHODS = (
+    'isochrones',
+    'distance_matrix',
+    'directions',
+    'pelias_search',
+    'pelias_reverse',
+    'elevation_point',
+    'elevation_line',
+    'optimization',
+)
+
+
+class NoHealthyBackendError(Exception):
+    """Raised when no ORS backend can serve a request."""
+    pass
+
+
+def health_url_for(base_url: str) -> str:
+    """Return the ``/v2/health`` URL for an ORS base URL."""
+    return f"{base_url.rstrip('/')}/v2/health"
+
+
+def check_backend_health(base_url: str, timeout: float = 5) -> bool:
+    """
+    Check whether an ORS backend reports itself as ready.
+
+    Args:
+        base_url: ORS base URL (e.g. http://host:8080/ors)
+        timeout: Request timeout in seconds
+
+    Returns:
+        True if the health endpoint returns status 'ready', False otherwise
+    """
+    try:
+        response = requests.get(health_url_for(base_url), timeout=timeout)
+        if response.status_code != 200:
+            return False
+        return response.json().get('status') == 'ready'
+    except (requests.exceptions.RequestException, ValueError):
+        return False
+
+
+def _is_backend_fault(error: Exception) -> bool:
+    """
+    Decide whether an exception should count against backend health.
+    Client errors (HTTP 4xx, e.g. unroutable point) are not the backend's fault.
+    """
+    if isinstance(error, openrouteservice.exceptions.ApiError):
+        status = getattr(error, 'status', None)
+        return status is None or int(status) >= 500 or int(status) == 429
+    return True
+
+
+class Backend:
+    """Observed state of a single ORS backend."""
+
+    __slots__ = (
+        'base_url', 'client', 'latency', 'error_rate', 'in_flight',
+        'consecutive_failures', 'healthy', 'next_check', 'requests', 'failures'
+    )
+
+    def __init__(self, base_url: str, client: Any):
+        self.base_url = base_url
+        self.client = client
+        self.latency: Optional[float] = None  # EWMA of successful request latency (s)
+        self.error_rate = 0.0                  # EWMA of failure indicator (0..1)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.next_check = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serializable view of the backend state."""
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'latency': self.latency,
+            'error_rate': round(self.error_rate, 4),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
+class ORSBackendPool:
+    """
+    Route ORS requests across several backends by observed latency and error rate.
+
+    Backends that fail ``failure_threshold`` times in a row are taken out of
+    rotation and re-admitted once their ``/v2/health`` endpoint reports ready
+    again (checked at most every ``readmit_interval`` seconds).
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        api_key: str = None,
+        timeout: int = 30,
+        failure_threshold: int = 3,
+        readmit_interval: float = 30.0,
+        latency_alpha: float = 0.2,
+        client_factory: Callable[[str], Any] = None,
+        health_check: Callable[[str], bool] = None
+    ):
+        if not base_urls:
+            raise ValueError("ORSBackendPool requires at least one base URL")
+
+        if client_factory is None:
+            def client_factory(url):
+                # Let the pool handle failover instead of the client's own 60s retry loop
+                return openrouteservice.Client(
+                    key=api_key, base_url=url, timeout=timeout, retry_timeout=timeout
+                )
+
+        self.backends = [Backend(url, client_factory(url)) for url in base_urls]
+        self.failure_threshold = failure_threshold
+        self.readmit_interval = readmit_interval
+        self.latency_alpha = latency_alpha
+        self._health_check = health_check or check_backend_health
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def __getattr__(self, name: str):
+        if name in ROUTED_METHODS:
+            def routed(*args, **kwargs):
+                return self.call(name, *args, **kwargs)
+            routed.__name__ = name
+            return routed
+        raise AttributeError(name)
+
+    @property
+    def healthy_backends(self) -> List[Backend]:
+        """Backends currently in rotation."""
+        return [b for b in self.backends if b.healthy]
+
+    def _score(self, backend: Backend, default_latency: float) -> float:
+        """Lower is better: expected latency inflated by queue depth and error rate."""
+        latency = backend.latency if backend.latency is not None else default_latency
+        return latency * (backend.in_flight + 1) / max(1.0 - backend.error_rate, 0.05)
+
+    def _readmit_due_backends(self):
+        """Health-check unhealthy backends whose re-admission check is due."""
+        now = time.monotonic()
+        with self._lock:
+            due = [b for b in self.backends if not b.healthy and b.next_check <= now]
+            for backend in due:
+                # Push the next check out before releasing the lock so only one caller probes
+                backend.next_check = now + self.readmit_interval
+
+        for backend in due:
+            if self._health_check(backend.base_url):
+                with self._lock:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    backend.error_rate = 0.0
+                logger.info(f"ORS backend {backend.base_url} is healthy again, re-admitted to rotation")
+            else:
+                logger.debug(f"ORS backend {backend.base_url} still unhealthy")
+
+    def select(self) -> Backend:
+        """
+        Pick a backend using power-of-two-choices on the latency/error score.
+
+        Raises:
+            NoHealthyBackendError: If every backend is out of rotation
+        """
+        self._readmit_due_backends()
+
+        with self._lock:
+            candidates = self.healthy_backends
+            if not candidates:
+                raise NoHealthyBackendError(
+                    f"No healthy ORS backends out of {len(self.backends)}: "
+                    f"{', '.join(b.base_url for b in self.backends)}"
+                )
+
+            observed = [b.latency for b in candidates if b.latency is not None]
+            default_latency = sum(observed) / len(observed) if observed else 1.0
+
+            if len(candidates) == 1:
+                chosen = candidates[0]
+            else:
+                first, second = self._random.sample(candidates, 2)
+                chosen = min(first, second, key=lambda b: self._score(b, default_latency))
+
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+
+    def _record_success(self, backend: Backend, elapsed: float):
+        alpha = self.latency_alpha
+        with self._lock:
+            backend.in_flight -= 1
+            backend.consecutive_failures = 0
+            backend.latency = elapsed if backend.latency is None else (1 - alpha) * backend.latency + alpha * elapsed
+            backend.error_rate = (1 - alpha) * backend.error_rate
+
+    def _record_failure(self, backend: Backend, error: Exception):
+        alpha = self.latency_alpha
+        with self._lock:
+            backend.in_flight -= 1
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.error_rate = (1 - alpha) * backend.error_rate + alpha
+            if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+                backend.healthy = False
+                backend.next_check = time.monotonic() + self.readmit_interval
+                taken_out = True
+            else:
+                taken_out = False
+
+        if taken_out:
+            logger.warning(
+                f"ORS backend {backend.base_url} failed {backend.consecutive_failures} times in a row "
+                f"({error}); taking it out of rotation for {self.readmit_interval:.0f}s"
+            )
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """
+        Send a single request to the best available backend.
+
+        Retries are left to the caller (``get_isochrone_with_retry``); each retry
+        is routed afresh, so it naturally lands on another backend after failures.
+        """
+        backend = self.select()
+        start = time.perf_counter()
+        try:
+            result = getattr(backend.client, method)(*args, **kwargs)
+        except Exception as e:
+            if _is_backend_fault(e):
+                self._record_failure(backend, e)
+            else:
+                self._record_success(backend, time.perf_counter() - start)
+            raise
+        self._record_success(backend, time.perf_counter() - start)
+        return result
+
+    def check_all(self) -> int:
+        """
+        Health-check every backend now and update rotation accordingly.
+
+        Returns:
+            Number of healthy backends
+        """
+        for backend in self.backends:
+            ok = self._health_check(backend.base_url)
+            with self._lock:
+                backend.healthy = ok
+                if ok:
+                    backend.consecutive_failures = 0
+                else:
+                    backend.next_check = time.monotonic() + self.readmit_interval
+            logger.info(f"  {backend.base_url}: {'ready' if ok else 'NOT ready'}")
+        return len(self.healthy_backends)
+
+    def stats(self) -> List[dict]:
+        """Return per-backend routing statistics."""
+        with self._lock:
+            return [b.snapshot() for b in self.backends]
+
+
+def create_ors_client(config=None):
+    """
+    Create an ORS client for the configured backend(s).
+
+    Returns a plain ``openrouteservice.Client`` when a single backend is
+    configured, an ``ORSBackendPool`` when ``ors.base_urls`` lists several, and
+    an ``OfflineIsochroneClient`` on the local road graph when ``ors.engine``
+    is ``offline``.
+    """
+    if config is None:
+        config = get_config()
+
+    if config.ors_engine == 'offline':
+        from offline_isochrones import OfflineIsochroneClient
+        return OfflineIsochroneClient(graph_path=config.road_graph_file, cell_m=config.offline_cell_m,
+                                      max_snap_m=config.offline_max_snap_m)
+
+    base_urls = config.ors_base_urls
+    if len(base_urls) <= 1:
+        return openrouteservice.Client(
+            key=config.ors_api_key,
+            base_url=base_urls[0] if base_urls else config.ors_base_url
+        )
+
+    logger.info(f"Load balancing ORS requests across {len(base_urls)} backends")
+    return ORSBackendPool(
+        base_urls,
+        api_key=config.ors_api_key,
+        timeout=config.ors_timeout,
+        failure_threshold=config.ors_failure_threshold,
+        readmit_interval=config.ors_readmit_interval
+    )
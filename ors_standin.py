@@ -0,0 +1,396 @@
+"""
+Local stand-in for the OpenRouteService HTTP API.
+
+Serves ``/v2/health``, ``/v2/isochrones/{profile}/geojson`` and
+``/v2/matrix/{profile}/json`` so the full pipeline can run (and be
+load-tested) offline and deterministically. Isochrones are either replayed
+from recorded ORS responses (e.g. kakamega_isochrone.json), translated to the
+requested location, or generated as synthetic polygons with realistic vertex
+counts. Latency, error rate and server concurrency are configurable.
+
+Usage:
+    python ors_standin.py --port 8080 --mode replay --recording kakamega_isochrone.json
+    # then point ORS_BASE_URL / ORS_HEALTH_URL at http://localhost:8080/ors
+"""
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+
+# Average driving speed used to size synthetic isochrones and matrix durations
+SYNTHETIC_SPEED_KMH = 40.0
+# Road distance is longer than straight-line distance
+SYNTHETIC_DETOUR_FACTOR = 1.3
+# A recorded 45-minute rural ORS isochrone has ~1800 vertices
+DEFAULT_VERTICES_PER_15MIN = 600
+
+
+def _location_seed(lon: float, lat: float, range_sec: float, seed: int) -> int:
+    """Stable per-request seed so the same request always yields the same polygon."""
+    return zlib.crc32(f"{lon:.6f},{lat:.6f},{range_sec:.0f},{seed}".encode())
+
+
+def synthetic_isochrone_feature(
+    lon: float,
+    lat: float,
+    range_sec: float,
+    vertices_per_15min: int = DEFAULT_VERTICES_PER_15MIN,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Generate an ORS-style isochrone feature: an irregular star-shaped polygon
+    around (lon, lat) whose size grows with range and whose vertex count is
+    comparable to real ORS output.
+
+    Args:
+        lon: Center longitude
+        lat: Center latitude
+        range_sec: Isochrone range in seconds
+        vertices_per_15min: Number of vertices per 15 minutes of range
+        seed: Extra seed to vary geometries between runs
+
+    Returns:
+        GeoJSON Feature with ORS isochrone properties
+    """
+    rng = random.Random(_location_seed(lon, lat, range_sec, seed))
+    n = max(8, int(vertices_per_15min * range_sec / 900))
+    radius_km = SYNTHETIC_SPEED_KMH * range_sec / 3600 / SYNTHETIC_DETOUR_FACTOR
+    dlat = radius_km * 1000 / METERS_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+
+    # Smooth radial noise (a few low-frequency harmonics) plus small per-vertex jitter
+    harmonics = [(rng.randint(2, 9), rng.uniform(0, 2 * math.pi), rng.uniform(0.05, 0.2)) for _ in range(4)]
+    ring = []
+    for i in range(n):
+        theta = 2 * math.pi * i / n
+        r = 1.0 + sum(a * math.sin(k * theta + phase) for k, phase, a in harmonics)
+        r *= rng.uniform(0.93, 1.0)
+        r = max(r, 0.2)
+        ring.append([round(lon + dlon * r * math.cos(theta), 6), round(lat + dlat * r * math.sin(theta), 6)])
+    ring.append(list(ring[0]))
+
+    area_km2 = _ring_area_km2(ring)
+    return {
+        "type": "Feature",
+        "properties": {
+            "group_index": 0,
+            "value": float(range_sec),
+            "center": [lon, lat],
+            "area": round(area_km2 * 1e6, 2),
+            # Synthetic stand-in for ORS's total_pop attribute (~100 people/km2)
+            "total_pop": round(area_km2 * 100.0),
+        },
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+
+
+def _ring_area_km2(ring: List[List[float]]) -> float:
+    """Approximate area of a lon/lat ring in km2 (shoelace on a local projection)."""
+    if len(ring) < 4:
+        return 0.0
+    lat0 = math.radians(sum(p[1] for p in ring) / len(ring))
+    kx = METERS_PER_DEGREE * math.cos(lat0) / 1000
+    ky = METERS_PER_DEGREE / 1000
+    total = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        total += (x1 * kx) * (y2 * ky) - (x2 * kx) * (y1 * ky)
+    return abs(total) / 2
+
+
+class RecordedIsochrones:
+    """
+    Recorded ORS isochrone features, replayed at new locations.
+    A recorded feature for the nearest range is translated to the requested
+    center and scaled by the ratio of requested to recorded range.
+    """
+
+    def __init__(self, paths: List[str]):
+        self.features: List[Dict[str, Any]] = []
+        for path in paths:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            for feature in data.get('features', []):
+                if feature.get('geometry') and 'value' in feature.get('properties', {}):
+                    self.features.append(feature)
+        if not self.features:
+            raise ValueError(f"No isochrone features found in recordings: {paths}")
+        logger.info(f"Loaded {len(self.features)} recorded isochrone(s) from {len(paths)} file(s)")
+
+    def feature_for(self, lon: float, lat: float, range_sec: float) -> Dict[str, Any]:
+        """Return a recorded feature moved to (lon, lat) and scaled to range_sec."""
+        recorded = min(self.features, key=lambda f: abs(f['properties']['value'] - range_sec))
+        props = recorded['properties']
+        c_lon, c_lat = props.get('center') or recorded['geometry']['coordinates'][0][0]
+        scale = range_sec / props['value'] if props['value'] else 1.0
+
+        def move(ring):
+            return [[round(lon + (x - c_lon) * scale, 6), round(lat + (y - c_lat) * scale, 6)] for x, y in ring]
+
+        geometry = recorded['geometry']
+        if geometry['type'] == 'Polygon':
+            coordinates = [move(ring) for ring in geometry['coordinates']]
+        else:
+            coordinates = [[move(ring) for ring in polygon] for polygon in geometry['coordinates']]
+
+        properties = dict(props, value=float(range_sec), center=[lon, lat])
+        if 'area' in properties:
+            properties['area'] = round(properties['area'] * scale * scale, 2)
+        if 'total_pop' in properties:
+            properties['total_pop'] = round(properties['total_pop'] * scale * scale)
+        return {"type": "Feature", "properties": properties,
+                "geometry": {"type": geometry['type'], "coordinates": coordinates}}
+
+
+class StandInState:
+    """Shared configuration and counters for the stand-in server."""
+
+    def __init__(
+        self,
+        mode: str = 'synthetic',
+        recordings: Optional[List[str]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        max_concurrency: int = 0,
+        queue_timeout: float = 30.0,
+        vertices_per_15min: int = DEFAULT_VERTICES_PER_15MIN,
+        seed: int = 0
+    ):
+        if mode not in ('synthetic', 'replay'):
+            raise ValueError(f"Unknown stand-in mode: {mode} (expected 'synthetic' or 'replay')")
+        self.mode = mode
+        self.recorded = RecordedIsochrones(recordings) if mode == 'replay' else None
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.vertices_per_15min = vertices_per_15min
+        self.seed = seed
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'rejected': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.counters[key] += delta
+            if key == 'in_flight':
+                self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.counters['in_flight'])
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def isochrones(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Build an ORS isochrone response for a request body."""
+        features = []
+        for group_index, (lon, lat) in enumerate(body.get('locations', [])):
+            for range_sec in body.get('range', []):
+                if self.recorded is not None:
+                    feature = self.recorded.feature_for(lon, lat, range_sec)
+                else:
+                    feature = synthetic_isochrone_feature(lon, lat, range_sec, self.vertices_per_15min, self.seed)
+                feature['properties']['group_index'] = group_index
+                features.append(feature)
+        return {
+            "type": "FeatureCollection",
+            "features": features,
+            "metadata": {
+                "attribution": "ors_standin (offline stand-in)",
+                "service": "isochrones",
+                "timestamp": int(time.time() * 1000),
+                "query": body,
+            },
+        }
+
+    def matrix(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Build an ORS matrix response with straight-line based durations."""
+        locations = body.get('locations', [])
+        sources = body.get('sources') or list(range(len(locations)))
+        destinations = body.get('destinations') or list(range(len(locations)))
+        durations = []
+        for i in sources:
+            lon1, lat1 = locations[int(i)]
+            row = []
+            for j in destinations:
+                lon2, lat2 = locations[int(j)]
+                dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+                km = math.hypot(dx, lat2 - lat1) * METERS_PER_DEGREE / 1000
+                row.append(round(km * SYNTHETIC_DETOUR_FACTOR / SYNTHETIC_SPEED_KMH * 3600, 2))
+            durations.append(row)
+        return {"durations": durations, "metadata": {"service": "matrix", "query": body}}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """HTTP handler emulating the ORS endpoints used by this project."""
+
+    server_version = "ORSStandIn/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> StandInState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, code: int, message: str):
+        self._send_json(status, {"error": {"code": code, "message": message}})
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/v2/health'):
+            self._send_json(200, {"status": "ready"})
+        elif self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, dict(self.state.counters))
+        else:
+            self._send_error(404, 2010, f"Unknown endpoint: {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_error(400, 2000, "Unable to parse JSON request")
+            return
+
+        if '/v2/isochrones/' in self.path:
+            handler = self.state.isochrones
+        elif '/v2/matrix/' in self.path:
+            handler = self.state.matrix
+        else:
+            self._send_error(404, 2010, f"Unknown endpoint: {self.path}")
+            return
+
+        state = self.state
+        state._count('requests')
+        slots = state._slots
+        if slots is not None and not slots.acquire(timeout=state.queue_timeout):
+            # Like a saturated Tomcat worker pool behind a proxy
+            state._count('rejected')
+            self._send_error(503, 2099, "Server busy: too many concurrent requests")
+            return
+
+        state._count('in_flight')
+        try:
+            time.sleep(state.delay())
+            if state.should_fail():
+                state._count('errors')
+                self._send_error(500, 2099, "Simulated internal server error")
+                return
+            self._send_json(200, handler(body))
+        finally:
+            state._count('in_flight', -1)
+            if slots is not None:
+                slots.release()
+
+
+class ORSStandIn:
+    """
+    Run the stand-in server in a background thread.
+
+    Example:
+        with ORSStandIn(mode='synthetic', latency=0.2) as server:
+            client = openrouteservice.Client(key='dummy', base_url=server.base_url)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **state_kwargs):
+        self.state = StandInState(**state_kwargs)
+        self._server = ThreadingHTTPServer((host, port), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/ors"
+
+    def start(self) -> "ORSStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ors-standin", daemon=True)
+        self._thread.start()
+        logger.info(f"ORS stand-in ({self.state.mode}) listening at {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "ORSStandIn":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline stand-in for the OpenRouteService API')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port (default: 8080)')
+    parser.add_argument('--mode', choices=['synthetic', 'replay'], default='synthetic',
+                        help='Generate synthetic polygons or replay recorded responses')
+    parser.add_argument('--recording', action='append', default=[],
+                        help='Recorded ORS isochrone response (repeatable; default: kakamega_isochrone.json)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform latency jitter in seconds (+/-)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='Requests served at once; extra requests queue (0 = unlimited)')
+    parser.add_argument('--queue-timeout', type=float, default=30.0,
+                        help='Seconds a queued request waits before HTTP 503')
+    parser.add_argument('--vertices-per-15min', type=int, default=DEFAULT_VERTICES_PER_15MIN,
+                        help='Synthetic polygon vertices per 15 minutes of range')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    recordings = args.recording
+    if args.mode == 'replay' and not recordings:
+        recordings = [str(Path(__file__).parent / "kakamega_isochrone.json")]
+
+    server = ORSStandIn(
+        host=args.host, port=args.port, mode=args.mode, recordings=recordings,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency, queue_timeout=args.queue_timeout,
+        vertices_per_15min=args.vertices_per_15min, seed=args.seed
+    )
+    print(f"ORS stand-in ({args.mode}) serving at {server.base_url}")
+    print(f"  Set ORS_BASE_URL={server.base_url} and ORS_HEALTH_URL={server.base_url}/v2/health to use it.")
+    print("  Press Ctrl+C to stop.")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("ORS stand-in stopped by user")
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Minimal OpenStreetMap PBF reader for road networks.
+
+Reads the nodes and ways of an ``.osm.pbf`` extract (the same
+kenya-latest.osm.pbf file ORS builds its graph from) without protobuf
+bindings or osmium: the few message types needed are decoded directly from
+the protobuf wire format, and the packed coordinate and node-reference
+arrays, which make up almost all of the data, are decoded with numpy.
+
+Only zlib-compressed and raw blobs are supported (what Geofabrik and osmium
+write by default).
+
+Usage:
+    for way_id, refs, tags in iter_ways(path): ...
+    for ids, lat, lon in iter_node_blocks(path): ...
+"""
+import struct
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Protobuf wire types
+_VARINT, _FIXED64, _BYTES, _FIXED32 = 0, 1, 2, 5
+
+_BLOB_HEADER_SIZE = struct.Struct('>I')
+
+# Largest blob the format allows (32 MiB uncompressed)
+MAX_BLOB_SIZE = 32 * 1024 * 1024
+
+
+class PBFError(ValueError):
+    """Raised for malformed or unsupported PBF files."""
+    pass
+
+
+def _varint(buf, pos: int) -> Tuple[int, int]:
+    """Decode one varint; return (value, next position)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf) -> Iterator[Tuple[int, int, object]]:
+    """
+    Iterate over the fields of a protobuf message.
+
+    Yields:
+        (field number, wire type, value): ints for varints and fixed-width
+        fields, memoryview slices for length-delimited fields
+    """
+    buf = memoryview(buf)
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == _VARINT:
+            value, pos = _varint(buf, pos)
+        elif wire == _BYTES:
+            length, pos = _varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == _FIXED64:
+            value = int.from_bytes(buf[pos:pos + 8], 'little')
+            pos += 8
+        elif wire == _FIXED32:
+            value = int.from_bytes(buf[pos:pos + 4], 'little')
+            pos += 4
+        else:
+            raise PBFError(f"Unsupported protobuf wire type {wire}")
+        yield field, wire, value
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def packed_varints(buf) -> np.ndarray:
+    """
+    Decode a packed repeated varint field with numpy.
+
+    Args:
+        buf: Field payload
+
+    Returns:
+        uint64 array of the raw (not zigzag-decoded) values
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0 or ends[-1] != len(data) - 1:
+        raise PBFError("Truncated packed varint field")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    # Position of every byte within its varint
+    shift = np.arange(len(data)) - np.repeat(starts, lengths)
+    parts = (data & 0x7F).astype(np.uint64) << (7 * shift).astype(np.uint64)
+    # The 7-bit groups don't overlap, so summing them is the same as OR-ing
+    return np.add.reduceat(parts, starts)
+
+
+def packed_sint64(buf, delta: bool = False) -> np.ndarray:
+    """Decode a packed sint64 field (zigzag encoded), optionally delta coded."""
+    raw = packed_varints(buf)
+    values = (raw >> np.uint64(1)).astype(np.int64) ^ -(raw & np.uint64(1)).astype(np.int64)
+    return np.cumsum(values) if delta else values
+
+
+def iter_blobs(path: str) -> Iterator[Tuple[str, bytes]]:
+    """
+    Iterate over the blobs of a PBF file.
+
+    Args:
+        path: .osm.pbf file
+
+    Yields:
+        (blob type, decompressed data): 'OSMHeader' or 'OSMData'
+
+    Raises:
+        PBFError: If the file is truncated or uses an unsupported compression
+    """
+    with open(path, 'rb') as f:
+        while True:
+            size_bytes = f.read(4)
+            if not size_bytes:
+                return
+            if len(size_bytes) < 4:
+                raise PBFError(f"Truncated blob header size in {path}")
+            header = f.read(_BLOB_HEADER_SIZE.unpack(size_bytes)[0])
+            blob_type, data_size = None, 0
+            for field, _, value in _fields(header):
+                if field == 1:
+                    blob_type = bytes(value).decode('utf-8')
+                elif field == 3:
+                    data_size = value
+            blob = f.read(data_size)
+            if len(blob) < data_size:
+                raise PBFError(f"Truncated blob in {path}")
+            yield blob_type, _decode_blob(blob)
+
+
+def _decode_blob(blob: bytes) -> bytes:
+    for field, _, value in _fields(blob):
+        if field == 1:
+            return bytes(value)
+        if field == 3:
+            return zlib.decompress(value, bufsize=MAX_BLOB_SIZE)
+        if field in (4, 5, 6, 7):
+            raise PBFError("Only zlib-compressed or raw PBF blobs are supported (re-encode with osmium cat)")
+    return b''
+
+
+class PrimitiveBlock:
+    """The string table and coordinate encoding of one OSMData blob, plus its primitive groups."""
+
+    __slots__ = ('strings', 'granularity', 'lat_offset', 'lon_offset', 'groups')
+
+    def __init__(self, data: bytes):
+        self.strings: List[str] = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+        self.groups = []
+        for field, _, value in _fields(data):
+            if field == 1:
+                self.strings = [bytes(s).decode('utf-8', 'replace') for f, _, s in _fields(value) if f == 1]
+            elif field == 2:
+                self.groups.append(value)
+            elif field == 17:
+                self.granularity = value
+            elif field == 19:
+                self.lat_offset = _signed64(value)
+            elif field == 20:
+                self.lon_offset = _signed64(value)
+
+    def degrees(self, values: np.ndarray, offset: int) -> np.ndarray:
+        return (offset + self.granularity * values.astype(np.float64)) * 1e-9
+
+    def nodes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (ids, lat, lon) of the block's dense and plain nodes."""
+        ids, lats, lons = [], [], []
+        for group in self.groups:
+            for field, _, value in _fields(group):
+                if field == 2:
+                    dense = {f: v for f, _, v in _fields(value) if f in (1, 8, 9)}
+                    ids.append(packed_sint64(dense.get(1, b''), delta=True))
+                    lats.append(packed_sint64(dense.get(8, b''), delta=True))
+                    lons.append(packed_sint64(dense.get(9, b''), delta=True))
+                elif field == 1:
+                    node = {f: v for f, _, v in _fields(value)}
+                    ids.append(np.array([_zigzag(node.get(1, 0))], dtype=np.int64))
+                    lats.append(np.array([_zigzag(node.get(8, 0))], dtype=np.int64))
+                    lons.append(np.array([_zigzag(node.get(9, 0))], dtype=np.int64))
+        if not ids:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty
+        return (np.concatenate(ids), self.degrees(np.concatenate(lats), self.lat_offset),
+                self.degrees(np.concatenate(lons), self.lon_offset))
+
+    def ways(self) -> Iterator[Tuple[int, np.ndarray, Dict[str, str]]]:
+        """Yield (way id, node ids, tags) for the block's ways."""
+        strings = self.strings
+        for group in self.groups:
+            for field, _, value in _fields(group):
+                if field != 3:
+                    continue
+                way_id, keys, vals, refs = 0, (), (), b''
+                for f, _, v in _fields(value):
+                    if f == 1:
+                        way_id = v
+                    elif f == 2:
+                        keys = packed_varints(v).tolist()
+                    elif f == 3:
+                        vals = packed_varints(v).tolist()
+                    elif f == 8:
+                        refs = v
+                tags = {strings[k]: strings[v] for k, v in zip(keys, vals)}
+                yield way_id, packed_sint64(refs, delta=True), tags
+
+
+def _signed64(value: int) -> int:
+    """Reinterpret a varint-decoded int64 field as signed."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _data_blocks(path: str) -> Iterator[PrimitiveBlock]:
+    for blob_type, data in iter_blobs(path):
+        if blob_type == 'OSMData':
+            yield PrimitiveBlock(data)
+
+
+def iter_node_blocks(path: str) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Iterate over the nodes of a PBF file, one array triple per block.
+
+    Yields:
+        (ids int64, lat float64, lon float64)
+    """
+    for block in _data_blocks(path):
+        ids, lat, lon = block.nodes()
+        if len(ids):
+            yield ids, lat, lon
+
+
+def iter_ways(path: str) -> Iterator[Tuple[int, np.ndarray, Dict[str, str]]]:
+    """
+    Iterate over the ways of a PBF file.
+
+    Yields:
+        (way id, node ids int64 array, tags dictionary)
+    """
+    for block in _data_blocks(path):
+        yield from block.ways()
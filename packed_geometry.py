@@ -0,0 +1,262 @@
+"""
+Packed coordinate storage for isochrone polygons.
+
+ORS returns polygon coordinates as nested lists of Python floats: a
+45-minute rural isochrone is thousands of boxed floats per facility.
+PackedGeometry holds the same (multi)polygon as one contiguous (N, 2) numpy
+array, float64 or int32 quantized to 1e-7 degrees (about 1 cm), plus offset
+arrays marking where each ring and polygon starts. Conversion to WKB writes
+views of that buffer; conversion back to GeoJSON uses numpy's tolist().
+
+Usage:
+    packed = PackedGeometry.from_geojson(feature['geometry'])
+    packed.to_wkb()       # little-endian WKB
+    packed.to_geojson()   # GeoJSON geometry dictionary
+"""
+import hashlib
+import struct
+from typing import Any, Dict, List
+
+import numpy as np
+
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+
+# Quantized coordinates are stored as round(degrees * QUANTIZE_SCALE) in int32
+QUANTIZE_SCALE = 10_000_000
+
+_HEADER = struct.Struct('<BI')
+_COUNT = struct.Struct('<I')
+_LE_FLOAT64 = np.dtype('<f8')
+
+
+class PackedGeometry:
+    """
+    A Polygon or MultiPolygon held as one coordinate array plus offsets.
+
+    ``coords[ring_offsets[i]:ring_offsets[i + 1]]`` is ring i, and rings
+    ``polygon_offsets[j]`` to ``polygon_offsets[j + 1]`` belong to polygon j.
+    """
+
+    __slots__ = ('geom_type', 'coords', 'ring_offsets', 'polygon_offsets')
+
+    def __init__(self, geom_type: str, coords: np.ndarray, ring_offsets: np.ndarray, polygon_offsets: np.ndarray):
+        """
+        Args:
+            geom_type: 'Polygon' or 'MultiPolygon'
+            coords: (N, 2) float64 degrees or int32 quantized coordinates
+            ring_offsets: Start index of each ring in coords, plus N at the end
+            polygon_offsets: Start index of each polygon in the rings, plus the ring count at the end
+        """
+        if geom_type not in ('Polygon', 'MultiPolygon'):
+            raise ValueError(f"Unsupported geometry type for isochrone storage: {geom_type}")
+        self.geom_type = geom_type
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.polygon_offsets = polygon_offsets
+
+    @classmethod
+    def from_geojson(cls, geometry: Dict[str, Any], quantize: bool = False) -> "PackedGeometry":
+        """
+        Pack a GeoJSON Polygon or MultiPolygon.
+
+        Args:
+            geometry: GeoJSON geometry dictionary (extra dimensions beyond x, y are dropped)
+            quantize: Store int32 coordinates at 1e-7 degree precision instead of float64
+
+        Returns:
+            PackedGeometry
+
+        Raises:
+            ValueError: If the geometry type is not Polygon or MultiPolygon
+        """
+        geom_type = geometry.get('type')
+        if geom_type == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geom_type == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            raise ValueError(f"Unsupported geometry type for isochrone storage: {geom_type}")
+
+        rings = [ring for polygon in polygons for ring in polygon]
+        ring_offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+        np.cumsum([len(ring) for ring in rings], out=ring_offsets[1:])
+        polygon_offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum([len(polygon) for polygon in polygons], out=polygon_offsets[1:])
+
+        coords = np.empty((int(ring_offsets[-1]), 2), dtype=np.float64)
+        for i, ring in enumerate(rings):
+            if ring:
+                coords[ring_offsets[i]:ring_offsets[i + 1]] = np.asarray(ring, dtype=np.float64)[:, :2]
+        if quantize:
+            coords = np.rint(coords * QUANTIZE_SCALE).astype(np.int32)
+        return cls(geom_type, coords, ring_offsets, polygon_offsets)
+
+    @classmethod
+    def from_wkb(cls, data: bytes) -> "PackedGeometry":
+        """
+        Unpack 2D little-endian WKB; the coordinate array is copied out of the buffer once.
+
+        Args:
+            data: WKB bytes of a Polygon or MultiPolygon
+
+        Returns:
+            PackedGeometry with float64 coordinates
+
+        Raises:
+            ValueError: If the WKB is big-endian or not a (multi)polygon
+        """
+        buffer = memoryview(data)
+        geom_type, offset = _read_header(buffer, 0)
+        if geom_type == WKB_POLYGON:
+            # Read below like the single member of a multipolygon
+            polygon_count = 1
+            name = 'Polygon'
+            offset = 0
+        elif geom_type == WKB_MULTIPOLYGON:
+            (polygon_count,) = _COUNT.unpack_from(buffer, offset)
+            offset += _COUNT.size
+            name = 'MultiPolygon'
+        else:
+            raise ValueError(f"Unsupported WKB geometry type: {geom_type}")
+
+        chunks: List[np.ndarray] = []
+        ring_sizes: List[int] = []
+        polygon_sizes: List[int] = []
+        for _ in range(polygon_count):
+            _, offset = _read_header(buffer, offset)
+            (ring_count,) = _COUNT.unpack_from(buffer, offset)
+            offset += _COUNT.size
+            polygon_sizes.append(ring_count)
+            for _ in range(ring_count):
+                (point_count,) = _COUNT.unpack_from(buffer, offset)
+                offset += _COUNT.size
+                chunks.append(np.frombuffer(buffer, dtype=_LE_FLOAT64, count=point_count * 2, offset=offset))
+                ring_sizes.append(point_count)
+                offset += point_count * 16
+
+        coords = np.concatenate(chunks).astype(np.float64).reshape(-1, 2) if chunks else np.empty((0, 2))
+        ring_offsets = np.zeros(len(ring_sizes) + 1, dtype=np.int64)
+        np.cumsum(ring_sizes, out=ring_offsets[1:])
+        polygon_offsets = np.zeros(len(polygon_sizes) + 1, dtype=np.int64)
+        np.cumsum(polygon_sizes, out=polygon_offsets[1:])
+        return cls(name, coords, ring_offsets, polygon_offsets)
+
+    @property
+    def quantized(self) -> bool:
+        return self.coords.dtype == np.int32
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the coordinate and offset arrays."""
+        return self.coords.nbytes + self.ring_offsets.nbytes + self.polygon_offsets.nbytes
+
+    @property
+    def num_points(self) -> int:
+        return len(self.coords)
+
+    def degrees(self) -> np.ndarray:
+        """(N, 2) float64 coordinates in degrees (the stored array itself when not quantized)."""
+        if self.quantized:
+            return self.coords / QUANTIZE_SCALE
+        return self.coords
+
+    def _polygon_rings(self, degrees: np.ndarray):
+        """Yield the rings (coordinate views) of each polygon."""
+        rings = self.ring_offsets
+        for p in range(len(self.polygon_offsets) - 1):
+            yield [degrees[rings[r]:rings[r + 1]] for r in range(self.polygon_offsets[p], self.polygon_offsets[p + 1])]
+
+    def to_wkb(self) -> bytes:
+        """
+        Encode as 2D little-endian WKB.
+
+        Ring coordinates are passed to the final join as views of the packed
+        array, so the only copy is into the returned bytes object.
+        """
+        degrees = self.degrees()
+        if degrees.dtype != _LE_FLOAT64 or not degrees.flags.c_contiguous:
+            degrees = np.ascontiguousarray(degrees, dtype=_LE_FLOAT64)
+
+        parts: list = []
+        polygons = list(self._polygon_rings(degrees))
+        if self.geom_type == 'MultiPolygon':
+            parts.append(_HEADER.pack(1, WKB_MULTIPOLYGON) + _COUNT.pack(len(polygons)))
+        for rings in polygons:
+            parts.append(_HEADER.pack(1, WKB_POLYGON) + _COUNT.pack(len(rings)))
+            for ring in rings:
+                parts.append(_COUNT.pack(len(ring)))
+                parts.append(memoryview(ring).cast('B'))
+        return b''.join(parts)
+
+    def to_geojson(self) -> Dict[str, Any]:
+        """Convert to a GeoJSON geometry dictionary."""
+        polygons = [[ring.tolist() for ring in rings] for rings in self._polygon_rings(self.degrees())]
+        if self.geom_type == 'Polygon':
+            return {"type": "Polygon", "coordinates": polygons[0] if polygons else []}
+        return {"type": "MultiPolygon", "coordinates": polygons}
+
+    def canonical_hash(self) -> str:
+        """
+        Hash that is equal for geometries that differ only in representation.
+
+        Coordinates are quantized to 1e-7 degrees; each ring loses its closing
+        and repeated vertices, starts at its smallest vertex and is oriented
+        counter-clockwise (exterior) or clockwise (holes); holes and polygons
+        are sorted. Polygon vs single-part MultiPolygon is not distinguished.
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        quantized = self.coords if self.quantized else np.rint(self.coords * QUANTIZE_SCALE).astype(np.int64)
+        quantized = quantized.astype(np.int64, copy=False)
+        polygons = []
+        for rings in self._polygon_rings(quantized):
+            normalized = [_normalize_ring(ring, hole=i > 0) for i, ring in enumerate(rings)]
+            exterior, holes = normalized[0], sorted(normalized[1:])
+            polygons.append(b''.join([_COUNT.pack(len(holes) + 1), exterior] + holes))
+        digest = hashlib.sha256()
+        for polygon in sorted(polygons):
+            digest.update(polygon)
+        return digest.hexdigest()
+
+    def __repr__(self) -> str:
+        dtype = 'int32' if self.quantized else 'float64'
+        return (f"PackedGeometry({self.geom_type}, points={self.num_points}, "
+                f"rings={len(self.ring_offsets) - 1}, {dtype})")
+
+
+def _normalize_ring(ring: np.ndarray, hole: bool) -> bytes:
+    """Canonical bytes of a quantized ring (see PackedGeometry.canonical_hash)."""
+    if len(ring) == 0:
+        return _COUNT.pack(0)
+    # Drop repeated consecutive vertices, including the closing vertex
+    keep = np.any(ring != np.roll(ring, 1, axis=0), axis=1)
+    if not keep.any():
+        keep[0] = True
+    ring = ring[keep]
+    # Orientation from the shoelace formula (positive: counter-clockwise)
+    x, y = ring[:, 0].astype(np.float64), ring[:, 1].astype(np.float64)
+    area2 = np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)
+    if (area2 < 0) != hole:
+        ring = ring[::-1]
+    start = np.lexsort((ring[:, 1], ring[:, 0]))[0]
+    ring = np.roll(ring, -start, axis=0)
+    return _COUNT.pack(len(ring)) + np.ascontiguousarray(ring, dtype='<i8').tobytes()
+
+
+def _read_header(buffer, offset: int) -> tuple:
+    byte_order, geom_type = _HEADER.unpack_from(buffer, offset)
+    if byte_order != 1:
+        raise ValueError("Only little-endian WKB is supported")
+    return geom_type, offset + _HEADER.size
+
+
+def geojson_to_wkb(geometry: Dict[str, Any]) -> bytes:
+    """Encode a GeoJSON Polygon or MultiPolygon as 2D little-endian WKB."""
+    return PackedGeometry.from_geojson(geometry).to_wkb()
+
+
+def wkb_to_geojson(data: bytes) -> Dict[str, Any]:
+    """Decode 2D little-endian WKB of a Polygon or MultiPolygon to GeoJSON."""
+    return PackedGeometry.from_wkb(data).to_geojson()
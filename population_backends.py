@@ -0,0 +1,347 @@
+"""
+Pluggable population backends.
+
+``process_facility`` asks a PopulationBackend for the population inside each
+isochrone instead of calling Google Earth Engine directly. The backend is
+chosen with ``population.backend`` in config.yaml:
+
+- ``gee``: Earth Engine reduceRegion/reduceRegions on the WorldPop dataset
+- ``raster``: zonal sum over a local raster (``population.raster_file``, GeoTIFF or .npz)
+- ``grid``: zonal sum over the precomputed population grid (``files.population_grid``)
+- ``h3``: precomputed H3 hexagon index (``population.h3_index_file``, see h3_index.py)
+- ``ors``: the ``total_pop`` attribute ORS computes server-side for each isochrone
+
+All backends share the same result cache and metrics, so they can be swapped
+and benchmarked against each other on the same facilities. Results are also
+stored in the persistent population cache (population_cache.py), namespaced
+by what each backend's results depend on. New engines are
+added with ``register_backend()``.
+
+Usage:
+    backend = get_population_backend(config)
+    pops = backend.populations(features)   # one value (or None) per GeoJSON Feature
+"""
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence, runtime_checkable
+
+from config import get_config
+from logger import get_logger
+from metrics import get_metrics
+from packed_geometry import PackedGeometry
+from population_cache import PopulationCache, cache_key, get_population_cache
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+
+@runtime_checkable
+class PopulationBackend(Protocol):
+    """Population inside isochrones, given as GeoJSON Features."""
+
+    name: str
+
+    def population(self, feature: Dict[str, Any]) -> Optional[float]:
+        """Return the population inside one feature, or None if it can't be calculated."""
+        ...
+
+    def populations(self, features: Sequence[Dict[str, Any]]) -> List[Optional[float]]:
+        """Return the population inside each feature (None where it can't be calculated)."""
+        ...
+
+
+def _file_namespace(name: str, path: Optional[str]) -> Optional[str]:
+    """Cache namespace of a file-based backend: rebuilding the file invalidates its entries."""
+    if not path or not Path(path).exists():
+        # Built from an in-memory grid/index: nothing stable to key the persistent cache on
+        return None
+    stat = Path(path).stat()
+    return f"{name}:{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class CachedPopulationBackend:
+    """
+    Base class for backends: in-process cache keyed by geometry, an optional
+    persistent PopulationCache consulted before computing, plus metrics.
+    Subclasses implement ``_compute(features)`` and ``cache_namespace()``.
+    """
+
+    name = 'base'
+    # Metrics stage timed around _compute (None when the backend times its own calls)
+    stage: Optional[str] = None
+    # Results depend only on the geometry (False when they come with the feature)
+    cacheable = True
+
+    def __init__(self):
+        self._cache: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Shared on-disk cache, set by get_population_backend() when population.cache_file is set
+        self.persistent_cache: Optional[PopulationCache] = None
+
+    @staticmethod
+    def geometry_key(feature: Dict[str, Any]) -> str:
+        """Cache key of a feature's geometry (equal for differently ordered but identical polygons)."""
+        return PackedGeometry.from_geojson(feature['geometry']).canonical_hash()
+
+    def cache_namespace(self) -> Optional[str]:
+        """
+        Identify what the results depend on besides the geometry (dataset, year, scale, file).
+        Populations are only shared between backends with the same namespace; None keeps
+        the backend out of the persistent cache.
+        """
+        return None
+
+    def population(self, feature: Dict[str, Any]) -> Optional[float]:
+        return self.populations([feature])[0]
+
+    def populations(self, features: Sequence[Dict[str, Any]]) -> List[Optional[float]]:
+        results: List[Optional[float]] = [None] * len(features)
+        missing: List[int] = list(range(len(features)))
+        keys: List[Optional[str]] = [None] * len(features)
+
+        if self.cacheable:
+            missing = []
+            with self._lock:
+                for i, feature in enumerate(features):
+                    keys[i] = self.geometry_key(feature)
+                    cached = self._cache.get(keys[i])
+                    if cached is None:
+                        missing.append(i)
+                    else:
+                        results[i] = cached
+            metrics.incr('population_cache_hits', len(features) - len(missing))
+            metrics.incr('population_cache_misses', len(missing))
+
+        persistent = self.persistent_cache if self.cacheable else None
+        namespace = self.cache_namespace() if persistent is not None else None
+        if namespace is None:
+            persistent = None
+        if missing and persistent is not None:
+            stored_keys = {i: cache_key(keys[i], namespace) for i in missing}
+            stored = persistent.get_many(stored_keys.values())
+            metrics.incr('population_store_hits', len(stored))
+            metrics.incr('population_store_misses', len(missing) - len(stored))
+            still_missing = []
+            with self._lock:
+                for i in missing:
+                    value = stored.get(stored_keys[i])
+                    if value is None:
+                        still_missing.append(i)
+                    else:
+                        results[i] = value
+                        self._cache[keys[i]] = value
+            missing = still_missing
+
+        if missing:
+            if self.stage:
+                with metrics.timer(self.stage):
+                    computed = self._compute([features[i] for i in missing])
+            else:
+                computed = self._compute([features[i] for i in missing])
+            new_values: Dict[str, float] = {}
+            with self._lock:
+                for i, value in zip(missing, computed):
+                    results[i] = value
+                    if value is None:
+                        metrics.incr('population_failures')
+                    elif self.cacheable:
+                        self._cache[keys[i]] = value
+                        new_values[keys[i]] = value
+            if persistent is not None and new_values:
+                persistent.put_many(
+                    {cache_key(key, namespace): value for key, value in new_values.items()}, namespace
+                )
+        return results
+
+    def _compute(self, features: List[Dict[str, Any]]) -> List[Optional[float]]:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name!r}>"
+
+
+class GeePopulationBackend(CachedPopulationBackend):
+    """Google Earth Engine: one reduceRegion per feature, or one reduceRegions per batch."""
+
+    name = 'gee'
+
+    def __init__(self, dataset_name: str = None, scale: int = None, max_pixels: int = None):
+        super().__init__()
+        config = get_config().snapshot()
+        self.dataset_name = dataset_name or config.gee_dataset
+        self.scale = scale or config.gee_scale
+        self.max_pixels = max_pixels or config.gee_max_pixels
+
+    def cache_namespace(self) -> str:
+        # Keyed on the image actually reduced: the population year, or the fallback image when the
+        # dataset has none for that year
+        from analyze_population import GEE_MIN_SCALE, population_image_source
+        return f"gee:{self.dataset_name}:{population_image_source(self.dataset_name)}:{max(self.scale, GEE_MIN_SCALE)}"
+
+    def _compute(self, features: List[Dict[str, Any]]) -> List[Optional[float]]:
+        # Imported here: analyze_population imports this module
+        import analyze_population
+        if len(features) == 1:
+            return [analyze_population.calculate_population_gee(
+                features[0]['geometry'], self.dataset_name, self.scale, self.max_pixels
+            )]
+        return analyze_population.calculate_populations_gee(
+            [feature['geometry'] for feature in features], self.dataset_name, self.scale
+        )
+
+
+class RasterPopulationBackend(CachedPopulationBackend):
+    """Zonal sum over a local population raster, loaded on first use."""
+
+    def __init__(self, path: str = None, grid=None, name: str = 'raster'):
+        """
+        Args:
+            path: GeoTIFF or .npz population raster
+            grid: Already loaded PopulationGrid (instead of path)
+            name: Backend name reported in metrics ('raster' or 'grid')
+        """
+        super().__init__()
+        if grid is None and (not path or not Path(path).exists()):
+            raise FileNotFoundError(f"Population raster for the '{name}' backend not found: {path!r}")
+        self.name = name
+        self.stage = f"{name}_population"
+        self.path = path
+        self._grid = grid
+
+    def cache_namespace(self) -> Optional[str]:
+        return _file_namespace(self.name, self.path)
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            with self._lock:
+                if self._grid is None:
+                    from population_grid import load_raster_grid
+                    self._grid = load_raster_grid(self.path)
+        return self._grid
+
+    def _compute(self, features: List[Dict[str, Any]]) -> List[Optional[float]]:
+        from rasterize import zonal_sum
+        grid = self.grid
+        results: List[Optional[float]] = []
+        for feature in features:
+            try:
+                results.append(zonal_sum(grid, PackedGeometry.from_geojson(feature['geometry'])))
+            except ValueError as e:
+                logger.warning(f"Raster population calculation failed: {e}")
+                results.append(None)
+        return results
+
+
+class H3PopulationBackend(CachedPopulationBackend):
+    """Precomputed H3 hexagon index (see h3_index.py), loaded on first use."""
+
+    name = 'h3'
+    stage = 'h3_population'
+
+    def __init__(self, path: str = None, index=None):
+        """
+        Args:
+            path: .npz index written by ``python h3_index.py``
+            index: Already loaded H3PopulationIndex (instead of path)
+        """
+        super().__init__()
+        if index is None and (not path or not Path(path).exists()):
+            raise FileNotFoundError(
+                f"H3 population index not found: {path!r}; build it with 'python h3_index.py'"
+            )
+        self.path = path
+        self._index = index
+
+    def cache_namespace(self) -> Optional[str]:
+        return _file_namespace(self.name, self.path)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    from h3_index import H3PopulationIndex
+                    self._index = H3PopulationIndex.load(self.path)
+        return self._index
+
+    def _compute(self, features: List[Dict[str, Any]]) -> List[Optional[float]]:
+        index = self.index
+        return [index.population(PackedGeometry.from_geojson(feature['geometry'])) for feature in features]
+
+
+class OrsAttributePopulationBackend(CachedPopulationBackend):
+    """Read the total_pop attribute ORS adds to each isochrone (requires population data on the server)."""
+
+    name = 'ors'
+    cacheable = False
+
+    def _compute(self, features: List[Dict[str, Any]]) -> List[Optional[float]]:
+        results: List[Optional[float]] = []
+        for feature in features:
+            value = (feature.get('properties') or {}).get('total_pop')
+            if value is None:
+                logger.warning("ORS isochrone has no total_pop attribute; is population data configured on the server?")
+            results.append(None if value is None else float(value))
+        return results
+
+
+_factories: Dict[str, Callable[[Any], PopulationBackend]] = {
+    'gee': lambda config: GeePopulationBackend(config.gee_dataset, config.gee_scale, config.gee_max_pixels),
+    'raster': lambda config: RasterPopulationBackend(config.population_raster_file, name='raster'),
+    'grid': lambda config: RasterPopulationBackend(config.population_grid_file, name='grid'),
+    'h3': lambda config: H3PopulationBackend(config.population_h3_index_file),
+    'ors': lambda config: OrsAttributePopulationBackend(),
+}
+_backends: Dict[str, PopulationBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[Any], PopulationBackend]):
+    """
+    Register a population backend selectable with ``population.backend``.
+
+    Args:
+        name: Backend name used in config.yaml
+        factory: Called with the config to create the backend
+    """
+    _factories[name] = factory
+    _backends.pop(name, None)
+
+
+def available_backends() -> List[str]:
+    return sorted(_factories)
+
+
+def get_population_backend(config=None, name: str = None) -> PopulationBackend:
+    """
+    Get the configured population backend; one instance (and cache) per backend name.
+
+    Args:
+        config: Configuration object (default: global config)
+        name: Backend name (default from config population.backend)
+
+    Returns:
+        PopulationBackend
+
+    Raises:
+        ValueError: If the backend name is unknown
+        FileNotFoundError: If a raster backend's file does not exist
+    """
+    if config is None:
+        config = get_config().snapshot()
+    if name is None:
+        name = config.population_backend
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name not in _factories:
+                raise ValueError(
+                    f"Unknown population backend '{name}'; choose from {', '.join(available_backends())}"
+                )
+            backend = _factories[name](config)
+            if isinstance(backend, CachedPopulationBackend) and backend.cacheable and backend.cache_namespace():
+                backend.persistent_cache = get_population_cache(config)
+            _backends[name] = backend
+            logger.info(f"Using population backend: {name}")
+        return backend
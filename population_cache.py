@@ -0,0 +1,152 @@
+"""
+Persistent population cache keyed by geometry.
+
+Re-runs, duplicate facilities and unchanged road graphs make ORS return
+byte-identical isochrones, whose population would otherwise be computed
+again. Results are stored in a SQLite file under a key made of the
+geometry's canonical hash (PackedGeometry.canonical_hash) and the backend's
+namespace (for GEE: dataset, year and scale), so every script and every run
+shares them. Population backends consult the cache before computing.
+
+Set ``population.cache_file`` to "" to disable the cache.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config import get_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite limits the number of parameters in one statement
+_QUERY_BATCH = 500
+
+_cache: Optional["PopulationCache"] = None
+_cache_lock = threading.Lock()
+
+
+def cache_key(geometry_hash: str, namespace: str) -> str:
+    """Combine a canonical geometry hash and a backend namespace into one key."""
+    return hashlib.sha256(f"{namespace}\n{geometry_hash}".encode('utf-8')).hexdigest()
+
+
+class PopulationCache:
+    """SQLite-backed mapping of cache key to population, safe to share between threads."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # WAL lets several scripts read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS populations ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, population REAL NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        """
+        Look up several keys; keys not in the cache are absent from the result.
+
+        Args:
+            keys: Cache keys from cache_key()
+
+        Returns:
+            Mapping of found keys to population
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, float] = {}
+        with self._lock:
+            for start in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[start:start + _QUERY_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, population FROM populations WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[float]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, values: Dict[str, float], namespace: str):
+        """
+        Store populations computed by one backend.
+
+        Args:
+            values: Mapping of cache key to population
+            namespace: Backend namespace the values were computed in
+        """
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO populations (key, namespace, population, created) VALUES (?, ?, ?, ?)",
+                [(key, namespace, float(value), now) for key, value in values.items()]
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM populations").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self) -> str:
+        """One-line hit/miss summary."""
+        return (f"Population cache: {self.hits} hits, {self.misses} misses "
+                f"({self.hit_rate:.0%} hit rate), {len(self):,} entries in {self.path}")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM populations")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_population_cache(config=None) -> Optional[PopulationCache]:
+    """
+    Get the shared population cache, or None if ``population.cache_file`` is empty.
+
+    Args:
+        config: Configuration object (default: global config)
+
+    Returns:
+        PopulationCache or None
+    """
+    global _cache
+    if config is None:
+        config = get_config().snapshot()
+    if not config.population_cache_file:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != str(config.population_cache_file):
+            _cache = PopulationCache(config.population_cache_file)
+        return _cache
+
+
+def log_population_cache_report():
+    """Log the shared cache's hit/miss summary, if a population backend used it this run."""
+    if _cache is not None and (_cache.hits or _cache.misses):
+        logger.info(_cache.report())
@@ -0,0 +1,304 @@
+"""
+Gridded population data.
+A regular lat/lon raster of population counts, loaded from a local .npz file
+or fetched from Google Earth Engine.
+"""
+import math
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from config import get_config
+from logger import get_logger
+from metrics import get_metrics
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+METERS_PER_DEGREE = 111320.0
+
+# Earth Engine computePixels limits a single request to 32768 pixels per side
+# and ~48MB of data; stay comfortably below both
+GEE_TILE_SIZE = 1024
+
+# GeoTIFF tags holding the pixel size and the raster-to-model tie point
+GEOTIFF_PIXEL_SCALE = 33550
+GEOTIFF_TIEPOINT = 33922
+
+
+class PopulationGrid:
+    """
+    Population counts on a regular EPSG:4326 grid.
+
+    Row 0 is the northern edge. Cell (row, col) covers
+    lon [west + col*xres, west + (col+1)*xres) and
+    lat (north - (row+1)*yres, north - row*yres].
+    """
+
+    __slots__ = ('values', 'west', 'north', 'xres', 'yres')
+
+    def __init__(self, values: np.ndarray, west: float, north: float, xres: float, yres: float):
+        self.values = np.asarray(values, dtype=np.float32)
+        self.west = float(west)
+        self.north = float(north)
+        self.xres = float(xres)
+        self.yres = float(yres)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.values.shape
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Return (west, south, east, north)."""
+        rows, cols = self.values.shape
+        return (self.west, self.north - rows * self.yres, self.west + cols * self.xres, self.north)
+
+    @property
+    def total(self) -> float:
+        return float(np.nansum(self.values))
+
+    def cell_centers(self, rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (lat, lon) arrays of the centers of the given cells."""
+        lat = self.north - (np.asarray(rows) + 0.5) * self.yres
+        lon = self.west + (np.asarray(cols) + 0.5) * self.xres
+        return lat, lon
+
+    def cell_index(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row, col) integer arrays of the cells containing the given points."""
+        rows = np.floor((self.north - np.asarray(lat)) / self.yres).astype(np.int64)
+        cols = np.floor((np.asarray(lon) - self.west) / self.xres).astype(np.int64)
+        return rows, cols
+
+    def populated_cells(self, min_population: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, cols) of cells with population above min_population."""
+        values = np.nan_to_num(self.values, nan=0.0)
+        return np.nonzero(values > min_population)
+
+    def save(self, path: str, scale: Optional[float] = None):
+        """
+        Save grid to a compressed .npz file.
+
+        Args:
+            path: Output .npz path
+            scale: GEE cell size in meters the grid was fetched at, recorded so
+                load_population_grid() can tell whether the cached grid still fits a request
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        extra = {} if scale is None else {'scale': np.float64(scale)}
+        np.savez_compressed(
+            path,
+            values=self.values,
+            transform=np.array([self.west, self.north, self.xres, self.yres], dtype=np.float64),
+            **extra
+        )
+        logger.info(f"Saved population grid {self.values.shape} to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "PopulationGrid":
+        """Load grid from a .npz file written by save()."""
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Population grid not found: {path}")
+        with np.load(path) as data:
+            west, north, xres, yres = data['transform']
+            return cls(data['values'], west, north, xres, yres)
+
+    @classmethod
+    def load_geotiff(cls, path: str) -> "PopulationGrid":
+        """
+        Load a single-band, north-up EPSG:4326 GeoTIFF (e.g. a WorldPop country raster).
+        Requires Pillow; the georeferencing is read from the ModelPixelScale and
+        ModelTiepoint tags. Negative no-data values are set to NaN.
+        """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Population raster not found: {path}")
+        try:
+            from PIL import Image
+        except ImportError as e:
+            raise ImportError("Reading GeoTIFF population rasters requires Pillow (pip install Pillow)") from e
+
+        with Image.open(path) as image:
+            tags = image.tag_v2
+            if GEOTIFF_PIXEL_SCALE not in tags or GEOTIFF_TIEPOINT not in tags:
+                raise ValueError(f"{path} has no GeoTIFF pixel scale/tiepoint tags")
+            xres, yres = tags[GEOTIFF_PIXEL_SCALE][:2]
+            i, j, _, x, y, _ = tags[GEOTIFF_TIEPOINT][:6]
+            values = np.asarray(image, dtype=np.float32)
+        values = np.where(values < 0, np.nan, values)
+        return cls(values, x - i * xres, y + j * yres, xres, yres)
+
+    def aggregate(self, factor: int) -> "PopulationGrid":
+        """
+        Return a coarser grid by summing factor x factor blocks of cells.
+        Partial blocks at the south/east edges are padded with zeros.
+        """
+        if factor <= 1:
+            return self
+        rows, cols = self.values.shape
+        pad_rows = (-rows) % factor
+        pad_cols = (-cols) % factor
+        values = np.pad(np.nan_to_num(self.values, nan=0.0), ((0, pad_rows), (0, pad_cols)))
+        new_rows, new_cols = values.shape[0] // factor, values.shape[1] // factor
+        summed = values.reshape(new_rows, factor, new_cols, factor).sum(axis=(1, 3))
+        return PopulationGrid(summed, self.west, self.north, self.xres * factor, self.yres * factor)
+
+
+def bounds_around(lats, lons, buffer_km: float) -> Tuple[float, float, float, float]:
+    """
+    Return a (west, south, east, north) box around points, expanded by buffer_km.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    dlat = buffer_km * 1000.0 / METERS_PER_DEGREE
+    mid_lat = float(np.mean(lats)) if len(lats) else 0.0
+    dlon = dlat / max(math.cos(math.radians(mid_lat)), 0.01)
+    return (float(lons.min()) - dlon, float(lats.min()) - dlat,
+            float(lons.max()) + dlon, float(lats.max()) + dlat)
+
+
+def fetch_population_grid_gee(
+    bounds: Tuple[float, float, float, float],
+    scale: float = None,
+    dataset_name: str = None
+) -> PopulationGrid:
+    """
+    Fetch a population grid for a bounding box from Google Earth Engine.
+    Source pixels are summed into cells of roughly ``scale`` meters, so cell
+    values are population counts rather than resampled densities.
+
+    Args:
+        bounds: (west, south, east, north) in degrees
+        scale: Output cell size in meters (default from config gee.scale)
+        dataset_name: GEE dataset name (default from config)
+
+    Returns:
+        PopulationGrid covering the bounding box
+    """
+    import ee
+    from analyze_population import get_population_image
+
+    config = get_config()
+    if dataset_name is None:
+        dataset_name = config.gee_dataset
+    if scale is None:
+        scale = config.gee_scale
+
+    west, south, east, north = bounds
+    res = scale / METERS_PER_DEGREE
+    width = int(math.ceil((east - west) / res))
+    height = int(math.ceil((north - south) / res))
+    logger.info(f"Fetching {width}x{height} population grid at ~{scale:.0f}m from GEE dataset {dataset_name}")
+
+    image = get_population_image(dataset_name).select('population').unmask(0)
+    # Sum native pixels into each output cell instead of nearest-neighbour sampling
+    image = image.reduceResolution(reducer=ee.Reducer.sum().unweighted(), maxPixels=65535)
+
+    values = np.zeros((height, width), dtype=np.float32)
+    for row0 in range(0, height, GEE_TILE_SIZE):
+        for col0 in range(0, width, GEE_TILE_SIZE):
+            tile_h = min(GEE_TILE_SIZE, height - row0)
+            tile_w = min(GEE_TILE_SIZE, width - col0)
+            request = {
+                'expression': image,
+                'fileFormat': 'NUMPY_NDARRAY',
+                'grid': {
+                    'dimensions': {'width': tile_w, 'height': tile_h},
+                    'affineTransform': {
+                        'scaleX': res, 'shearX': 0, 'translateX': west + col0 * res,
+                        'shearY': 0, 'scaleY': -res, 'translateY': north - row0 * res,
+                    },
+                    'crsCode': 'EPSG:4326',
+                },
+            }
+            tile = ee.data.computePixels(request)
+            values[row0:row0 + tile_h, col0:col0 + tile_w] = tile['population']
+            logger.debug(f"Fetched population tile at ({row0}, {col0}) size {tile_h}x{tile_w}")
+
+    return PopulationGrid(values, west, north, res, res)
+
+
+def grid_covers(grid: PopulationGrid, bounds: Tuple[float, float, float, float]) -> bool:
+    """Return True if a grid's extent contains a (west, south, east, north) box."""
+    west, south, east, north = grid.bounds
+    tolerance = 1e-9
+    return (west <= bounds[0] + tolerance and south <= bounds[1] + tolerance
+            and east >= bounds[2] - tolerance and north >= bounds[3] - tolerance)
+
+
+def load_population_grid(
+    path: Optional[str] = None,
+    bounds: Optional[Tuple[float, float, float, float]] = None,
+    scale: float = None
+) -> PopulationGrid:
+    """
+    Load the population grid from a local file, or fetch it from GEE.
+    A fetched grid is saved to ``path`` with its scale so later runs can work
+    offline. A grid cached by an earlier fetch is fetched again when it does
+    not cover ``bounds`` or was fetched at a different scale.
+
+    Args:
+        path: Path to a .npz population grid (default from config files.population_grid)
+        bounds: Bounding box the grid must cover, fetched from GEE if needed
+        scale: Cell size in meters for GEE fetches (default from config gee.scale)
+
+    Returns:
+        PopulationGrid
+
+    Raises:
+        FileNotFoundError: If there is no grid file and no bounds to fetch
+        ValueError: If a grid file not fetched by this function doesn't cover bounds
+    """
+    config = get_config()
+    if path is None:
+        path = config.population_grid_file
+    if scale is None:
+        scale = config.gee_scale
+
+    if path and Path(path).exists():
+        logger.info(f"Loading population grid from {path}")
+        grid = PopulationGrid.load(path)
+        with np.load(path) as data:
+            cached_scale = float(data['scale']) if 'scale' in data.files else None
+        same_scale = cached_scale is None or math.isclose(cached_scale, scale)
+        if bounds is None or (grid_covers(grid, bounds) and same_scale):
+            return grid
+        if cached_scale is None:
+            raise ValueError(
+                f"Population grid {path} (bounds {grid.bounds}) does not cover the requested bounds {bounds}; "
+                f"extend it, or remove it to fetch a new grid from GEE"
+            )
+        logger.warning(
+            f"Cached population grid {path} ({cached_scale:.0f}m, bounds {grid.bounds}) does not match the "
+            f"requested {scale:.0f}m grid over {bounds}; fetching it again"
+        )
+
+    if bounds is None:
+        raise FileNotFoundError(
+            f"Population grid file not found ({path}) and no bounds given to fetch it from GEE"
+        )
+
+    from auth_gee import initialize_gee
+    with metrics.timer('gee_init'):
+        initialize_gee()
+    grid = fetch_population_grid_gee(bounds, scale=scale)
+    if path:
+        grid.save(path, scale=scale)
+    return grid
+
+
+def load_raster_grid(path: str) -> PopulationGrid:
+    """
+    Load a population raster from a .npz grid or a GeoTIFF, by file extension.
+
+    Args:
+        path: .npz file written by PopulationGrid.save(), or .tif/.tiff GeoTIFF
+
+    Returns:
+        PopulationGrid
+    """
+    if Path(path).suffix.lower() in ('.tif', '.tiff'):
+        logger.info(f"Loading population raster from {path}")
+        return PopulationGrid.load_geotiff(path)
+    logger.info(f"Loading population grid from {path}")
+    return PopulationGrid.load(path)
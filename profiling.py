@@ -0,0 +1,359 @@
+"""
+CPU profiling for analysis runs.
+
+``--profile`` on the analysis scripts runs the script under one of two profilers:
+
+- ``deterministic``: records every Python and C function call (sys.setprofile).
+  Exact call counts and timings, with noticeable overhead on call-heavy code.
+- ``sampling``: samples the running stack every few milliseconds from a
+  background thread. Low overhead, statistical timings.
+
+Both write a collapsed-stack file (``profile_<run>_<mode>.folded``, one
+``frame;frame;frame <microseconds>`` line per stack, readable by flamegraph.pl,
+speedscope and inferno) and a top-functions report next to the log file. Time
+spent in socket/SSL/HTTP code is reported as network wait and time in
+``time.sleep`` as sleep, separately from CPU time.
+"""
+import argparse
+import linecache
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import get_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_MODES = ('deterministic', 'sampling')
+DEFAULT_SAMPLE_INTERVAL = 0.005  # seconds
+
+# Python modules whose frames mean the thread is waiting on the network
+NETWORK_FILES = ('socket.py', 'ssl.py', 'selectors.py', 'http/client.py', 'http\\client.py')
+# C extension modules whose functions block on the network
+NETWORK_C_MODULES = {'_socket', 'socket', '_ssl', 'ssl', 'select', 'selectors'}
+
+CATEGORY_CPU = 'cpu'
+CATEGORY_NETWORK = 'network'
+CATEGORY_SLEEP = 'sleep'
+
+Stack = Tuple[str, ...]
+
+
+def _short_path(filename: str) -> str:
+    """Shorten a source path to its package-relative form for frame labels."""
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/', '/lib/python'):
+        if marker in path:
+            path = path.split(marker, 1)[1]
+            if marker == '/lib/python':
+                path = path.split('/', 1)[-1]
+            return path
+    return Path(path).name
+
+
+class ProfileResult:
+    """Collapsed stacks with seconds per stack, and the category hint of each frame label."""
+
+    def __init__(self, mode: str, stacks: Dict[Stack, float], hints: Dict[str, str], wall_seconds: float):
+        self.mode = mode
+        self.stacks = stacks
+        self.hints = hints
+        self.wall_seconds = wall_seconds
+
+    def category(self, stack: Stack) -> str:
+        """Classify a stack as sleep, network wait or CPU time."""
+        if stack and self.hints.get(stack[-1]) == CATEGORY_SLEEP:
+            return CATEGORY_SLEEP
+        if any(self.hints.get(label) == CATEGORY_NETWORK for label in stack):
+            return CATEGORY_NETWORK
+        return CATEGORY_CPU
+
+    def by_category(self) -> Dict[str, float]:
+        totals = {CATEGORY_CPU: 0.0, CATEGORY_NETWORK: 0.0, CATEGORY_SLEEP: 0.0}
+        for stack, seconds in self.stacks.items():
+            totals[self.category(stack)] += seconds
+        return totals
+
+    def top_functions(self, limit: int = 20, cpu_only: bool = False) -> Tuple[list, list]:
+        """
+        Return (by_self, by_total) lists of (label, self_seconds, total_seconds).
+
+        Args:
+            limit: Number of functions in each list
+            cpu_only: Exclude network/sleep stacks from the self-time ranking
+        """
+        self_time = defaultdict(float)
+        total_time = defaultdict(float)
+        for stack, seconds in self.stacks.items():
+            if not stack:
+                continue
+            if not cpu_only or self.category(stack) == CATEGORY_CPU:
+                self_time[stack[-1]] += seconds
+            for label in set(stack):
+                total_time[label] += seconds
+        by_self = sorted(self_time, key=self_time.get, reverse=True)[:limit]
+        by_total = sorted(total_time, key=total_time.get, reverse=True)[:limit]
+        return (
+            [(label, self_time[label], total_time[label]) for label in by_self],
+            [(label, self_time.get(label, 0.0), total_time[label]) for label in by_total],
+        )
+
+    def folded(self) -> str:
+        """Render collapsed stacks, weighted in integer microseconds."""
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            micros = int(round(seconds * 1e6))
+            if stack and micros > 0:
+                lines.append(f"{';'.join(stack)} {micros}")
+        return "\n".join(lines) + "\n"
+
+    def report(self, run_name: str, limit: int = 20) -> str:
+        """Render the human-readable summary: time by category and top functions."""
+        profiled = sum(self.stacks.values())
+        categories = self.by_category()
+        lines = [
+            f"Profile ({self.mode}) of {run_name}: {self.wall_seconds:.1f}s wall, {profiled:.1f}s profiled",
+        ]
+        for name, label in ((CATEGORY_CPU, 'CPU'), (CATEGORY_NETWORK, 'Network wait'), (CATEGORY_SLEEP, 'Sleep')):
+            share = categories[name] / profiled * 100 if profiled > 0 else 0.0
+            lines.append(f"  {label:<13} {categories[name]:>9.2f}s {share:>5.1f}%")
+
+        by_self, by_total = self.top_functions(limit, cpu_only=True)
+        lines.append("")
+        lines.append(f"Top {limit} functions by self CPU time (network/sleep excluded):")
+        lines.append(f"  {'self':>9} {'total':>9}  function")
+        for label, self_s, total_s in by_self:
+            lines.append(f"  {self_s:>8.3f}s {total_s:>8.3f}s  {label}")
+        lines.append("")
+        lines.append(f"Top {limit} functions by total time:")
+        lines.append(f"  {'self':>9} {'total':>9}  function")
+        for label, self_s, total_s in by_total:
+            lines.append(f"  {self_s:>8.3f}s {total_s:>8.3f}s  {label}")
+        return "\n".join(lines)
+
+    def write(self, output_dir: str, run_name: str) -> Dict[str, str]:
+        """
+        Write profile_<run_name>_<mode>.folded and .txt to output_dir.
+
+        Returns:
+            Dictionary with 'folded' and 'report' file paths
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        folded_path = out / f"profile_{run_name}_{self.mode}.folded"
+        report_path = out / f"profile_{run_name}_{self.mode}.txt"
+        folded_path.write_text(self.folded())
+        report_path.write_text(self.report(run_name) + "\n")
+        return {'folded': str(folded_path), 'report': str(report_path)}
+
+
+class _LabelCache:
+    """Frame labels ("function (file:line)") and their category hints."""
+
+    def __init__(self):
+        self.hints: Dict[str, str] = {}
+        self._codes: Dict[Any, str] = {}
+
+    def code_label(self, code) -> str:
+        label = self._codes.get(code)
+        if label is None:
+            filename = code.co_filename.replace('\\', '/')
+            label = f"{code.co_name} ({_short_path(filename)}:{code.co_firstlineno})".replace(';', ',')
+            if filename.endswith(NETWORK_FILES):
+                self.hints[label] = CATEGORY_NETWORK
+            self._codes[code] = label
+        return label
+
+    def c_label(self, func) -> str:
+        label = self._codes.get(func)
+        if label is None:
+            module = getattr(func, '__module__', None)
+            owner = getattr(func, '__self__', None)
+            if not module and owner is not None:
+                module = type(owner).__module__
+            name = getattr(func, '__qualname__', None) or getattr(func, '__name__', repr(func))
+            label = f"{module}.{name}" if module else name
+            if label == 'time.sleep':
+                self.hints[label] = CATEGORY_SLEEP
+            elif module in NETWORK_C_MODULES:
+                self.hints[label] = CATEGORY_NETWORK
+            try:
+                self._codes[func] = label
+            except TypeError:
+                pass  # Unhashable callables are labelled on every call
+        return label
+
+
+class DeterministicProfiler:
+    """Times every function call on the current thread via sys.setprofile."""
+
+    mode = 'deterministic'
+
+    def __init__(self):
+        self._labels = _LabelCache()
+        self._stack = []  # [path, start, child_seconds]
+        self._stacks: Dict[Stack, float] = defaultdict(float)
+        self._started = 0.0
+        self._wall = 0.0
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            label = self._labels.code_label(frame.f_code)
+        elif event == 'c_call':
+            label = self._labels.c_label(arg)
+        else:
+            # return, c_return, c_exception; frames entered before start() have no entry
+            if self._stack:
+                path, start, child = self._stack.pop()
+                elapsed = now - start
+                self._stacks[path] += elapsed - child
+                if self._stack:
+                    self._stack[-1][2] += elapsed
+            return
+        parent = self._stack[-1][0] if self._stack else ()
+        self._stack.append([parent + (label,), now, 0.0])
+
+    def start(self):
+        self._started = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def stop(self) -> ProfileResult:
+        sys.setprofile(None)
+        self._wall = time.perf_counter() - self._started
+        # Close frames still open (the profiled function's callers)
+        now = time.perf_counter()
+        while self._stack:
+            path, start, child = self._stack.pop()
+            elapsed = now - start
+            self._stacks[path] += elapsed - child
+            if self._stack:
+                self._stack[-1][2] += elapsed
+        return ProfileResult(self.mode, dict(self._stacks), self._labels.hints, self._wall)
+
+
+class SamplingProfiler:
+    """Samples the profiled thread's stack from a background thread."""
+
+    mode = 'sampling'
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._labels = _LabelCache()
+        self._stacks: Dict[Stack, float] = defaultdict(float)
+        self._thread_id = None
+        self._root = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started = 0.0
+        self._sleep_lines: Dict[Tuple[str, int], bool] = {}
+
+    def _is_sleep_line(self, frame) -> bool:
+        """A C call is invisible to sampling; infer time.sleep from the leaf frame's source line."""
+        key = (frame.f_code.co_filename, frame.f_lineno)
+        is_sleep = self._sleep_lines.get(key)
+        if is_sleep is None:
+            is_sleep = 'sleep(' in linecache.getline(*key)
+            self._sleep_lines[key] = is_sleep
+        return is_sleep
+
+    def _sample(self, weight: float):
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        labels = []
+        leaf = frame
+        while frame is not None and frame is not self._root:
+            labels.append(self._labels.code_label(frame.f_code))
+            frame = frame.f_back
+        if not labels:
+            return
+        labels.reverse()
+        if self._is_sleep_line(leaf):
+            labels.append(self._labels.c_label(time.sleep))
+        self._stacks[tuple(labels)] += weight
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        # Stop stack walks at the caller of start(), so samples match the deterministic view
+        self._root = sys._getframe(1)
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> ProfileResult:
+        self._stop.set()
+        self._sampler.join()
+        wall = time.perf_counter() - self._started
+        return ProfileResult(self.mode, dict(self._stacks), self._labels.hints, wall)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Add --profile and --profile-interval options to a script's argument parser."""
+    parser.add_argument(
+        '--profile', nargs='?', const='deterministic', choices=PROFILE_MODES, default=None,
+        help='Record a CPU profile of the run (default mode: deterministic). Writes a '
+             'flame-graph .folded file and a top-functions report next to the log file'
+    )
+    parser.add_argument(
+        '--profile-interval', type=float, default=DEFAULT_SAMPLE_INTERVAL * 1000,
+        help=f'Sampling interval in milliseconds for --profile sampling (default: {DEFAULT_SAMPLE_INTERVAL * 1000:.0f})'
+    )
+
+
+def profile_call(
+    fn: Callable[..., Any],
+    mode: str,
+    run_name: str,
+    output_dir: Optional[str] = None,
+    interval: float = DEFAULT_SAMPLE_INTERVAL,
+    *args,
+    **kwargs
+) -> Any:
+    """
+    Run fn(*args, **kwargs) under a profiler and write its profile.
+
+    Args:
+        fn: Function to profile
+        mode: 'deterministic' or 'sampling'
+        run_name: Name used in the output file names
+        output_dir: Directory for profile files (default: the log file's directory)
+        interval: Sampling interval in seconds (sampling mode)
+
+    Returns:
+        fn's return value
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+    if output_dir is None:
+        output_dir = str(Path(get_config().log_file).parent)
+
+    profiler = DeterministicProfiler() if mode == 'deterministic' else SamplingProfiler(interval)
+    logger.info(f"Profiling {run_name} ({mode})")
+    profiler.start()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        result = profiler.stop()
+        paths = result.write(output_dir, run_name)
+        print(f"\n{result.report(run_name, limit=15)}")
+        logger.info(f"Saved profile to {paths['folded']} (flame graph) and {paths['report']}")
+
+
+def run_profiled(fn: Callable[[], Any], args: argparse.Namespace, run_name: str) -> Any:
+    """Run fn directly, or under the profiler selected by --profile."""
+    if not getattr(args, 'profile', None):
+        return fn()
+    return profile_call(fn, args.profile, run_name, interval=args.profile_interval / 1000.0)
@@ -0,0 +1,195 @@
+"""
+Throttled progress reporting for long facility runs.
+
+Per-facility and per-range events are aggregated and rendered as a single
+status line (throughput, ETA, failure counts), refreshed at most every
+``refresh_interval`` seconds. When stdout is not a TTY (log files, CI, nohup)
+the reporter instead logs a progress line every ``log_interval`` seconds.
+"""
+import shutil
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+from config import get_config
+from logger import get_console_handler, get_logger
+
+logger = get_logger(__name__)
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as e.g. '42s', '3m05s' or '2h14m'."""
+    if seconds is None or seconds != seconds or seconds == float('inf'):
+        return '--'
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{(seconds % 3600) // 60:02d}m"
+
+
+class ProgressReporter:
+    """
+    Aggregate progress events and render them at a bounded rate.
+
+    Usage:
+        with ProgressReporter(total=len(df)) as progress:
+            for row in rows:
+                progress.start_item(name)
+                ...
+                progress.range_done(ok)
+                ...
+                progress.item_done(ok)
+    """
+
+    def __init__(
+        self,
+        total: int,
+        unit: str = 'facilities',
+        stream: Optional[TextIO] = None,
+        refresh_interval: float = None,
+        log_interval: float = None,
+        is_tty: Optional[bool] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            total: Number of items expected
+            unit: Plural item name for the status line
+            stream: Output stream for the TTY status line (default: the console log
+                handler's stream, with log records written above the status line)
+            refresh_interval: Minimum seconds between status line redraws (default from config)
+            log_interval: Seconds between progress log lines when not a TTY (default from config)
+            is_tty: Force TTY/non-TTY mode (default: detect from stream)
+            clock: Time source (for tests)
+        """
+        config = get_config()
+        self.total = total
+        self.unit = unit
+        # Sharing the console handler keeps log records from breaking the status line
+        self._console = get_console_handler() if stream is None else None
+        self.stream = stream if stream is not None else self._console.stream
+        self.refresh_interval = config.progress_refresh_interval if refresh_interval is None else refresh_interval
+        self.log_interval = config.progress_log_interval if log_interval is None else log_interval
+        if is_tty is None:
+            is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.is_tty = is_tty
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.done = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.ranges_ok = 0
+        self.ranges_failed = 0
+        self.current = ''
+        self._started = clock()
+        self._last_render = float('-inf')
+        self._line_width = 0
+
+    def __enter__(self) -> "ProgressReporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def elapsed(self) -> float:
+        return self._clock() - self._started
+
+    @property
+    def rate(self) -> float:
+        """Completed items per second."""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds remaining, or None before the first item completes."""
+        rate = self.rate
+        if rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def start_item(self, name: str):
+        """Record that an item (facility) started processing."""
+        with self._lock:
+            self.current = str(name)
+            self._maybe_render()
+
+    def range_done(self, ok: bool):
+        """Record one per-range result (isochrone + population) of the current item."""
+        with self._lock:
+            if ok:
+                self.ranges_ok += 1
+            else:
+                self.ranges_failed += 1
+            self._maybe_render()
+
+    def item_done(self, ok: bool):
+        """Record that the current item finished, successfully or not."""
+        with self._lock:
+            self.done += 1
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self._maybe_render(force=self.done >= self.total)
+
+    def status_line(self) -> str:
+        """Render the current status as one line."""
+        pct = self.done / self.total * 100 if self.total else 100.0
+        line = (
+            f"[{self.done}/{self.total}] {pct:5.1f}% | {self.rate:.2f} {self.unit}/s | "
+            f"ETA {format_duration(self.eta)} | ok {self.succeeded} failed {self.failed} | "
+            f"ranges ok {self.ranges_ok} failed {self.ranges_failed}"
+        )
+        if self.current and self.done < self.total:
+            line += f" | {self.current}"
+        return line
+
+    def _maybe_render(self, force: bool = False):
+        """Redraw the status line or log a progress line if the interval has elapsed."""
+        now = self._clock()
+        interval = self.refresh_interval if self.is_tty else self.log_interval
+        if not force and now - self._last_render < interval:
+            return
+        self._last_render = now
+        if self.is_tty:
+            self._draw(self.status_line())
+        else:
+            logger.info(self.status_line())
+
+    def _draw(self, line: str):
+        width = shutil.get_terminal_size((120, 20)).columns - 1
+        line = line[:width]
+        if self._console is not None:
+            self._console.set_status(line)
+            return
+        # Pad over any leftover characters of a longer previous line
+        padding = max(self._line_width - len(line), 0)
+        self.stream.write(f"\r{line}{' ' * padding}")
+        self.stream.flush()
+        self._line_width = len(line)
+
+    def close(self):
+        """Render the final status and finish the status line."""
+        with self._lock:
+            if self.is_tty:
+                if self._console is not None:
+                    # Leave the final status as an ordinary line of output
+                    self._console.set_status('')
+                    self.stream.write(f"{self.status_line()}\n")
+                else:
+                    self._draw(self.status_line())
+                    self.stream.write("\n")
+                self.stream.flush()
+                self._line_width = 0
+            else:
+                logger.info(self.status_line())
+            logger.info(
+                f"Processed {self.done}/{self.total} {self.unit} in {format_duration(self.elapsed)}: "
+                f"{self.succeeded} succeeded, {self.failed} failed, "
+                f"{self.ranges_failed} range(s) failed"
+            )
@@ -0,0 +1,434 @@
+"""
+Compact road graph for offline travel-time searches.
+
+The drivable ways of an OSM PBF extract are turned into a directed graph in
+CSR form: ``indptr``/``indices``/``seconds`` arrays where the edges leaving
+node ``u`` are ``indices[indptr[u]:indptr[u + 1]]`` with travel times
+``seconds[...]``. Travel times come from the way length and a car speed per
+highway class (capped by ``maxspeed``), with one-way streets honoured. Only
+nodes that are part of a drivable way are kept, so the Kenya graph fits in a
+few hundred MB and is saved to a single .npz file.
+
+Usage:
+    python road_graph.py                        # build files.road_graph from files.osm_pbf
+    python road_graph.py --pbf extract.osm.pbf -o graph.npz
+"""
+import argparse
+import heapq
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from config import get_config
+from logger import get_logger
+from metrics import get_metrics
+from osm_pbf import iter_node_blocks, iter_ways
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+EARTH_RADIUS_M = 6371008.8
+
+# Free-flow car speeds (km/h) per OSM highway class, close to the ORS driving-car profile
+CAR_SPEEDS_KMH: Dict[str, float] = {
+    'motorway': 100, 'motorway_link': 60,
+    'trunk': 85, 'trunk_link': 60,
+    'primary': 65, 'primary_link': 50,
+    'secondary': 60, 'secondary_link': 50,
+    'tertiary': 50, 'tertiary_link': 40,
+    'unclassified': 30, 'residential': 30, 'road': 20,
+    'living_street': 10, 'service': 20, 'track': 15,
+}
+
+_NO_ACCESS = {'no', 'private'}
+_MAXSPEED = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(mph)?', re.IGNORECASE)
+
+
+def way_speed_kmh(tags: Dict[str, str], speeds: Dict[str, float] = CAR_SPEEDS_KMH) -> Optional[float]:
+    """
+    Car speed on a way, or None if cars can't use it.
+
+    Args:
+        tags: OSM way tags
+        speeds: Speed per highway class in km/h
+
+    Returns:
+        Speed in km/h (class speed, capped by a numeric maxspeed)
+    """
+    speed = speeds.get(tags.get('highway', ''))
+    if speed is None:
+        return None
+    if tags.get('access') in _NO_ACCESS or tags.get('motor_vehicle') in _NO_ACCESS \
+            or tags.get('motorcar') in _NO_ACCESS:
+        return None
+    match = _MAXSPEED.match(tags.get('maxspeed', ''))
+    if match:
+        maxspeed = float(match.group(1)) * (1.609344 if match.group(2) else 1.0)
+        if maxspeed > 0:
+            speed = min(speed, maxspeed)
+    return float(speed)
+
+
+def way_direction(tags: Dict[str, str]) -> int:
+    """Return 1 for one-way along the node order, -1 for one-way against it, 0 for both directions."""
+    oneway = tags.get('oneway', '').lower()
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('highway') in ('motorway', 'motorway_link') or tags.get('junction') in ('roundabout', 'circular'):
+        return 1
+    return 0
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters; arguments broadcast like numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form.
+
+    ``lat``/``lon`` give each node's position, and the edges leaving node u are
+    ``indices[indptr[u]:indptr[u + 1]]`` with travel times ``seconds[...]``.
+    """
+
+    __slots__ = ('lat', 'lon', 'indptr', 'indices', 'seconds')
+
+    def __init__(self, lat, lon, indptr, indices, seconds):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.seconds = np.asarray(seconds, dtype=np.float32)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.lat)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    @classmethod
+    def from_edges(cls, lat, lon, tails, heads, seconds) -> "RoadGraph":
+        """
+        Build a graph from edge lists.
+
+        Args:
+            lat: Node latitudes
+            lon: Node longitudes
+            tails: Start node of each directed edge
+            heads: End node of each directed edge
+            seconds: Travel time of each edge
+        """
+        tails = np.asarray(tails, dtype=np.int64)
+        order = np.argsort(tails, kind='stable')
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(tails, minlength=len(lat)))))
+        return cls(lat, lon, indptr, np.asarray(heads)[order], np.asarray(seconds)[order])
+
+    @classmethod
+    def from_osm_pbf(cls, path: str, speeds: Dict[str, float] = CAR_SPEEDS_KMH) -> "RoadGraph":
+        """
+        Build the car road graph of an OSM PBF extract (two passes: ways, then their nodes).
+
+        Args:
+            path: .osm.pbf file
+            speeds: Speed per highway class in km/h
+
+        Returns:
+            RoadGraph of the nodes on drivable ways
+        """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"OSM extract not found: {path}")
+
+        refs, way_of_ref, way_speeds, way_directions = [], [], [], []
+        with metrics.timer('road_graph_ways'):
+            for _, way_refs, tags in iter_ways(path):
+                speed = way_speed_kmh(tags, speeds)
+                if speed is None or len(way_refs) < 2:
+                    continue
+                way_of_ref.append(np.full(len(way_refs), len(way_speeds), dtype=np.int64))
+                refs.append(way_refs)
+                way_speeds.append(speed)
+                way_directions.append(way_direction(tags))
+        if not refs:
+            raise ValueError(f"No drivable ways in {path}")
+        refs = np.concatenate(refs)
+        way_of_ref = np.concatenate(way_of_ref)
+        way_speeds = np.array(way_speeds, dtype=np.float64)
+        way_directions = np.array(way_directions, dtype=np.int8)
+        logger.info(f"Read {len(way_speeds):,} drivable ways with {len(refs):,} node references")
+
+        # Second pass: coordinates of the referenced nodes only
+        node_ids = np.unique(refs)
+        lat = np.full(len(node_ids), np.nan)
+        lon = np.full(len(node_ids), np.nan)
+        with metrics.timer('road_graph_nodes'):
+            for ids, block_lat, block_lon in iter_node_blocks(path):
+                positions = np.minimum(np.searchsorted(node_ids, ids), len(node_ids) - 1)
+                found = node_ids[positions] == ids
+                lat[positions[found]] = block_lat[found]
+                lon[positions[found]] = block_lon[found]
+
+        # Consecutive references of the same way form an edge; drop edges to nodes outside the extract
+        node = np.searchsorted(node_ids, refs)
+        same_way = way_of_ref[:-1] == way_of_ref[1:]
+        u, v, way = node[:-1][same_way], node[1:][same_way], way_of_ref[:-1][same_way]
+        known = ~np.isnan(lat[u]) & ~np.isnan(lat[v])
+        u, v, way = u[known], v[known], way[known]
+        seconds = haversine_m(lat[u], lon[u], lat[v], lon[v]) / (way_speeds[way] / 3.6)
+
+        direction = way_directions[way]
+        forward = direction >= 0
+        backward = direction <= 0
+        tails = np.concatenate((u[forward], v[backward]))
+        heads = np.concatenate((v[forward], u[backward]))
+        seconds = np.concatenate((seconds[forward], seconds[backward]))
+
+        # Keep only nodes with edges, renumbered densely
+        used = np.zeros(len(node_ids), dtype=bool)
+        used[tails] = True
+        used[heads] = True
+        renumber = np.cumsum(used) - 1
+        graph = cls.from_edges(lat[used], lon[used], renumber[tails], renumber[heads], seconds)
+        logger.info(f"Road graph: {graph.num_nodes:,} nodes, {graph.num_edges:,} edges, "
+                    f"{graph.nbytes / 1e6:.1f} MB")
+        return graph
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[int, float]:
+        """
+        Return (node index, distance in meters) of the node closest to a point.
+
+        Args:
+            lat: Latitude
+            lon: Longitude
+        """
+        # Equirectangular distance is accurate enough to rank nearby nodes
+        scale = np.cos(np.radians(lat))
+        d2 = (self.lat - lat) ** 2 + ((self.lon - lon) * scale) ** 2
+        node = int(np.argmin(d2))
+        return node, float(haversine_m(lat, lon, self.lat[node], self.lon[node]))
+
+    def shortest_times(
+        self,
+        sources: Iterable[int],
+        max_seconds: float,
+        source_seconds: Optional[Iterable[float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dijkstra from one or more source nodes, bounded at max_seconds.
+
+        Args:
+            sources: Source node indices
+            max_seconds: Stop once every remaining node is further than this
+            source_seconds: Starting time of each source (default 0)
+
+        Returns:
+            (nodes, seconds): reached node indices and their travel times, in order of travel time
+        """
+        sources = list(sources)
+        starts = [0.0] * len(sources) if source_seconds is None else [float(s) for s in source_seconds]
+        indptr, indices, weights = self.indptr, self.indices, self.seconds
+        best: Dict[int, float] = {}
+        heap = [(start, int(node)) for start, node in zip(starts, sources) if start <= max_seconds]
+        heapq.heapify(heap)
+        done_nodes, done_times = [], []
+        done = set()
+        while heap:
+            time_u, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            done_nodes.append(u)
+            done_times.append(time_u)
+            lo, hi = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                time_v = time_u + w
+                if time_v <= max_seconds and time_v < best.get(v, np.inf) and v not in done:
+                    best[v] = time_v
+                    heapq.heappush(heap, (time_v, v))
+        return np.array(done_nodes, dtype=np.int64), np.array(done_times, dtype=np.float64)
+
+    def nearest_nodes(self, lat, lon, max_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Snap many points to their nearest node within max_m.
+
+        Nodes are bucketed on a grid of max_m cells, so each point only
+        compares against the nodes of its 3x3 neighbourhood.
+
+        Args:
+            lat: Point latitudes
+            lon: Point longitudes
+            max_m: Largest snapping distance in meters
+
+        Returns:
+            (nodes, meters): nearest node per point, -1 and inf where none is within max_m
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        cell = max_m / (np.pi * EARTH_RADIUS_M / 180)
+        # Longitude buckets widen with latitude so the 3x3 neighbourhood still covers max_m
+        cell_lon = cell / max(np.cos(np.radians(np.abs(np.concatenate((self.lat, lat))).max())), 0.01)
+        node_keys = np.floor(self.lat / cell).astype(np.int64) * (1 << 32) + np.floor(self.lon / cell_lon).astype(np.int64)
+        order = np.argsort(node_keys, kind='stable')
+        sorted_keys = node_keys[order]
+
+        nodes = np.full(len(lat), -1, dtype=np.int64)
+        meters = np.full(len(lat), np.inf)
+        rows, cols = np.floor(lat / cell).astype(np.int64), np.floor(lon / cell_lon).astype(np.int64)
+        for i in range(len(lat)):
+            keys = [(rows[i] + dr) * (1 << 32) + cols[i] + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+            candidates = np.concatenate([
+                order[np.searchsorted(sorted_keys, key):np.searchsorted(sorted_keys, key, side='right')]
+                for key in keys
+            ])
+            if len(candidates) == 0:
+                continue
+            distances = haversine_m(lat[i], lon[i], self.lat[candidates], self.lon[candidates])
+            best = int(np.argmin(distances))
+            if distances[best] <= max_m:
+                nodes[i], meters[i] = candidates[best], distances[best]
+        return nodes, meters
+
+    def nearest_source_times(
+        self,
+        sources: Iterable[int],
+        max_seconds: float,
+        source_seconds: Optional[Iterable[float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        One Dijkstra search seeded from all sources at once: the travel time
+        from the nearest source to every node, and which source that is.
+
+        The cost is one search over the graph, whatever the number of sources.
+
+        Args:
+            sources: Source node indices
+            max_seconds: Nodes further than this from every source stay unreached
+            source_seconds: Starting time of each source (default 0), e.g. the time to reach the road
+
+        Returns:
+            (seconds, source): per node, the travel time (inf if unreached) and the
+            position in ``sources`` of the nearest source (-1 if unreached)
+        """
+        sources = list(sources)
+        starts = [0.0] * len(sources) if source_seconds is None else [float(s) for s in source_seconds]
+        indptr, indices, weights = self.indptr, self.indices, self.seconds
+        best = [np.inf] * self.num_nodes
+        label = [-1] * self.num_nodes
+        heap = []
+        for position, (node, start) in enumerate(zip(sources, starts)):
+            node = int(node)
+            if start <= max_seconds and start < best[node]:
+                best[node] = start
+                label[node] = position
+                heap.append((start, node))
+        heapq.heapify(heap)
+        done = bytearray(self.num_nodes)
+        while heap:
+            time_u, u = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = 1
+            source = label[u]
+            lo, hi = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                time_v = time_u + w
+                if time_v < best[v] and time_v <= max_seconds:
+                    best[v] = time_v
+                    label[v] = source
+                    heapq.heappush(heap, (time_v, v))
+        return np.array(best, dtype=np.float64), np.array(label, dtype=np.int64)
+
+    def update_source_times(
+        self,
+        seconds: np.ndarray,
+        source: np.ndarray,
+        seeds: Iterable[int],
+        max_seconds: float
+    ) -> np.ndarray:
+        """
+        Continue a nearest_source_times() search in place from changed seed nodes.
+
+        The seeds keep their current time and source; the search only goes on
+        through nodes it reaches faster than their current time, so the cost
+        is proportional to the area that changes hands.
+
+        Args:
+            seconds: Per-node travel times from nearest_source_times(), updated in place
+            source: Per-node source labels from nearest_source_times(), updated in place
+            seeds: Nodes to search from
+            max_seconds: Nodes further than this from every source stay unreached
+
+        Returns:
+            Indices of the nodes whose time or source changed (the seeds are not included)
+        """
+        indptr, indices, weights = self.indptr, self.indices, self.seconds
+        heap = [(float(seconds[node]), int(node)) for node in seeds if np.isfinite(seconds[node])]
+        heapq.heapify(heap)
+        changed = set()
+        while heap:
+            time_u, u = heapq.heappop(heap)
+            if time_u > seconds[u]:
+                continue
+            label = source[u]
+            lo, hi = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                time_v = time_u + w
+                if time_v < seconds[v] and time_v <= max_seconds:
+                    seconds[v] = time_v
+                    source[v] = label
+                    changed.add(v)
+                    heapq.heappush(heap, (time_v, v))
+        return np.fromiter(changed, dtype=np.int64, count=len(changed))
+
+    def save(self, path: str):
+        """Save the graph to a compressed .npz file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, lat=self.lat, lon=self.lon, indptr=self.indptr,
+                            indices=self.indices, seconds=self.seconds)
+        logger.info(f"Saved road graph ({self.num_nodes:,} nodes) to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        """Load a graph written by save()."""
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Road graph not found: {path}; build it with 'python road_graph.py'")
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['indptr'], data['indices'], data['seconds'])
+
+    def __repr__(self) -> str:
+        return f"RoadGraph(nodes={self.num_nodes}, edges={self.num_edges})"
+
+
+def main(argv: list = None):
+    """Build the road graph used by the offline isochrone engine."""
+    config = get_config()
+    parser = argparse.ArgumentParser(description='Build the road graph for offline isochrones from an OSM PBF extract')
+    parser.add_argument('--pbf', default=config.osm_pbf_file,
+                        help=f'OSM extract (default: {config.osm_pbf_file})')
+    parser.add_argument('-o', '--output', default=config.road_graph_file,
+                        help=f'Output .npz path (default: {config.road_graph_file})')
+    args = parser.parse_args(argv)
+
+    if not args.pbf or not Path(args.pbf).exists():
+        parser.error(f"OSM extract not found: {args.pbf!r}")
+    graph = RoadGraph.from_osm_pbf(args.pbf)
+    graph.save(args.output)
+    print(f"Road graph: {graph.num_nodes:,} nodes, {graph.num_edges:,} edges ({graph.nbytes / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+What-if scenarios: add or remove facilities and get the change in covered population.
+
+A CoverageState holds the nearest-facility travel-time field of the current
+facilities, per road node and per population cell (see travel_time_field.py).
+Scenarios are applied to it incrementally instead of rerunning the analysis:
+
+- Adding a facility searches from its road node only through the nodes it
+  reaches faster than their current facility.
+- Removing a facility clears the road nodes of its catchment and refills them
+  from the border of the neighbouring catchments.
+
+Only the population cells within off-road reach of the changed road nodes are
+recomputed, so a scenario takes seconds even on a national graph.
+
+Usage:
+    python scenarios.py --remove "Facility A" --upgrade "Facility B" --add "New site,0.28,34.75"
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from config import get_config
+from lazy_import import lazy_import
+from logger import get_logger
+from metrics import finish_run, get_metrics
+from population_grid import PopulationGrid
+from road_graph import RoadGraph
+from travel_time_field import cell_field, facility_field, spread_step_m, spread_steps
+
+pd = lazy_import('pandas')
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+# (row_start, row_stop, col_start, col_stop) of a block of grid cells
+Window = Tuple[int, int, int, int]
+
+
+class ScenarioImpact(NamedTuple):
+    """Covered population per range (minutes) before and after a scenario."""
+    before: Dict[int, float]
+    after: Dict[int, float]
+    nodes_changed: int
+    cells_changed: int
+    seconds: float
+
+    @property
+    def delta(self) -> Dict[int, float]:
+        """Change in covered population per range."""
+        return {m: self.after[m] - self.before[m] for m in self.before}
+
+    def summary(self) -> str:
+        lines = [f"{self.nodes_changed:,} road nodes and {self.cells_changed:,} cells changed "
+                 f"(computed in {self.seconds:.2f}s)"]
+        for m in self.before:
+            lines.append(f"  Within {m:>3} min: {self.before[m]:>14,.0f} -> {self.after[m]:>14,.0f} "
+                         f"({self.delta[m]:+,.0f})")
+        return "\n".join(lines)
+
+
+def _merge_windows(windows: List[Window]) -> List[Window]:
+    """Merge overlapping windows into their bounding boxes until all are disjoint."""
+    merged: List[Window] = []
+    for window in windows:
+        while True:
+            for i, other in enumerate(merged):
+                if (window[0] < other[1] and other[0] < window[1]
+                        and window[2] < other[3] and other[2] < window[3]):
+                    window = (min(window[0], other[0]), max(window[1], other[1]),
+                              min(window[2], other[2]), max(window[3], other[3]))
+                    del merged[i]
+                    break
+            else:
+                merged.append(window)
+                break
+    return merged
+
+
+class CoverageState:
+    """
+    Stored coverage of a set of facilities, updated incrementally by what_if().
+
+    Facilities keep their index for the life of the state; removed facilities
+    are marked inactive and added ones are appended.
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        grid: PopulationGrid,
+        names: Sequence[str],
+        lat: Sequence[float],
+        lon: Sequence[float],
+        node_seconds: np.ndarray,
+        node_facility: np.ndarray,
+        cell_seconds: np.ndarray,
+        cell_facility: np.ndarray,
+        max_seconds: float,
+        max_offroad_m: float,
+        offroad_kmh: float,
+        active: Optional[Sequence[bool]] = None
+    ):
+        self.graph = graph
+        self.grid = grid
+        self.names = list(names)
+        self.lat = list(lat)
+        self.lon = list(lon)
+        self.active = [True] * len(self.names) if active is None else [bool(a) for a in active]
+        self.node_seconds = node_seconds
+        self.node_facility = node_facility
+        self.cell_seconds = cell_seconds
+        self.cell_facility = cell_facility
+        self.max_seconds = float(max_seconds)
+        self.max_offroad_m = float(max_offroad_m)
+        self.offroad_kmh = float(offroad_kmh)
+        self.step_m = spread_step_m(grid)
+        self._edge_tails = None
+
+    @classmethod
+    def build(
+        cls,
+        graph: RoadGraph,
+        grid: PopulationGrid,
+        facilities: pd.DataFrame,
+        max_seconds: float,
+        max_offroad_m: float,
+        offroad_kmh: float
+    ) -> "CoverageState":
+        """
+        Compute the coverage of a set of facilities from scratch (one multi-source search).
+
+        Args:
+            graph: Road graph
+            grid: Population grid
+            facilities: DataFrame with 'name', 'lat', 'lon' columns
+            max_seconds: Search bound; scenarios can report ranges up to this
+            max_offroad_m: Largest off-road distance to the road network
+            offroad_kmh: Off-road speed
+        """
+        lat = facilities['lat'].to_numpy(dtype=np.float64)
+        lon = facilities['lon'].to_numpy(dtype=np.float64)
+        node_seconds, node_facility = facility_field(graph, lat, lon, max_seconds, max_offroad_m, offroad_kmh)
+        with metrics.timer('cell_field'):
+            cell_seconds, cell_facility = cell_field(graph, node_seconds, node_facility, grid,
+                                                     max_offroad_m, offroad_kmh)
+        return cls(graph, grid, facilities['name'].astype(str).tolist(), lat, lon, node_seconds, node_facility,
+                   cell_seconds, cell_facility, max_seconds, max_offroad_m, offroad_kmh)
+
+    def facility_index(self, facility: Union[int, str]) -> int:
+        """
+        Resolve a facility name (or index) to its index.
+
+        Raises:
+            KeyError: If no active facility has that name or index
+        """
+        if isinstance(facility, (int, np.integer)):
+            if 0 <= facility < len(self.names) and self.active[facility]:
+                return int(facility)
+        else:
+            for index, (name, active) in enumerate(zip(self.names, self.active)):
+                if active and name == facility:
+                    return index
+        raise KeyError(f"No active facility {facility!r}")
+
+    def covered_population(self, ranges_min: Iterable[int]) -> Dict[int, float]:
+        """Population within each range (minutes) of its nearest active facility."""
+        population = np.nan_to_num(self.grid.values)
+        return {m: float(population[self.cell_seconds <= m * 60].sum()) for m in ranges_min}
+
+    def what_if(
+        self,
+        add: Iterable[Tuple[str, float, float]] = (),
+        remove: Iterable[Union[int, str]] = (),
+        ranges_min: Iterable[int] = (15, 30, 45),
+        apply: bool = False
+    ) -> ScenarioImpact:
+        """
+        Evaluate removing and adding facilities (removals first).
+
+        Args:
+            add: (name, lat, lon) of facilities to add, e.g. an upgraded facility
+            remove: Names or indices of facilities to remove
+            ranges_min: Ranges in minutes to report (at most max_seconds / 60)
+            apply: Keep the scenario in this state instead of discarding it
+
+        Returns:
+            ScenarioImpact with the covered population per range before and after
+
+        Raises:
+            KeyError: If a facility to remove is unknown
+            ValueError: If a facility to add is too far from a road, or a range exceeds the stored field
+        """
+        start = time.perf_counter()
+        add, remove = list(add), list(remove)
+        ranges_min = [int(m) for m in ranges_min]
+        if any(m * 60 > self.max_seconds for m in ranges_min):
+            raise ValueError(f"Ranges must be at most {self.max_seconds / 60:.0f} minutes for this state")
+        graph = self.graph
+        seconds, source = self.node_seconds.copy(), self.node_facility.copy()
+        names, lat, lon, active = list(self.names), list(self.lat), list(self.lon), list(self.active)
+        changed: List[np.ndarray] = []
+
+        with metrics.timer('scenario_nodes'):
+            for facility in remove:
+                index = self.facility_index(facility)
+                active[index] = False
+                cleared = np.flatnonzero(source == index)
+                seconds[cleared] = np.inf
+                source[cleared] = -1
+                # Refill the catchment from the reached nodes with an edge into it
+                in_catchment = np.zeros(graph.num_nodes, dtype=bool)
+                in_catchment[cleared] = True
+                tails = self._tails()
+                border = in_catchment[graph.indices] & ~in_catchment[tails] & np.isfinite(seconds[tails])
+                changed.append(cleared)
+                changed.append(graph.update_source_times(seconds, source, np.unique(tails[border]),
+                                                         self.max_seconds))
+
+            for name, facility_lat, facility_lon in add:
+                nodes, snap_m = graph.nearest_nodes([facility_lat], [facility_lon], self.max_offroad_m)
+                if nodes[0] < 0:
+                    raise ValueError(f"{name} is more than {self.max_offroad_m:.0f} m from a road")
+                node = int(nodes[0])
+                index = len(names)
+                names.append(str(name))
+                lat.append(float(facility_lat))
+                lon.append(float(facility_lon))
+                active.append(True)
+                start_seconds = float(snap_m[0]) / (self.offroad_kmh / 3.6)
+                if start_seconds < seconds[node]:
+                    seconds[node] = start_seconds
+                    source[node] = index
+                    changed.append(np.array([node]))
+                    changed.append(graph.update_source_times(seconds, source, [node], self.max_seconds))
+
+        changed_nodes = np.unique(np.concatenate(changed)) if changed else np.empty(0, dtype=np.int64)
+        with metrics.timer('scenario_cells'):
+            before = self.covered_population(ranges_min)
+            after = dict(before)
+            cells_changed = 0
+            updates = []
+            population = self.grid.values
+            for r0, r1, c0, c1 in self._affected_windows(changed_nodes):
+                new_s, new_f = self._window_field(seconds, source, (r0, r1, c0, c1))
+                old_s = self.cell_seconds[r0:r1, c0:c1]
+                old_f = self.cell_facility[r0:r1, c0:c1]
+                window_population = np.nan_to_num(population[r0:r1, c0:c1])
+                for m in ranges_min:
+                    after[m] += float(window_population[new_s <= m * 60].sum()
+                                      - window_population[old_s <= m * 60].sum())
+                cells_changed += int(((new_s != old_s) | (new_f != old_f)).sum())
+                updates.append(((r0, r1, c0, c1), new_s, new_f))
+
+        if apply:
+            self.node_seconds, self.node_facility = seconds, source
+            self.names, self.lat, self.lon, self.active = names, lat, lon, active
+            for (r0, r1, c0, c1), new_s, new_f in updates:
+                self.cell_seconds[r0:r1, c0:c1] = new_s
+                self.cell_facility[r0:r1, c0:c1] = new_f
+
+        impact = ScenarioImpact(before, after, len(changed_nodes), cells_changed, time.perf_counter() - start)
+        logger.info(f"Scenario (+{len(add)} / -{len(remove)} facilities): {impact.nodes_changed:,} nodes, "
+                    f"{impact.cells_changed:,} cells changed in {impact.seconds:.2f}s")
+        return impact
+
+    def _tails(self) -> np.ndarray:
+        """Start node of every edge, in CSR order (built on first use)."""
+        if self._edge_tails is None:
+            self._edge_tails = np.repeat(np.arange(self.graph.num_nodes), np.diff(self.graph.indptr))
+        return self._edge_tails
+
+    def _affected_windows(self, nodes: np.ndarray) -> List[Window]:
+        """Disjoint blocks of cells whose travel time can depend on the given road nodes."""
+        if len(nodes) == 0:
+            return []
+        n_rows, n_cols = self.grid.shape
+        rows, cols = self.grid.cell_index(self.graph.lat[nodes], self.graph.lon[nodes])
+        inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+        if not inside.any():
+            return []
+        rows, cols = rows[inside], cols[inside]
+        k = spread_steps(self.max_offroad_m, self.step_m)
+        # One window per block of 64 x 64 cells with changed nodes, so far-apart changes stay small
+        blocks = np.unique(np.column_stack((rows // 64, cols // 64)), axis=0)
+        windows = [(max(int(br) * 64 - k, 0), min(int(br) * 64 + 64 + k, n_rows),
+                    max(int(bc) * 64 - k, 0), min(int(bc) * 64 + 64 + k, n_cols)) for br, bc in blocks]
+        return _merge_windows(windows)
+
+    def _window_field(self, seconds: np.ndarray, source: np.ndarray, window: Window) -> Tuple[np.ndarray, np.ndarray]:
+        """Recompute cell_field() for a window, from a grid padded by the spread distance."""
+        r0, r1, c0, c1 = window
+        n_rows, n_cols = self.grid.shape
+        k = spread_steps(self.max_offroad_m, self.step_m)
+        p0, p1 = max(r0 - k, 0), min(r1 + k, n_rows)
+        q0, q1 = max(c0 - k, 0), min(c1 + k, n_cols)
+        grid = self.grid
+        padded = PopulationGrid(grid.values[p0:p1, q0:q1], grid.west + q0 * grid.xres,
+                                grid.north - p0 * grid.yres, grid.xres, grid.yres)
+        cell_seconds, cell_facility = cell_field(self.graph, seconds, source, padded,
+                                                 self.max_offroad_m, self.offroad_kmh, step_m=self.step_m)
+        return cell_seconds[r0 - p0:r1 - p0, c0 - q0:c1 - q0], cell_facility[r0 - p0:r1 - p0, c0 - q0:c1 - q0]
+
+    def save(self, path: str):
+        """Save the state (not the graph or grid) to a compressed .npz file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with metrics.timer('coverage_state_write'):
+            np.savez_compressed(
+                path, names=np.array(self.names, dtype=str), lat=np.array(self.lat), lon=np.array(self.lon),
+                active=np.array(self.active), node_seconds=self.node_seconds, node_facility=self.node_facility,
+                cell_seconds=self.cell_seconds, cell_facility=self.cell_facility,
+                params=np.array([self.max_seconds, self.max_offroad_m, self.offroad_kmh])
+            )
+        logger.info(f"Saved coverage state ({sum(self.active)} facilities) to {path}")
+
+    @classmethod
+    def load(cls, path: str, graph: RoadGraph, grid: PopulationGrid) -> "CoverageState":
+        """
+        Load a state written by save() for the same graph and grid.
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+            ValueError: If it was built for a different graph or grid
+        """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Coverage state not found: {path}")
+        with np.load(path) as data:
+            if len(data['node_seconds']) != graph.num_nodes or data['cell_seconds'].shape != grid.shape:
+                raise ValueError(f"Coverage state {path} was built for a different road graph or population grid")
+            max_seconds, max_offroad_m, offroad_kmh = data['params'].tolist()
+            return cls(graph, grid, data['names'].tolist(), data['lat'], data['lon'], data['node_seconds'],
+                       data['node_facility'], data['cell_seconds'], data['cell_facility'],
+                       max_seconds, max_offroad_m, offroad_kmh, active=data['active'])
+
+
+def _parse_addition(value: str) -> Tuple[str, float, float]:
+    """Parse a 'name,lat,lon' command-line argument."""
+    name, _, coordinates = value.rpartition(',')
+    name, _, lat = name.rpartition(',')
+    try:
+        return name, float(lat), float(coordinates)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected NAME,LAT,LON, got {value!r}")
+
+
+def _find_facility(name: str, config) -> Tuple[str, float, float]:
+    """Look up a facility of any level in the input file, e.g. one to be upgraded."""
+    from analyze_population import extract_facility_locations, load_facilities
+    facilities = extract_facility_locations(load_facilities(config.input_file))
+    match = facilities[facilities['name'].astype(str) == name]
+    if len(match) == 0:
+        raise KeyError(f"Facility {name!r} not found in {config.input_file}")
+    row = match.iloc[0]
+    return name, float(row['lat']), float(row['lon'])
+
+
+def main(argv: list = None):
+    """Evaluate a what-if scenario against the stored coverage of the configured facilities."""
+    from matrix_analysis import load_matrix_inputs
+    config = get_config().snapshot()
+    parser = argparse.ArgumentParser(description='Change in covered population when facilities are added or removed')
+    parser.add_argument('--add', action='append', default=[], type=_parse_addition, metavar='NAME,LAT,LON',
+                        help='New facility at a point (repeatable)')
+    parser.add_argument('--upgrade', action='append', default=[], metavar='NAME',
+                        help='Existing facility of another level to add, by name (repeatable)')
+    parser.add_argument('--remove', action='append', default=[], metavar='NAME',
+                        help='Facility to remove, by name (repeatable)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help=f'Recompute the stored coverage state ({config.coverage_state_file})')
+    args = parser.parse_args(argv)
+
+    inputs = load_matrix_inputs(config)
+    if inputs is None:
+        return
+    facilities, grid = inputs
+    try:
+        with metrics.timer('road_graph_load'):
+            graph = RoadGraph.load(config.road_graph_file)
+        state = None
+        if not args.rebuild and Path(config.coverage_state_file).exists():
+            try:
+                state = CoverageState.load(config.coverage_state_file, graph, grid)
+            except ValueError as e:
+                logger.warning(f"{e}; rebuilding")
+        if state is None:
+            state = CoverageState.build(graph, grid, facilities, config.matrix_max_minutes * 60,
+                                        config.matrix_max_offroad_m, config.matrix_offroad_kmh)
+            state.save(config.coverage_state_file)
+        additions = args.add + [_find_facility(name, config) for name in args.upgrade]
+        impact = state.what_if(add=additions, remove=args.remove,
+                               ranges_min=[range_sec // 60 for range_sec in config.range_seconds])
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        logger.error(f"{e}")
+        return
+
+    print(f"\n{'='*70}")
+    print("SCENARIO: CHANGE IN POPULATION COVERED")
+    print(f"{'='*70}")
+    print(impact.summary())
+    print(f"{'='*70}\n")
+    finish_run('scenarios', config)
+
+
+if __name__ == "__main__":
+    main()
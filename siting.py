@@ -0,0 +1,386 @@
+"""
+Greedy maximal-coverage facility siting.
+
+Picks the K candidate sites (for example Level 3/4 facilities that could be
+upgraded) whose isochrones add the most population to what the existing
+facilities already cover within a travel time range.
+
+Coverage sets are bitsets over the population grid in 8 x 8 cell tiles: a
+site is a sorted array of tile ids plus one uint64 word per tile, with bit
+(row % 8) * 8 + (col % 8) set for each covered cell. Only the tiles an
+isochrone touches are stored, and the union of the selected sites is one word
+per tile of the grid.
+
+Selection is lazy greedy (CELF): a site's marginal gain can only shrink as
+other sites are selected, so candidates wait in a max-heap under their last
+computed gain and only the top one is re-evaluated. If its fresh gain is still
+the largest it is selected without looking at the others.
+
+Usage:
+    python siting.py            # k and range from config.yaml (siting section)
+    python siting.py --k 5 --range-min 30
+"""
+import argparse
+import heapq
+import json
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import get_config
+from lazy_import import lazy_import
+from logger import get_logger
+from metrics import finish_run, get_metrics
+from packed_geometry import PackedGeometry
+from population_grid import PopulationGrid
+from rasterize import geometry_bounds, grid_window, polygon_mask
+
+pd = lazy_import('pandas')
+folium = lazy_import('folium')
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+# Tiles are TILE x TILE cells, one bit per cell in a uint64 word
+TILE = 8
+
+
+class Bitset(NamedTuple):
+    """Coverage set: sorted tile ids and one 64-bit word of covered cells per tile."""
+    tiles: np.ndarray
+    words: np.ndarray
+
+    @property
+    def cells(self) -> int:
+        return int(np.unpackbits(self.words.view(np.uint8)).sum())
+
+
+class TiledPopulation:
+    """A population grid re-laid out as one row of 64 cell values per 8 x 8 tile."""
+
+    __slots__ = ('grid', 'tile_rows', 'tile_cols', 'values')
+
+    def __init__(self, grid: PopulationGrid):
+        self.grid = grid
+        n_rows, n_cols = grid.shape
+        self.tile_rows = -(-n_rows // TILE)
+        self.tile_cols = -(-n_cols // TILE)
+        padded = np.zeros((self.tile_rows * TILE, self.tile_cols * TILE), dtype=np.float32)
+        padded[:n_rows, :n_cols] = np.nan_to_num(grid.values)
+        self.values = (padded.reshape(self.tile_rows, TILE, self.tile_cols, TILE)
+                       .transpose(0, 2, 1, 3).reshape(-1, TILE * TILE))
+
+    @property
+    def num_tiles(self) -> int:
+        return self.tile_rows * self.tile_cols
+
+    def mask_bitset(self, mask: np.ndarray, row0: int, col0: int) -> Bitset:
+        """
+        Pack a boolean mask of grid cells into a Bitset.
+
+        Args:
+            mask: Boolean window of the grid
+            row0: Grid row of the window's first row
+            col0: Grid column of the window's first column
+        """
+        # Align the window to tile boundaries
+        top, left = row0 % TILE, col0 % TILE
+        rows, cols = mask.shape
+        tile_rows, tile_cols = -(-(rows + top) // TILE), -(-(cols + left) // TILE)
+        aligned = np.zeros((tile_rows * TILE, tile_cols * TILE), dtype=bool)
+        aligned[top:top + rows, left:left + cols] = mask
+        bits = aligned.reshape(tile_rows, TILE, tile_cols, TILE).transpose(0, 2, 1, 3).reshape(-1, TILE * TILE)
+        words = np.packbits(bits, axis=1, bitorder='little').view('<u8').ravel()
+        tile_row, tile_col = np.divmod(np.arange(len(words)), tile_cols)
+        tiles = (row0 // TILE + tile_row) * self.tile_cols + col0 // TILE + tile_col
+        keep = words != 0
+        return Bitset(tiles[keep].astype(np.int64), words[keep].astype(np.uint64))
+
+    def isochrone_bitset(self, packed: PackedGeometry) -> Bitset:
+        """Bitset of the grid cells whose centers are inside an isochrone."""
+        grid = self.grid
+        row0, row1, col0, col1 = grid_window(grid, geometry_bounds(packed))
+        mask = polygon_mask(packed, grid.west + col0 * grid.xres, grid.north - row0 * grid.yres,
+                            grid.xres, grid.yres, (row1 - row0, col1 - col0))
+        return self.mask_bitset(mask, row0, col0)
+
+    def population(self, tiles: np.ndarray, words: np.ndarray) -> float:
+        """Population of the cells set in words (one word per tile id)."""
+        if len(tiles) == 0:
+            return 0.0
+        bits = np.unpackbits(words.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').astype(bool)
+        return float(self.values[tiles][bits].sum(dtype=np.float64))
+
+    def union(self, bitsets: Sequence[Bitset]) -> np.ndarray:
+        """Dense coverage words (one per tile of the grid) of the union of bitsets."""
+        covered = np.zeros(self.num_tiles, dtype=np.uint64)
+        for bitset in bitsets:
+            covered[bitset.tiles] |= bitset.words
+        return covered
+
+
+def greedy_max_coverage(
+    population: TiledPopulation,
+    candidates: Sequence[Bitset],
+    k: int,
+    covered: Optional[np.ndarray] = None
+) -> List[Tuple[int, float]]:
+    """
+    Select up to k candidates that maximize the population newly covered (lazy greedy).
+
+    Args:
+        population: Tiled population grid
+        candidates: Coverage bitset of each candidate site
+        k: Number of sites to select
+        covered: Dense coverage words of the existing facilities (default: nothing covered)
+
+    Returns:
+        (candidate index, added population) in selection order; stops early
+        once no candidate adds anyone
+    """
+    covered = population.union([]) if covered is None else covered.copy()
+
+    def gain(index: int) -> float:
+        tiles, words = candidates[index]
+        return population.population(tiles, words & ~covered[tiles])
+
+    # Entries are (-gain, index, number of sites selected when the gain was computed)
+    heap = [(-gain(i), i, 0) for i in range(len(candidates))]
+    heapq.heapify(heap)
+    evaluations = len(candidates)
+    selected: List[Tuple[int, float]] = []
+    while heap and len(selected) < k:
+        negative_gain, index, computed_at = heapq.heappop(heap)
+        if computed_at == len(selected):
+            # Fresh gain and still the largest bound: this is the greedy choice
+            if -negative_gain <= 0:
+                break
+            tiles, words = candidates[index]
+            covered[tiles] |= words
+            selected.append((index, -negative_gain))
+            continue
+        evaluations += 1
+        heapq.heappush(heap, (-gain(index), index, len(selected)))
+    metrics.incr('siting_gain_evaluations', evaluations)
+    logger.info(f"Lazy greedy selected {len(selected)} of {len(candidates)} candidates with "
+                f"{evaluations:,} gain evaluations (plain greedy: ~{len(candidates) * max(len(selected), 1):,})")
+    return selected
+
+
+def rank_sites(
+    population: TiledPopulation,
+    candidates: pd.DataFrame,
+    bitsets: Sequence[Bitset],
+    existing: Sequence[Bitset],
+    k: int
+) -> pd.DataFrame:
+    """
+    Rank the k candidate sites that add the most coverage to the existing facilities.
+
+    Args:
+        population: Tiled population grid
+        candidates: DataFrame with 'name', 'lat', 'lon' columns, one row per bitset
+        bitsets: Coverage bitset of each candidate
+        existing: Coverage bitsets of the existing facilities
+        k: Number of sites to select
+
+    Returns:
+        DataFrame with rank, name, lat, lon, population_covered (the site alone),
+        added_population, cumulative_added and total_covered columns, plus the
+        'candidate' row index
+    """
+    covered = population.union(existing)
+    baseline = population.population(np.arange(population.num_tiles), covered)
+    selected = greedy_max_coverage(population, bitsets, k, covered)
+    rows = []
+    cumulative = 0.0
+    for rank, (index, added) in enumerate(selected, 1):
+        cumulative += added
+        candidate = candidates.iloc[index]
+        rows.append({
+            'rank': rank,
+            'name': candidate['name'],
+            'lat': candidate['lat'],
+            'lon': candidate['lon'],
+            'population_covered': population.population(*bitsets[index]),
+            'added_population': added,
+            'cumulative_added': cumulative,
+            'total_covered': baseline + cumulative,
+            'candidate': index,
+        })
+    columns = ['rank', 'name', 'lat', 'lon', 'population_covered', 'added_population', 'cumulative_added',
+               'total_covered', 'candidate']
+    table = pd.DataFrame(rows, columns=columns)
+    table.attrs['baseline_covered'] = baseline
+    return table
+
+
+def load_isochrone_cache(path: str) -> Dict[Tuple[str, str, int], Dict[str, Any]]:
+    """Read cached isochrones, keyed by (role, name, range seconds)."""
+    if not path or not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        features = json.load(f).get('features', [])
+    return {(f['properties']['role'], str(f['properties']['name']), int(f['properties']['value'])): f
+            for f in features}
+
+
+def save_isochrone_cache(path: str, cache: Dict[Tuple[str, str, int], Dict[str, Any]]):
+    with metrics.timer('geojson_write'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': list(cache.values())}, f)
+
+
+def facility_isochrones(
+    client,
+    facilities: pd.DataFrame,
+    role: str,
+    range_seconds: int,
+    cache: Dict[Tuple[str, str, int], Dict[str, Any]]
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Isochrone feature of each facility, from the cache or requested (and cached).
+
+    Args:
+        client: ORS client, pool or offline client (None to use the cache only)
+        facilities: DataFrame with 'name', 'lat', 'lon' columns
+        role: 'existing' or 'candidate'
+        range_seconds: Isochrone range
+        cache: Cache from load_isochrone_cache(), updated in place
+
+    Returns:
+        One GeoJSON Feature per facility (None where it could not be computed)
+    """
+    from analyze_population import get_isochrone_with_retry
+    features = []
+    for _, facility in facilities.iterrows():
+        key = (role, str(facility['name']), int(range_seconds))
+        if key not in cache and client is not None:
+            response = get_isochrone_with_retry(client, facility['lat'], facility['lon'], [range_seconds])
+            if response and response.get('features'):
+                feature = response['features'][0]
+                cache[key] = {'type': 'Feature', 'geometry': feature['geometry'],
+                              'properties': {'role': role, 'name': key[1], 'value': key[2],
+                                             'lat': float(facility['lat']), 'lon': float(facility['lon'])}}
+        features.append(cache.get(key))
+    missing = sum(feature is None for feature in features)
+    if missing:
+        logger.warning(f"No isochrone for {missing} of {len(features)} {role} facilities; they are left out")
+    return features
+
+
+def siting_layer(table: pd.DataFrame, features: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """GeoJSON FeatureCollection of the selected sites' isochrones, with their rank and added population."""
+    layer = []
+    for _, site in table.iterrows():
+        properties = {column: site[column] for column in table.columns if column != 'candidate'}
+        properties = {key: value.item() if hasattr(value, 'item') else value for key, value in properties.items()}
+        layer.append({'type': 'Feature', 'geometry': features[int(site['candidate'])]['geometry'],
+                      'properties': properties})
+    return {'type': 'FeatureCollection', 'features': layer}
+
+
+def create_siting_map(layer: Dict[str, Any], config) -> folium.Map:
+    """Folium map with the selected sites as a toggleable layer, labelled by rank."""
+    m = folium.Map(location=[config.map_center_lat, config.map_center_lon], zoom_start=config.map_zoom_start)
+    group = folium.FeatureGroup(name=f"Recommended sites ({len(layer['features'])})")
+    for feature in layer['features']:
+        site = feature['properties']
+        folium.GeoJson(
+            feature,
+            style_function=lambda x: {'fillColor': '#2E7D32', 'color': '#1B5E20', 'weight': 2,
+                                      'fillOpacity': config.map_isochrone_opacity},
+            tooltip=f"#{site['rank']} {site['name']}: +{site['added_population']:,.0f} people"
+        ).add_to(group)
+        folium.Marker(
+            [site['lat'], site['lon']],
+            popup=(f"<b>#{site['rank']} {site['name']}</b><br>Adds {site['added_population']:,.0f} people"
+                   f"<br>Covers {site['population_covered']:,.0f} people on its own"),
+            icon=folium.DivIcon(html=f"<div style='font-weight:bold;color:#1B5E20'>{site['rank']}</div>")
+        ).add_to(group)
+    group.add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def main(argv: list = None):
+    """Select the candidate sites that add the most population coverage."""
+    from analyze_population import extract_facility_locations, load_and_filter_data
+    from matrix_analysis import load_grid_around
+    from ors_pool import create_ors_client
+    config = get_config().snapshot()
+    parser = argparse.ArgumentParser(description='Greedy maximal-coverage facility siting')
+    parser.add_argument('--k', type=int, default=config.siting_k,
+                        help=f'Number of sites to select (default: {config.siting_k})')
+    parser.add_argument('--range-min', type=int, default=config.siting_range_seconds // 60,
+                        help=f'Coverage range in minutes (default: {config.siting_range_seconds // 60})')
+    args = parser.parse_args(argv)
+    range_seconds = args.range_min * 60
+
+    try:
+        existing = extract_facility_locations(load_and_filter_data(config.input_file, config.target_levels))
+        candidates = extract_facility_locations(load_and_filter_data(config.input_file,
+                                                                     config.siting_candidate_levels))
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Data loading error: {e}", exc_info=True)
+        return
+    candidates = candidates[~candidates.index.isin(existing.index)].reset_index(drop=True)
+    existing = existing.reset_index(drop=True)
+    if len(candidates) == 0:
+        logger.error(f"No candidate facilities at levels {list(config.siting_candidate_levels)}")
+        return
+    logger.info(f"{len(existing)} existing facilities, {len(candidates)} candidate sites, "
+                f"range {args.range_min} min, k={args.k}")
+
+    cache = load_isochrone_cache(config.siting_isochrones_file)
+    cached = len(cache)
+    client = create_ors_client(config)
+    existing_features = facility_isochrones(client, existing, 'existing', range_seconds, cache)
+    candidate_features = facility_isochrones(client, candidates, 'candidate', range_seconds, cache)
+    if len(cache) > cached:
+        save_isochrone_cache(config.siting_isochrones_file, cache)
+        logger.info(f"Cached {len(cache) - cached} new isochrones in {config.siting_isochrones_file}")
+
+    usable = [i for i, feature in enumerate(candidate_features) if feature is not None]
+    candidates = candidates.iloc[usable].reset_index(drop=True)
+    candidate_features = [candidate_features[i] for i in usable]
+
+    grid = load_grid_around(pd.concat([existing['lat'], candidates['lat']]),
+                            pd.concat([existing['lon'], candidates['lon']]), config)
+    with metrics.timer('siting_bitsets'):
+        population = TiledPopulation(grid)
+        existing_bitsets = [population.isochrone_bitset(PackedGeometry.from_geojson(f['geometry']))
+                            for f in existing_features if f is not None]
+        bitsets = [population.isochrone_bitset(PackedGeometry.from_geojson(f['geometry']))
+                   for f in candidate_features]
+    logger.info(f"Coverage bitsets: {sum(len(b.tiles) for b in bitsets):,} tile words for "
+                f"{len(bitsets)} candidates over {population.num_tiles:,} tiles")
+    with metrics.timer('siting_greedy'):
+        table = rank_sites(population, candidates, bitsets, existing_bitsets, args.k)
+
+    layer = siting_layer(table, candidate_features)
+    with metrics.timer('csv_write'):
+        table.drop(columns='candidate').to_csv(config.siting_output_table, index=False)
+    with metrics.timer('geojson_write'):
+        with open(config.siting_output_layer, 'w', encoding='utf-8') as f:
+            json.dump(layer, f)
+    with metrics.timer('map_render'):
+        create_siting_map(layer, config).save(config.siting_output_map)
+    logger.info(f"Saved ranked sites to {config.siting_output_table}, layer to {config.siting_output_layer} "
+                f"and map to {config.siting_output_map}")
+
+    print(f"\n{'='*70}")
+    print(f"TOP {len(table)} SITES BY ADDED POPULATION WITHIN {args.range_min} MIN")
+    print(f"{'='*70}")
+    print(f"  Covered by existing facilities: {table.attrs['baseline_covered']:,.0f} people")
+    for _, site in table.iterrows():
+        print(f"  {site['rank']:>3}. {site['name']:<40} +{site['added_population']:>12,.0f}")
+    if len(table):
+        print(f"  Covered with all {len(table)} sites:    {table['total_covered'].iloc[-1]:,.0f} people")
+    print(f"{'='*70}\n")
+    finish_run('siting', config)
+
+
+if __name__ == "__main__":
+    main()
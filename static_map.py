@@ -0,0 +1,276 @@
+"""
+Static raster maps of analysis results.
+
+Draws every facility's isochrones, range by range, and the facility points
+into a PNG or GeoTIFF image without a browser or plotting library. All
+isochrones of a range are rasterized in one pass with
+rasterize.coverage_mask(), then filled and outlined in the map colors. The
+image is encoded with numpy and zlib.
+
+PNGs have a white background for reports. GeoTIFFs are north-up WGS84
+(EPSG:4326) with a transparent background, so they can be laid over a
+basemap in QGIS or read with GDAL.
+
+Usage:
+    image = render_static_map(results, config)            # StaticImage (RGBA array + extent)
+    save_static_map(results, "maps/isochrones.png", config)
+    save_static_map(results, "maps/isochrones.tif", config)
+"""
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from facility_result import FacilityResult
+from logger import get_logger
+from metrics import get_metrics
+from rasterize import coverage_mask
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+# Largest image rendered (about 400 MB of RGBA); coarser resolutions keep national maps well below it
+MAX_PIXELS = 100_000_000
+
+POINT_COLOR = (255, 0, 0)
+
+_NAMED_COLORS = {
+    'black': (0, 0, 0), 'white': (255, 255, 255), 'red': (255, 0, 0), 'green': (0, 128, 0),
+    'blue': (0, 0, 255), 'orange': (255, 165, 0), 'purple': (128, 0, 128), 'yellow': (255, 255, 0),
+    'gray': (128, 128, 128), 'grey': (128, 128, 128),
+}
+
+
+class StaticImage(NamedTuple):
+    """RGBA image of a map and where it lies: its north-west corner and cell size in degrees."""
+    rgba: np.ndarray
+    west: float
+    north: float
+    resolution: float
+
+
+def parse_color(color: str) -> Tuple[int, int, int]:
+    """
+    Convert a map color ('#rrggbb', '#rgb' or a basic color name) to RGB.
+
+    Raises:
+        ValueError: If the color is not recognized
+    """
+    value = color.strip().lower()
+    if value in _NAMED_COLORS:
+        return _NAMED_COLORS[value]
+    if value.startswith('#') and len(value) in (4, 7):
+        digits = value[1:] if len(value) == 7 else ''.join(c * 2 for c in value[1:])
+        try:
+            return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            pass
+    raise ValueError(f"Unsupported map color: {color!r}")
+
+
+def _outline(mask: np.ndarray) -> np.ndarray:
+    """Cells of a mask with at least one 4-neighbour outside it."""
+    interior = mask.copy()
+    interior[1:] &= mask[:-1]
+    interior[:-1] &= mask[1:]
+    interior[:, 1:] &= mask[:, :-1]
+    interior[:, :-1] &= mask[:, 1:]
+    return mask & ~interior
+
+
+def render_static_map(
+    results: List[FacilityResult],
+    config,
+    border_colors: Optional[Dict[int, str]] = None,
+    resolution: Optional[float] = None
+) -> StaticImage:
+    """
+    Rasterize the isochrones and facility points of an analysis.
+
+    Args:
+        results: Facility results with isochrones
+        config: Configuration object (map colors, opacity, image resolution and point radius)
+        border_colors: Outline color per range in minutes (default: the fill color)
+        resolution: Degrees per pixel (default: map.image_resolution)
+
+    Returns:
+        StaticImage whose alpha is 0 where nothing was drawn
+
+    Raises:
+        ValueError: If there is nothing to draw, more than 10 ranges, or the image would exceed MAX_PIXELS
+    """
+    resolution = resolution or config.map_image_resolution
+    border_colors = border_colors or {}
+    results = [r for r in results if isinstance(r, FacilityResult)]
+    by_range: Dict[int, list] = {}
+    for result in results:
+        for range_min, iso in result.ranges.items():
+            by_range.setdefault(range_min, []).append(iso.packed)
+    points = np.array([(r.lon, r.lat) for r in results if r.lat is not None and r.lon is not None]).reshape(-1, 2)
+    coords = [c for c in [p.degrees() for polygons in by_range.values() for p in polygons] + [points] if len(c)]
+    if not coords:
+        raise ValueError("No isochrones or facility points to draw")
+    coords = np.concatenate(coords)
+
+    # Image extent: everything drawn plus a 2% margin
+    lon_min, lat_min = coords.min(axis=0)
+    lon_max, lat_max = coords.max(axis=0)
+    margin = 0.02 * max(lon_max - lon_min, lat_max - lat_min, resolution * 50)
+    west, north = lon_min - margin, lat_max + margin
+    rows = int(np.ceil((lat_max - lat_min + 2 * margin) / resolution))
+    cols = int(np.ceil((lon_max - lon_min + 2 * margin) / resolution))
+    if rows * cols > MAX_PIXELS:
+        raise ValueError(f"A {cols} x {rows} image exceeds {MAX_PIXELS:,} pixels; "
+                         f"use a coarser resolution than {resolution} degrees")
+
+    # Each range leaves a pixel untouched (0), shaded (1) or outlined (2); the pixel's color depends only on
+    # these states, so pixels store a base-3 code and colors are looked up from a palette of all codes
+    range_order = sorted(by_range, reverse=True)  # largest first: smaller ranges are shaded on top, as on the HTML map
+    if len(range_order) > 10:
+        raise ValueError(f"At most 10 time ranges can be drawn, got {len(range_order)}")
+    code = np.zeros((rows, cols), dtype=np.uint16)
+    for i, range_min in enumerate(range_order):
+        with metrics.timer('static_map_rasterize'):
+            mask = coverage_mask(by_range[range_min], west, north, resolution, resolution, (rows, cols))
+        code += mask.astype(np.uint16) * 3 ** i
+        code += _outline(mask).astype(np.uint16) * 3 ** i
+
+    opacity = config.map_isochrone_opacity
+    palette = np.zeros((3 ** len(range_order), 4), dtype=np.uint8)
+    for value in range(len(palette)):
+        color = np.array([255.0, 255.0, 255.0])
+        for i, range_min in enumerate(range_order):
+            state = value // 3 ** i % 3
+            fill = config.map_isochrone_colors.get(range_min, config.map_isochrone_color)
+            if state == 1:
+                color = color * (1 - opacity) + np.array(parse_color(fill)) * opacity
+            elif state == 2:
+                color = np.array(parse_color(border_colors.get(range_min, fill)), dtype=float)
+        palette[value] = [*np.rint(color), 255 if value else 0]
+    rgba = palette[code]
+
+    # Facility points: filled disks of map.image_point_radius pixels
+    radius = config.map_image_point_radius
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    disk = dx ** 2 + dy ** 2 <= radius ** 2 + radius
+    point_rows = np.floor((north - points[:, 1]) / resolution).astype(np.int64)
+    point_cols = np.floor((points[:, 0] - west) / resolution).astype(np.int64)
+    pr = (point_rows[:, None] + dy[disk][None, :]).ravel()
+    pc = (point_cols[:, None] + dx[disk][None, :]).ravel()
+    inside = (pr >= 0) & (pr < rows) & (pc >= 0) & (pc < cols)
+    rgba[pr[inside], pc[inside]] = (*POINT_COLOR, 255)
+    return StaticImage(rgba, float(west), float(north), float(resolution))
+
+
+def write_png(path: str, rgba: np.ndarray):
+    """Write an RGBA uint8 array as a PNG."""
+    rows, cols = rgba.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    raw = np.zeros((rows, cols * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(rows, cols * 4)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_geotiff(path: str, image: StaticImage, rows_per_strip: int = 64):
+    """
+    Write a StaticImage as a deflate-compressed RGBA GeoTIFF in EPSG:4326.
+
+    Args:
+        path: Output .tif file
+        image: Rendered map
+        rows_per_strip: Image rows per compressed strip
+    """
+    rows, cols = image.rgba.shape[:2]
+    strips = [zlib.compress(image.rgba[r:r + rows_per_strip].tobytes(), 6) for r in range(0, rows, rows_per_strip)]
+    # (tag, field type, values); types: 3 = SHORT, 4 = LONG, 12 = DOUBLE
+    tags = [
+        (256, 4, [cols]),                       # ImageWidth
+        (257, 4, [rows]),                       # ImageLength
+        (258, 3, [8, 8, 8, 8]),                 # BitsPerSample
+        (259, 3, [8]),                          # Compression: deflate
+        (262, 3, [2]),                          # PhotometricInterpretation: RGB
+        (273, 4, [0] * len(strips)),            # StripOffsets (filled in below)
+        (277, 3, [4]),                          # SamplesPerPixel
+        (278, 4, [rows_per_strip]),             # RowsPerStrip
+        (279, 4, [len(s) for s in strips]),     # StripByteCounts
+        (284, 3, [1]),                          # PlanarConfiguration: contiguous
+        (338, 3, [2]),                          # ExtraSamples: unassociated alpha
+        (33550, 12, [image.resolution, image.resolution, 0.0]),             # ModelPixelScale
+        (33922, 12, [0.0, 0.0, 0.0, image.west, image.north, 0.0]),          # ModelTiepoint
+        # GeoKeyDirectory: geographic model, pixel is area, WGS84 (EPSG:4326)
+        (34735, 3, [1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, 4326]),
+    ]
+    formats = {3: 'H', 4: 'I', 12: 'd'}
+
+    # Layout: header, strips, IFD, then tag values too large for their 4-byte IFD slot
+    offset = 8
+    strip_offsets = []
+    for s in strips:
+        strip_offsets.append(offset)
+        offset += len(s) + len(s) % 2
+    tags[5] = (273, 4, strip_offsets)
+    ifd_offset = offset
+    extra_offset = ifd_offset + 2 + 12 * len(tags) + 4
+    entries, extra = [], b''
+    for tag, kind, values in tags:
+        data = struct.pack(f"<{len(values)}{formats[kind]}", *values)
+        if len(data) <= 4:
+            entries.append(struct.pack('<HHI', tag, kind, len(values)) + data.ljust(4, b'\0'))
+        else:
+            entries.append(struct.pack('<HHII', tag, kind, len(values), extra_offset + len(extra)))
+            extra += data + b'\0' * (len(data) % 2)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<2sHI', b'II', 42, ifd_offset))
+        for s in strips:
+            f.write(s + b'\0' * (len(s) % 2))
+        f.write(struct.pack('<H', len(entries)) + b''.join(entries) + struct.pack('<I', 0))
+        f.write(extra)
+
+
+def save_static_map(
+    results: List[FacilityResult],
+    path: str,
+    config,
+    border_colors: Optional[Dict[int, str]] = None
+) -> StaticImage:
+    """
+    Render the map and write it as a PNG (.png) or GeoTIFF (.tif, .tiff).
+
+    Args:
+        results: Facility results with isochrones
+        path: Output file; the extension selects the format
+        config: Configuration object
+        border_colors: Outline color per range in minutes
+
+    Returns:
+        The rendered StaticImage
+
+    Raises:
+        ValueError: For other extensions, or when render_static_map() fails
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix not in ('.png', '.tif', '.tiff'):
+        raise ValueError(f"Static map must be .png, .tif or .tiff, got {path}")
+    with metrics.timer('static_map_render'):
+        image = render_static_map(results, config, border_colors)
+    with metrics.timer('static_map_write'):
+        if suffix == '.png':
+            # Reports get an opaque white background
+            write_png(path, np.concatenate([image.rgba[..., :3],
+                                            np.full(image.rgba.shape[:2] + (1,), 255, np.uint8)], axis=2))
+        else:
+            write_geotiff(path, image)
+    rows, cols = image.rgba.shape[:2]
+    logger.info(f"Saved {cols} x {rows} static map ({image.resolution} degrees per pixel) to {path}")
+    return image
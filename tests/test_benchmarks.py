@@ -0,0 +1,48 @@
+"""Tests for the hot-path benchmark suite."""
+import pytest
+from benchmarks.bench_hot_paths import (
+    compare_to_baseline,
+    make_facility_table,
+    measure,
+    run_benchmarks
+)
+
+
+class TestBenchmarkHarness:
+    """Test measurement and regression detection."""
+
+    def test_make_facility_table(self):
+        """Test synthetic table size and columns."""
+        table = make_facility_table(50)
+        assert len(table) == 50
+        assert {'Facility Name', 'Latitude', 'Longitude', 'keph_level_name'} <= set(table.columns)
+
+    def test_measure_reports_throughput_and_memory(self):
+        """Test that measure records time, throughput and peak memory."""
+        result = measure(lambda: [0] * 100000, items=10, repeat=2)
+        assert result['seconds'] > 0
+        assert result['throughput'] == pytest.approx(10 / result['seconds'])
+        assert result['peak_mb'] > 0.5
+
+    def test_compare_to_baseline_flags_regressions(self):
+        """Test that only changes beyond the threshold are reported."""
+        baseline = {
+            'a': {'seconds': 1.0, 'peak_mb': 10.0},
+            'b': {'seconds': 1.0, 'peak_mb': 10.0},
+        }
+        results = {
+            'a': {'seconds': 1.1, 'peak_mb': 10.5},   # Within threshold
+            'b': {'seconds': 2.0, 'peak_mb': 20.0},   # Slower and bigger
+            'c': {'seconds': 9.0, 'peak_mb': 90.0},   # Not in baseline
+        }
+        regressions = compare_to_baseline(results, baseline, threshold=0.25)
+        assert len(regressions) == 2
+        assert all(line.startswith('b:') for line in regressions)
+
+    def test_run_benchmarks_smoke(self):
+        """Test a tiny end-to-end benchmark run."""
+        results = run_benchmarks([30], process_sample=2, map_sample=2, repeat=1, measure_memory=False)
+        assert set(results) == {
+            'load_and_filter_data[30]', 'process_facility[30]', 'create_map[30]', 'write_results_csv[30]'
+        }
+        assert all(m['seconds'] > 0 for m in results.values())
@@ -0,0 +1,99 @@
+"""Tests for the ORS load test in check_ors.py."""
+import csv
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from check_ors import (
+    LoadLevel,
+    format_load_report,
+    run_load_test,
+    sample_locations,
+    saturation_point,
+    write_load_report,
+)
+
+
+class CapacityLimitedClient:
+    """Stub ORS server handling `slots` requests at once, each taking `seconds`; shared by all clients."""
+
+    def __init__(self, slots: int, seconds: float, fail_every: int = 0):
+        self.slots = threading.Semaphore(slots)
+        self.seconds = seconds
+        self.fail_every = fail_every
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def isochrones(self, locations, profile='driving-car', range=None, **kwargs):
+        with self.lock:
+            self.calls.append((tuple(locations[0]), tuple(range)))
+            call = len(self.calls)
+        if self.fail_every and call % self.fail_every == 0:
+            raise RuntimeError("503 Service Unavailable")
+        with self.slots:
+            time.sleep(self.seconds)
+        return {'features': [{'properties': {'value': r}} for r in range]}
+
+
+class TestLoadTest:
+    """Test the concurrency ramp against a stub server."""
+
+    def test_ramp_finds_saturation(self):
+        server = CapacityLimitedClient(slots=2, seconds=0.02)
+        clients = []
+
+        def factory():
+            clients.append(object())
+            return server
+
+        results = run_load_test(factory, [[36.8, -1.3], [34.7, 0.3]], [900, 1800], levels=[4, 1, 2],
+                                requests_per_level=8)
+
+        assert [r.concurrency for r in results] == [1, 2, 4]
+        assert [r.requests for r in results] == [8, 8, 8] and all(r.errors == 0 for r in results)
+        # At most one client per worker thread
+        assert len(clients) <= 1 + 2 + 4
+        # One range per request, cycling through every (location, range) pair
+        assert server.calls[:5] == [((36.8, -1.3), (900,)), ((36.8, -1.3), (1800,)), ((34.7, 0.3), (900,)),
+                                    ((34.7, 0.3), (1800,)), ((36.8, -1.3), (900,))]
+        # Two requests at a time double throughput; four only queue
+        assert results[1].throughput > 1.5 * results[0].throughput
+        assert results[2].p90 > 1.5 * results[1].p90
+        assert results[0].p50 <= results[0].p90 <= results[0].p99 <= results[0].max
+        assert saturation_point(results).concurrency == 2
+        assert 'stops scaling at 2 concurrent requests' in format_load_report(results)
+
+    def test_errors_stop_the_ramp(self):
+        server = CapacityLimitedClient(slots=4, seconds=0.0, fail_every=2)
+        results = run_load_test(lambda: server, [[36.8, -1.3]], [900], levels=[1, 2, 4], requests_per_level=10,
+                                max_error_rate=0.4)
+
+        assert len(results) == 1
+        assert results[0].errors == 5 and results[0].error_rate == 0.5
+        assert saturation_point(results) is None
+        assert 'Every level had errors' in format_load_report(results)
+
+
+class TestHelpers:
+
+    def test_sample_locations(self):
+        facilities = pd.DataFrame({'lat': [0.1, 0.2, 0.3], 'lon': [34.1, 34.2, 34.3]})
+        locations = sample_locations(facilities, 2, seed=1)
+        assert len(locations) == 2 and all(loc in [[34.1, 0.1], [34.2, 0.2], [34.3, 0.3]] for loc in locations)
+        assert locations == sample_locations(facilities, 2, seed=1)
+        assert len(sample_locations(facilities, 10)) == 3
+
+    def test_saturation_and_csv(self, tmp_path):
+        levels = [LoadLevel(1, 10, 0, 10.0, 1.0, 1.2, 1.5, 1.6), LoadLevel(2, 10, 0, 5.0, 1.0, 1.2, 1.5, 1.6),
+                  LoadLevel(4, 10, 0, 4.8, 1.9, 2.2, 2.5, 2.6), LoadLevel(8, 10, 0, 2.0, 1.0, 1.0, 1.0, 1.0)]
+        assert levels[1].throughput == pytest.approx(2.0)
+        assert saturation_point(levels).concurrency == 2
+        assert 'still rising at 2' in format_load_report(levels[:2])
+
+        write_load_report(levels, str(tmp_path / 'load.csv'))
+        with open(tmp_path / 'load.csv') as f:
+            rows = list(csv.DictReader(f))
+        assert [row['concurrency'] for row in rows] == ['1', '2', '4', '8']
+        assert rows[2]['throughput'] == '2.083' and rows[0]['error_rate'] == '0.0'
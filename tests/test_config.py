@@ -115,6 +115,29 @@ analysis:
         finally:
             temp_path.unlink()
     
+    def test_ors_base_urls_fallback_and_list(self):
+        """Test that ors_base_urls falls back to base_url and accepts a list."""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+            f.write("""
+ors:
+  base_url: "http://single:8080/ors"
+""")
+            single_path = Path(f.name)
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+            f.write("""
+ors:
+  base_url: "http://single:8080/ors"
+  base_urls: ["http://a:8080/ors", "http://b:8080/ors"]
+""")
+            multi_path = Path(f.name)
+        
+        try:
+            assert Config(config_path=single_path).ors_base_urls == ["http://single:8080/ors"]
+            assert Config(config_path=multi_path).ors_base_urls == ["http://a:8080/ors", "http://b:8080/ors"]
+        finally:
+            single_path.unlink()
+            multi_path.unlink()
+    
     def test_config_missing_file(self):
         """Test that missing config file raises FileNotFoundError."""
         with pytest.raises(FileNotFoundError):
@@ -139,3 +162,38 @@ analysis:
         log_file_path = Path(config.log_file)
         assert log_file_path.parent.exists()
 
+
+
+class TestConfigSnapshot:
+    """Test the immutable configuration snapshot."""
+    
+    def test_snapshot_matches_properties(self):
+        """Test that every snapshot field equals the corresponding property."""
+        config = Config()
+        snapshot = config.snapshot()
+        assert snapshot.ors_base_url == config.ors_base_url
+        assert snapshot.gee_dataset == config.gee_dataset
+        assert snapshot.sleep_between_requests == config.sleep_between_requests
+        assert list(snapshot.range_seconds) == [int(r) for r in config.range_seconds]
+    
+    def test_snapshot_is_cached_and_frozen(self):
+        """Test that the snapshot is built once and cannot be modified."""
+        config = Config()
+        snapshot = config.snapshot()
+        assert config.snapshot() is snapshot
+        with pytest.raises(AttributeError):
+            snapshot.sleep_between_requests = 0
+        assert isinstance(snapshot.range_seconds, tuple)
+    
+    def test_snapshot_pickles(self):
+        """Test that the snapshot round-trips through pickle for worker processes."""
+        import pickle
+        snapshot = Config().snapshot()
+        assert pickle.loads(pickle.dumps(snapshot)) == snapshot
+    
+    def test_snapshot_replace(self):
+        """Test deriving a modified snapshot without touching the original."""
+        snapshot = Config().snapshot()
+        fast = snapshot._replace(sleep_between_requests=0.0)
+        assert fast.sleep_between_requests == 0.0
+        assert snapshot.sleep_between_requests == Config().sleep_between_requests
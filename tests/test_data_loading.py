@@ -4,6 +4,7 @@ import pandas as pd
 from pathlib import Path
 from analyze_population import (
     load_and_filter_data,
+    load_facilities,
     find_column_by_pattern,
     filter_by_level
 )
@@ -23,6 +24,11 @@ class TestDataLoading:
         assert 'Hospital B' in df['Facility Name'].values
         assert 'Clinic C' not in df['Facility Name'].values  # Level 3 should be filtered out
     
+    def test_load_facilities_keeps_every_level(self, sample_excel_file):
+        """Test loading without a level filter."""
+        df = load_facilities(str(sample_excel_file))
+        assert df['Facility Name'].tolist() == ['Hospital A', 'Hospital B', 'Clinic C']
+    
     def test_load_and_filter_data_missing_level_column(self, tmp_path):
         """Test error handling when level column is missing."""
         # Create Excel file without level column
@@ -0,0 +1,54 @@
+"""Tests for the compact facility result model."""
+import pandas as pd
+import pytest
+from config import get_config
+from facility_result import FacilityResult
+from analyze_population import create_map, write_results_csv
+
+
+@pytest.fixture
+def facility_result(sample_facilities_data, sample_multiple_isochrone_response):
+    """FacilityResult with 15/30/45-minute isochrones built from the sample response."""
+    row = sample_facilities_data.iloc[0]
+    result = FacilityResult(row['Facility Name'], row['Latitude'], row['Longitude'], source_row=row)
+    for feature, pop in zip(sample_multiple_isochrone_response['features'], (100.0, 250.0, -1)):
+        result.add_range(feature['properties']['value'], feature, pop)
+    return result
+
+
+class TestFacilityResult:
+    """Test derived views of FacilityResult."""
+
+    def test_geometry_stored_once(self, facility_result):
+        """Test that only packed coordinates are stored and features are rebuilt on demand."""
+        iso = facility_result.ranges[15]
+        assert not hasattr(facility_result, '__dict__')
+        assert iso.packed.coords.shape == (5, 2)
+        assert facility_result.geometry_bytes == iso.packed.nbytes * 3
+        assert facility_result.feature(15) is not facility_result.feature(15)
+        assert facility_result.feature(15)['properties']['value'] == 900
+
+    def test_populations_and_views(self, facility_result, sample_multiple_isochrone_response):
+        """Test populations, the combined FeatureCollection and the largest-range isochrone."""
+        assert facility_result.populations == {15: 100.0, 30: 250.0, 45: -1}
+        assert facility_result.population_1hr == -1
+        assert facility_result.isochrone_geojson == sample_multiple_isochrone_response
+        assert facility_result.isochrone['features'] == [sample_multiple_isochrone_response['features'][2]]
+
+    def test_to_row(self, facility_result):
+        """Test the flat CSV row: source columns, then populations per range."""
+        row = facility_result.to_row()
+        assert list(row)[:5] == ['Facility Name', 'Latitude', 'Longitude', 'Keph level', 'County']
+        assert row['name'] == 'Hospital A'
+        assert row['population_15min'] == 100.0
+        assert row['population_45min'] == -1
+        assert 'isochrones' not in row
+
+    def test_write_results_csv_and_map(self, facility_result, tmp_path):
+        """Test that the CSV and map consumers accept FacilityResult."""
+        df = write_results_csv([facility_result], str(tmp_path / 'results.csv'))
+        assert list(df['population_30min']) == [250.0]
+        assert pd.read_csv(tmp_path / 'results.csv').loc[0, 'name'] == 'Hospital A'
+
+        html = create_map([facility_result], get_config().snapshot()).get_root().render()
+        assert 'Hospital A - 30 min: 250 people' in html
@@ -0,0 +1,85 @@
+"""Tests for the H3 hexagon population index."""
+import numpy as np
+import pytest
+from h3_index import H3PopulationIndex
+from packed_geometry import PackedGeometry
+from population_grid import PopulationGrid
+from rasterize import zonal_sum
+
+
+def square(x0, y0, x1, y1):
+    return PackedGeometry.from_geojson(
+        {"type": "Polygon", "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]}
+    )
+
+
+@pytest.fixture
+def small_index():
+    """Index with two hexagons (ids 10 and 20)."""
+    return H3PopulationIndex(resolution=8, cell_ids=[10, 20], counts=[3.0, 30.0], raster='json/grid.npz')
+
+
+class TestH3PopulationIndex:
+    """Test lookups and persistence (no h3 package needed)."""
+
+    def test_sum_cells(self, small_index):
+        """Test vectorized lookup, ignoring unknown cells."""
+        assert small_index.sum_cells([20, 10, 99]) == pytest.approx(33.0)
+        assert small_index.sum_cells([]) == 0.0
+
+    def test_save_and_load(self, small_index, tmp_path):
+        """Test .npz round trip; only cell ids, counts and the raster path are stored."""
+        path = tmp_path / "h3.npz"
+        small_index.save(str(path))
+        with np.load(path) as data:
+            assert sorted(data.files) == ['cell_ids', 'counts', 'raster', 'resolution']
+        loaded = H3PopulationIndex.load(str(path))
+        assert loaded.resolution == 8
+        assert loaded.cell_ids.tolist() == [10, 20]
+        assert loaded.total == pytest.approx(33.0)
+        assert loaded.raster == 'json/grid.npz'
+
+    def test_missing_raster(self, small_index):
+        """Test that boundary refinement needs the source raster."""
+        with pytest.raises(FileNotFoundError, match="rebuild the index"):
+            small_index.grid
+
+
+class TestH3Build:
+    """Test building and querying a real index (requires the h3 package)."""
+
+    @pytest.fixture
+    def grid(self):
+        rng = np.random.default_rng(0)
+        return PopulationGrid(rng.uniform(0, 50, (200, 200)), west=36.0, north=0.0, xres=0.002, yres=0.002)
+
+    def test_population_matches_raster_zonal_sum(self, grid, tmp_path):
+        """Test that interior + refined boundary totals match the raster zonal sum."""
+        pytest.importorskip('h3', minversion='4')
+        from h3_index import build_h3_index
+
+        index = build_h3_index(grid, resolution=8)
+        assert index.total == pytest.approx(grid.total, rel=1e-6)
+
+        polygon = square(36.05, -0.35, 36.3, -0.1)
+        assert index.population(polygon) == pytest.approx(zonal_sum(grid, polygon), rel=1e-6)
+
+        # A saved index reads the raster back for refinement
+        grid.save(str(tmp_path / 'grid.npz'))
+        build_h3_index(grid, resolution=8, raster=str(tmp_path / 'grid.npz')).save(str(tmp_path / 'h3.npz'))
+        loaded = H3PopulationIndex.load(str(tmp_path / 'h3.npz'))
+        assert loaded.population(polygon) == pytest.approx(zonal_sum(grid, polygon), rel=1e-6)
+
+    def test_refine_cells(self, grid):
+        """Test that refinement counts only raster cells of the given hexagons inside the polygon."""
+        pytest.importorskip('h3', minversion='4')
+        from h3_index import build_h3_index, polygon_cells
+
+        index = build_h3_index(grid, resolution=8)
+        polygon = square(36.05, -0.35, 36.3, -0.1)
+        assert index.refine_cells(index.cell_ids, polygon) == pytest.approx(zonal_sum(grid, polygon), rel=1e-6)
+        assert index.refine_cells([], polygon) == 0.0
+
+        # Hexagons well inside the polygon contribute their whole count
+        inner = polygon_cells(square(36.1, -0.3, 36.25, -0.15), 8)
+        assert index.refine_cells(inner, polygon) == pytest.approx(index.sum_cells(inner), rel=1e-6)
@@ -0,0 +1,67 @@
+"""Import-time budgets for the command-line entry points."""
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from lazy_import import LazyModule, lazy_import
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+HEAVY_MODULES = ['ee', 'openrouteservice', 'pandas', 'folium']
+
+# Seconds for the import alone (interpreter startup excluded); generous for slow CI machines
+QUICK_UTILITY_BUDGET = 0.5
+ENTRY_POINT_BUDGET = 1.0
+
+
+def import_in_subprocess(module: str) -> dict:
+    """Import module in a fresh interpreter; return import seconds and heavy modules loaded."""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImportBudgets:
+    """Test that entry points don't import heavy dependencies until they are used."""
+
+    @pytest.mark.parametrize("module", ['check_ors', 'get_gcp_ors_ip'])
+    def test_quick_utilities_start_fast(self, module):
+        """Test that health-check utilities import well under a second, with no heavy modules."""
+        result = import_in_subprocess(module)
+        assert result['loaded'] == []
+        assert result['seconds'] < QUICK_UTILITY_BUDGET
+
+    @pytest.mark.parametrize("module", [
+        'analyze_population',
+        'create_kakamega_isochrone',
+        'generate_single_isochrone',
+    ])
+    def test_entry_points_defer_heavy_imports(self, module):
+        """Test that analysis scripts defer ee/openrouteservice/pandas/folium to first use."""
+        result = import_in_subprocess(module)
+        assert result['loaded'] == []
+        assert result['seconds'] < ENTRY_POINT_BUDGET
+
+
+class TestLazyModule:
+    """Test the lazy module proxy."""
+
+    def test_imports_on_first_attribute_access(self):
+        """Test that the proxy loads the module when an attribute is used."""
+        module = LazyModule('colorsys')
+        assert 'not loaded' in repr(module)
+        assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1.0)
+        assert 'not loaded' not in repr(module)
+
+    def test_returns_already_imported_module(self):
+        """Test that modules already in sys.modules are returned directly."""
+        assert lazy_import('json') is json
@@ -1,11 +1,19 @@
 """Tests for isochrone generation."""
+import threading
+import time
+
+import pandas as pd
 import pytest
 from unittest.mock import Mock, patch
 from analyze_population import (
     get_isochrone_with_retry,
+    process_facilities,
     validate_coordinates,
     InvalidCoordinateError
 )
+from config import get_config
+from metrics import get_metrics
+from offline_isochrones import OfflineIsochroneError
 
 
 class TestCoordinateValidation:
@@ -92,6 +100,21 @@ class TestIsochroneGeneration:
         assert result is None
         assert mock_client.isochrones.call_count == 2
     
+    def test_get_isochrone_offline_error_not_retried(self):
+        """Test that offline engine errors fail at once, without backoff or ORS error counts."""
+        mock_client = Mock()
+        mock_client.isochrones.side_effect = OfflineIsochroneError("No road within 2000 m")
+        metrics = get_metrics()
+        errors = metrics.counters.get('ors_errors', 0)
+
+        with patch('analyze_population.time.sleep') as sleep:
+            result = get_isochrone_with_retry(mock_client, -1.2921, 36.8219, max_retries=3)
+
+        assert result is None
+        assert mock_client.isochrones.call_count == 1
+        sleep.assert_not_called()
+        assert metrics.counters.get('ors_errors', 0) == errors
+
     def test_get_isochrone_correct_parameters_single_range(self, mock_ors_client):
         """Test that isochrone is called with correct parameters for single range."""
         get_isochrone_with_retry(mock_ors_client, -1.2921, 36.8219, ranges_sec=[7200])
@@ -127,3 +150,35 @@ class TestIsochroneGeneration:
         kwargs = call_args.kwargs
         assert kwargs['range'] == [3600]  # Should be converted to list
 
+
+
+class TestProcessFacilities:
+    """Test processing facilities on a worker pool."""
+
+    def test_workers_run_concurrently_in_input_order(self, sample_isochrone_response):
+        """Test that facilities overlap across workers and results keep the input order."""
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def isochrones(**kwargs):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return sample_isochrone_response
+
+        client = Mock()
+        client.isochrones.side_effect = isochrones
+        backend = Mock()
+        backend.populations.side_effect = lambda features: [100.0] * len(features)
+        config = get_config().snapshot()._replace(range_seconds=(900,), sleep_between_requests=0)
+        df = pd.DataFrame({'Facility Name': ['A', 'B', 'C', 'D'], 'Latitude': [-1.29, -1.30, -1.28, -1.27],
+                           'Longitude': [36.82, 36.83, 36.81, 36.80]})
+
+        results = process_facilities(df, client, config, workers=2, population_backend=backend)
+
+        assert [r.name for r in results] == ['A', 'B', 'C', 'D']
+        assert client.isochrones.call_count == 4
+        assert state['peak'] == 2
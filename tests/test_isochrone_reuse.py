@@ -0,0 +1,101 @@
+"""Tests for approximate isochrone reuse between nearby facilities."""
+import pandas as pd
+import pytest
+from config import get_config
+from isochrone_reuse import IsochroneReuse, haversine_m
+import analyze_population
+
+
+def feature(tag):
+    ring = [[36.8, -1.3], [36.9, -1.3], [36.9, -1.2], [36.8, -1.3]]
+    return {"type": "Feature", "properties": {"tag": tag}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+class StubBackend:
+    """Population backend returning 1000 for ORS isochrones and 1100 for reused ones."""
+
+    name = 'stub'
+
+    def populations(self, features):
+        return [1100.0 if f['properties'].get('tag') == 'reused' else 1000.0 for f in features]
+
+
+class TestIsochroneReuse:
+    """Test neighbour lookups, validation sampling and the report."""
+
+    def test_lookup_within_radius(self):
+        """Test that the nearest isochrone of the same profile and range within the radius is reused."""
+        reuse = IsochroneReuse(radius_m=300)
+        reuse.add('A', -1.2921, 36.8219, 900, feature('a'))
+        reuse.add('B', -1.2935, 36.8219, 900, feature('b'))  # ~156 m south of A
+
+        match = reuse.lookup(-1.2933, 36.8219, 900)
+        assert match.source_name == 'B'
+        assert match.distance_m == pytest.approx(haversine_m(-1.2933, 36.8219, -1.2935, 36.8219))
+        assert match.provenance.startswith('reused:B (')
+
+        assert reuse.lookup(-1.2933, 36.8219, 1800) is None
+        assert reuse.lookup(-1.2933, 36.8219, 900, profile='foot-walking') is None
+        assert reuse.lookup(-1.2921, 36.8260, 900) is None  # ~456 m east
+        assert (reuse.requests, reuse.reused) == (4, 1)
+
+    def test_lookup_across_cells(self):
+        """Test that a neighbour just across a grid cell boundary is found."""
+        reuse = IsochroneReuse(radius_m=100)
+        cell = reuse._cell_deg
+        reuse.add('A', 0.0, cell * 5 - 1e-6, 900, feature('a'))
+        assert reuse.lookup(0.0, cell * 5 + 1e-6, 900).source_name == 'A'
+
+    def test_validation_every_nth_reuse(self):
+        """Test that every Nth reuse is flagged for validation and deltas are summarized."""
+        reuse = IsochroneReuse(radius_m=300, validate_every=2)
+        reuse.add('A', 0.0, 0.0, 900, feature('a'))
+        assert [reuse.lookup(0.0, 0.0001, 900).validate for _ in range(4)] == [False, True, False, True]
+
+        reuse.record_validation(110.0, 100.0)
+        reuse.record_validation(95.0, 100.0)
+        summary = reuse.validation_summary()
+        assert summary['count'] == 2
+        assert summary['max_abs_error'] == pytest.approx(0.10)
+        assert summary['mean_error'] == pytest.approx(0.025)
+        assert '4 of 4 isochrones reused, 2 ORS requests saved' in reuse.report()
+        assert 'max 10.0%' in reuse.report()
+
+    def test_invalid_radius(self):
+        with pytest.raises(ValueError):
+            IsochroneReuse(radius_m=0)
+
+
+class TestProcessFacilityReuse:
+    """Test approximate mode in process_facility."""
+
+    def test_reuse_provenance_and_validation(self, mocker, sample_isochrone_response):
+        """Test that a nearby facility skips ORS, records provenance, and validations compare populations."""
+        mocker.patch('analyze_population.time.sleep')
+        client = mocker.Mock()
+        client.isochrones.return_value = sample_isochrone_response
+        config = get_config().snapshot()._replace(range_seconds=(900, 1800))
+        df = pd.DataFrame({'Facility Name': ['A', 'B'], 'Latitude': [-1.2921, -1.2930],
+                           'Longitude': [36.8219, 36.8219]})
+        reuse = IsochroneReuse(radius_m=300, validate_every=2)
+        backend = StubBackend()
+
+        first = analyze_population.process_facility(df.iloc[0], df, client, config, population_backend=backend,
+                                                     isochrone_reuse=reuse)
+        assert first.to_row()['isochrone_source_15min'] == 'ors'
+        assert client.isochrones.call_count == 2
+
+        # Tag the cached isochrones so the stub backend can tell them apart
+        for entries in reuse._entries.values():
+            entries[:] = [(lat, lon, name, feature('reused')) for lat, lon, name, _ in entries]
+
+        second = analyze_population.process_facility(df.iloc[1], df, client, config, population_backend=backend,
+                                                     isochrone_reuse=reuse)
+        row = second.to_row()
+        # 15 min reused; 30 min was the 2nd reuse, so ORS was called and the exact result kept
+        assert row['isochrone_source_15min'].startswith('reused:A (')
+        assert row['population_15min'] == 1100.0
+        assert row['isochrone_source_30min'] == 'ors'
+        assert row['population_30min'] == 1000.0
+        assert client.isochrones.call_count == 3
+        assert reuse.validations == [(1100.0, 1000.0)]
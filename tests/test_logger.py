@@ -1,8 +1,22 @@
 """Tests for logging configuration."""
+import io
+import json
 import logging
+import logging.handlers
+import queue
 import tempfile
+import threading
 from pathlib import Path
-from logger import setup_logger, get_logger
+from logger import (
+    setup_logger,
+    get_logger,
+    get_listener_handlers,
+    flush_logging,
+    log_context,
+    ContextQueueHandler,
+    ConsoleHandler,
+    JsonLinesFormatter
+)
 
 
 class TestLogger:
@@ -15,13 +29,20 @@ class TestLogger:
         assert logger.name == 'test_module'
     
     def test_logger_has_handlers(self):
-        """Test that logger has both console and file handlers."""
+        """Test that logger writes through the queue to console and file handlers."""
         logger = setup_logger('test_handlers')
-        assert len(logger.handlers) >= 2
+        assert any(isinstance(h, logging.handlers.QueueHandler) for h in logger.handlers)
         
-        handler_types = [type(h).__name__ for h in logger.handlers]
-        assert 'StreamHandler' in handler_types
-        assert 'FileHandler' in handler_types
+        handlers = get_listener_handlers()
+        assert any(isinstance(h, ConsoleHandler) for h in handlers)
+        assert any(isinstance(h, logging.FileHandler) for h in handlers)
+    
+    def test_loggers_share_one_queue_handler(self):
+        """Test that module loggers share a single queue handler (one file handle)."""
+        logger1 = setup_logger('test_shared_a')
+        logger2 = setup_logger('test_shared_b')
+        assert logger1.handlers == logger2.handlers
+        assert len(logger1.handlers) == 1
     
     def test_logger_does_not_duplicate_handlers(self):
         """Test that calling setup_logger multiple times doesn't duplicate handlers."""
@@ -45,6 +66,79 @@ class TestLogger:
         logger.info("Test message")
         
         # Verify file handler exists
-        file_handlers = [h for h in logger.handlers if isinstance(h, logging.FileHandler)]
+        file_handlers = [h for h in get_listener_handlers() if isinstance(h, logging.FileHandler)]
         assert len(file_handlers) > 0
+        
+        flush_logging()
+        log_file = Path(file_handlers[0].baseFilename)
+        assert "Test message" in log_file.read_text(encoding='utf-8')
 
+
+class TestStructuredLogging:
+    """Test context fields and JSON-lines formatting."""
+    
+    def _record(self, msg, *args):
+        return logging.LogRecord('test', logging.INFO, __file__, 1, msg, args, None)
+    
+    def test_context_fields_captured_in_caller_thread(self):
+        """Test that facility/stage are stamped on the record when queued."""
+        handler = ContextQueueHandler(queue.Queue())
+        with log_context(facility='Hospital A'):
+            with log_context(stage='ors_request'):
+                record = handler.prepare(self._record("Requesting %s", 'isochrone'))
+        
+        assert record.facility == 'Hospital A'
+        assert record.stage == 'ors_request'
+        assert record.msg == "Requesting isochrone" and record.args is None
+    
+    def test_context_does_not_leak(self):
+        """Test that fields are removed when the context exits."""
+        handler = ContextQueueHandler(queue.Queue())
+        with log_context(facility='Hospital A'):
+            pass
+        record = handler.prepare(self._record("after"))
+        assert record.facility is None
+    
+    def test_json_lines_formatter(self):
+        """Test one JSON object per record, with context fields when set."""
+        record = self._record("Population: %d", 42)
+        record.facility = 'Hospital A'
+        record.stage = None
+        
+        entry = json.loads(JsonLinesFormatter().format(record))
+        
+        assert entry['message'] == "Population: 42"
+        assert entry['level'] == 'INFO'
+        assert entry['facility'] == 'Hospital A'
+        assert 'stage' not in entry
+    
+    def test_logging_does_not_block_on_handler(self):
+        """Test that a slow handler does not block the logging call."""
+        release = threading.Event()
+        
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait(5)
+        
+        log_queue = queue.Queue()
+        listener = logging.handlers.QueueListener(log_queue, SlowHandler())
+        listener.start()
+        try:
+            logger = logging.getLogger('test_nonblocking')
+            logger.propagate = False
+            logger.addHandler(ContextQueueHandler(log_queue))
+            for i in range(100):
+                logger.warning("message %d", i)
+            assert log_queue.qsize() >= 99
+        finally:
+            release.set()
+            listener.stop()
+    
+    def test_console_records_written_above_status_line(self):
+        """Test that the console handler clears and redraws the progress status line."""
+        stream = io.StringIO()
+        handler = ConsoleHandler(stream)
+        handler.set_status('[1/10] 10.0%')
+        handler.handle(self._record("Saved results"))
+        
+        assert stream.getvalue() == '[1/10] 10.0%\r\x1b[KSaved results\n[1/10] 10.0%'
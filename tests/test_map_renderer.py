@@ -0,0 +1,194 @@
+"""Tests for the template-based Leaflet map renderer."""
+import gzip
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from config import get_config
+from facility_result import FacilityResult
+from analyze_population import build_map, find_county_column, save_map
+from map_renderer import LeafletMap
+from folium.plugins import FastMarkerCluster
+
+
+def square(west, south, size):
+    ring = [[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {}}
+
+
+def sample_map():
+    m = LeafletMap(center=(-0.3, 36.1), zoom=9)
+    m.add_geojson(square(36.0, -0.4, 0.2), style={'fillColor': '#FF0000', 'weight': 2}, tooltip="A - 15 min")
+    m.add_marker(-0.3, 36.1, popup="<b>A</b></script><script>alert(1)", tooltip="A")
+    m.add_circle_marker(-0.2, 36.2, radius=4, tooltip="Site", group="Sites", color='#1B5E20')
+    m.add_html('<div id="legend">Legend</div>')
+    return m
+
+
+class TestLeafletMap:
+    """Test the rendered page and its folium equivalent."""
+
+    def test_render(self):
+        html = sample_map().render()
+        assert html.startswith('<!DOCTYPE html>')
+        assert 'leaflet@1.9.3/dist/leaflet.js' in html
+        assert '"A - 15 min"' in html and '"fillColor":"#FF0000"' in html
+        assert '<div id="legend">Legend</div>' in html
+        assert 'var groupNames = ["Sites"];' in html
+        # Popup HTML can't close the map script early
+        assert '</script><script>alert(1)' not in html
+        assert '<\\/script><script>alert(1)' in html
+
+    def test_serialized_geojson_and_save(self, tmp_path):
+        """Test that pre-serialized GeoJSON strings are embedded as-is."""
+        m = LeafletMap(center=(0, 36), zoom=7)
+        m.add_geojson(json.dumps(square(36.0, -0.4, 0.2)), style={})
+        m.save(str(tmp_path / 'map.html'))
+        assert '"coordinates": [[[36.0, -0.4]' in (tmp_path / 'map.html').read_text()
+
+    def test_sidecars(self, tmp_path):
+        """Test that grouped layers move to per-group files and ungrouped ones stay inline."""
+        m = LeafletMap(center=(-0.3, 36.1), zoom=9)
+        m.add_geojson(square(36.0, -0.4, 0.2), style={}, tooltip="Inline")
+        m.add_geojson(square(36.0, -0.4, 0.2), style={}, tooltip="A - 45 min", group="45 min",
+                      bounds=(-0.4, 36.0, -0.2, 36.2))
+        m.add_geojson(square(36.5, -0.1, 0.1), style={}, tooltip="B - 45 min", group="45 min",
+                      bounds=(-0.1, 36.5, 0.0, 36.6))
+        m.add_geojson(square(36.0, -0.4, 0.1), style={}, tooltip="A - 15 min", group="15 min")
+        (tmp_path / 'map_layers').mkdir()
+        (tmp_path / 'map_layers' / '007_old.json').write_text('[]')
+
+        written = m.save(str(tmp_path / 'map.html'), sidecars=True, compress=True)
+
+        names = ['000_45_min.json.gz', '001_15_min.json.gz']
+        assert sorted(p.name for p in (tmp_path / 'map_layers').iterdir()) == names
+        assert written == [str(tmp_path / 'map_layers' / name) for name in names]
+        rows = json.loads(gzip.decompress((tmp_path / 'map_layers' / '000_45_min.json.gz').read_bytes()))
+        assert [row[2] for row in rows] == ['A - 45 min', 'B - 45 min']
+        assert rows[0][0] == square(36.0, -0.4, 0.2) and rows[0][3] == 0
+
+        html = (tmp_path / 'map.html').read_text()
+        assert '"Inline"' in html and 'A - 45 min' not in html
+        assert ('var sidecars = [["map_layers/000_45_min.json.gz",0,[-0.4,36.0,0.0,36.6]],'
+                '["map_layers/001_15_min.json.gz",1,null]];') in html
+        # Without sidecars everything is inline
+        assert m.save(str(tmp_path / 'inline.html')) == []
+        assert 'A - 45 min' in (tmp_path / 'inline.html').read_text()
+
+    def test_points(self):
+        """Test that points are one data array drawn on a canvas, with the cluster plugin loaded only when used."""
+        m = LeafletMap(center=(0, 36), zoom=6)
+        m.add_points([(0, 36, 'A', 1234.0, None)], columns=['15min', '30min'], title='Population:', color='red')
+        html = m.render()
+        assert '"rows":[[0.0,36.0,"A",1234.0,null]]' in html and '"columns":["15min","30min"]' in html
+        assert 'L.canvas(' in html and 'markercluster' not in html
+
+        m.add_points([(0.5, 36.5, 'B</script>')], cluster=True, group='Facilities')
+        html = m.render()
+        assert 'leaflet.markercluster.js' in html and '"cluster":true' in html
+        assert 'B<\\/script>' in html
+
+    def test_to_folium(self):
+        """Test that the folium map carries the same layers."""
+        html = sample_map().to_folium().get_root().render()
+        assert 'A - 15 min' in html
+        assert '#FF0000' in html
+        assert '<div id="legend">Legend</div>' in html
+        assert 'L.control.layers' in html and '"Sites"' in html
+
+        m = LeafletMap(center=(0, 36), zoom=6, prefer_canvas=True)
+        m.add_points([(0, 36, 'A', 1234.0)], columns=['15min'], cluster=True)
+        html = m.to_folium().get_root().render()
+        assert 'L.markerClusterGroup' in html and 'function pointPopup' in html
+        assert '"preferCanvas": true' in html
+
+    @pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+    def test_to_folium_cluster_script_runs(self):
+        """Test that folium's cluster script builds a popup circle for every data row."""
+        m = LeafletMap(center=(0, 36), zoom=6)
+        m.add_points([(0, 36, 'A<b>', 1234.0), (0.5, 36.5, 'B', None)], columns=['15min'], title='Population:',
+                     cluster=True)
+        folium_map = m.to_folium()
+        cluster = next(e for e in folium_map._children.values() if isinstance(e, FastMarkerCluster))
+        stub = """
+            var added = [];
+            var L = {
+                circleMarker: function (latlng, style) {
+                    return {latlng: latlng, bindPopup: function (popup) { this.popup = popup; return this; },
+                            addTo: function (target) { added.push(this); return this; }};
+                },
+                markerClusterGroup: function () { return {addTo: function () { return this; }}; }
+            };
+            var %s = {};
+        """ % folium_map.get_name()
+        script = stub + cluster._template.module.script(cluster, {}) + "\nconsole.log(JSON.stringify(added));"
+        output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+        markers = json.loads(output)
+        assert [marker['latlng'] for marker in markers] == [[0, 36], [0.5, 36.5]]
+        assert markers[0]['popup'] == '<b>A&#60;b&#62;</b><br>Population:<br>15min: 1,234'
+        assert markers[1]['popup'] == '<b>B</b><br>Population:<br>15min: -'
+
+
+@pytest.fixture
+def facility_result(sample_facilities_data, sample_multiple_isochrone_response):
+    row = sample_facilities_data.iloc[0]
+    result = FacilityResult(row['Facility Name'], row['Latitude'], row['Longitude'], source_row=row)
+    for feature, pop in zip(sample_multiple_isochrone_response['features'], (100.0, 250.0, 400.0)):
+        result.add_range(feature['properties']['value'], feature, pop)
+    return result
+
+
+class TestBuildMap:
+    """Test the analysis map built from facility results."""
+
+    def test_build_and_save(self, facility_result, tmp_path):
+        config = get_config().snapshot()
+
+        m = build_map([facility_result], config)
+        html = m.render()
+        assert 'Hospital A - 30 min: 250 people' in html
+        assert 'Isochrone Times & Totals' in html
+
+        save_map(m, str(tmp_path / 'template.html'), config)
+        save_map(m, str(tmp_path / 'folium.html'), config._replace(map_renderer='folium'))
+        for name in ('template.html', 'folium.html'):
+            assert 'Hospital A - 45 min: 400 people' in (tmp_path / name).read_text()
+
+    def test_clustered_facilities(self, facility_result):
+        """Test that facilities switch to the clustered data layer from the configured count."""
+        config = get_config().snapshot()._replace(map_facility_layer='auto', map_cluster_threshold=2)
+        assert '"cluster":true' not in build_map([facility_result], config).render()
+
+        html = build_map([facility_result] * 2, config).render()
+        assert html.count('L.circleMarker([d[0], d[1]], d[4])') == 1 and 'var circleMarkers = [\n\n];' in html
+        assert '"rows":[[-1.2921,36.8219,"Hospital A",100.0,250.0,400.0],' in html
+        assert '"columns":["15min","30min","45min"]' in html and 'preferCanvas: true' in html
+
+    def test_sidecar_groups(self, facility_result, tmp_path):
+        """Test per-range and per-county sidecar files written by save_map."""
+        config = get_config().snapshot()._replace(map_sidecars=True, map_sidecar_gzip=False)
+
+        save_map(build_map([facility_result], config), str(tmp_path / 'ranges.html'), config)
+        assert sorted(p.name for p in (tmp_path / 'ranges_layers').iterdir()) == [
+            '000_45_min_isochrones.json', '001_30_min_isochrones.json', '002_15_min_isochrones.json']
+        html = (tmp_path / 'ranges.html').read_text()
+        assert 'people' not in html.split('var sidecars')[0].split('var geojsonLayers')[1]
+        assert 'Hospital A - 30 min' in (tmp_path / 'ranges_layers' / '001_30_min_isochrones.json').read_text()
+
+        county = config._replace(map_sidecar_split='county')
+        save_map(build_map([facility_result], county), str(tmp_path / 'counties.html'), county)
+        rows = json.loads((tmp_path / 'counties_layers' / '000_nairobi.json').read_text())
+        assert len(rows) == 3
+
+    def test_county_column_by_pattern(self, facility_result):
+        """Test that county groups find snake_case county columns like the facility export's."""
+        config = get_config().snapshot()._replace(map_sidecars=True, map_sidecar_split='county')
+        facility_result.source_row = facility_result.source_row.rename({'County': 'county_name'})
+        assert find_county_column([facility_result]) == 'county_name'
+        assert 'var groupNames = ["Nairobi"];' in build_map([facility_result], config).render()
+
+        facility_result.source_row = facility_result.source_row.drop('county_name')
+        assert find_county_column([facility_result]) is None
+        assert 'var groupNames = ["Unknown county"];' in build_map([facility_result], config).render()
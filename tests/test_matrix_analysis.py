@@ -0,0 +1,121 @@
+"""Tests for the matrix travel-time analysis mode."""
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import Mock
+from matrix_analysis import (
+    haversine_km,
+    nearest_candidates,
+    plan_matrix_batches,
+    compute_travel_times,
+    population_by_minute,
+    population_within,
+    catchment_table
+)
+
+
+def fake_matrix(locations, sources, destinations, **kwargs):
+    """Matrix stand-in: 60 seconds of driving per straight-line km."""
+    src = np.array([locations[i] for i in sources])
+    dst = np.array([locations[j] for j in destinations])
+    km = haversine_km(src[:, None, 1], src[:, None, 0], dst[None, :, 1], dst[None, :, 0])
+    return {'durations': (km * 60).tolist()}
+
+
+class TestPrefilterAndBatching:
+    """Test straight-line prefilter and request batching."""
+
+    def test_haversine_one_degree_latitude(self):
+        """Test that one degree of latitude is ~111 km."""
+        assert haversine_km(0, 0, 1, 0) == pytest.approx(111.2, abs=0.2)
+
+    def test_nearest_candidates_sorted_and_limited(self):
+        """Test that candidates are the k nearest, sorted, within max_km."""
+        cell_lat = np.array([0.0, 5.0])
+        cell_lon = np.array([0.0, 5.0])
+        fac_lat = np.array([0.0, 0.1, 0.3])
+        fac_lon = np.array([0.2, 0.0, 0.0])
+
+        candidates = nearest_candidates(cell_lat, cell_lon, fac_lat, fac_lon, k=2, max_km=100)
+
+        assert candidates[0].tolist() == [1, 0]
+        assert candidates[1].tolist() == [-1, -1]  # Far from every facility
+
+    def test_batches_respect_maximum_routes(self):
+        """Test that every batch fits the server limit and covers each reachable cell once."""
+        rng = np.random.default_rng(0)
+        candidates = rng.integers(0, 20, size=(500, 3))
+        candidates[::7] = -1
+
+        batches = plan_matrix_batches(candidates, maximum_routes=100)
+
+        covered = np.concatenate([cells for cells, _ in batches])
+        assert sorted(covered.tolist()) == np.nonzero(candidates[:, 0] >= 0)[0].tolist()
+        for cells, facilities in batches:
+            assert len(cells) * len(facilities) <= 100
+            for cell in cells:
+                assert set(candidates[cell]) <= set(facilities)
+
+
+class TestTravelTimes:
+    """Test travel-time computation and tabulation."""
+
+    def test_compute_travel_times_uses_nearest(self):
+        """Test that each cell gets the minimum duration across its candidates."""
+        client = Mock()
+        client.distance_matrix.side_effect = fake_matrix
+        cell_lat = np.array([0.0, 0.0, 3.0])
+        cell_lon = np.array([0.0, 0.5, 3.0])
+        fac_lat = np.array([0.0, 0.0])
+        fac_lon = np.array([0.1, 0.6])
+
+        seconds, nearest = compute_travel_times(
+            client, cell_lat, cell_lon, fac_lat, fac_lon, k=2, max_km=50, maximum_routes=4
+        )
+
+        assert nearest.tolist() == [0, 1, -1]
+        assert seconds[0] == pytest.approx(0.1 * 111.2 * 60, rel=0.01)
+        assert np.isinf(seconds[2])
+        for call in client.distance_matrix.call_args_list:
+            kwargs = call.kwargs
+            assert len(kwargs['sources']) * len(kwargs['destinations']) <= 4
+
+    def test_failed_matrix_leaves_cells_unreachable(self, mocker):
+        """Test that a failed request marks its cells unreachable instead of aborting."""
+        mocker.patch('matrix_analysis.time.sleep')
+        client = Mock()
+        client.distance_matrix.side_effect = Exception("server down")
+
+        seconds, nearest = compute_travel_times(
+            client, np.array([0.0]), np.array([0.0]), np.array([0.0]), np.array([0.1]),
+            k=1, max_km=50, maximum_routes=10
+        )
+
+        assert np.isinf(seconds[0])
+        assert nearest[0] == -1
+
+    def test_population_by_minute(self):
+        """Test cumulative population table for arbitrary thresholds."""
+        minutes = np.array([0.5, 1.2, 14.9, 15.0, 29.0, np.inf])
+        population = np.array([10, 20, 30, 40, 50, 60])
+
+        table = population_by_minute(minutes, population, max_minutes=30)
+
+        assert len(table) == 30
+        assert population_within(table, 1) == 10
+        assert population_within(table, 15) == 100
+        assert population_within(table, 30) == 150
+        assert table['cumulative_pct'].iloc[-1] == pytest.approx(150 / 210 * 100)
+
+    def test_catchment_table(self):
+        """Test that each cell's population is credited once, to its nearest facility, per range."""
+        facilities = pd.DataFrame({'name': ['A', 'B', 'C'], 'lat': [0.0, 0.1, 0.2], 'lon': [36.0, 36.1, 36.2]})
+        nearest = np.array([0, 0, 1, 1, -1])
+        minutes = np.array([5.0, 20.0, 14.0, 40.0, np.inf])
+        population = np.array([10, 20, 30, 40, 50])
+
+        table = catchment_table(facilities, nearest, minutes, population, [15, 30])
+
+        assert table['name'].tolist() == ['A', 'B', 'C']
+        assert table['population_15min'].tolist() == [10, 30, 0]
+        assert table['population_30min'].tolist() == [30, 30, 0]
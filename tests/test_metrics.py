@@ -0,0 +1,92 @@
+"""Tests for run metrics collection and export."""
+import json
+import pytest
+from unittest.mock import Mock, patch
+from metrics import MetricsRegistry, percentile, get_metrics
+from analyze_population import get_isochrone_with_retry
+
+
+class TestMetricsRegistry:
+    """Test latency histograms, counters and exports."""
+
+    def test_percentile_interpolates(self):
+        """Test quantiles on a known distribution."""
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == pytest.approx(50.5)
+        assert percentile(values, 0.99) == pytest.approx(99.01)
+        assert percentile([], 0.5) == 0.0
+
+    def test_timer_records_observation(self):
+        """Test that timer() records one observation even when the block raises."""
+        registry = MetricsRegistry()
+        with registry.timer('stage'):
+            pass
+        with pytest.raises(ValueError):
+            with registry.timer('stage'):
+                raise ValueError("boom")
+
+        stats = registry.summary()['stages']['stage']
+        assert stats['count'] == 2
+        assert stats['total_seconds'] >= 0
+
+    def test_summary_quantiles_and_counters(self):
+        """Test p50/p95/p99 and counters in the summary."""
+        registry = MetricsRegistry()
+        for ms in range(1, 101):
+            registry.observe('ors_request', ms / 1000)
+        registry.incr('ors_retries', 2)
+        registry.incr('ors_retries')
+
+        summary = registry.summary()
+        stats = summary['stages']['ors_request']
+        assert stats['p50_seconds'] == pytest.approx(0.0505)
+        assert stats['p95_seconds'] == pytest.approx(0.09505)
+        assert stats['max_seconds'] == pytest.approx(0.1)
+        assert summary['counters'] == {'ors_retries': 3}
+
+    def test_prometheus_format(self):
+        """Test the Prometheus text exposition output."""
+        registry = MetricsRegistry()
+        registry.observe('map_save', 0.25)
+        registry.incr('ors_errors')
+
+        text = registry.to_prometheus('analyze_population')
+
+        assert '# TYPE isochrone_analysis_stage_seconds summary' in text
+        assert 'isochrone_analysis_stage_seconds{run="analyze_population",stage="map_save",quantile="0.5"} 0.250000' in text
+        assert 'isochrone_analysis_stage_seconds_count{run="analyze_population",stage="map_save"} 1' in text
+        assert 'isochrone_analysis_events_total{run="analyze_population",event="ors_errors"} 1' in text
+
+    def test_write_files_and_bottleneck(self, tmp_path):
+        """Test JSON/Prometheus files and the console summary naming the slowest stage."""
+        registry = MetricsRegistry()
+        registry.observe('gee_population', 3.0)
+        registry.observe('ors_request', 1.0)
+
+        paths = registry.write(str(tmp_path), 'test_run')
+
+        data = json.loads((tmp_path / 'metrics_test_run.json').read_text())
+        assert data['run'] == 'test_run'
+        assert set(data['stages']) == {'gee_population', 'ors_request'}
+        assert paths['prometheus'].endswith('metrics_test_run.prom')
+        assert 'Bottleneck: gee_population' in registry.bottleneck_summary()
+
+
+class TestInstrumentation:
+    """Test that pipeline stages report into the global registry."""
+
+    def test_isochrone_retries_counted(self, sample_isochrone_response):
+        """Test ORS request latency and retry counters."""
+        registry = get_metrics()
+        registry.reset()
+        client = Mock()
+        client.isochrones.side_effect = [Exception("Network error"), sample_isochrone_response]
+
+        with patch('analyze_population.time.sleep'):
+            get_isochrone_with_retry(client, -1.2921, 36.8219, [900], max_retries=3, retry_delay=0.1)
+
+        summary = registry.summary()
+        assert summary['stages']['ors_request']['count'] == 2
+        assert summary['stages']['retry_backoff']['count'] == 1
+        assert summary['counters']['ors_retries'] == 1
+        assert summary['counters']['ors_errors'] == 1
@@ -0,0 +1,119 @@
+"""Tests for ORS backend load balancing."""
+import pytest
+from unittest.mock import Mock
+from ors_pool import ORSBackendPool, NoHealthyBackendError, create_ors_client, health_url_for
+
+
+def make_pool(clients, health=None, **kwargs):
+    """Create a pool whose backends use the given mock clients."""
+    urls = list(clients.keys())
+    return ORSBackendPool(
+        urls,
+        client_factory=lambda url: clients[url],
+        health_check=health or (lambda url: True),
+        **kwargs
+    )
+
+
+class TestORSBackendPool:
+    """Test routing, failover and re-admission."""
+
+    def test_routes_isochrones_to_backend(self, sample_isochrone_response):
+        """Test that isochrones() is forwarded to a backend client."""
+        client_a, client_b = Mock(), Mock()
+        client_a.isochrones.return_value = sample_isochrone_response
+        client_b.isochrones.return_value = sample_isochrone_response
+        pool = make_pool({'http://a/ors': client_a, 'http://b/ors': client_b})
+
+        result = pool.isochrones(locations=[[36.8, -1.3]], profile='driving-car', range=[900])
+
+        assert result == sample_isochrone_response
+        assert client_a.isochrones.call_count + client_b.isochrones.call_count == 1
+
+    def test_unhealthy_backend_taken_out_of_rotation(self, sample_isochrone_response):
+        """Test that a backend failing repeatedly stops receiving requests."""
+        bad, good = Mock(), Mock()
+        bad.isochrones.side_effect = ConnectionError("refused")
+        good.isochrones.return_value = sample_isochrone_response
+        pool = make_pool(
+            {'http://bad/ors': bad, 'http://good/ors': good},
+            health=lambda url: False,
+            failure_threshold=1,
+            readmit_interval=3600
+        )
+
+        for _ in range(20):
+            try:
+                pool.isochrones(locations=[[36.8, -1.3]], range=[900])
+            except ConnectionError:
+                pass
+
+        assert bad.isochrones.call_count <= 1
+        assert good.isochrones.call_count == 20 - bad.isochrones.call_count
+        if bad.isochrones.call_count:
+            assert [b.base_url for b in pool.healthy_backends] == ['http://good/ors']
+
+    def test_backend_readmitted_after_health_check(self, sample_isochrone_response):
+        """Test that an out-of-rotation backend is re-admitted once healthy."""
+        client = Mock()
+        client.isochrones.side_effect = [ConnectionError("down"), sample_isochrone_response]
+        pool = make_pool({'http://a/ors': client}, failure_threshold=1, readmit_interval=0)
+
+        with pytest.raises(ConnectionError):
+            pool.isochrones(locations=[[36.8, -1.3]], range=[900])
+        assert pool.healthy_backends == []
+
+        assert pool.isochrones(locations=[[36.8, -1.3]], range=[900]) == sample_isochrone_response
+        assert len(pool.healthy_backends) == 1
+
+    def test_no_healthy_backends_raises(self):
+        """Test that requests fail fast when every backend is down."""
+        client = Mock()
+        client.isochrones.side_effect = ConnectionError("down")
+        pool = make_pool({'http://a/ors': client}, health=lambda url: False,
+                         failure_threshold=1, readmit_interval=3600)
+
+        with pytest.raises(ConnectionError):
+            pool.isochrones(locations=[[36.8, -1.3]], range=[900])
+        with pytest.raises(NoHealthyBackendError):
+            pool.isochrones(locations=[[36.8, -1.3]], range=[900])
+
+    def test_prefers_lower_latency_backend(self):
+        """Test that the faster backend receives most of the traffic."""
+        fast, slow = Mock(), Mock()
+        pool = make_pool({'http://fast/ors': fast, 'http://slow/ors': slow})
+        pool.backends[0].latency = 0.1
+        pool.backends[1].latency = 2.0
+
+        for _ in range(50):
+            pool.isochrones(locations=[[36.8, -1.3]], range=[900])
+
+        assert fast.isochrones.call_count == 50
+
+    def test_unknown_attribute_raises(self):
+        """Test that non-routed attributes are not silently proxied."""
+        pool = make_pool({'http://a/ors': Mock()})
+        with pytest.raises(AttributeError):
+            pool.not_a_method
+
+
+class TestCreateClient:
+    """Test client factory selection."""
+
+    def test_single_url_returns_plain_client(self):
+        """Test that a single backend yields a regular ORS client."""
+        config = Mock(ors_base_urls=['http://a/ors'], ors_api_key='key')
+        client = create_ors_client(config)
+        assert not isinstance(client, ORSBackendPool)
+
+    def test_multiple_urls_return_pool(self):
+        """Test that several backends yield a pool."""
+        config = Mock(ors_base_urls=['http://a/ors', 'http://b/ors'], ors_api_key='key',
+                      ors_timeout=30, ors_failure_threshold=3, ors_readmit_interval=30)
+        client = create_ors_client(config)
+        assert isinstance(client, ORSBackendPool)
+        assert len(client.backends) == 2
+
+    def test_health_url_for(self):
+        """Test health URL construction."""
+        assert health_url_for('http://a:8080/ors/') == 'http://a:8080/ors/v2/health'
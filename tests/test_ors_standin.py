@@ -0,0 +1,91 @@
+"""Tests for the offline ORS stand-in server."""
+import threading
+import openrouteservice
+import pytest
+import requests
+from pathlib import Path
+from analyze_population import get_isochrone_with_retry
+from ors_standin import ORSStandIn, synthetic_isochrone_feature
+
+RECORDING = Path(__file__).parent.parent / "kakamega_isochrone.json"
+
+
+def make_client(server):
+    return openrouteservice.Client(key='dummy', base_url=server.base_url, retry_timeout=1)
+
+
+class TestSyntheticGeometry:
+    """Test synthetic isochrone generation."""
+
+    def test_vertex_count_scales_with_range(self):
+        """Test that larger ranges yield more vertices and a larger area."""
+        small = synthetic_isochrone_feature(36.82, -1.29, 900)
+        large = synthetic_isochrone_feature(36.82, -1.29, 2700)
+        assert len(small['geometry']['coordinates'][0]) == 601
+        assert len(large['geometry']['coordinates'][0]) == 1801
+        assert large['properties']['area'] > small['properties']['area']
+
+    def test_deterministic(self):
+        """Test that the same request always produces the same polygon."""
+        assert synthetic_isochrone_feature(36.82, -1.29, 900) == synthetic_isochrone_feature(36.82, -1.29, 900)
+
+
+class TestStandInServer:
+    """Test the HTTP endpoints."""
+
+    def test_health(self):
+        """Test that /v2/health reports ready."""
+        with ORSStandIn() as server:
+            response = requests.get(f"{server.base_url}/v2/health", timeout=5)
+        assert response.json() == {'status': 'ready'}
+
+    def test_synthetic_isochrones_via_pipeline(self):
+        """Test that the pipeline's retry wrapper works against the stand-in."""
+        with ORSStandIn(mode='synthetic') as server:
+            iso = get_isochrone_with_retry(make_client(server), -1.2921, 36.8219, [900])
+        feature = iso['features'][0]
+        assert feature['properties']['value'] == 900
+        assert feature['properties']['center'] == [36.8219, -1.2921]
+        assert feature['geometry']['type'] == 'Polygon'
+
+    def test_replay_moves_recording_to_location(self):
+        """Test that replayed polygons keep their vertex count and move to the request."""
+        with ORSStandIn(mode='replay', recordings=[str(RECORDING)]) as server:
+            iso = make_client(server).isochrones(locations=[[36.8219, -1.2921]], profile='driving-car', range=[2700])
+        ring = iso['features'][0]['geometry']['coordinates'][0]
+        assert len(ring) == 1794
+        lons = [p[0] for p in ring]
+        assert min(lons) < 36.8219 < max(lons)
+
+    def test_error_rate(self):
+        """Test that simulated errors surface as ORS API errors."""
+        with ORSStandIn(error_rate=1.0) as server:
+            with pytest.raises(openrouteservice.exceptions.ApiError):
+                make_client(server).isochrones(locations=[[36.8, -1.3]], range=[900])
+            assert server.state.counters['errors'] == 1
+
+    def test_concurrency_limit(self):
+        """Test that no more than max_concurrency requests are served at once."""
+        with ORSStandIn(latency=0.05, max_concurrency=2) as server:
+            def request():
+                requests.post(f"{server.base_url}/v2/isochrones/driving-car/geojson",
+                              json={'locations': [[36.8, -1.3]], 'range': [300]}, timeout=10)
+            threads = [threading.Thread(target=request) for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            counters = server.state.counters
+        assert counters['requests'] == 6
+        assert counters['max_in_flight'] <= 2
+
+    def test_matrix(self):
+        """Test that matrix requests return a sources x destinations duration table."""
+        with ORSStandIn() as server:
+            result = make_client(server).distance_matrix(
+                locations=[[36.8, -1.3], [36.9, -1.3], [37.0, -1.3]],
+                sources=[0], destinations=[1, 2], metrics=['duration']
+            )
+        durations = result['durations']
+        assert len(durations) == 1 and len(durations[0]) == 2
+        assert 0 < durations[0][0] < durations[0][1]
@@ -0,0 +1,95 @@
+"""Tests for packed isochrone coordinate storage."""
+import numpy as np
+import pytest
+from packed_geometry import PackedGeometry, geojson_to_wkb, wkb_to_geojson
+
+MULTIPOLYGON = {
+    "type": "MultiPolygon",
+    "coordinates": [
+        [[[0.0, 0.0], [4.0, 0.0], [4.0, 4.0], [0.0, 0.0]],
+         [[1.0, 1.0], [2.0, 1.0], [2.0, 2.0], [1.0, 1.0]]],
+        [[[10.0, 10.0], [11.0, 10.0], [11.0, 11.0], [10.0, 10.0]]],
+    ]
+}
+
+
+class TestPackedGeometry:
+    """Test packing and conversion to WKB and GeoJSON."""
+
+    def test_polygon_packed_contiguously(self, sample_isochrone_response):
+        """Test that a polygon becomes one (N, 2) float64 array with ring offsets."""
+        geometry = sample_isochrone_response['features'][0]['geometry']
+        packed = PackedGeometry.from_geojson(geometry)
+
+        assert packed.coords.dtype == np.float64
+        assert packed.coords.flags.c_contiguous
+        assert packed.coords.shape == (5, 2)
+        assert packed.ring_offsets.tolist() == [0, 5]
+        assert packed.to_geojson() == geometry
+
+    def test_multipolygon_offsets(self):
+        """Test ring and polygon offsets for a multipolygon with a hole."""
+        packed = PackedGeometry.from_geojson(MULTIPOLYGON)
+        assert packed.ring_offsets.tolist() == [0, 4, 8, 12]
+        assert packed.polygon_offsets.tolist() == [0, 2, 3]
+        assert packed.to_geojson() == MULTIPOLYGON
+
+    def test_wkb_layout_and_round_trip(self, sample_isochrone_response):
+        """Test the WKB header/size and that WKB unpacks to the same geometry."""
+        geometry = sample_isochrone_response['features'][0]['geometry']
+        wkb = geojson_to_wkb(geometry)
+        assert wkb[:5] == b'\x01\x03\x00\x00\x00'
+        assert len(wkb) == 1 + 4 + 4 + 4 + 5 * 16
+        assert wkb_to_geojson(wkb) == geometry
+        assert wkb_to_geojson(geojson_to_wkb(MULTIPOLYGON)) == MULTIPOLYGON
+
+    def test_quantized_storage(self, sample_isochrone_response):
+        """Test int32 quantization halves coordinate storage within 1e-7 degrees."""
+        geometry = sample_isochrone_response['features'][0]['geometry']
+        exact = PackedGeometry.from_geojson(geometry)
+        packed = PackedGeometry.from_geojson(geometry, quantize=True)
+
+        assert packed.quantized
+        assert packed.coords.nbytes * 2 == exact.coords.nbytes
+        np.testing.assert_allclose(packed.degrees(), exact.coords, atol=1e-7)
+        assert PackedGeometry.from_wkb(packed.to_wkb()).coords == pytest.approx(packed.degrees())
+
+    def test_extra_dimensions_dropped(self):
+        """Test that elevation values are dropped."""
+        geometry = {"type": "Polygon", "coordinates": [[[0, 0, 5], [1, 0, 5], [1, 1, 5], [0, 0, 5]]]}
+        assert PackedGeometry.from_geojson(geometry).to_geojson()['coordinates'][0][1] == [1.0, 0.0]
+
+    def test_unsupported_types(self):
+        """Test that non-polygon geometries and big-endian WKB are rejected."""
+        with pytest.raises(ValueError):
+            PackedGeometry.from_geojson({"type": "Point", "coordinates": [0.0, 0.0]})
+        with pytest.raises(ValueError):
+            PackedGeometry.from_wkb(b'\x00\x00\x00\x00\x03')
+
+
+class TestCanonicalHash:
+    """Test the representation-independent geometry hash."""
+
+    def test_equal_for_equivalent_rings(self):
+        """Test that start vertex, orientation, closing vertex and single-part MultiPolygon don't matter."""
+        ring = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]
+        rotated_reversed = [[1.0, 1.0], [1.0, 0.0], [0.0, 0.0], [0.0, 1.0]]
+        expected = PackedGeometry.from_geojson({"type": "Polygon", "coordinates": [ring]}).canonical_hash()
+        assert PackedGeometry.from_geojson(
+            {"type": "Polygon", "coordinates": [rotated_reversed]}
+        ).canonical_hash() == expected
+        assert PackedGeometry.from_geojson(
+            {"type": "MultiPolygon", "coordinates": [[ring]]}, quantize=True
+        ).canonical_hash() == expected
+
+    def test_part_order_ignored_and_coordinates_matter(self):
+        """Test that polygon order is ignored but a 1e-7 degree shift changes the hash."""
+        reordered = {"type": "MultiPolygon", "coordinates": MULTIPOLYGON['coordinates'][::-1]}
+        expected = PackedGeometry.from_geojson(MULTIPOLYGON).canonical_hash()
+        assert PackedGeometry.from_geojson(reordered).canonical_hash() == expected
+
+        shifted = {"type": "MultiPolygon", "coordinates": [
+            [[[0.0, 0.0], [4.0, 0.0], [4.0, 4.0000001], [0.0, 0.0]], MULTIPOLYGON['coordinates'][0][1]],
+            MULTIPOLYGON['coordinates'][1],
+        ]}
+        assert PackedGeometry.from_geojson(shifted).canonical_hash() != expected
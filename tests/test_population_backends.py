@@ -0,0 +1,99 @@
+"""Tests for the pluggable population backends."""
+import numpy as np
+import pytest
+from unittest.mock import patch
+from metrics import get_metrics
+from population_grid import PopulationGrid
+import population_backends
+from population_backends import (
+    GeePopulationBackend,
+    OrsAttributePopulationBackend,
+    PopulationBackend,
+    RasterPopulationBackend,
+    get_population_backend,
+    register_backend,
+)
+
+
+def square_feature(x0, y0, x1, y1, **properties):
+    ring = [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+    return {"type": "Feature", "properties": properties, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+@pytest.fixture
+def grid():
+    """10x10 grid of 2 people per cell over lon 36-37, lat 0-1."""
+    return PopulationGrid(np.full((10, 10), 2.0), west=36.0, north=1.0, xres=0.1, yres=0.1)
+
+
+class TestRasterBackend:
+    """Test the local raster backend and the shared cache."""
+
+    def test_zonal_population_and_cache(self, grid):
+        """Test zonal sums and that repeated geometries are served from the cache."""
+        backend = RasterPopulationBackend(grid=grid)
+        assert isinstance(backend, PopulationBackend)
+        metrics = get_metrics()
+        metrics.reset()
+
+        features = [square_feature(36.0, 0.0, 36.5, 0.5), square_feature(36.0, 0.0, 37.0, 1.0)]
+        assert backend.populations(features) == [pytest.approx(50.0), pytest.approx(200.0)]
+        with patch('rasterize.zonal_sum') as zonal_sum:
+            assert backend.population(features[0]) == pytest.approx(50.0)
+            zonal_sum.assert_not_called()
+
+        counters = metrics.summary()['counters']
+        assert counters['population_cache_hits'] == 1
+        assert counters['population_cache_misses'] == 2
+        assert metrics.summary()['stages']['raster_population']['count'] == 1
+
+    def test_missing_file(self, tmp_path):
+        """Test that a missing raster fails when the backend is created."""
+        with pytest.raises(FileNotFoundError):
+            RasterPopulationBackend(str(tmp_path / 'missing.tif'))
+
+
+class TestOtherBackends:
+    """Test the ORS attribute and GEE backends."""
+
+    def test_ors_total_pop(self):
+        """Test reading total_pop, with None when the server doesn't provide it."""
+        backend = OrsAttributePopulationBackend()
+        features = [square_feature(0, 0, 1, 1, total_pop=1234), square_feature(0, 0, 1, 1)]
+        assert backend.populations(features) == [1234.0, None]
+
+    def test_gee_single_and_batch(self):
+        """Test that one feature uses reduceRegion and several use one batch request."""
+        backend = GeePopulationBackend('WorldPop/GP/100m/pop', 100, 1e9)
+        features = [square_feature(0, 0, 1, 1), square_feature(0, 0, 2, 2)]
+        with patch('analyze_population.calculate_population_gee', return_value=10.0) as single, \
+                patch('analyze_population.calculate_populations_gee', return_value=[20.0, None]) as batch:
+            assert backend.population(features[0]) == 10.0
+            # The first feature is now cached, so only the second is sent
+            assert backend.populations(features[::-1]) == [10.0, 10.0]
+        assert single.call_count == 2
+        batch.assert_not_called()
+
+        with patch('analyze_population.calculate_populations_gee', return_value=[20.0, None]) as batch:
+            assert backend.populations([square_feature(0, 0, 3, 3), square_feature(0, 0, 4, 4)]) == [20.0, None]
+        batch.assert_called_once()
+
+
+class TestBackendSelection:
+    """Test selecting backends by name."""
+
+    def test_unknown_backend(self):
+        """Test that an unknown name lists the available backends."""
+        with pytest.raises(ValueError, match="gee, grid, h3, ors, raster"):
+            get_population_backend(name='nope')
+
+    def test_register_backend(self, grid):
+        """Test that registered backends are created once and selectable by name."""
+        register_backend('test_grid', lambda config: RasterPopulationBackend(grid=grid, name='test_grid'))
+        try:
+            backend = get_population_backend(name='test_grid')
+            assert backend is get_population_backend(name='test_grid')
+            assert backend.name == 'test_grid'
+        finally:
+            population_backends._factories.pop('test_grid')
+            population_backends._backends.pop('test_grid', None)
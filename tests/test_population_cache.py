@@ -0,0 +1,97 @@
+"""Tests for the persistent geometry-keyed population cache."""
+import numpy as np
+import pytest
+from unittest.mock import patch
+from metrics import get_metrics
+from population_cache import PopulationCache, cache_key
+from population_backends import GeePopulationBackend, RasterPopulationBackend
+from population_grid import PopulationGrid
+
+
+def square_feature(x0, y0, x1, y1):
+    ring = [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PopulationCache(str(tmp_path / 'cache' / 'populations.sqlite'))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def raster_path(tmp_path):
+    """10x10 grid of 2 people per cell over lon 36-37, lat 0-1, saved as .npz."""
+    path = tmp_path / 'grid.npz'
+    PopulationGrid(np.full((10, 10), 2.0), west=36.0, north=1.0, xres=0.1, yres=0.1).save(str(path))
+    return str(path)
+
+
+class TestPopulationCache:
+    """Test storing and looking up populations."""
+
+    def test_get_put_and_stats(self, cache):
+        """Test batch lookups, persistence across connections and the hit/miss counters."""
+        cache.put_many({'a': 10.0, 'b': 20.5}, 'test')
+        assert cache.get_many(['a', 'b', 'c']) == {'a': 10.0, 'b': 20.5}
+        assert cache.get('c') is None
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert cache.hit_rate == pytest.approx(0.5)
+        assert '2 hits, 2 misses (50% hit rate), 2 entries' in cache.report()
+
+        reopened = PopulationCache(cache.path)
+        assert reopened.get('b') == 20.5
+        reopened.close()
+
+    def test_key_depends_on_namespace(self):
+        """Test that the same geometry in different namespaces gets different keys."""
+        assert cache_key('abc', 'gee:ds:2020:250') != cache_key('abc', 'gee:ds:2020:1000')
+        assert cache_key('abc', 'ns') == cache_key('abc', 'ns')
+
+
+class TestBackendPersistence:
+    """Test that backends consult the persistent cache before computing."""
+
+    def test_raster_results_shared_between_backends(self, cache, raster_path):
+        """Test that a new backend instance is served from the cache, even for a reordered ring."""
+        first = RasterPopulationBackend(raster_path)
+        first.persistent_cache = cache
+        assert first.population(square_feature(36.0, 0.0, 36.5, 0.5)) == pytest.approx(50.0)
+
+        second = RasterPopulationBackend(raster_path)
+        second.persistent_cache = cache
+        metrics = get_metrics()
+        metrics.reset()
+        reordered = {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [
+            [[36.5, 0.5], [36.5, 0.0], [36.0, 0.0], [36.0, 0.5]]
+        ]}}
+        with patch('rasterize.zonal_sum') as zonal_sum:
+            assert second.population(reordered) == pytest.approx(50.0)
+            zonal_sum.assert_not_called()
+        assert metrics.summary()['counters']['population_store_hits'] == 1
+
+    def test_rebuilt_raster_invalidates(self, cache, raster_path):
+        """Test that rewriting the raster file changes the namespace."""
+        backend = RasterPopulationBackend(raster_path)
+        before = backend.cache_namespace()
+        PopulationGrid(np.full((20, 20), 0.5), west=36.0, north=1.0, xres=0.05, yres=0.05).save(raster_path)
+        assert backend.cache_namespace() != before
+
+    def test_gee_namespace(self, monkeypatch):
+        """Test that the GEE namespace covers dataset, the image used and effective scale."""
+        sources = {'WorldPop/GP/100m/pop': '2020', 'Other/pop': 'latest:KEN_2018'}
+        monkeypatch.setattr('analyze_population.population_image_source', sources.get)
+        assert GeePopulationBackend('WorldPop/GP/100m/pop', 100, 1).cache_namespace() == \
+            'gee:WorldPop/GP/100m/pop:2020:250'
+        assert GeePopulationBackend('WorldPop/GP/100m/pop', 1000, 1).cache_namespace().endswith(':1000')
+        # A dataset without images for the population year is keyed on the fallback image
+        assert GeePopulationBackend('Other/pop', 100, 1).cache_namespace() == 'gee:Other/pop:latest:KEN_2018:250'
+
+    def test_in_memory_grid_not_persisted(self, cache):
+        """Test that backends without a file stay out of the persistent cache."""
+        grid = PopulationGrid(np.full((10, 10), 2.0), west=36.0, north=1.0, xres=0.1, yres=0.1)
+        backend = RasterPopulationBackend(grid=grid)
+        backend.persistent_cache = cache
+        backend.population(square_feature(36.0, 0.0, 36.5, 0.5))
+        assert len(cache) == 0
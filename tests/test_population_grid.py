@@ -0,0 +1,111 @@
+"""Tests for gridded population data."""
+import numpy as np
+import pytest
+import population_grid
+from population_grid import PopulationGrid, bounds_around, grid_covers, load_population_grid, load_raster_grid
+
+
+class TestPopulationGrid:
+    """Test grid geometry helpers and persistence."""
+
+    def test_cell_centers_and_index_round_trip(self):
+        """Test that cell centers map back to their own cells."""
+        grid = PopulationGrid(np.zeros((4, 5)), west=36.0, north=-1.0, xres=0.01, yres=0.01)
+        rows, cols = np.array([0, 3]), np.array([0, 4])
+
+        lat, lon = grid.cell_centers(rows, cols)
+        assert lat[0] == pytest.approx(-1.005)
+        assert lon[1] == pytest.approx(36.045)
+
+        back_rows, back_cols = grid.cell_index(lat, lon)
+        assert back_rows.tolist() == [0, 3]
+        assert back_cols.tolist() == [0, 4]
+
+    def test_save_and_load(self, tmp_path):
+        """Test .npz round trip."""
+        grid = PopulationGrid(np.arange(6).reshape(2, 3), 36.0, -1.0, 0.01, 0.02)
+        path = tmp_path / "grid.npz"
+        grid.save(str(path))
+
+        loaded = PopulationGrid.load(str(path))
+        assert np.array_equal(loaded.values, grid.values)
+        assert loaded.bounds == grid.bounds
+
+    def test_load_geotiff(self, tmp_path):
+        """Test reading values and georeferencing from a GeoTIFF."""
+        Image = pytest.importorskip('PIL.Image')
+        from PIL import TiffImagePlugin
+        tags = TiffImagePlugin.ImageFileDirectory_v2()
+        tags[33550] = (0.5, 0.25, 0.0)
+        tags.tagtype[33550] = 12
+        tags[33922] = (0.0, 0.0, 0.0, 36.0, 1.0, 0.0)
+        tags.tagtype[33922] = 12
+        values = np.arange(12, dtype=np.float32).reshape(3, 4)
+        values[0, 0] = -99999  # WorldPop no-data
+        path = tmp_path / "pop.tif"
+        Image.fromarray(values).save(path, tiffinfo=tags)
+
+        grid = load_raster_grid(str(path))
+        assert (grid.west, grid.north, grid.xres, grid.yres) == (36.0, 1.0, 0.5, 0.25)
+        assert np.isnan(grid.values[0, 0])
+        assert grid.total == pytest.approx(sum(range(1, 12)))
+
+    def test_aggregate_preserves_total(self):
+        """Test that aggregation sums blocks and preserves total population."""
+        grid = PopulationGrid(np.ones((5, 5)), 36.0, -1.0, 0.01, 0.01)
+        coarse = grid.aggregate(2)
+        assert coarse.shape == (3, 3)
+        assert coarse.total == pytest.approx(25)
+        assert coarse.values[0, 0] == 4
+
+    def test_bounds_around(self):
+        """Test buffered bounding box."""
+        west, south, east, north = bounds_around([0.0, 1.0], [36.0, 37.0], buffer_km=111.32)
+        assert south == pytest.approx(-1.0)
+        assert north == pytest.approx(2.0)
+        assert west < 35.0 and east > 38.0
+
+
+class TestLoadPopulationGrid:
+    """Test reuse and refetching of the cached population grid."""
+
+    @pytest.fixture
+    def fetches(self, monkeypatch):
+        """Record GEE fetches and return a 0.01 degree grid over the requested bounds."""
+        calls = []
+
+        def fetch(bounds, scale=None, dataset_name=None):
+            calls.append((bounds, scale))
+            west, south, east, north = bounds
+            shape = (int(np.ceil((north - south) / 0.01)), int(np.ceil((east - west) / 0.01)))
+            return PopulationGrid(np.ones(shape), west, north, 0.01, 0.01)
+
+        monkeypatch.setattr(population_grid, 'fetch_population_grid_gee', fetch)
+        monkeypatch.setattr('auth_gee.initialize_gee', lambda: None)
+        return calls
+
+    def test_cached_grid_reused_when_it_fits(self, tmp_path, fetches):
+        path = str(tmp_path / 'grid.npz')
+        grid = load_population_grid(path, bounds=(36.0, -1.0, 37.0, 0.0), scale=1000)
+        assert grid_covers(grid, (36.0, -1.0, 37.0, 0.0))
+        assert load_population_grid(path, bounds=(36.2, -0.8, 36.5, -0.5), scale=1000).shape == grid.shape
+        assert load_population_grid(path).shape == grid.shape
+        assert len(fetches) == 1
+
+    def test_refetch_for_other_bounds_or_scale(self, tmp_path, fetches):
+        path = str(tmp_path / 'grid.npz')
+        load_population_grid(path, bounds=(36.0, -1.0, 37.0, 0.0), scale=1000)
+        grid = load_population_grid(path, bounds=(34.0, -1.0, 35.0, 0.0), scale=1000)
+        assert grid.west == pytest.approx(34.0)
+        load_population_grid(path, bounds=(34.0, -1.0, 35.0, 0.0), scale=500)
+        assert fetches[1:] == [((34.0, -1.0, 35.0, 0.0), 1000), ((34.0, -1.0, 35.0, 0.0), 500)]
+        with np.load(path) as data:
+            assert float(data['scale']) == 500
+
+    def test_user_grid_not_covering_raises(self, tmp_path, fetches):
+        path = str(tmp_path / 'grid.npz')
+        PopulationGrid(np.ones((10, 10)), 36.0, 0.0, 0.1, 0.1).save(path)
+        assert load_population_grid(path, bounds=(36.1, -0.9, 36.9, -0.1), scale=250).shape == (10, 10)
+        with pytest.raises(ValueError, match="does not cover"):
+            load_population_grid(path, bounds=(35.0, -0.9, 36.9, -0.1), scale=1000)
+        assert fetches == []
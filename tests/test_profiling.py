@@ -0,0 +1,95 @@
+"""Tests for the --profile run profiler."""
+import argparse
+import time
+import pytest
+from profiling import (
+    DeterministicProfiler,
+    SamplingProfiler,
+    ProfileResult,
+    add_profile_arguments,
+    profile_call,
+    run_profiled
+)
+
+
+def busy(n=50000):
+    """CPU-bound helper."""
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def workload():
+    """A little CPU work followed by a sleep."""
+    busy()
+    time.sleep(0.1)
+    return 'done'
+
+
+class TestProfilers:
+    """Test deterministic and sampling profilers."""
+
+    def test_deterministic_separates_sleep(self):
+        """Test that time.sleep is reported as sleep and busy() as CPU."""
+        profiler = DeterministicProfiler()
+        profiler.start()
+        workload()
+        result = profiler.stop()
+
+        categories = result.by_category()
+        assert categories['sleep'] == pytest.approx(0.1, abs=0.05)
+        by_self, _ = result.top_functions(cpu_only=True)
+        assert any(label.startswith('busy (test_profiling.py') for label, _, _ in by_self)
+
+    def test_sampling_records_stacks(self):
+        """Test that sampled stacks attribute the sleep to the workload."""
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        workload()
+        result = profiler.stop()
+
+        assert result.by_category()['sleep'] > 0.05
+        sleeping = [stack for stack in result.stacks if stack[-1] == 'time.sleep']
+        assert sleeping and sleeping[0][0].startswith('workload')
+
+    def test_network_frames_classified(self):
+        """Test that stacks through socket code count as network wait."""
+        result = ProfileResult(
+            'sampling',
+            {('main (a.py:1)', 'recv_into (socket.py:700)'): 2.0, ('main (a.py:1)',): 1.0},
+            {'recv_into (socket.py:700)': 'network'},
+            wall_seconds=3.0
+        )
+        assert result.by_category() == {'cpu': 1.0, 'network': 2.0, 'sleep': 0.0}
+
+    def test_folded_output(self):
+        """Test collapsed-stack lines weighted in microseconds."""
+        result = ProfileResult('deterministic', {('a', 'b'): 0.5, ('a',): 0.25}, {}, 0.75)
+        assert result.folded().splitlines() == ['a 250000', 'a;b 500000']
+
+
+class TestProfileCli:
+    """Test the --profile command-line wiring."""
+
+    def test_profile_call_writes_files(self, tmp_path, capsys):
+        """Test that profile_call writes the flame graph input and report."""
+        assert profile_call(workload, 'deterministic', 'test_run', str(tmp_path)) == 'done'
+
+        assert (tmp_path / 'profile_test_run_deterministic.folded').read_text().strip()
+        report = (tmp_path / 'profile_test_run_deterministic.txt').read_text()
+        assert 'Top 20 functions by self CPU time' in report
+        assert 'Profile (deterministic)' in capsys.readouterr().out
+
+    def test_profile_argument_default_mode(self):
+        """Test that bare --profile selects deterministic mode."""
+        parser = argparse.ArgumentParser()
+        add_profile_arguments(parser)
+        assert parser.parse_args(['--profile']).profile == 'deterministic'
+        assert parser.parse_args(['--profile', 'sampling']).profile == 'sampling'
+        assert parser.parse_args([]).profile is None
+
+    def test_run_profiled_without_profile(self):
+        """Test that the function runs unprofiled when --profile is not given."""
+        args = argparse.Namespace(profile=None, profile_interval=5)
+        assert run_profiled(lambda: 42, args, 'unused') == 42
@@ -0,0 +1,77 @@
+"""Tests for the throttled progress reporter."""
+import io
+import pytest
+from progress import ProgressReporter, format_duration
+
+
+class FakeClock:
+    """Manually advanced time source."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter:
+    """Test aggregation, throttling and output modes."""
+
+    def test_status_line_throughput_eta_failures(self):
+        """Test rate, ETA and failure counts in the status line."""
+        clock = FakeClock()
+        progress = ProgressReporter(10, stream=io.StringIO(), is_tty=True, clock=clock)
+        for ok in (True, True, False, True):
+            progress.start_item('Hospital A')
+            progress.range_done(ok)
+            clock.now += 2.0
+            progress.item_done(ok)
+
+        line = progress.status_line()
+        assert line.startswith('[4/10]  40.0% | 0.50 facilities/s | ETA 12s')
+        assert 'ok 3 failed 1' in line
+        assert 'ranges ok 3 failed 1' in line
+
+    def test_tty_redraws_are_throttled(self):
+        """Test that events within the refresh interval don't redraw the line."""
+        clock = FakeClock()
+        stream = io.StringIO()
+        progress = ProgressReporter(1000, stream=stream, is_tty=True, refresh_interval=1.0, clock=clock)
+        for _ in range(100):
+            progress.range_done(True)
+            clock.now += 0.05
+
+        assert stream.getvalue().count('\r') == 5  # t = 0, 1, 2, 3, 4 seconds
+        assert '\n' not in stream.getvalue()
+
+        progress.close()
+        assert stream.getvalue().endswith('\n')
+
+    def test_non_tty_logs_periodically(self, mocker):
+        """Test that without a TTY progress goes to periodic log lines, not the stream."""
+        clock = FakeClock()
+        stream = io.StringIO()
+        log_info = mocker.patch('progress.logger.info')
+        progress = ProgressReporter(100, stream=stream, is_tty=False, log_interval=30, clock=clock)
+        for _ in range(50):
+            progress.item_done(True)
+            clock.now += 1.0
+
+        assert stream.getvalue() == ''
+        assert log_info.call_count == 2  # t = 0 and t = 30
+
+    def test_final_item_always_rendered(self):
+        """Test that completing the last item forces a redraw."""
+        clock = FakeClock()
+        stream = io.StringIO()
+        progress = ProgressReporter(2, stream=stream, is_tty=True, refresh_interval=60, clock=clock)
+        progress.item_done(True)
+        progress.item_done(False)
+
+        assert stream.getvalue().rstrip().endswith('ranges ok 0 failed 0')
+        assert '[2/2] 100.0%' in stream.getvalue()
+
+    @pytest.mark.parametrize("seconds,expected", [(None, '--'), (42, '42s'), (185, '3m05s'), (8040, '2h14m')])
+    def test_format_duration(self, seconds, expected):
+        """Test compact duration formatting."""
+        assert format_duration(seconds) == expected
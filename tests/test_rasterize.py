@@ -0,0 +1,93 @@
+"""Tests for vectorized polygon rasterization."""
+import numpy as np
+import pytest
+from packed_geometry import PackedGeometry
+from population_grid import PopulationGrid
+from rasterize import coverage_mask, polygon_mask, zonal_sum
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def point_in_rings(x, y, rings):
+    """Reference even-odd point-in-polygon test."""
+    inside = False
+    for ring in rings:
+        for (ax, ay), (bx, by) in zip(ring, ring[1:] + ring[:1]):
+            if (ay <= y) != (by <= y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+                inside = not inside
+    return inside
+
+
+class TestPolygonMask:
+    """Test scanline rasterization against a reference point-in-polygon test."""
+
+    def test_square_with_hole(self):
+        """Test that cells in the hole are excluded."""
+        geometry = {"type": "Polygon", "coordinates": [square(0, 0, 10, 10), square(4, 4, 6, 6)]}
+        mask = polygon_mask(PackedGeometry.from_geojson(geometry), 0.0, 10.0, 1.0, 1.0, (10, 10))
+        assert mask.sum() == 100 - 4
+        assert not mask[4:6, 4:6].any()
+
+    def test_matches_reference_on_irregular_polygon(self):
+        """Test an irregular multipolygon cell by cell."""
+        rng = np.random.default_rng(1)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 40))
+        radii = rng.uniform(2, 5, 40)
+        ring = [[5 + r * np.cos(a), 5 + r * np.sin(a)] for a, r in zip(angles, radii)]
+        polygons = [[ring + ring[:1]], [square(11, 1, 13, 3)]]
+        packed = PackedGeometry.from_geojson({"type": "MultiPolygon", "coordinates": polygons})
+
+        mask = polygon_mask(packed, 0.0, 10.0, 0.25, 0.25, (40, 56))
+        for row in range(40):
+            for col in range(56):
+                x, y = (col + 0.5) * 0.25, 10 - (row + 0.5) * 0.25
+                expected = point_in_rings(x, y, polygons[0][0:1]) or point_in_rings(x, y, polygons[1])
+                assert mask[row, col] == expected
+
+
+class TestCoverageMask:
+    """Test rasterizing the union of many polygons at once."""
+
+    def test_matches_union_of_polygon_masks(self):
+        """Test overlapping polygons, holes and polygons partly off the grid, in several batches."""
+        rng = np.random.default_rng(4)
+        polygons = []
+        for i in range(60):
+            cx, cy = rng.uniform(-1, 11, 2)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 12))
+            radii = rng.uniform(0.5, 3, 12)
+            ring = [[cx + r * np.cos(a), cy + r * np.sin(a)] for a, r in zip(angles, radii)]
+            rings = [ring + ring[:1]]
+            if i % 4 == 0:
+                rings.append(square(cx - 0.3, cy - 0.3, cx + 0.3, cy + 0.3))
+            polygons.append(PackedGeometry.from_geojson({"type": "Polygon", "coordinates": rings}))
+
+        mask = coverage_mask(polygons, 0.0, 10.0, 0.1, 0.1, (100, 100), batch_size=7)
+
+        expected = np.zeros((100, 100), dtype=bool)
+        for packed in polygons:
+            expected |= polygon_mask(packed, 0.0, 10.0, 0.1, 0.1, (100, 100))
+        np.testing.assert_array_equal(mask, expected)
+        assert not coverage_mask([], 0.0, 10.0, 0.1, 0.1, (5, 5)).any()
+
+
+class TestZonalSum:
+    """Test zonal sums over population grids."""
+
+    def test_sum_clipped_to_grid(self):
+        """Test a polygon partly outside the grid, with NaN cells counted as zero."""
+        values = np.ones((10, 10))
+        values[0, 0] = np.nan
+        grid = PopulationGrid(values, west=36.0, north=1.0, xres=0.1, yres=0.1)
+        geometry = {"type": "Polygon", "coordinates": [square(35.0, 0.5, 36.5, 2.0)]}
+
+        # Rows 0-4 and columns 0-4 are inside, minus the NaN cell
+        assert zonal_sum(grid, PackedGeometry.from_geojson(geometry)) == pytest.approx(24)
+
+    def test_polygon_outside_grid(self):
+        """Test that a polygon off the grid sums to zero."""
+        grid = PopulationGrid(np.ones((5, 5)), west=36.0, north=1.0, xres=0.1, yres=0.1)
+        geometry = {"type": "Polygon", "coordinates": [square(10, 10, 11, 11)]}
+        assert zonal_sum(grid, PackedGeometry.from_geojson(geometry)) == 0.0
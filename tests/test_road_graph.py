@@ -0,0 +1,227 @@
+"""Tests for the OSM PBF reader, the road graph and the offline isochrone engine."""
+import zlib
+
+import numpy as np
+import pytest
+
+from analyze_population import get_isochrone_with_retry
+from offline_isochrones import OfflineIsochroneClient, OfflineIsochroneError, mask_to_geometry, trace_mask
+from osm_pbf import iter_node_blocks, iter_ways, packed_sint64, packed_varints
+from packed_geometry import PackedGeometry
+from rasterize import points_in_polygon
+from road_graph import RoadGraph, haversine_m, way_direction, way_speed_kmh
+
+
+# Minimal PBF writer for the test fixture
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(number: int, values, signed=False, delta=False) -> bytes:
+    values = list(values)
+    if delta:
+        values = [v - p for v, p in zip(values, [0] + values[:-1])]
+    return _field(number, b''.join(_varint(_zigzag(v) if signed else v) for v in values))
+
+
+def _blob(blob_type: str, data: bytes) -> bytes:
+    blob = _varint_field(2, len(data)) + _field(3, zlib.compress(data))
+    header = _field(1, blob_type.encode()) + _varint_field(3, len(blob))
+    return len(header).to_bytes(4, 'big') + header + blob
+
+
+def write_pbf(path, nodes, ways):
+    """
+    Write nodes {id: (lat, lon)} as DenseNodes and ways [(id, refs, tags)] to a PBF file,
+    in separate blocks like real extracts.
+    """
+    strings = ['']
+    for _, _, tags in ways:
+        for item in tags.items():
+            for s in item:
+                if s not in strings:
+                    strings.append(s)
+    table = _field(1, b''.join(_field(1, s.encode()) for s in strings))
+
+    ids = sorted(nodes)
+    dense = (_packed(1, ids, signed=True, delta=True)
+             + _packed(8, [round(nodes[i][0] * 1e7) for i in ids], signed=True, delta=True)
+             + _packed(9, [round(nodes[i][1] * 1e7) for i in ids], signed=True, delta=True))
+    node_block = table + _field(2, _field(2, dense))
+
+    way_group = b''.join(
+        _field(3, _varint_field(1, way_id)
+               + _packed(2, [strings.index(k) for k in tags])
+               + _packed(3, [strings.index(v) for v in tags.values()])
+               + _packed(8, refs, signed=True, delta=True))
+        for way_id, refs, tags in ways
+    )
+    way_block = table + _field(2, way_group)
+
+    header = _field(4, b'OsmSchema-V0.6') + _field(4, b'DenseNodes')
+    with open(path, 'wb') as f:
+        f.write(_blob('OSMHeader', header) + _blob('OSMData', node_block) + _blob('OSMData', way_block))
+
+
+@pytest.fixture
+def grid_pbf(tmp_path):
+    """
+    5x5 street grid near Nairobi, 0.01 degrees (~1.1 km) apart: residential streets
+    (30 km/h), one primary road along the bottom row, a one-way street and a footway.
+    """
+    nodes = {}
+    for r in range(5):
+        for c in range(5):
+            nodes[100 + r * 5 + c] = (-1.30 + r * 0.01, 36.80 + c * 0.01)
+    nodes[200] = (-1.25, 36.90)  # footway end, not drivable
+    ways = [(1, [100 + c for c in range(5)], {'highway': 'primary', 'name': 'Bottom'})]
+    for r in range(1, 5):
+        ways.append((1 + r, [100 + r * 5 + c for c in range(5)], {'highway': 'residential'}))
+    for c in range(5):
+        ways.append((10 + c, [100 + r * 5 + c for r in range(5)], {'highway': 'residential'}))
+    ways.append((20, [124, 118], {'highway': 'residential', 'oneway': 'yes'}))
+    ways.append((21, [124, 200], {'highway': 'footway'}))
+    path = tmp_path / 'grid.osm.pbf'
+    write_pbf(path, nodes, ways)
+    return str(path), nodes
+
+
+class TestPBFReader:
+    """Test decoding the protobuf wire format."""
+
+    def test_packed_varints(self):
+        """Test vectorized varint and zigzag decoding, including multi-byte and negative values."""
+        values = [0, 1, 127, 128, 300, 2 ** 35, 2 ** 62]
+        data = b''.join(_varint(v) for v in values)
+        assert packed_varints(data).tolist() == values
+
+        signed = [5, -3, 0, -(2 ** 40), 2 ** 40]
+        data = b''.join(_varint(_zigzag(v)) for v in signed)
+        assert packed_sint64(data).tolist() == signed
+        assert packed_sint64(data, delta=True).tolist() == np.cumsum(signed).tolist()
+
+    def test_nodes_and_ways(self, grid_pbf):
+        """Test reading dense nodes and ways with tags from zlib blobs."""
+        path, nodes = grid_pbf
+        ids, lat, lon = next(iter_node_blocks(path))
+        assert ids.tolist() == sorted(nodes)
+        assert lat[0] == pytest.approx(-1.30) and lon[-1] == pytest.approx(36.90)
+
+        ways = list(iter_ways(path))
+        assert len(ways) == 12
+        way_id, refs, tags = ways[0]
+        assert way_id == 1 and refs.tolist() == [100, 101, 102, 103, 104]
+        assert tags == {'highway': 'primary', 'name': 'Bottom'}
+
+
+class TestRoadGraph:
+    """Test building and searching the CSR road graph."""
+
+    def test_speeds_and_directions(self):
+        """Test highway class speeds, maxspeed caps, access restrictions and one-way rules."""
+        assert way_speed_kmh({'highway': 'primary'}) == 65
+        assert way_speed_kmh({'highway': 'primary', 'maxspeed': '50'}) == 50
+        assert way_speed_kmh({'highway': 'primary', 'maxspeed': '20 mph'}) == pytest.approx(32.19, abs=0.01)
+        assert way_speed_kmh({'highway': 'footway'}) is None
+        assert way_speed_kmh({'highway': 'service', 'access': 'private'}) is None
+        assert way_direction({'highway': 'residential'}) == 0
+        assert way_direction({'highway': 'residential', 'oneway': '-1'}) == -1
+        assert way_direction({'highway': 'motorway'}) == 1
+        assert way_direction({'highway': 'tertiary', 'junction': 'roundabout'}) == 1
+
+    def test_build_from_pbf(self, grid_pbf):
+        """Test that drivable ways become CSR edges with travel times and the footway is dropped."""
+        path, nodes = grid_pbf
+        graph = RoadGraph.from_osm_pbf(path)
+        assert graph.num_nodes == 25
+        # 40 two-way grid segments plus one one-way diagonal
+        assert graph.num_edges == 81
+        assert np.all(np.diff(graph.indptr) >= 2)
+
+        # Bottom row is primary (65 km/h), the rest residential (30 km/h)
+        seg_m = haversine_m(-1.30, 36.80, -1.30, 36.81)
+        assert np.isclose(graph.seconds, seg_m / (65 / 3.6), rtol=1e-3).sum() == 8
+        assert np.isclose(graph.seconds, seg_m / (30 / 3.6), rtol=1e-3).sum() == 72
+
+    def test_shortest_times(self, grid_pbf, tmp_path):
+        """Test bounded single- and multi-source Dijkstra and the .npz round trip."""
+        graph = RoadGraph.from_osm_pbf(grid_pbf[0])
+        graph.save(str(tmp_path / 'graph.npz'))
+        graph = RoadGraph.load(str(tmp_path / 'graph.npz'))
+
+        corner, distance = graph.nearest_node(-1.3001, 36.8001)
+        assert distance < 20
+        nodes, times = graph.shortest_times([corner], max_seconds=1e9)
+        assert len(nodes) == 25 and np.all(np.diff(times) >= 0)
+        # Along the primary road: 4 segments at 65 km/h
+        far, _ = graph.nearest_node(-1.30, 36.84)
+        seg = haversine_m(-1.30, 36.80, -1.30, 36.81)
+        assert times[nodes.tolist().index(far)] == pytest.approx(4 * seg / (65 / 3.6), rel=1e-4)
+
+        bounded, bounded_times = graph.shortest_times([corner], max_seconds=300)
+        assert bounded_times.max() <= 300 and len(bounded) < 25
+
+        both, both_times = graph.shortest_times([corner, far], max_seconds=1e9)
+        assert both_times[both.tolist().index(far)] == 0.0
+        assert both_times.max() < times.max()
+
+    def test_missing_graph(self, tmp_path):
+        with pytest.raises(FileNotFoundError, match='road_graph.py'):
+            RoadGraph.load(str(tmp_path / 'missing.npz'))
+
+
+class TestOfflineIsochrones:
+    """Test polygon tracing and the ORS-compatible client."""
+
+    def test_trace_mask_holes_and_diagonals(self):
+        """Test that holes are traced clockwise and diagonal cells become separate polygons."""
+        ring_mask = np.ones((3, 3), dtype=bool)
+        ring_mask[1, 1] = False
+        geometry = mask_to_geometry(ring_mask, 36.0, -1.0, 0.1, 0.1)
+        assert geometry['type'] == 'Polygon' and len(geometry['coordinates']) == 2
+
+        diagonal = np.zeros((2, 2), dtype=bool)
+        diagonal[0, 0] = diagonal[1, 1] = True
+        assert len(trace_mask(diagonal)) == 2
+        assert mask_to_geometry(diagonal, 0.0, 0.0, 1.0, 1.0)['type'] == 'MultiPolygon'
+
+    def test_client_matches_ors_interface(self, grid_pbf):
+        """Test that isochrones nest, contain the start and come back through get_isochrone_with_retry."""
+        client = OfflineIsochroneClient(graph=RoadGraph.from_osm_pbf(grid_pbf[0]), cell_m=200, max_snap_m=500)
+        iso = get_isochrone_with_retry(client, -1.28, 36.82, [300, 600], max_retries=1, retry_delay=0)
+        assert [f['properties']['value'] for f in iso['features']] == [300.0, 600.0]
+
+        small, large = (PackedGeometry.from_geojson(f['geometry']) for f in iso['features'])
+        for packed in (small, large):
+            assert points_in_polygon(packed, np.array([36.82]), np.array([-1.28]))[0]
+        # 2.5 km at 30 km/h in 5 minutes: two blocks (2.2 km) east is reachable, the corner (4.4 km) only in 10
+        inside = points_in_polygon(small, np.array([36.84, 36.84]), np.array([-1.28, -1.26]))
+        assert inside.tolist() == [True, False]
+        assert points_in_polygon(large, np.array([36.84]), np.array([-1.26]))[0]
+
+    def test_far_from_roads(self, grid_pbf):
+        """Test that locations far from any road fail like an ORS routing error."""
+        client = OfflineIsochroneClient(graph=RoadGraph.from_osm_pbf(grid_pbf[0]), cell_m=200, max_snap_m=500)
+        with pytest.raises(OfflineIsochroneError, match='No road within'):
+            client.isochrones(locations=[[37.5, -1.0]], profile='driving-car', range=[900])
@@ -0,0 +1,120 @@
+"""Tests for incremental what-if scenarios."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from population_grid import PopulationGrid
+from road_graph import RoadGraph
+from config import get_config
+from scenarios import CoverageState, _find_facility, _merge_windows, _parse_addition
+
+RES = 0.005
+N_ROWS, N_COLS = 40, 140
+PARAMS = dict(max_seconds=3600, max_offroad_m=1200, offroad_kmh=5)
+
+
+@pytest.fixture
+def network():
+    """Road lattice on every third row of a 40 x 140 grid; the rows in between are off road."""
+    rng = np.random.default_rng(7)
+    road_rows = np.arange(0, N_ROWS, 3)
+    node = {(r, c): i for i, (r, c) in enumerate((r, c) for r in road_rows for c in range(N_COLS))}
+    lat = np.array([-(r + 0.5) * RES for r, _ in node])
+    lon = np.array([36.0 + (c + 0.5) * RES for _, c in node])
+    tails, heads = [], []
+    for (r, c), i in node.items():
+        for neighbour in ((r, c + 1), (r + 3, c)):
+            if neighbour in node:
+                tails += [i, node[neighbour]]
+                heads += [node[neighbour], i]
+    seconds = np.repeat(rng.uniform(30, 90, len(tails) // 2), 2)
+    graph = RoadGraph.from_edges(lat, lon, tails, heads, seconds)
+    grid = PopulationGrid(rng.uniform(0, 100, (N_ROWS, N_COLS)), west=36.0, north=0.0, xres=RES, yres=RES)
+    return graph, grid
+
+
+def facilities(*points):
+    return pd.DataFrame({'name': [p[0] for p in points], 'lat': [p[1] for p in points],
+                         'lon': [p[2] for p in points]})
+
+
+A = ('A', -0.0025, 36.0025)
+B = ('B', -0.1, 36.35)
+C = ('C', -0.18, 36.68)
+D = ('D', -0.05, 36.2)
+
+
+class TestCoverageState:
+    """Test that incremental scenarios match a full recomputation."""
+
+    def test_add_matches_rebuild(self, network):
+        graph, grid = network
+        state = CoverageState.build(graph, grid, facilities(A, B), **PARAMS)
+        impact = state.what_if(add=[C, D], ranges_min=[5, 15, 60])
+        expected = CoverageState.build(graph, grid, facilities(A, B, C, D), **PARAMS)
+
+        assert impact.after == pytest.approx(expected.covered_population([5, 15, 60]))
+        assert all(d >= 0 for d in impact.delta.values()) and impact.delta[15] > 0
+        assert impact.nodes_changed > 0 and impact.cells_changed > 0
+        # Evaluating doesn't change the state
+        assert state.covered_population([15])[15] == pytest.approx(impact.before[15])
+        assert state.names == ['A', 'B']
+
+    def test_remove_matches_rebuild(self, network):
+        graph, grid = network
+        state = CoverageState.build(graph, grid, facilities(A, B, C, D), **PARAMS)
+        impact = state.what_if(remove=['B', 3], ranges_min=[5, 15, 60], apply=True)
+        expected = CoverageState.build(graph, grid, facilities(A, C), **PARAMS)
+
+        assert impact.after == pytest.approx(expected.covered_population([5, 15, 60]))
+        assert impact.delta[15] < 0
+        np.testing.assert_allclose(state.node_seconds, expected.node_seconds)
+        np.testing.assert_allclose(state.cell_seconds, expected.cell_seconds)
+        # C keeps its index 2 in the updated state
+        np.testing.assert_array_equal(state.cell_facility,
+                                      np.where(expected.cell_facility == 1, 2, expected.cell_facility))
+        with pytest.raises(KeyError):
+            state.what_if(remove=['B'])
+
+    def test_swap_save_and_load(self, network, tmp_path):
+        """Test a combined removal and addition applied to a reloaded state."""
+        graph, grid = network
+        CoverageState.build(graph, grid, facilities(A, B), **PARAMS).save(str(tmp_path / 'state.npz'))
+        state = CoverageState.load(str(tmp_path / 'state.npz'), graph, grid)
+        assert state.names == ['A', 'B'] and state.max_seconds == 3600
+
+        impact = state.what_if(remove=['A'], add=[C], ranges_min=[15, 60])
+        expected = CoverageState.build(graph, grid, facilities(B, C), **PARAMS)
+        assert impact.after == pytest.approx(expected.covered_population([15, 60]))
+        assert 'Within  15 min' in impact.summary()
+
+        with pytest.raises(ValueError, match='different'):
+            CoverageState.load(str(tmp_path / 'state.npz'), graph, grid.aggregate(2))
+
+    def test_invalid_scenarios(self, network):
+        graph, grid = network
+        state = CoverageState.build(graph, grid, facilities(A), **PARAMS)
+        with pytest.raises(ValueError, match='from a road'):
+            state.what_if(add=[('Far', 1.0, 37.0)])
+        with pytest.raises(ValueError, match='at most 60'):
+            state.what_if(add=[B], ranges_min=[90])
+        impact = state.what_if()
+        assert impact.delta == {15: 0.0, 30: 0.0, 45: 0.0} and impact.cells_changed == 0
+
+
+class TestHelpers:
+
+    def test_merge_windows(self):
+        windows = _merge_windows([(0, 10, 0, 10), (20, 30, 20, 30), (5, 25, 5, 25)])
+        assert windows == [(0, 30, 0, 30)]
+        assert _merge_windows([(0, 10, 0, 10), (10, 20, 0, 10)]) == [(0, 10, 0, 10), (10, 20, 0, 10)]
+
+    def test_parse_addition(self):
+        assert _parse_addition('Clinic, Kisumu,-0.1,34.75') == ('Clinic, Kisumu', -0.1, 34.75)
+
+    def test_find_facility_of_any_level(self, sample_excel_file):
+        """Test that upgrades can name facilities outside the configured target levels."""
+        config = get_config().snapshot()._replace(input_file=str(sample_excel_file), target_levels=('5',))
+        assert _find_facility('Clinic C', config) == ('Clinic C', -1.28, 36.81)
+        with pytest.raises(KeyError):
+            _find_facility('Nowhere', config)
@@ -0,0 +1,128 @@
+"""Tests for the greedy maximal-coverage siting optimizer."""
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import get_config
+from packed_geometry import PackedGeometry
+from population_grid import PopulationGrid
+from rasterize import zonal_sum
+from siting import (
+    TiledPopulation,
+    create_siting_map,
+    facility_isochrones,
+    greedy_max_coverage,
+    rank_sites,
+    siting_layer,
+)
+
+
+def square(west, south, size):
+    ring = [[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+@pytest.fixture
+def population():
+    rng = np.random.default_rng(3)
+    grid = PopulationGrid(rng.uniform(0, 10, (50, 77)), west=36.0, north=0.0, xres=0.01, yres=0.01)
+    return TiledPopulation(grid)
+
+
+class TestBitsets:
+    """Test packing coverage into tiled bitsets."""
+
+    def test_mask_round_trip(self, population):
+        """Test that an unaligned mask keeps exactly its cells and their population."""
+        rng = np.random.default_rng(1)
+        mask = rng.random((21, 30)) < 0.3
+        bitset = population.mask_bitset(mask, 13, 45)
+        assert np.all(np.diff(bitset.tiles) > 0)
+        assert bitset.cells == mask.sum()
+        expected = population.grid.values[13:34, 45:75][mask].sum(dtype=np.float64)
+        assert population.population(*bitset) == pytest.approx(expected, rel=1e-6)
+
+        covered = population.union([bitset])
+        assert population.population(np.arange(population.num_tiles), covered) == pytest.approx(expected, rel=1e-6)
+
+    def test_isochrone_bitset_matches_zonal_sum(self, population):
+        packed = PackedGeometry.from_geojson(square(36.123, -0.311, 0.2))
+        bitset = population.isochrone_bitset(packed)
+        assert population.population(*bitset) == pytest.approx(zonal_sum(population.grid, packed), rel=1e-6)
+
+
+class TestGreedy:
+    """Test lazy greedy selection."""
+
+    def test_matches_plain_greedy(self, population):
+        """Test that lazy evaluation selects the same sites as re-evaluating every candidate each round."""
+        rng = np.random.default_rng(5)
+        candidates = []
+        for _ in range(60):
+            row, col = rng.integers(0, 40), rng.integers(0, 65)
+            size = rng.integers(3, 12)
+            candidates.append(population.mask_bitset(np.ones((size, size), dtype=bool), row, col))
+
+        lazy = greedy_max_coverage(population, candidates, k=8)
+
+        covered = population.union([])
+        plain = []
+        for _ in range(8):
+            gains = [population.population(b.tiles, b.words & ~covered[b.tiles]) for b in candidates]
+            best = int(np.argmax(gains))
+            plain.append((best, gains[best]))
+            covered[candidates[best].tiles] |= candidates[best].words
+        assert [i for i, _ in lazy] == [i for i, _ in plain]
+        assert [g for _, g in lazy] == pytest.approx([g for _, g in plain])
+        assert all(a >= b for (_, a), (_, b) in zip(lazy, lazy[1:]))
+
+    def test_existing_coverage_and_early_stop(self, population):
+        """Test that sites inside existing coverage add nothing and are never selected."""
+        inside = population.mask_bitset(np.ones((5, 5), dtype=bool), 10, 10)
+        outside = population.mask_bitset(np.ones((5, 5), dtype=bool), 30, 30)
+        existing = population.mask_bitset(np.ones((20, 20), dtype=bool), 0, 0)
+        candidates = pd.DataFrame({'name': ['Inside', 'Outside'], 'lat': [-0.1, -0.3], 'lon': [36.1, 36.3]})
+
+        table = rank_sites(population, candidates, [inside, outside], [existing], k=2)
+
+        assert table['name'].tolist() == ['Outside']
+        assert table['added_population'].iloc[0] == pytest.approx(population.population(*outside))
+        assert table.attrs['baseline_covered'] == pytest.approx(population.population(*existing))
+        assert table['total_covered'].iloc[0] == pytest.approx(table.attrs['baseline_covered']
+                                                               + table['added_population'].iloc[0])
+
+
+class TestOutputs:
+    """Test isochrone caching and the exported layer and map."""
+
+    def test_isochrones_cached(self):
+        client = Mock()
+        client.isochrones.return_value = {'features': [{'geometry': square(36.1, -0.2, 0.1), 'properties': {}}]}
+        facilities = pd.DataFrame({'name': ['A', 'B'], 'lat': [-0.15, -0.25], 'lon': [36.15, 36.25]})
+        cache = {('candidate', 'B', 1800): {'type': 'Feature', 'geometry': square(36.2, -0.3, 0.1),
+                                            'properties': {'name': 'B'}}}
+
+        features = facility_isochrones(client, facilities, 'candidate', 1800, cache)
+
+        assert client.isochrones.call_count == 1
+        assert features[0]['properties'] == {'role': 'candidate', 'name': 'A', 'value': 1800,
+                                             'lat': -0.15, 'lon': 36.15}
+        assert ('candidate', 'A', 1800) in cache
+        assert facility_isochrones(None, facilities.iloc[[0]], 'existing', 1800, cache) == [None]
+
+    def test_layer_and_map(self, population):
+        features = [{'type': 'Feature', 'geometry': square(36.1 + i * 0.2, -0.3, 0.1), 'properties': {}}
+                    for i in range(3)]
+        candidates = pd.DataFrame({'name': ['A', 'B', 'C'], 'lat': [-0.25] * 3, 'lon': [36.15, 36.35, 36.55]})
+        bitsets = [population.isochrone_bitset(PackedGeometry.from_geojson(f['geometry'])) for f in features]
+        table = rank_sites(population, candidates, bitsets, [], k=2)
+
+        layer = siting_layer(table, features)
+        assert [f['properties']['rank'] for f in layer['features']] == [1, 2]
+        assert 'candidate' not in layer['features'][0]['properties']
+        assert layer['features'][0]['geometry'] == features[int(table['candidate'].iloc[0])]['geometry']
+
+        html = create_siting_map(layer, get_config().snapshot()).get_root().render()
+        assert 'Recommended sites (2)' in html
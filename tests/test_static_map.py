@@ -0,0 +1,99 @@
+"""Tests for static PNG and GeoTIFF map export."""
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from config import get_config
+from facility_result import FacilityResult
+from static_map import parse_color, render_static_map, save_static_map
+
+
+def square(west, south, size):
+    ring = [[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {}}
+
+
+@pytest.fixture
+def results():
+    """Two facilities with nested 15 and 30 minute squares."""
+    facilities = []
+    for name, lon in (('A', 36.0), ('B', 36.5)):
+        result = FacilityResult(name, 0.0, lon)
+        result.add_range(900, square(lon - 0.05, -0.05, 0.1), 100.0)
+        result.add_range(1800, square(lon - 0.1, -0.1, 0.2), 200.0)
+        facilities.append(result)
+    return facilities
+
+
+@pytest.fixture
+def config():
+    return get_config().snapshot()._replace(
+        map_isochrone_colors={15: '#ff0000', 30: '#0000ff'}, map_isochrone_opacity=0.5,
+        map_image_resolution=0.01, map_image_point_radius=1)
+
+
+def read_png(path):
+    """Decode the unfiltered RGBA PNG written by write_png."""
+    data = path.read_bytes()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    cols, rows = struct.unpack('>II', data[16:24])
+    idat_length = struct.unpack('>I', data[33:37])[0]
+    raw = np.frombuffer(zlib.decompress(data[41:41 + idat_length]), dtype=np.uint8)
+    return raw.reshape(rows, cols * 4 + 1)[:, 1:].reshape(rows, cols, 4)
+
+
+class TestRenderStaticMap:
+    """Test rasterized isochrones and points."""
+
+    def test_ranges_points_and_extent(self, results, config):
+        image = render_static_map(results, config, border_colors={30: '#000000'})
+        rows, cols = image.rgba.shape[:2]
+        # 0.7 x 0.2 degrees of content plus a 2% margin on each side, at 0.01 degrees per pixel
+        assert (rows, cols) == (int(np.ceil(0.228 / 0.01)), int(np.ceil(0.728 / 0.01)))
+        assert image.west == pytest.approx(35.886) and image.north == pytest.approx(0.114)
+
+        def pixel(lon, lat):
+            return image.rgba[int((image.north - lat) / 0.01), int((lon - image.west) / 0.01)]
+
+        # 30 min only: blue at 50% over white; 15 min: red over that; outside: transparent
+        assert pixel(36.075, 0.075).tolist() == [128, 128, 255, 255]
+        assert pixel(36.035, 0.035).tolist() == [191, 64, 128, 255]
+        assert pixel(36.25, 0.0)[3] == 0
+        # Outline of the 30 minute range and facility point
+        assert pixel(36.095, 0.0).tolist() == [0, 0, 0, 255]
+        assert pixel(36.5, 0.0).tolist() == [255, 0, 0, 255]
+
+    def test_errors(self, config):
+        with pytest.raises(ValueError, match='No isochrones'):
+            render_static_map([], config)
+        with pytest.raises(ValueError, match='coarser'):
+            render_static_map([FacilityResult('A', 0.0, 36.0), FacilityResult('B', 10.0, 46.0)], config,
+                              resolution=0.0001)
+        with pytest.raises(ValueError, match='Unsupported'):
+            parse_color('teal')
+        assert parse_color('#F44336') == (244, 67, 54) and parse_color('#fff') == (255, 255, 255)
+
+
+class TestSaveStaticMap:
+    """Test the PNG and GeoTIFF encoders."""
+
+    def test_png(self, results, config, tmp_path):
+        image = save_static_map(results, str(tmp_path / 'map.png'), config)
+        png = read_png(tmp_path / 'map.png')
+        np.testing.assert_array_equal(png[..., :3], image.rgba[..., :3])
+        assert (png[..., 3] == 255).all()
+
+    def test_geotiff(self, results, config, tmp_path):
+        image = save_static_map(results, str(tmp_path / 'map.tif'), config)
+        PIL = pytest.importorskip('PIL.Image')
+        with PIL.open(tmp_path / 'map.tif') as tif:
+            assert tif.mode == 'RGBA'
+            np.testing.assert_array_equal(np.asarray(tif), image.rgba)
+            assert tif.tag_v2[33550] == (0.01, 0.01, 0.0)
+            assert tif.tag_v2[33922] == pytest.approx((0, 0, 0, image.west, image.north, 0))
+            assert tuple(tif.tag_v2[34735])[-4:] == (2048, 0, 1, 4326)
+
+        with pytest.raises(ValueError, match='.png'):
+            save_static_map(results, str(tmp_path / 'map.jpg'), config)
@@ -0,0 +1,103 @@
+"""Tests for the multi-source road-graph travel-time field."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import get_config
+from matrix_analysis import run_matrix_analysis
+from population_grid import PopulationGrid
+from road_graph import EARTH_RADIUS_M, RoadGraph
+from travel_time_field import cell_field, compute_travel_times_graph, facility_field
+
+STEP_DEG = 0.01
+STEP_M = STEP_DEG * np.pi * EARTH_RADIUS_M / 180
+
+
+@pytest.fixture
+def line_graph():
+    """Eleven nodes along the equator, 0.01 degrees apart, 60 s per two-way edge."""
+    lon = np.arange(11) * STEP_DEG
+    lat = np.zeros(11)
+    tails = np.concatenate((np.arange(10), np.arange(1, 11)))
+    heads = np.concatenate((np.arange(1, 11), np.arange(10)))
+    return RoadGraph.from_edges(lat, lon, tails, heads, np.full(20, 60.0))
+
+
+@pytest.fixture
+def line_grid():
+    """3 x 11 grid whose middle row holds one road node per cell."""
+    return PopulationGrid(np.ones((3, 11)), west=-STEP_DEG / 2, north=1.5 * STEP_DEG, xres=STEP_DEG, yres=STEP_DEG)
+
+
+class TestRoadGraphMultiSource:
+    """Test batch snapping and the multi-source search."""
+
+    def test_nearest_nodes(self, line_graph):
+        nodes, meters = line_graph.nearest_nodes([0.0, 0.0001, 0.05], [0.031, 0.1, 0.05], max_m=500)
+        assert nodes.tolist() == [3, 10, -1]
+        assert meters[0] == pytest.approx(0.001 * STEP_M / STEP_DEG, rel=1e-3)
+        assert np.isinf(meters[2])
+
+    def test_nearest_source_labels(self, line_graph):
+        """Test that every node is labelled with its nearest source and start times are honoured."""
+        seconds, source = line_graph.nearest_source_times([0, 9], max_seconds=1e9)
+        assert source.tolist() == [0] * 5 + [1] * 6
+        assert seconds.tolist() == [0, 60, 120, 180, 240, 240, 180, 120, 60, 0, 60]
+
+        seconds, source = line_graph.nearest_source_times([0, 9], max_seconds=1e9, source_seconds=[0, 130])
+        assert source.tolist() == [0] * 6 + [1] * 5
+        assert seconds[9] == 130
+
+        seconds, source = line_graph.nearest_source_times([0], max_seconds=150)
+        assert np.isinf(seconds[3:]).all() and (source[3:] == -1).all()
+
+
+class TestTravelTimeField:
+    """Test the per-facility and per-cell travel-time fields."""
+
+    def test_facility_field_skips_far_facilities(self, line_graph):
+        seconds, facility = facility_field(line_graph, np.array([0.0, 0.5, 0.0]), np.array([0.0, 0.05, 0.09]),
+                                           max_seconds=1e9, max_snap_m=500, offroad_kmh=5)
+        # Facility 1 is far off the road; facilities 0 and 2 split the line
+        assert set(facility.tolist()) == {0, 2}
+        assert facility[10] == 2 and seconds[10] == 60
+
+    def test_cell_field_spreads_off_road(self, line_graph, line_grid):
+        """Test that road cells take their node's time and neighbouring cells add the off-road crossing."""
+        node_seconds, node_facility = line_graph.nearest_source_times([0, 9], max_seconds=1e9)
+        seconds, facility = cell_field(line_graph, node_seconds, node_facility, line_grid,
+                                       max_snap_m=1.5 * STEP_M, offroad_kmh=5)
+        np.testing.assert_allclose(seconds[1], node_seconds, atol=1e-6)
+        np.testing.assert_array_equal(facility[1], node_facility)
+        np.testing.assert_allclose(seconds[0], node_seconds + STEP_M / (5 / 3.6), rtol=1e-6)
+        np.testing.assert_array_equal(facility[2], node_facility)
+
+        # Too short an off-road distance to leave the road row
+        seconds, _ = cell_field(line_graph, node_seconds, node_facility, line_grid,
+                                max_snap_m=0.5 * STEP_M, offroad_kmh=5)
+        assert np.isinf(seconds[[0, 2]]).all()
+
+    def test_compute_travel_times_graph(self, line_graph, line_grid):
+        """Test the matrix-compatible result layout and the max_seconds bound."""
+        rows = np.array([1, 1, 1, 0])
+        cols = np.array([0, 2, 5, 0])
+        seconds, facility = compute_travel_times_graph(
+            line_graph, line_grid, rows, cols, np.array([0.0]), np.array([0.0]),
+            max_seconds=200, max_snap_m=1.5 * STEP_M, offroad_kmh=5
+        )
+        assert seconds[:2].tolist() == [0.0, 120.0]
+        assert facility[:2].tolist() == [0, 0]
+        # Beyond the bound by road, and too slow off road
+        assert np.isinf(seconds[2:]).all() and (facility[2:] == -1).all()
+
+    def test_run_matrix_analysis_graph_engine(self, line_graph, line_grid):
+        """Test that matrix mode uses the road graph, without a client, when matrix.engine is graph."""
+        config = get_config().snapshot()._replace(matrix_engine='graph', matrix_max_minutes=12,
+                                                  matrix_min_cell_population=0.5)
+        facilities = pd.DataFrame({'name': ['A'], 'lat': [0.0], 'lon': [0.0]})
+        result = run_matrix_analysis(facilities, line_grid, None, config, graph=line_graph)
+
+        road_row = result['rows'] == 1
+        np.testing.assert_allclose(result['minutes'][road_row], np.arange(11), atol=1e-6)
+        reached = np.isfinite(result['minutes'])
+        assert result['table']['cumulative_population'].iloc[-1] == pytest.approx(result['population'][reached].sum())
@@ -0,0 +1,176 @@
+"""
+National travel-time field from one multi-source road-graph search.
+
+Instead of one isochrone (or matrix batch) per facility, every facility is
+snapped to the road graph and a single Dijkstra search is seeded from all of
+them at once (``RoadGraph.nearest_source_times``). Each road node gets the
+travel time to its nearest facility and which facility that is; each
+population cell then takes the best of the road nodes inside it or in the
+neighbouring cells, plus the off-road time to reach them. The run time
+depends on the size of the road network, not on the number of facilities.
+
+Used by matrix_analysis.py when ``matrix.engine`` is ``graph``.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from logger import get_logger
+from metrics import get_metrics
+from population_grid import PopulationGrid
+from road_graph import EARTH_RADIUS_M, RoadGraph, haversine_m
+
+logger = get_logger(__name__)
+metrics = get_metrics()
+
+
+def facility_field(
+    graph: RoadGraph,
+    fac_lat: np.ndarray,
+    fac_lon: np.ndarray,
+    max_seconds: float,
+    max_snap_m: float,
+    offroad_kmh: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Travel time from the nearest facility to every road node, in one search.
+
+    Args:
+        graph: Road graph
+        fac_lat: Facility latitudes
+        fac_lon: Facility longitudes
+        max_seconds: Search bound
+        max_snap_m: Facilities further than this from a road are left out
+        offroad_kmh: Speed from a facility to its road node
+
+    Returns:
+        (seconds, facility) per node: travel time (inf if unreached) and facility index (-1 if unreached)
+    """
+    with metrics.timer('snap_facilities'):
+        nodes, snap_m = graph.nearest_nodes(fac_lat, fac_lon, max_snap_m)
+    snapped = np.flatnonzero(nodes >= 0)
+    if len(snapped) < len(nodes):
+        logger.warning(f"{len(nodes) - len(snapped)} facilities are more than {max_snap_m:.0f} m from a road "
+                       f"and were left out")
+    with metrics.timer('multi_source_search'):
+        seconds, source = graph.nearest_source_times(
+            nodes[snapped], max_seconds, snap_m[snapped] / (offroad_kmh / 3.6)
+        )
+    facility = np.where(source >= 0, snapped[np.maximum(source, 0)], -1)
+    logger.info(f"Multi-source search from {len(snapped)} facilities reached "
+                f"{int(np.isfinite(seconds).sum()):,} of {graph.num_nodes:,} road nodes")
+    return seconds, facility
+
+
+def spread_step_m(grid: PopulationGrid) -> float:
+    """Off-road distance in meters across one cell of a grid (the shorter side, at its middle latitude)."""
+    mid_lat = grid.north - grid.shape[0] * grid.yres / 2
+    return min(grid.yres, grid.xres * np.cos(np.radians(mid_lat))) * np.pi * EARTH_RADIUS_M / 180
+
+
+def spread_steps(max_snap_m: float, step_m: float) -> int:
+    """Number of cells cell_field() spreads travel times away from the road network."""
+    return int(max_snap_m // step_m)
+
+
+def cell_field(
+    graph: RoadGraph,
+    node_seconds: np.ndarray,
+    node_facility: np.ndarray,
+    grid: PopulationGrid,
+    max_snap_m: float,
+    offroad_kmh: float,
+    step_m: float = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Travel time from the nearest facility to every cell of a population grid.
+
+    A cell's time is the best, over the reached road nodes inside it, of the
+    node's time plus the off-road time from the node to the cell center. Cells
+    without reached roads take their neighbours' times plus the off-road time
+    across one cell, repeatedly, up to max_snap_m away.
+
+    Args:
+        graph: Road graph
+        node_seconds: Per-node travel times from facility_field()
+        node_facility: Per-node facility indices from facility_field()
+        grid: Population grid
+        max_snap_m: Largest off-road distance from a cell to the road network
+        offroad_kmh: Off-road speed
+        step_m: Off-road distance across one cell (default: spread_step_m(grid))
+
+    Returns:
+        (seconds, facility) arrays of the grid's shape (inf / -1 where unreached)
+    """
+    n_rows, n_cols = grid.shape
+    seconds = np.full(n_rows * n_cols, np.inf)
+    facility = np.full(n_rows * n_cols, -1, dtype=np.int64)
+    offroad_ms = offroad_kmh / 3.6
+
+    reached = np.flatnonzero(np.isfinite(node_seconds))
+    rows, cols = grid.cell_index(graph.lat[reached], graph.lon[reached])
+    inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+    reached, rows, cols = reached[inside], rows[inside], cols[inside]
+    center_lat, center_lon = grid.cell_centers(rows, cols)
+    candidate = node_seconds[reached] + haversine_m(graph.lat[reached], graph.lon[reached],
+                                                   center_lat, center_lon) / offroad_ms
+    cell = rows * n_cols + cols
+    # Best node per cell: sort by (cell, time) and keep the first of each cell
+    order = np.lexsort((candidate, cell))
+    first = order[np.concatenate(([True], np.diff(cell[order]) != 0))]
+    seconds[cell[first]] = candidate[first]
+    facility[cell[first]] = node_facility[reached[first]]
+
+    seconds = seconds.reshape(n_rows, n_cols)
+    facility = facility.reshape(n_rows, n_cols)
+    if step_m is None:
+        step_m = spread_step_m(grid)
+    for _ in range(spread_steps(max_snap_m, step_m)):
+        # Spread times one cell in each direction at off-road speed
+        spread_s, spread_f = seconds.copy(), facility.copy()
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            source_s = np.full_like(seconds, np.inf)
+            source_f = np.full_like(facility, -1)
+            dst_r = slice(max(dr, 0), n_rows + min(dr, 0))
+            src_r = slice(max(-dr, 0), n_rows + min(-dr, 0))
+            dst_c = slice(max(dc, 0), n_cols + min(dc, 0))
+            src_c = slice(max(-dc, 0), n_cols + min(-dc, 0))
+            source_s[dst_r, dst_c] = seconds[src_r, src_c] + step_m / offroad_ms
+            source_f[dst_r, dst_c] = facility[src_r, src_c]
+            better = source_s < spread_s
+            spread_s[better] = source_s[better]
+            spread_f[better] = source_f[better]
+        if np.array_equal(spread_f, facility) and np.array_equal(spread_s, seconds):
+            break
+        seconds, facility = spread_s, spread_f
+    return seconds, facility
+
+
+def compute_travel_times_graph(
+    graph: RoadGraph,
+    grid: PopulationGrid,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    fac_lat: np.ndarray,
+    fac_lon: np.ndarray,
+    max_seconds: float,
+    max_snap_m: float,
+    offroad_kmh: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the travel time from each populated cell to its nearest facility over the road graph.
+
+    Same result layout as ``matrix_analysis.compute_travel_times``.
+
+    Returns:
+        Tuple of (seconds, facility_index) arrays for the given cells; unreachable
+        cells have seconds = inf and facility_index = -1
+    """
+    node_seconds, node_facility = facility_field(graph, fac_lat, fac_lon, max_seconds, max_snap_m, offroad_kmh)
+    with metrics.timer('cell_field'):
+        seconds, facility = cell_field(graph, node_seconds, node_facility, grid, max_snap_m, offroad_kmh)
+    seconds, facility = seconds[rows, cols], facility[rows, cols]
+    beyond = seconds > max_seconds
+    seconds[beyond] = np.inf
+    facility[beyond] = -1
+    return seconds, facility